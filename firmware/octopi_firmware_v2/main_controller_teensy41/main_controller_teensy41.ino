@@ -67,6 +67,9 @@ static const int SET_PID_ARGUMENTS = 29;
 static const int SEND_HARDWARE_TRIGGER = 30;
 static const int SET_STROBE_DELAY = 31;
 static const int SET_AXIS_DISABLE_ENABLE = 32;
+static const int SET_Z_STACK_SEQUENCE = 33;
+static const int SET_Z_STACK_SEQUENCE_TRIGGER = 34;
+static const int START_Z_STACK_SEQUENCE = 35;
 static const int SET_PIN_LEVEL = 41;
 static const int INITFILTERWHEEL = 253;
 static const int INITIALIZE = 254;
@@ -155,12 +158,29 @@ long timestamp_trigger_rising_edge[6] = {0, 0, 0, 0, 0, 0};
 IntervalTimer strobeTimer;
 static const int strobeTimer_interval_us = 100;
 
+void send_hardware_trigger(uint8_t trigger_config, long on_time_us)
+{
+  // Some (all?) the arrays used by the trigger timer interrupt use data types that don't have
+  // atomic writes, so we need to disable interrupts here to make sure the timer interrupt
+  // doesn't get partially written values.
+  noInterrupts();
+  int camera_channel = trigger_config & 0x0f;
+  control_strobe[camera_channel] = trigger_config >> 7;
+  illumination_on_time[camera_channel] = on_time_us;
+  digitalWrite(camera_trigger_pins[camera_channel], LOW);
+  timestamp_trigger_rising_edge[camera_channel] = micros();
+  trigger_output_level[camera_channel] = LOW;
+  interrupts();
+}
+
 /***************************************************************************************************/
 /******************************************* DAC80508 **********************************************/
 /***************************************************************************************************/
 const uint8_t DAC8050x_DAC_ADDR = 0x08;
 const uint8_t DAC8050x_GAIN_ADDR = 0x04;
 const uint8_t DAC8050x_CONFIG_ADDR = 0x03;
+// last value written to each DAC channel
+uint16_t DAC8050x_output_value[8] = {0, 0, 0, 0, 0, 0, 0, 0};
 
 void set_DAC8050x_gain(uint8_t div, uint8_t gains) 
 {
@@ -193,6 +213,7 @@ void set_DAC8050x_config()
 
 void set_DAC8050x_output(int channel, uint16_t value)
 {
+  DAC8050x_output_value[channel] = value;
   SPI.beginTransaction(SPISettings(1000000, MSBFIRST, SPI_MODE2));
   digitalWrite(DAC8050x_CS_pin, LOW);
   SPI.transfer(DAC8050x_DAC_ADDR + channel);
@@ -295,6 +316,28 @@ PID_ARGUMENTS axes_pid_arg[4];
 // home safety margin
 uint16_t home_safety_margin[4] = {4, 4, 4, 4};
 
+/***************************************************************************************************/
+/**************************************** z stack sequence *****************************************/
+/***************************************************************************************************/
+// A z stack sequence steps the focus (the z stepper, or a piezo driven by one of the DAC80508 channels) through
+// n planes and sends a camera trigger at each plane, without needing a command from the computer for each plane.
+// The first plane is the current position.
+static const uint8_t Z_STACK_SEQUENCE_USE_Z_STEPPER = 0xFF;
+static const int Z_STACK_SEQUENCE_IDLE = 0;
+static const int Z_STACK_SEQUENCE_MOVING = 1;
+static const int Z_STACK_SEQUENCE_SETTLING = 2;
+static const int Z_STACK_SEQUENCE_EXPOSING = 3;
+int z_stack_sequence_state = Z_STACK_SEQUENCE_IDLE;
+uint8_t z_stack_sequence_dac = Z_STACK_SEQUENCE_USE_Z_STEPPER;
+long z_stack_sequence_step = 0; // in usteps for the z stepper, or DAC counts for a piezo
+uint8_t z_stack_sequence_trigger_config = 0; // same format as the SEND_HARDWARE_TRIGGER camera channel byte
+long z_stack_sequence_illumination_on_time_us = 0;
+uint16_t z_stack_sequence_n_planes = 0;
+uint16_t z_stack_sequence_plane = 0;
+unsigned long z_stack_sequence_settle_time_us = 0;
+unsigned long z_stack_sequence_frame_time_us = 0;
+elapsedMicros us_since_z_stack_sequence_event;
+
 /***************************************************************************************************/
 /******************************************** timing ***********************************************/
 /***************************************************************************************************/
@@ -1582,17 +1625,34 @@ void loop() {
           }
         case SEND_HARDWARE_TRIGGER:
           {
-            // Some (all?) the arrays used by the trigger timer interrupt use data types that don't have
-            // atomic writes, so we need to disable interrupts here to make sure the timer interrupt
-            // doesn't get partially written values.
-            noInterrupts();
-            int camera_channel = buffer_rx[2] & 0x0f;
-            control_strobe[camera_channel] = buffer_rx[2] >> 7;
-            illumination_on_time[camera_channel] = uint32_t(buffer_rx[3]) << 24 | uint32_t(buffer_rx[4]) << 16 | uint32_t(buffer_rx[5]) << 8 | uint32_t(buffer_rx[6]);
-            digitalWrite(camera_trigger_pins[camera_channel], LOW);
-            timestamp_trigger_rising_edge[camera_channel] = micros();
-            trigger_output_level[camera_channel] = LOW;
-            interrupts();
+            send_hardware_trigger(buffer_rx[2], uint32_t(buffer_rx[3]) << 24 | uint32_t(buffer_rx[4]) << 16 | uint32_t(buffer_rx[5]) << 8 | uint32_t(buffer_rx[6]));
+            break;
+          }
+        case SET_Z_STACK_SEQUENCE:
+          {
+            z_stack_sequence_dac = buffer_rx[2];
+            z_stack_sequence_step = int32_t(uint32_t(buffer_rx[3]) << 24 | uint32_t(buffer_rx[4]) << 16 | uint32_t(buffer_rx[5]) << 8 | uint32_t(buffer_rx[6]));
+            break;
+          }
+        case SET_Z_STACK_SEQUENCE_TRIGGER:
+          {
+            z_stack_sequence_trigger_config = buffer_rx[2];
+            z_stack_sequence_illumination_on_time_us = uint32_t(buffer_rx[3]) << 24 | uint32_t(buffer_rx[4]) << 16 | uint32_t(buffer_rx[5]) << 8 | uint32_t(buffer_rx[6]);
+            break;
+          }
+        case START_Z_STACK_SEQUENCE:
+          {
+            z_stack_sequence_n_planes = (uint16_t(buffer_rx[2]) << 8) + uint16_t(buffer_rx[3]);
+            z_stack_sequence_settle_time_us = uint32_t(buffer_rx[4]) * 1000;
+            z_stack_sequence_frame_time_us = ((uint32_t(buffer_rx[5]) << 8) + uint32_t(buffer_rx[6])) * 1000;
+            z_stack_sequence_plane = 0;
+            if (z_stack_sequence_n_planes > 0)
+            {
+              // the first plane is where we are now, so it only needs to settle
+              z_stack_sequence_state = Z_STACK_SEQUENCE_SETTLING;
+              us_since_z_stack_sequence_event = 0;
+              mcu_cmd_execution_in_progress = true;
+            }
             break;
           }
         case SET_PIN_LEVEL:
@@ -1723,6 +1783,7 @@ void loop() {
         case RESET:
           {
             mcu_cmd_execution_in_progress = false;
+            z_stack_sequence_state = Z_STACK_SEQUENCE_IDLE;
             X_commanded_movement_in_progress = false;
             Y_commanded_movement_in_progress = false;
             Z_commanded_movement_in_progress = false;
@@ -2268,6 +2329,49 @@ void loop() {
       }
     }
   }
+
+  // z stack sequence
+  if (z_stack_sequence_state != Z_STACK_SEQUENCE_IDLE)
+  {
+    if (z_stack_sequence_state == Z_STACK_SEQUENCE_MOVING && !Z_commanded_movement_in_progress)
+    {
+      z_stack_sequence_state = Z_STACK_SEQUENCE_SETTLING;
+      us_since_z_stack_sequence_event = 0;
+    }
+    else if (z_stack_sequence_state == Z_STACK_SEQUENCE_SETTLING && us_since_z_stack_sequence_event >= z_stack_sequence_settle_time_us)
+    {
+      send_hardware_trigger(z_stack_sequence_trigger_config, z_stack_sequence_illumination_on_time_us);
+      z_stack_sequence_state = Z_STACK_SEQUENCE_EXPOSING;
+      us_since_z_stack_sequence_event = 0;
+    }
+    else if (z_stack_sequence_state == Z_STACK_SEQUENCE_EXPOSING && us_since_z_stack_sequence_event >= z_stack_sequence_frame_time_us)
+    {
+      z_stack_sequence_plane = z_stack_sequence_plane + 1;
+      if (z_stack_sequence_plane >= z_stack_sequence_n_planes)
+      {
+        z_stack_sequence_state = Z_STACK_SEQUENCE_IDLE;
+      }
+      else if (z_stack_sequence_dac == Z_STACK_SEQUENCE_USE_Z_STEPPER)
+      {
+        long current_position = tmc4361A_currentPosition(&tmc4361[z]);
+        Z_direction = sgn(z_stack_sequence_step);
+        Z_commanded_target_position = ( z_stack_sequence_step > 0 ? min(current_position + z_stack_sequence_step, Z_POS_LIMIT) : max(current_position + z_stack_sequence_step, Z_NEG_LIMIT) );
+        focusPosition = Z_commanded_target_position;
+        if ( tmc4361A_moveTo(&tmc4361[z], Z_commanded_target_position) == 0)
+          Z_commanded_movement_in_progress = true;
+        z_stack_sequence_state = Z_STACK_SEQUENCE_MOVING;
+      }
+      else
+      {
+        long dac_value = long(DAC8050x_output_value[z_stack_sequence_dac]) + z_stack_sequence_step;
+        set_DAC8050x_output(z_stack_sequence_dac, uint16_t(constrain(dac_value, 0L, 65535L)));
+        z_stack_sequence_state = Z_STACK_SEQUENCE_SETTLING;
+        us_since_z_stack_sequence_event = 0;
+      }
+    }
+    // the checks above clear this when a z move finishes, but the sequence isn't done until all planes are
+    mcu_cmd_execution_in_progress = (z_stack_sequence_state != Z_STACK_SEQUENCE_IDLE) || X_commanded_movement_in_progress || Y_commanded_movement_in_progress || Z_commanded_movement_in_progress || W_commanded_movement_in_progress;
+  }
 }
 
 /***************************************************
@@ -145,6 +145,9 @@ class CMD_SET:
     SEND_HARDWARE_TRIGGER = 30
     SET_STROBE_DELAY = 31
     SET_AXIS_DISABLE_ENABLE = 32
+    SET_Z_STACK_SEQUENCE = 33
+    SET_Z_STACK_SEQUENCE_TRIGGER = 34
+    START_Z_STACK_SEQUENCE = 35
     SET_PIN_LEVEL = 41
     INITFILTERWHEEL = 253
     INITIALIZE = 254
@@ -246,12 +249,15 @@ class FileSavingOption(Enum):
 
     INDIVIDUAL_IMAGES: Save each image as a separate file. Format is defined in Acquisition.IMAGE_FORMAT.
     TODO: Move all file saving related settings to this enum.
-    MULTI_PAGE_TIFF: Save all images from a single FOV as a single multi-page TIFF file.
-    TODO: Add zarr saving options.
+    MULTI_PAGE_TIFF: Save all images from a single FOV as a single multi-page TIFF file.  This is an ImageJ hyperstack
+        with ZC(YX) axes where the pixel type allows it.
+    OME_ZARR: Stream all images of the acquisition into a single OME-Zarr store with the HCS plate layout (one well
+        per region, one field per FOV, each field a TCZYX array).  Only supports single channel (non-RGB) images.
     """
 
     INDIVIDUAL_IMAGES = "INDIVIDUAL_IMAGES"
     MULTI_PAGE_TIFF = "MULTI_PAGE_TIFF"
+    OME_ZARR = "OME_ZARR"
 
     @staticmethod
     def convert_to_enum(option: Union[str, "FileSavingOption"]) -> "FileSavingOption":
@@ -551,7 +557,7 @@ CAMERA_SN = {"ch 1": "SN1", "ch 2": "SN2"}  # for multiple cameras, to be overwr
 
 ENABLE_STROBE_OUTPUT = False
 
-ACQUISITION_PATTERN = "S-Pattern"  # 'S-Pattern', 'Unidirectional'
+ACQUISITION_PATTERN = "S-Pattern"  # 'S-Pattern', 'Unidirectional', 'Optimized' (minimize stage travel time)
 FOV_PATTERN = "Unidirectional"  # 'S-Pattern', 'Unidirectional'
 
 Z_STACKING_CONFIG = "FROM BOTTOM"  # 'FROM BOTTOM', 'FROM TOP'
@@ -567,6 +573,10 @@ N_SPECTRUM_PER_POINT = 5
 
 # focus measure operator
 FOCUS_MEASURE_OPERATOR = FocusMeasureOperator.LAPE
+# Contrast autofocus scores the autofocus crop binned by this much, on this many threads, while it moves on to the
+# next z.  Only the relative focus measures matter to autofocus, so binning just trades off fine detail for speed.
+AF_FOCUS_MEASURE_BINNING = 2
+AF_FOCUS_MEASURE_NUM_WORKERS = 2
 
 # controller version
 CONTROLLER_VERSION = "Arduino Due"  # 'Teensy'
@@ -587,6 +597,9 @@ LASER_AF_CROP_HEIGHT = 256
 LASER_AF_SPOT_DETECTION_MODE = SpotDetectionMode.DUAL_LEFT.value
 LASER_AF_RANGE = 100
 DISPLACEMENT_SUCCESS_WINDOW_UM = 1.0
+# After each laser AF move, the frame used for the cross correlation check also gives the new displacement.  While it
+# is outside of displacement_success_window_um, laser AF moves again, up to this many moves in total (1 means open loop).
+LASER_AF_MAX_MOVES = 1
 SPOT_CROP_SIZE = 100
 CORRELATION_THRESHOLD = 0.9
 PIXEL_TO_UM_CALIBRATION_DISTANCE = 6.0
@@ -689,6 +702,21 @@ ENABLE_STITCHER = False
 IS_HCS = False
 DYNAMIC_REGISTRATION = False
 STITCH_COMPLETE_ACQUISITION = False
+# Output chunks are built (tiles read, flatfield corrected, and placed) and written by this many threads in parallel.
+STITCHING_NUM_WORKERS = min(8, os.cpu_count() or 1)
+# With registration, register every overlapping pair of tiles and solve for the positions of all tiles together,
+# instead of using the shifts between the center tiles of the first region for every tile.
+STITCHING_GLOBAL_REGISTRATION = False
+
+# Flatfields
+# Flatfields are estimated from this many randomly sampled images per channel (and time point, when stitching).
+FLATFIELD_NUM_SAMPLES = 32
+# Estimated flatfields are saved here, keyed by objective, channel, and camera settings, and reused by later
+# acquisitions and stitches.  Delete the files here to have them estimated again.
+FLATFIELD_CACHE_DIR = "cache/flatfields"
+# During multipoint acquisitions, sample frames of channels without a cached flatfield and cache their flatfield at
+# the end, and correct the displayed images of channels with one.  Saved images are always left uncorrected.
+MULTIPOINT_FLATFIELD = False
 
 # Pseudo color settings
 CHANNEL_COLORS_MAP = {
@@ -816,6 +844,49 @@ USE_TEMPLATE_MULTIPOINT = False
 
 FILE_SAVING_OPTION = FileSavingOption.INDIVIDUAL_IMAGES
 
+# Live view and recording frames are handled on their own thread (so they never hold up the camera or an acquisition),
+# through a queue of up to this many frames.  When live view falls behind, the oldest queued frames are dropped.
+STREAM_HANDLER_FRAME_QUEUE_SIZE = 2
+# Raw recording (see control/core/raw_recording.py) writes every frame into preallocated chunk files of this size.
+RAW_RECORDING_CHUNK_SIZE_MB = 1024
+# Frames waiting to be written during raw recording.  When full, the camera waits for the disk instead of dropping.
+RAW_RECORDING_FRAME_QUEUE_SIZE = 32
+# Live view and recording frame counts, drops, and write throughput/latency are logged this often (0 to disable).
+FRAME_STREAM_METRICS_LOG_INTERVAL_S = 30
+
+# Multipoint images are written to disk by background threads so that saving does not block the camera frame
+# callback.  Setting the number of threads to 0 writes images synchronously in the frame callback instead.
+MULTIPOINT_IMAGE_WRITER_THREADS = 2
+# Max number of images waiting to be written, per writer thread.  When full, the acquisition waits for the disk.
+MULTIPOINT_IMAGE_WRITER_QUEUE_SIZE = 16
+MULTIPOINT_IMAGE_WRITER_FLUSH_TIMEOUT_S = 120
+# The multipoint frame callback runs on its own thread, and gets frames through a queue of up to this many frames.
+# Acquisition frames can't be dropped, so if the queue is full the camera waits for room.
+MULTIPOINT_FRAME_CALLBACK_QUEUE_SIZE = 8
+# coordinates.csv is written out every time this many new rows (images) have been recorded, so a crash part way
+# through a time point still leaves the coordinates so far on disk.  0 means only write it at the end of the time point.
+MULTIPOINT_COORDINATES_FLUSH_ROWS = 100
+# Pipelined multipoint acquisition: start the xy move to the next fov as soon as the last image of the current fov
+# has been exposed, move x and y at the same time (so only one settle, of the longer of the x and y settle times, is
+# needed), and set up the first channel of the next fov while the stage settles.
+MULTIPOINT_PIPELINED_ACQUISITION = False
+# Sequenced z stacks: in hardware trigger mode, have the microcontroller step through each z stack (z stepper or
+# objective piezo) and trigger the camera at every plane on its own, instead of a round trip from the computer for
+# every plane.  Each channel is acquired as its own pass through the stack.  This needs a firmware that supports the
+# START_Z_STACK_SEQUENCE command.
+MULTIPOINT_SEQUENCED_Z_STACK = False
+# Continuous sweep contrast autofocus: in hardware trigger mode with a microcontroller driven z stage, sweep z once
+# through the autofocus range (slowed down to one autofocus step per camera frame) while triggering the camera at
+# fixed intervals, tag each frame with its z from the stage's position history, and move to the peak of a fit to the
+# focus measures.  Otherwise, autofocus stops at each step.
+AF_CONTINUOUS_SWEEP = False
+# Online focus tracking: fit a surface to the focus z of every successful autofocus (contrast or laser) during an
+# acquisition, move z to the surface's prediction for each fov during the move there, and only autofocus at fovs where
+# the prediction's standard deviation is above MULTIPOINT_FOCUS_TRACKING_MAX_UNCERTAINTY_UM.  With this, contrast
+# autofocus no longer runs every NUMBER_OF_FOVS_PER_AF fovs.
+MULTIPOINT_FOCUS_TRACKING = False
+MULTIPOINT_FOCUS_TRACKING_MAX_UNCERTAINTY_UM = 2.0
+
 ##########################################################
 #### start of loading machine specific configurations ####
 ##########################################################
@@ -285,18 +285,25 @@ class ToupcamCamera(AbstractCamera):
                 raw_image = np.frombuffer(self._internal_read_buffer, dtype="uint16")
             current_raw_image = raw_image.reshape(height, width)
 
+            # _internal_read_buffer gets reused for the next frame, so this copies it into a recycled buffer.
+            processed_frame, release_fn = self._process_raw_frame_pooled(current_raw_image)
             current_frame = CameraFrame(
                 frame_id=this_frame_id,
                 timestamp=this_timestamp,
-                frame=self._process_raw_frame(current_raw_image),
+                frame=processed_frame,
                 frame_format=this_frame_format,
                 frame_pixel_format=this_pixel_format,
+                release_fn=release_fn,
             )
 
             # Before releasing the lock, set the new current fram with the incremented frame id so other methods can
             # see we have a new frame. This should be the only place we modify _current_frame outside of init, and
             # since we hold a lock this whole time, we know that the frame id is still correct.
+            old_frame = self._current_frame
             self._current_frame = current_frame
+            # We hold a reference to the current frame, so drop the one to the frame it replaced.
+            if old_frame:
+                old_frame.release()
 
         # Propagate the local copy so we are sure it's the correct frame that goes out.
         self._propogate_frame(current_frame)
@@ -682,7 +689,8 @@ class ToupcamCamera(AbstractCamera):
 
         while time.time() < timeout_end_time_s:
             if self.get_frame_id() != starting_frame_id:
-                return self._current_frame
+                with self._raw_frame_callback_lock:
+                    return self._current_frame.detach()
             time.sleep(0.001)
 
         self._log.error(f"Timed out after {timeout_s} [s] waiting for a frame.")
@@ -284,7 +284,7 @@ class TucsenCamera(AbstractCamera):
 
                 np_image = self._convert_frame_to_numpy(self._m_frame)
 
-                processed_frame = self._process_raw_frame(np_image)
+                processed_frame, release_fn = self._process_raw_frame_pooled(np_image, raw_frame_from_pool=True)
                 with self._frame_lock:
                     camera_frame = CameraFrame(
                         frame_id=self._current_frame.frame_id + 1 if self._current_frame else 1,
@@ -292,9 +292,14 @@ class TucsenCamera(AbstractCamera):
                         frame=processed_frame,
                         frame_format=self.get_frame_format(),
                         frame_pixel_format=self.get_pixel_format(),
+                        release_fn=release_fn,
                     )
 
+                    old_frame = self._current_frame
                     self._current_frame = camera_frame
+                # We hold a reference to the current frame, so drop the one to the frame it replaced.
+                if old_frame:
+                    old_frame.release()
                 self._propogate_frame(camera_frame)
                 self._trigger_sent.clear()
 
@@ -308,13 +313,13 @@ class TucsenCamera(AbstractCamera):
         # TODO: In the latest version of 400BSI V3, the readout data will match the actual bit depth.
         # We are not able to tell the firmware version from SN yet. Need to figure out if it's safe to assume
         # all users have the latest firmware. We use 16-bit buffer for the old demo units for now.
-        buf = create_string_buffer(frame.uiImgSize)
+        # Copy straight into a recycled buffer from the frame pool, the caller is responsible for giving it back.
+        image_np = self._frame_pool.acquire((frame.usHeight, frame.usWidth), np.uint16)
+        if image_np.nbytes != frame.uiImgSize:
+            self._frame_pool.release(image_np)
+            raise CameraError(f"Frame size {frame.uiImgSize} [bytes] does not match a {image_np.shape} uint16 frame.")
         pointer_data = c_void_p(frame.pBuffer + frame.usHeader)
-        memmove(buf, pointer_data, frame.uiImgSize)
-
-        data = bytes(buf)
-        image_np = np.frombuffer(data, dtype=np.uint16)
-        image_np = image_np.reshape((frame.usHeight, frame.usWidth))
+        memmove(image_np.ctypes.data, pointer_data, frame.uiImgSize)
 
         return image_np
 
@@ -339,7 +344,7 @@ class TucsenCamera(AbstractCamera):
             time.sleep(0.001)
 
         with self._frame_lock:
-            return self._current_frame
+            return self._current_frame.detach()
 
     def get_frame_id(self) -> int:
         with self._frame_lock:
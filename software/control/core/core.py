@@ -7,6 +7,7 @@ import control._def
 from control.microcontroller import Microcontroller
 from control.piezo import PiezoStage
 from squid.abc import AbstractStage, AbstractCamera, CameraAcquisitionMode
+from squid.stage.cephla import CephlaStage
 import squid.logging
 
 # qt libraries
@@ -19,7 +20,10 @@ from qtpy.QtGui import *
 
 # control
 from control._def import *
+from control.core.focus_measure import FocusMeasureEngine
 from control.core.multi_point_worker import MultiPointWorker
+from control.core.stream_metrics import FrameStreamMetrics
+import control.core.scan_path as scan_path
 
 import control.utils as utils
 import control.utils_acquisition as utils_acquisition
@@ -35,8 +39,9 @@ try:
 except:
     pass
 
-from typing import List, Tuple, Optional, Dict, Any, Callable
-from queue import Queue
+from typing import List, Tuple, Optional, Dict, Any, Callable, Sequence
+from queue import Queue, Full
+from collections import OrderedDict
 from threading import Thread, Lock
 from pathlib import Path
 from datetime import datetime
@@ -46,6 +51,7 @@ import time
 import itertools
 import json
 import math
+import hashlib
 import numpy as np
 import pandas as pd
 import cv2
@@ -114,11 +120,16 @@ class StreamHandler(QObject):
         self.timestamp_last = 0
         self.counter = 0
         self.fps_real = 0
+        # Frames received, and frames the camera sent that never made it here (eg: dropped by the camera or by a
+        # full frame callback queue), based on gaps in frame_id.
+        self.metrics = FrameStreamMetrics("stream", log_interval_s=FRAME_STREAM_METRICS_LOG_INTERVAL_S)
 
         # Only accept new frames if this user defined function returns true
         self._accept_new_frames_fn = accept_new_frame_fn
 
     def start_recording(self):
+        # Stats shown while recording should only cover the recording.
+        self.metrics.reset()
         self.save_image_flag = True
 
     def stop_recording(self):
@@ -136,41 +147,49 @@ class StreamHandler(QObject):
 
     def on_new_frame(self, frame: squid.abc.CameraFrame):
         if not self._accept_new_frames_fn():
+            # We skipped this frame on purpose, so don't count the gap up to the next one we take as missed.
+            self.metrics.resync_frame_id(frame.frame_id)
             return
 
         self.handler_busy = True
         self.signal_new_frame_received.emit()
+        self.metrics.frame_received(frame.frame_id)
 
         # measure real fps
-        timestamp_now = round(time.time())
-        if timestamp_now == self.timestamp_last:
-            self.counter = self.counter + 1
-        else:
+        timestamp_now = time.time()
+        self.counter = self.counter + 1
+        if timestamp_now - self.timestamp_last >= 1:
+            self.fps_real = self.counter / (timestamp_now - self.timestamp_last)
             self.timestamp_last = timestamp_now
-            self.fps_real = self.counter
             self.counter = 0
             if PRINT_CAMERA_FPS:
-                print("real camera fps is " + str(self.fps_real))
+                print(f"real camera fps is {self.fps_real:.1f}")
 
         # crop image
         image = np.squeeze(frame.frame)
 
+        # Signal receivers can't release pooled frames, so anything we emit from one needs to be a copy.  Only the
+        # frames we actually emit (which are rate limited) get copied.
+        is_pooled = frame.is_pooled()
+
         # send image to display
         time_now = time.time()
         if time_now - self.timestamp_last_display >= 1 / self.fps_display:
-            self.image_to_display.emit(
-                utils.crop_image(
-                    image,
-                    round(image.shape[1] * self.display_resolution_scaling),
-                    round(image.shape[0] * self.display_resolution_scaling),
-                )
+            image_to_display = utils.crop_image(
+                image,
+                round(image.shape[1] * self.display_resolution_scaling),
+                round(image.shape[0] * self.display_resolution_scaling),
             )
+            self.image_to_display.emit(image_to_display.copy() if is_pooled else image_to_display)
             self.timestamp_last_display = time_now
 
         # send image to write
         if self.save_image_flag and time_now - self.timestamp_last_save >= 1 / self.fps_save:
             if frame.is_color():
+                # cvtColor makes a new image, so no need to copy it.
                 image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            elif is_pooled:
+                image = image.copy()
             self.packet_image_to_write.emit(image, frame.frame_id, frame.timestamp)
             self.timestamp_last_save = time_now
 
@@ -195,6 +214,10 @@ class ImageSaver(QObject):
         self.counter = 0
         self.recording_start_time = 0
         self.recording_time_limit = -1
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.metrics = FrameStreamMetrics("image saver", log_interval_s=FRAME_STREAM_METRICS_LOG_INTERVAL_S)
+        # Threads queueing a save_metrics request that didn't fit in the queue right away.  See save_metrics.
+        self._pending_metrics_puts: List[Thread] = []
 
     def process_queue(self):
         while True:
@@ -203,7 +226,16 @@ class ImageSaver(QObject):
                 return
             # process the queue
             try:
-                [image, frame_ID, timestamp] = self.queue.get(timeout=0.1)
+                [image, frame_ID, timestamp, enqueue_time] = self.queue.get(timeout=0.1)
+                if image is None:
+                    # see save_metrics, frame_ID is the path to save to and the extra metrics to save with ours
+                    metrics_path, extra_metrics = frame_ID
+                    try:
+                        self.metrics.save_json(metrics_path, extra_metrics)
+                    except OSError:
+                        self._log.exception(f"Failed to save recording metrics to '{metrics_path}'")
+                    self.queue.task_done()
+                    continue
                 self.image_lock.acquire(True)
                 folder_ID = int(self.counter / self.max_num_image_per_folder)
                 file_ID = int(self.counter % self.max_num_image_per_folder)
@@ -227,21 +259,44 @@ class ImageSaver(QObject):
                     cv2.imwrite(saving_path, image)
 
                 self.counter = self.counter + 1
+                self.metrics.frame_written(image.nbytes, time.monotonic() - enqueue_time)
+                self.metrics.queue_depth_changed(self.queue.qsize())
                 self.queue.task_done()
                 self.image_lock.release()
             except:
                 pass
 
     def enqueue(self, image, frame_ID, timestamp):
+        # The stream handler only sends frames at the save fps, so frame_ID gaps here are expected.
+        self.metrics.frame_received()
         try:
-            self.queue.put_nowait([image, frame_ID, timestamp])
+            self.queue.put_nowait([image, frame_ID, timestamp, time.monotonic()])
+            self.metrics.queue_depth_changed(self.queue.qsize())
             if (self.recording_time_limit > 0) and (
                 time.time() - self.recording_start_time >= self.recording_time_limit
             ):
                 self.stop_recording.emit()
             # when using self.queue.put(str_), program can be slowed down despite multithreading because of the block and the GIL
         except:
-            print("imageSaver queue is full, image discarded")
+            self.metrics.frame_dropped(frame_ID)
+            self._log.warning(f"imageSaver queue is full, image {frame_ID} discarded")
+
+    def save_metrics(self, file_name="recording_metrics.json", stream_metrics: Optional[FrameStreamMetrics] = None):
+        """
+        Save the metrics for the current experiment into its folder, once the images already queued are written.
+        If given, stream_metrics (eg: the StreamHandler's, which has the frame id gaps) are saved with them under
+        "stream", as of now.  This never blocks.
+        """
+        path = os.path.join(self.base_path, self.experiment_ID, file_name)
+        extra_metrics = {"stream": stream_metrics.to_dict()} if stream_metrics else None
+        request = [None, (path, extra_metrics), None, None]
+        try:
+            self.queue.put_nowait(request)
+        except Full:
+            # Don't block the caller (usually the GUI thread) until the images ahead of it are written.
+            put_thread = Thread(target=self.queue.put, args=(request,), daemon=True)
+            put_thread.start()
+            self._pending_metrics_puts.append(put_thread)
 
     def set_base_path(self, path):
         self.base_path = path
@@ -264,8 +319,11 @@ class ImageSaver(QObject):
             pass
         # reset the counter
         self.counter = 0
+        self.metrics.reset()
 
     def close(self):
+        for put_thread in self._pending_metrics_puts:
+            put_thread.join()
         self.queue.join()
         self.stop_signal_received = True
         self.thread.join()
@@ -426,33 +484,39 @@ class LiveController(QObject):
             self.led_array.set_NA(SCIMICROSCOPY_LED_ARRAY_DEFAULT_NA)
 
     # illumination control
+    # These return the future for the mcu command they send (if any), for use with wait_for_commands(...)
     def turn_on_illumination(self):
+        future = None
         if not "LED matrix" in self.currentConfiguration.name:
-            self.illuminationController.turn_on_illumination(
+            future = self.illuminationController.turn_on_illumination(
                 int(utils_channel.extract_wavelength_from_config_name(self.currentConfiguration.name))
             )
         elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and "LED matrix" in self.currentConfiguration.name:
             self.led_array.turn_on_illumination()
         # LED matrix
         else:
-            self.microcontroller.turn_on_illumination()  # to wrap microcontroller in Squid_led_array
+            future = self.microcontroller.turn_on_illumination()  # to wrap microcontroller in Squid_led_array
         self.illumination_on = True
+        return future
 
     def turn_off_illumination(self):
+        future = None
         if not "LED matrix" in self.currentConfiguration.name:
-            self.illuminationController.turn_off_illumination(
+            future = self.illuminationController.turn_off_illumination(
                 int(utils_channel.extract_wavelength_from_config_name(self.currentConfiguration.name))
             )
         elif SUPPORT_SCIMICROSCOPY_LED_ARRAY and "LED matrix" in self.currentConfiguration.name:
             self.led_array.turn_off_illumination()
         # LED matrix
         else:
-            self.microcontroller.turn_off_illumination()  # to wrap microcontroller in Squid_led_array
+            future = self.microcontroller.turn_off_illumination()  # to wrap microcontroller in Squid_led_array
         self.illumination_on = False
+        return future
 
     def update_illumination(self):
         illumination_source = self.currentConfiguration.illumination_source
         intensity = self.currentConfiguration.illumination_intensity
+        future = None
         if illumination_source < 10:  # LED matrix
             if SUPPORT_SCIMICROSCOPY_LED_ARRAY:
                 # set color
@@ -481,13 +545,19 @@ class LiveController(QObject):
                     self.led_array.set_illumination("df")
             else:
                 if "BF LED matrix full_R" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=(intensity / 100), g=0, b=0)
+                    future = self.microcontroller.set_illumination_led_matrix(
+                        illumination_source, r=(intensity / 100), g=0, b=0
+                    )
                 elif "BF LED matrix full_G" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=0, g=(intensity / 100), b=0)
+                    future = self.microcontroller.set_illumination_led_matrix(
+                        illumination_source, r=0, g=(intensity / 100), b=0
+                    )
                 elif "BF LED matrix full_B" in self.currentConfiguration.name:
-                    self.microcontroller.set_illumination_led_matrix(illumination_source, r=0, g=0, b=(intensity / 100))
+                    future = self.microcontroller.set_illumination_led_matrix(
+                        illumination_source, r=0, g=0, b=(intensity / 100)
+                    )
                 else:
-                    self.microcontroller.set_illumination_led_matrix(
+                    future = self.microcontroller.set_illumination_led_matrix(
                         illumination_source,
                         r=(intensity / 100) * LED_MATRIX_R_FACTOR,
                         g=(intensity / 100) * LED_MATRIX_G_FACTOR,
@@ -496,7 +566,7 @@ class LiveController(QObject):
         else:
             # update illumination
             wavelength = int(utils_channel.extract_wavelength_from_config_name(self.currentConfiguration.name))
-            self.illuminationController.set_intensity(wavelength, intensity)
+            future = self.illuminationController.set_intensity(wavelength, intensity)
             if ENABLE_NL5 and NL5_USE_DOUT and "Fluorescence" in self.currentConfiguration.name:
                 self.microscope.nl5.set_active_channel(NL5_WAVENLENGTH_MAP[wavelength])
                 if NL5_USE_AOUT:
@@ -568,6 +638,8 @@ class LiveController(QObject):
             except Exception as e:
                 print("not setting emission filter position due to " + str(e))
 
+        return future
+
     def start_live(self):
         self.is_live = True
         self.camera.start_streaming()
@@ -669,11 +741,14 @@ class LiveController(QObject):
         self.currentConfiguration = configuration
         self._log.info("setting microscope mode to " + self.currentConfiguration.name)
 
+        # Send all the mcu commands for the mode change, and then wait for them once.
+        mcu_commands = []
+
         # temporarily stop live while changing mode
         if self.is_live is True:
             self.timer_trigger.stop()
             if self.control_illumination:
-                self.turn_off_illumination()
+                mcu_commands.append(self.turn_off_illumination())
 
         # set camera exposure time and analog gain
         self.camera.set_exposure_time(self.currentConfiguration.exposure_time)
@@ -684,12 +759,13 @@ class LiveController(QObject):
 
         # set illumination
         if self.control_illumination:
-            self.update_illumination()
+            mcu_commands.append(self.update_illumination())
 
         # restart live
+        if self.is_live is True and self.control_illumination:
+            mcu_commands.append(self.turn_on_illumination())
+        self.microcontroller.wait_for_commands(mcu_commands)
         if self.is_live is True:
-            if self.control_illumination:
-                self.turn_on_illumination()
             self.timer_trigger.start()
         self._log.info("Done setting microscope mode.")
 
@@ -940,8 +1016,12 @@ class AutofocusWorker(QObject):
         self.crop_width = self.autofocusController.crop_width
         self.crop_height = self.autofocusController.crop_height
 
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._timing = utils.TimingManager("AutofocusWorker Timer Manager")
+
     def run(self):
         self.run_autofocus()
+        self._log.debug(self._timing.get_report())
         self.finished.emit()
 
     def wait_till_operation_is_completed(self):
@@ -949,6 +1029,11 @@ class AutofocusWorker(QObject):
             time.sleep(SLEEP_TIME_S)
 
     def run_autofocus(self):
+        if AF_CONTINUOUS_SWEEP and self._can_sweep():
+            if self.run_sweep_autofocus():
+                return
+            self._log.warning("Falling back to the stepped autofocus.")
+
         # @@@ to add: increase gain, decrease exposure time
         # @@@ can move the execution into a thread - done 08/21/2021
         focus_measure_vs_z = [0] * self.N
@@ -959,47 +1044,53 @@ class AutofocusWorker(QObject):
         self.stage.move_z(-z_af_offset)
 
         steps_moved = 0
-        for i in range(self.N):
-            self.stage.move_z(self.deltaZ)
-            steps_moved = steps_moved + 1
-            # trigger acquisition (including turning on the illumination) and read frame
-            if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
-                self.liveController.turn_on_illumination()
-                self.wait_till_operation_is_completed()
-                self.camera.send_trigger()
-                image = self.camera.read_frame()
-            elif self.liveController.trigger_mode == TriggerMode.HARDWARE:
-                if "Fluorescence" in self.liveController.currentConfiguration.name and ENABLE_NL5 and NL5_USE_DOUT:
-                    self.microscope.nl5.start_acquisition()
-                    # TODO(imo): This used to use the "reset_image_ready_flag=False" arg, but oinly the toupcam camera implementation had the
-                    #  "reset_image_ready_flag" arg, so this is broken for all other cameras.
+        # The (step, score future) of frames that are scored (or being scored), but haven't been looked at yet.
+        scoring = []
+        with self._create_focus_measure_engine() as focus_measure_engine:
+            for i in range(self.N):
+                self.stage.move_z(self.deltaZ)
+                steps_moved = steps_moved + 1
+                # trigger acquisition (including turning on the illumination) and read frame
+                if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
+                    self.liveController.turn_on_illumination()
+                    self.wait_till_operation_is_completed()
+                    self.camera.send_trigger()
                     image = self.camera.read_frame()
-                else:
-                    self.microcontroller.send_hardware_trigger(
-                        control_illumination=True, illumination_on_time_us=self.camera.get_exposure_time() * 1000
-                    )
-                    image = self.camera.read_frame()
-            if image is None:
-                continue
-            # tunr of the illumination if using software trigger
-            if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
-                self.liveController.turn_off_illumination()
-
-            image = utils.crop_image(image, self.crop_width, self.crop_height)
-            self.image_to_display.emit(image)
-
-            QApplication.processEvents()
-            timestamp_0 = time.time()
-            focus_measure = utils.calculate_focus_measure(image, FOCUS_MEASURE_OPERATOR)
-            timestamp_1 = time.time()
-            print("             calculating focus measure took " + str(timestamp_1 - timestamp_0) + " second")
-            focus_measure_vs_z[i] = focus_measure
-            print(i, focus_measure)
-            focus_measure_max = max(focus_measure, focus_measure_max)
-            if focus_measure < focus_measure_max * AF.STOP_THRESHOLD:
-                break
-
-        QApplication.processEvents()
+                elif self.liveController.trigger_mode == TriggerMode.HARDWARE:
+                    if "Fluorescence" in self.liveController.currentConfiguration.name and ENABLE_NL5 and NL5_USE_DOUT:
+                        self.microscope.nl5.start_acquisition()
+                        # TODO(imo): This used to use the "reset_image_ready_flag=False" arg, but oinly the toupcam camera implementation had the
+                        #  "reset_image_ready_flag" arg, so this is broken for all other cameras.
+                        image = self.camera.read_frame()
+                    else:
+                        self.microcontroller.send_hardware_trigger(
+                            control_illumination=True, illumination_on_time_us=self.camera.get_exposure_time() * 1000
+                        )
+                        image = self.camera.read_frame()
+                if image is None:
+                    continue
+                # tunr of the illumination if using software trigger
+                if self.liveController.trigger_mode == TriggerMode.SOFTWARE:
+                    self.liveController.turn_off_illumination()
+
+                self.image_to_display.emit(utils.crop_image(image, self.crop_width, self.crop_height))
+                scoring.append((i, focus_measure_engine.submit(image)))
+
+                # Only look at the scores of frames before this one, which were scored while we moved to and imaged
+                # this one, so scoring is never waited on.  This means we stop a step later than if we waited.
+                past_peak = False
+                while len(scoring) > 1:
+                    step, future = scoring.pop(0)
+                    focus_measure = focus_measure_engine.result(future)[FOCUS_MEASURE_OPERATOR]
+                    self._log.debug(f"Focus measure at step {step}: {focus_measure}")
+                    focus_measure_vs_z[step] = focus_measure
+                    focus_measure_max = max(focus_measure, focus_measure_max)
+                    past_peak = past_peak or focus_measure < focus_measure_max * AF.STOP_THRESHOLD
+                if past_peak:
+                    break
+
+            for step, future in scoring:
+                focus_measure_vs_z[step] = focus_measure_engine.result(future)[FOCUS_MEASURE_OPERATOR]
 
         # maneuver for achiving uniform step size and repeatability when using open-loop control
         self.stage.move_z(-steps_moved * self.deltaZ)
@@ -1015,6 +1106,124 @@ class AutofocusWorker(QObject):
         if idx_in_focus == self.N - 1:
             print("moved to the top end of the AF range")
 
+    def _create_focus_measure_engine(self) -> FocusMeasureEngine:
+        return FocusMeasureEngine(
+            [FOCUS_MEASURE_OPERATOR],
+            self.crop_width,
+            self.crop_height,
+            binning=AF_FOCUS_MEASURE_BINNING,
+            num_workers=AF_FOCUS_MEASURE_NUM_WORKERS,
+            timing=self._timing,
+        )
+
+    def _can_sweep(self) -> bool:
+        reason = None
+        if self.liveController.trigger_mode != TriggerMode.HARDWARE:
+            reason = "it needs hardware triggering"
+        elif ENABLE_NL5 and NL5_USE_DOUT:
+            reason = "the NL5 triggers the camera"
+        elif not isinstance(self.stage, CephlaStage):
+            reason = "the z stage is not driven by the microcontroller"
+
+        if reason:
+            self._log.warning(f"Not using the continuous sweep autofocus since {reason}.")
+            return False
+        return True
+
+    def run_sweep_autofocus(self) -> bool:
+        """
+        Autofocus over the same z range as the stepped autofocus, but in one continuous move up through it, with
+        the z speed set so that the camera (triggered at fixed intervals) gets one frame per deltaZ.  Each frame's z
+        is where the stage was in the middle of its exposure, from the stage's position history, and the stage ends
+        up at the peak of a fit to the focus measures vs z.
+
+        The trigger times come from when the microcontroller reported receiving each trigger, not from when we sent
+        them.  Those reports arrive with the same latency as the position updates the history is built from, so
+        the latency cancels out instead of biasing the frames' z (and with it the fitted peak).
+
+        Returns False (with the stage back where it started) if the sweep didn't get enough frames to fit.
+        """
+        z_config = self.stage.get_config().Z_AXIS
+        exposure_time_ms = self.camera.get_exposure_time()
+        # The illumination (which the trigger controls) comes on after the strobe delay, for the exposure time.
+        trigger_to_mid_exposure_s = (self.camera.get_strobe_time() + exposure_time_ms / 2) / 1000
+        frame_interval_s = self.camera.get_total_frame_time() / 1000
+        start_z_mm = self.stage.get_pos().z_mm
+        bottom_z_mm = start_z_mm + self.deltaZ * (1 - round(self.N / 2))
+        top_z_mm = bottom_z_mm + self.deltaZ * (self.N - 1)
+
+        # Start from below, so the sweep (up) starts with the backlash already taken up.
+        self.stage.move_z_to(bottom_z_mm)
+        # The microcontroller only has a 0.01 mm/s velocity resolution.
+        sweep_speed_mm_s = max(0.01, self.deltaZ / frame_interval_s)
+        self.microcontroller.wait_for_commands(
+            [self.microcontroller.set_max_velocity_acceleration(AXIS.Z, sweep_speed_mm_s, z_config.MAX_ACCELERATION)]
+        )
+
+        z_mm = []
+        scores = []
+        # Give up on the sweep if it takes much longer than it should (eg: if frames aren't keeping up).
+        sweep_deadline = time.time() + 3 * (top_z_mm - bottom_z_mm) / sweep_speed_mm_s + 1
+        with self._create_focus_measure_engine() as focus_measure_engine:
+            try:
+                self.stage.move_z_to(top_z_mm, blocking=False)
+                next_trigger_time = time.time()
+                while time.time() < sweep_deadline:
+                    time.sleep(max(0.0, next_trigger_time - time.time()))
+                    next_trigger_time = time.time() + frame_interval_s
+                    trigger = self.microcontroller.send_hardware_trigger(
+                        control_illumination=True, illumination_on_time_us=exposure_time_ms * 1000
+                    )
+                    image = self.camera.read_frame()
+                    if image is None:
+                        continue
+
+                    # The mcu triggers as soon as it gets the command, so on average half a status period before
+                    # it reports having it.
+                    trigger_time = (
+                        self.microcontroller.wait_for_command_received(trigger)
+                        - Microcontroller.STATUS_UPDATE_PERIOD_S / 2
+                    )
+                    frame_z_mm = self.stage.get_pos_at(trigger_time + trigger_to_mid_exposure_s).z_mm
+                    self.image_to_display.emit(utils.crop_image(image, self.crop_width, self.crop_height))
+                    z_mm.append(frame_z_mm)
+                    # Frames are scored while the sweep goes on, and only waited on once it's over.
+                    scores.append(focus_measure_engine.submit(image))
+                    if frame_z_mm >= top_z_mm - self.deltaZ / 4:
+                        break
+                else:
+                    self._log.warning(f"Autofocus sweep didn't reach the top of the range, got {len(z_mm)} frames.")
+            finally:
+                try:
+                    self.microcontroller.wait_till_operation_is_completed(max(5.0, sweep_deadline - time.time()))
+                finally:
+                    self.microcontroller.wait_for_commands(
+                        [
+                            self.microcontroller.set_max_velocity_acceleration(
+                                AXIS.Z, z_config.MAX_SPEED, z_config.MAX_ACCELERATION
+                            )
+                        ]
+                    )
+            focus_measures = [focus_measure_engine.result(future)[FOCUS_MEASURE_OPERATOR] for future in scores]
+
+        if len(set(z_mm)) < 3:
+            self._log.error(
+                f"Got frames at only {len(set(z_mm))} z positions during the autofocus sweep, which isn't enough to fit, going back to where it started."
+            )
+            self.stage.move_z_to(start_z_mm)
+            return False
+
+        focus_z_mm = utils.fit_focus_peak(z_mm, focus_measures)
+        self._log.info(
+            f"Autofocus sweep got {len(z_mm)} frames in [{min(z_mm):.4f}, {max(z_mm):.4f}] mm, in focus at {focus_z_mm:.4f} mm."
+        )
+        self.stage.move_z_to(focus_z_mm)
+        if focus_z_mm <= min(z_mm):
+            print("moved to the bottom end of the AF range")
+        if focus_z_mm >= max(z_mm):
+            print("moved to the top end of the AF range")
+        return True
+
 
 class AutoFocusController(QObject):
 
@@ -1822,6 +2031,10 @@ class ScanCoordinates(QObject):
     def sort_coordinates(self):
         self._log.info(f"Acquisition pattern: {self.acquisition_pattern}")
 
+        if self.acquisition_pattern == "Optimized":
+            self._optimize_coordinates_order()
+            return
+
         if len(self.region_centers) <= 1:
             return
 
@@ -1857,6 +2070,65 @@ class ScanCoordinates(QObject):
             k: self.region_fov_coordinates[k] for k, _ in sorted_items if k in self.region_fov_coordinates
         }
 
+    def _optimize_coordinates_order(self):
+        """
+        Order the regions, and the fovs within each region, to minimize the stage travel time starting from the current
+        stage position.  Regions are ordered by their centers.  Then each region's fovs are ordered starting from
+        where the previous region ended, keeping the original fov order (or its reverse) if that is already as fast.
+        """
+        stage_config = self.stage.get_config()
+        concurrent_xy = MULTIPOINT_PIPELINED_ACQUISITION
+        pos = self.stage.get_pos()
+        start_xy_mm = (pos.x_mm, pos.y_mm)
+        original_time_s = self.get_estimated_travel_time_s()
+
+        region_ids = list(self.region_centers.keys())
+        region_order = scan_path.get_optimized_order(
+            [self.region_centers[region_id][:2] for region_id in region_ids], stage_config, concurrent_xy, start_xy_mm
+        )
+
+        sorted_region_ids = [region_ids[idx] for idx in region_order]
+        region_fov_coordinates = {}
+        current_xy_mm = start_xy_mm
+        for region_id in sorted_region_ids:
+            fov_coordinates = self.region_fov_coordinates.get(region_id)
+            if not fov_coordinates:
+                continue
+            n = len(fov_coordinates)
+            candidate_orders = [list(range(n)), list(reversed(range(n)))]
+            if n > 2:
+                candidate_orders.append(
+                    scan_path.get_optimized_order(fov_coordinates, stage_config, concurrent_xy, current_xy_mm)
+                )
+            fov_order, _ = scan_path.get_best_order(
+                candidate_orders, fov_coordinates, stage_config, concurrent_xy, current_xy_mm
+            )
+            region_fov_coordinates[region_id] = [fov_coordinates[idx] for idx in fov_order]
+            current_xy_mm = region_fov_coordinates[region_id][-1][:2]
+
+        self.region_centers = {region_id: self.region_centers[region_id] for region_id in sorted_region_ids}
+        self.region_fov_coordinates = region_fov_coordinates
+        self._log.info(
+            f"Optimized scan order, estimated stage travel time {original_time_s:.1f} [s] -> "
+            f"{self.get_estimated_travel_time_s():.1f} [s]"
+        )
+
+    def get_estimated_travel_time_s(self) -> float:
+        """
+        Estimate how long the stage will spend moving (not including settle times) to visit every fov, in the
+        current order, starting from the current stage position.
+        """
+        all_fov_coordinates = [
+            coordinate for fov_coordinates in self.region_fov_coordinates.values() for coordinate in fov_coordinates
+        ]
+        pos = self.stage.get_pos()
+        return scan_path.get_path_time_s(
+            all_fov_coordinates,
+            self.stage.get_config(),
+            concurrent_xy=MULTIPOINT_PIPELINED_ACQUISITION,
+            start_xy_mm=(pos.x_mm, pos.y_mm),
+        )
+
     def get_region_bounds(self, region_id):
         """Get region boundaries"""
         if not self.validate_region(region_id):
@@ -1925,6 +2197,27 @@ class ScanCoordinates(QObject):
 
         self._log.info(f"Updated z-level to {new_z} for region:{region_id}, fov:{fov}")
 
+    def update_fov_z_levels(self, z_levels_by_region: Dict[str, Sequence[float]]):
+        """Update z-levels for every FOV of the given regions (and their region centers) at once
+
+        Args:
+            z_levels_by_region: Dictionary with region_id as key and the z-level of each of its FOVs, in FOV order
+        """
+        for region_id, z_levels in z_levels_by_region.items():
+            if not self.validate_region(region_id):
+                self._log.warning(f"Region {region_id} not found")
+                continue
+
+            fov_coords = self.region_fov_coordinates[region_id]
+            fov_coords[:] = [(coords[0], coords[1], float(z)) for coords, z in zip(fov_coords, z_levels)]
+            if len(fov_coords):
+                if len(self.region_centers[region_id]) == 3:
+                    self.region_centers[region_id][2] = fov_coords[0][2]
+                else:
+                    self.region_centers[region_id].append(fov_coords[0][2])
+
+        self._log.info(f"Updated z-levels for {sum(len(z) for z in z_levels_by_region.values())} fovs")
+
 
 class MultiPointController(QObject):
 
@@ -2305,15 +2598,16 @@ class MultiPointController(QObject):
 
         if self.focus_map:
             self._log.info("Using focus surface for Z interpolation")
-            for region_id in self.scan_region_names:
+            z_levels_by_region = self.focus_map.interpolate_regions(
+                {region_id: self.scan_region_fov_coords_mm[region_id] for region_id in self.scan_region_names}
+            )
+            for region_id, z_levels in z_levels_by_region.items():
                 region_fov_coords = self.scan_region_fov_coords_mm[region_id]
-                # Convert each tuple to list for modification
-                for i, coords in enumerate(region_fov_coords):
-                    x, y = coords[:2]  # This handles both (x,y) and (x,y,z) formats
-                    z = self.focus_map.interpolate(x, y, region_id)
-                    # Modify the list directly
-                    region_fov_coords[i] = (x, y, z)
-                    self.scanCoordinates.update_fov_z_level(region_id, i, z)
+                # Modify the list directly
+                region_fov_coords[:] = [
+                    (coords[0], coords[1], float(z)) for coords, z in zip(region_fov_coords, z_levels)
+                ]
+            self.scanCoordinates.update_fov_z_levels(z_levels_by_region)
 
         elif self.gen_focus_map and not self.do_reflection_af:
             self._log.info("Generating autofocus plane for multipoint grid")
@@ -2728,7 +3022,6 @@ class TrackingWorker(QObject):
         self.signal_current_configuration.emit(config)
         # TODO(imo): replace with illumination controller.
         self.liveController.set_microscope_mode(config)
-        self.microcontroller.wait_till_operation_is_completed()
         self.liveController.turn_on_illumination()  # keep illumination on for single configuration acqusition
         self.microcontroller.wait_till_operation_is_completed()
 
@@ -4087,6 +4380,9 @@ from scipy.interpolate import SmoothBivariateSpline, RBFInterpolator
 class FocusMap:
     """Handles fitting and interpolation of slide surfaces through measured focus points"""
 
+    # How many fitted surfaces to keep around, so refitting the same focus points doesn't redo the fit
+    SURFACE_FIT_CACHE_SIZE = 16
+
     def __init__(self, smoothing_factor=0.1):
         self._log = squid.logging.get_logger(self.__class__.__name__)
         self.smoothing_factor = smoothing_factor
@@ -4100,6 +4396,8 @@ class FocusMap:
         self.fit_by_region = False
         self.focus_points = {}
         self.is_fitted = False
+        # Hash of (points, method, smoothing factor) -> (surface_fit, method, errors), least recently used first
+        self._surface_fit_cache = OrderedDict()
 
     def generate_grid_coordinates(
         self, scanCoordinates: ScanCoordinates, rows: int = 4, cols: int = 4, add_margin: bool = False
@@ -4247,6 +4545,24 @@ class FocusMap:
         Returns:
             tuple: (surface_fit, method, errors)
         """
+        cache_key = self._surface_fit_cache_key(points)
+        if cache_key in self._surface_fit_cache:
+            self._surface_fit_cache.move_to_end(cache_key)
+            self.is_fitted = True
+            return self._surface_fit_cache[cache_key]
+
+        surface_fit, method, errors = self._fit_surface_uncached(points)
+        self._surface_fit_cache[cache_key] = (surface_fit, method, errors)
+        while len(self._surface_fit_cache) > FocusMap.SURFACE_FIT_CACHE_SIZE:
+            self._surface_fit_cache.popitem(last=False)
+        return surface_fit, method, errors
+
+    def _surface_fit_cache_key(self, points: List[Tuple[float, float, float]]) -> str:
+        points_hash = hashlib.sha1(np.asarray(points, dtype=np.float64).tobytes())
+        points_hash.update(f"{self.method}:{self.smoothing_factor}".encode())
+        return points_hash.hexdigest()
+
+    def _fit_surface_uncached(self, points: List[Tuple[float, float, float]]) -> Tuple[Callable, str, np.ndarray]:
         points_array = np.array(points)
         x = points_array[:, 0]
         y = points_array[:, 1]
@@ -4328,6 +4644,32 @@ class FocusMap:
 
         return self._interpolate_helper(x, y, surface_fit, method)
 
+    def interpolate_regions(self, region_coords: Dict[str, Sequence[Sequence[float]]]) -> Dict[str, np.ndarray]:
+        """Get interpolated Z values for every coordinate of every region, with one vectorized call per surface
+
+        Args:
+            region_coords: Dictionary with region_id as key and list of (x,y) or (x,y,z) coordinates as value
+
+        Returns:
+            Dictionary with region_id as key and array of interpolated Z values (in coordinate order) as value
+        """
+        region_xy = {
+            region_id: np.asarray([coords[:2] for coords in coords_list], dtype=float).reshape(-1, 2)
+            for region_id, coords_list in region_coords.items()
+        }
+        if self.fit_by_region:
+            return {
+                region_id: self.interpolate(xy[:, 0], xy[:, 1], region_id) if len(xy) else np.empty(0)
+                for region_id, xy in region_xy.items()
+            }
+
+        if not region_xy:
+            return {}
+        all_xy = np.concatenate(list(region_xy.values()))
+        all_z = self.interpolate(all_xy[:, 0], all_xy[:, 1])
+        split_indices = np.cumsum([len(xy) for xy in region_xy.values()])[:-1]
+        return dict(zip(region_xy.keys(), np.split(np.asarray(all_z), split_indices)))
+
     def _interpolate_helper(self, x, y, surface_fit, method):
         if np.isscalar(x) and np.isscalar(y):
             if method == "spline":
@@ -4335,7 +4677,7 @@ class FocusMap:
             elif method == "constant":
                 return surface_fit(x, y)
             else:  # rbf
-                return float(surface_fit([[x, y]]))
+                return float(surface_fit([[x, y]])[0])
         else:
             x = np.asarray(x)
             y = np.asarray(y)
@@ -4352,11 +4694,9 @@ class FocusMap:
         self, points: List[Tuple[float, float, float]], surface_fit: Callable, method: str
     ) -> np.ndarray:
         """Calculate absolute errors at measured points"""
-        errors = []
-        for x, y, z_measured in points:
-            z_fit = self._interpolate_helper(x, y, surface_fit, method)
-            errors.append(abs(z_fit - z_measured))
-        return np.array(errors)
+        points_array = np.asarray(points, dtype=float)
+        z_fit = self._interpolate_helper(points_array[:, 0], points_array[:, 1], surface_fit, method)
+        return np.abs(z_fit - points_array[:, 2])
 
     def get_surface_grid(self, x_range, y_range, num_points=50, region_id=None):
         """Generate grid of interpolated Z values for visualization
@@ -4634,20 +4974,17 @@ class LaserAutofocusController(QObject):
             float: Displacement in micrometers, or float('nan') if measurement fails
         """
 
-        def finish_with(um: float) -> float:
-            self.signal_displacement_um.emit(um)
-            return um
-
         try:
             # turn on the laser
             self.microcontroller.turn_on_AF_laser()
             self.microcontroller.wait_till_operation_is_completed()
         except TimeoutError:
             self._log.exception("Turning on AF laser timed out, failed to measure displacement.")
-            return finish_with(float("nan"))
+            self.signal_displacement_um.emit(float("nan"))
+            return float("nan")
 
         # get laser spot location
-        result = self._get_laser_spot_centroid()
+        displacement_um = self._measure_displacement_with_laser_on()
 
         # turn off the laser
         try:
@@ -4658,20 +4995,33 @@ class LaserAutofocusController(QObject):
             # Continue with the measurement, but we're essentially in an unknown / weird state here.  It's not clear
             # what we should do.
 
+        return displacement_um
+
+    def _measure_displacement_with_laser_on(self) -> float:
+        """Same as measure_displacement, but assumes that the autofocus laser is already on (and leaves it on)."""
+        result = self._get_laser_spot_centroid()
         if result is None:
             self._log.error("Failed to detect laser spot during displacement measurement")
-            return finish_with(float("nan"))  # Signal invalid measurement
+            displacement_um = float("nan")  # Signal invalid measurement
+        else:
+            displacement_um = self._displacement_um(result[0])
+        self.signal_displacement_um.emit(displacement_um)
+        return displacement_um
 
-        x, y = result
-        # calculate displacement
-        displacement_um = (x - self.laser_af_properties.x_reference) * self.laser_af_properties.pixel_to_um
-        return finish_with(displacement_um)
+    def _displacement_um(self, spot_x: float) -> float:
+        return (spot_x - self.laser_af_properties.x_reference) * self.laser_af_properties.pixel_to_um
 
-    def move_to_target(self, target_um: float) -> bool:
+    def move_to_target(self, target_um: float, max_moves: Optional[int] = None) -> bool:
         """Move the stage to reach a target displacement from reference position.
 
+        The laser stays on for the whole operation.  The displacement is averaged over laser_af_averaging_n frames
+        before the first move, and after each move a single frame gives both the new displacement and the image for
+        the cross-correlation check.  Moves repeat while the displacement is outside of displacement_success_window_um
+        of the target, up to max_moves moves.
+
         Args:
             target_um: Target displacement in micrometers
+            max_moves: Maximum number of z moves, or None for LASER_AF_MAX_MOVES
 
         Returns:
             bool: True if move was successful, False if measurement failed or displacement was out of range
@@ -4680,7 +5030,24 @@ class LaserAutofocusController(QObject):
             self._log.warning("Cannot move to target - reference not set")
             return False
 
-        current_displacement_um = self.measure_displacement()
+        try:
+            self.microcontroller.turn_on_AF_laser()
+            self.microcontroller.wait_till_operation_is_completed()
+        except TimeoutError:
+            self._log.exception("Turning on AF laser timed out, cannot move to target.")
+            return False
+
+        try:
+            return self._move_to_target_with_laser_on(target_um, max(1, max_moves or LASER_AF_MAX_MOVES))
+        finally:
+            try:
+                self.microcontroller.turn_off_AF_laser()
+                self.microcontroller.wait_till_operation_is_completed()
+            except TimeoutError:
+                self._log.exception("Turning off AF laser timed out after moving to target, laser may still be on.")
+
+    def _move_to_target_with_laser_on(self, target_um: float, max_moves: int) -> bool:
+        current_displacement_um = self._measure_displacement_with_laser_on()
         self._log.info(f"Current laser AF displacement: {current_displacement_um:.1f} μm")
 
         if math.isnan(current_displacement_um):
@@ -4693,16 +5060,49 @@ class LaserAutofocusController(QObject):
             )
             return False
 
-        um_to_move = target_um - current_displacement_um
-        self._move_z(um_to_move)
+        um_moved = 0.0
+        current_image = None
+        for move in range(max_moves):
+            um_to_move = target_um - current_displacement_um
+            self._move_z(um_to_move)
+            um_moved += um_to_move
+
+            try:
+                current_image = self.get_new_frame()
+            except Exception as e:
+                self._log.error(f"Error reading laser AF frame after move {move + 1}: {str(e)}")
+                current_image = None
+            if current_image is None or move == max_moves - 1:
+                break
+
+            try:
+                spot = self._find_spot(current_image)
+            except ValueError as e:
+                self._log.error(f"Error finding laser AF spot after move {move + 1}: {str(e)}")
+                spot = None
+            if spot is None:
+                break
+            current_displacement_um = self._displacement_um(spot[0])
+            self.signal_displacement_um.emit(current_displacement_um)
+            if (
+                abs(target_um - current_displacement_um) <= self.laser_af_properties.displacement_success_window_um
+                or abs(current_displacement_um) > self.laser_af_properties.laser_af_range
+            ):
+                break
+            self._log.info(f"Laser AF displacement after move {move + 1}: {current_displacement_um:.1f} μm")
+
+        if current_image is not None:
+            self.image = current_image
+            if LASER_AF_DISPLAY_SPOT_IMAGE:
+                self.image_to_display.emit(current_image)
 
         # Verify using cross-correlation that spot is in same location as reference
-        cc_result, correlation = self._verify_spot_alignment()
+        cc_result, correlation = self._verify_spot_alignment(current_image)
         self.signal_cross_correlation.emit(correlation)
         if not cc_result:
             self._log.warning("Cross correlation check failed - spots not well aligned")
             # move back to the current position
-            self._move_z(-um_to_move)
+            self._move_z(-um_moved)
             return False
         else:
             self._log.info("Cross correlation check passed - spots are well aligned")
@@ -4789,10 +5189,10 @@ class LaserAutofocusController(QObject):
         self.is_initialized = False
         self.load_cached_configuration()
 
-    def _verify_spot_alignment(self) -> Tuple[bool, np.array]:
+    def _verify_spot_alignment(self, current_image: Optional[np.ndarray]) -> Tuple[bool, np.array]:
         """Verify laser spot alignment using cross-correlation with reference image.
 
-        Captures current laser spot image and compares it with the reference image
+        Compares an already captured laser spot image with the reference image
         using normalized cross-correlation. Images are cropped around the expected
         spot location and normalized by maximum intensity before comparison.
 
@@ -4801,29 +5201,6 @@ class LaserAutofocusController(QObject):
         """
         failure_return_value = False, np.array([0.0, 0.0])
 
-        # Get current spot image
-        try:
-            self.microcontroller.turn_on_AF_laser()
-            self.microcontroller.wait_till_operation_is_completed()
-        except TimeoutError:
-            self._log.exception("Failed to turn on AF laser for verifying spot alignment.")
-            return failure_return_value
-
-        # TODO: create a function to get the current image (taking care of trigger mode checking and laser on/off switching)
-        """
-        self.camera.send_trigger()
-        current_image = self.camera.read_frame()
-        """
-        self._get_laser_spot_centroid()
-        current_image = self.image
-
-        try:
-            self.microcontroller.turn_off_AF_laser()
-            self.microcontroller.wait_till_operation_is_completed()
-        except TimeoutError:
-            self._log.exception("Failed to turn off AF laser after verifying spot alignment, laser in unknown state!")
-            # Continue on because we got a reading, but the system is in a potentially weird and unknown state here.
-
         if self.reference_crop is None:
             self._log.warning("No reference crop stored")
             return failure_return_value
@@ -4886,26 +5263,7 @@ class LaserAutofocusController(QObject):
 
                 self.image = image  # store for debugging # TODO: add to return instead of storing
 
-                if remove_background:
-                    # remove background using top hat filter
-                    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (50, 50))  # TODO: tmp hard coded value
-                    image = cv2.morphologyEx(image, cv2.MORPH_TOPHAT, kernel)
-
-                # calculate centroid
-                spot_detection_params = {
-                    "y_window": self.laser_af_properties.y_window,
-                    "x_window": self.laser_af_properties.x_window,
-                    "peak_width": self.laser_af_properties.min_peak_width,
-                    "peak_distance": self.laser_af_properties.min_peak_distance,
-                    "peak_prominence": self.laser_af_properties.min_peak_prominence,
-                    "spot_spacing": self.laser_af_properties.spot_spacing,
-                }
-                result = utils.find_spot_location(
-                    image,
-                    mode=self.laser_af_properties.spot_detection_mode,
-                    params=spot_detection_params,
-                    filter_sigma=self.laser_af_properties.filter_sigma,
-                )
+                result = self._find_spot(image, remove_background)
                 if result is None:
                     self._log.warning(
                         f"No spot detected in frame {i+1}/{self.laser_af_properties.laser_af_averaging_n}"
@@ -4939,6 +5297,29 @@ class LaserAutofocusController(QObject):
         self._log.debug(f"Spot centroid found at ({x:.1f}, {y:.1f}) from {successful_detections} detections")
         return (x, y)
 
+    def _find_spot(self, image: np.ndarray, remove_background: bool = False) -> Optional[Tuple[float, float]]:
+        """Find the (x,y) location of the laser spot in a single image, or None if detection fails."""
+        if remove_background:
+            # remove background using top hat filter
+            kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (50, 50))  # TODO: tmp hard coded value
+            image = cv2.morphologyEx(image, cv2.MORPH_TOPHAT, kernel)
+
+        # calculate centroid
+        spot_detection_params = {
+            "y_window": self.laser_af_properties.y_window,
+            "x_window": self.laser_af_properties.x_window,
+            "peak_width": self.laser_af_properties.min_peak_width,
+            "peak_distance": self.laser_af_properties.min_peak_distance,
+            "peak_prominence": self.laser_af_properties.min_peak_prominence,
+            "spot_spacing": self.laser_af_properties.spot_spacing,
+        }
+        return utils.find_spot_location(
+            image,
+            mode=self.laser_af_properties.spot_detection_mode,
+            params=spot_detection_params,
+            filter_sigma=self.laser_af_properties.filter_sigma,
+        )
+
     def get_image(self) -> Optional[np.ndarray]:
         """Capture and display a single image from the laser autofocus camera.
 
@@ -0,0 +1,220 @@
+"""
+Flatfield estimation and caching.
+
+FlatfieldEstimator keeps a bounded random sample (a reservoir sample) of the images of one channel, so images can be
+added one at a time as they are acquired, and fits a flatfield to the sample with BaSiC.  Images are kept downsampled,
+since flatfields are smooth (BaSiC fits at low resolution anyway), so a sample costs a few MB no matter how big the
+camera's frames are.
+
+estimate_flatfields reads sampled images of several channels on a pool of threads and fits the channels in parallel.
+
+FlatfieldCache saves and loads flatfields on disk keyed by the objective, channel, and camera settings they were
+estimated for, so later acquisitions and re-stitches with the same setup reuse them instead of estimating them again.
+"""
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Sequence
+
+import cv2
+import numpy as np
+
+import squid.logging
+
+
+def flatfield_camera_settings(sensor_pixel_size_um: float, shape: Sequence[int]) -> dict:
+    """
+    The camera settings a flatfield is cached under: the binned pixel size at the sensor, and the (y, x) image shape.
+    """
+    return {"sensor_pixel_size_um": round(float(sensor_pixel_size_um), 6), "shape": [int(shape[0]), int(shape[1])]}
+
+
+def fit_flatfield(images: np.ndarray) -> np.ndarray:
+    """
+    Fit a flatfield to the (n, y, x) images with BaSiC.  The flatfield is normalized to a mean of 1.
+    """
+    # Only import this here, so that basicpy (and jax) are only needed once a flatfield is actually estimated.
+    from basicpy import BaSiC
+
+    basic = BaSiC(get_darkfield=False, smoothness_flatfield=1)
+    basic.fit(images)
+    return basic.flatfield
+
+
+class FlatfieldEstimator:
+    """
+    Keeps a uniform random sample of up to num_samples of the (y, x) images added to it, downsampled to at most
+    max_size pixels on a side, and estimates a flatfield from them at the images' full size.  Thread safe.
+    """
+
+    def __init__(self, num_samples: int, max_size: int = 512, seed: Optional[int] = None):
+        if num_samples < 1:
+            raise ValueError(f"num_samples must be >= 1, but got {num_samples}")
+        self._num_samples = num_samples
+        self._max_size = max_size
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._samples = [None] * num_samples
+        self._seen_count = 0
+        self._shape = None
+
+    def add(self, image: np.ndarray):
+        """
+        Add image to the sample, if the sampling picks it.  The first num_samples images are always kept.  Only
+        images that are kept get copied (downsampled), so this is cheap enough to call on every frame.
+        """
+        if len(image.shape) != 2:
+            raise ValueError(f"Flatfield images must be 2D, but got shape {image.shape}")
+        with self._lock:
+            if self._shape is not None and tuple(image.shape) != self._shape:
+                raise ValueError(f"Flatfield image of shape {image.shape} doesn't match earlier ones of {self._shape}")
+            slot = self._next_slot()
+            self._seen_count += 1
+            if slot is None:
+                return
+            self._shape = tuple(image.shape)
+
+        downsampled = self._downsample(image)
+        with self._lock:
+            self._samples[slot] = downsampled
+
+    def get_sample_count(self) -> int:
+        with self._lock:
+            return sum(sample is not None for sample in self._samples)
+
+    def estimate(self) -> Optional[np.ndarray]:
+        """
+        Fit a flatfield to the sampled images, at the size of the images added.  Returns None if nothing was added.
+        """
+        with self._lock:
+            samples = [sample for sample in self._samples if sample is not None]
+            shape = self._shape
+        if not samples:
+            return None
+        flatfield = np.asarray(fit_flatfield(np.stack(samples)), dtype=np.float32)
+        if flatfield.shape != shape:
+            flatfield = cv2.resize(flatfield, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+        return flatfield
+
+    def _next_slot(self) -> Optional[int]:
+        """
+        Reservoir sampling: where the next image goes in the sample, or None if it doesn't make it in.  Needs the lock.
+        """
+        if self._seen_count < self._num_samples:
+            return self._seen_count
+        slot = self._random.randrange(self._seen_count + 1)
+        return slot if slot < self._num_samples else None
+
+    def _downsample(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape
+        scale = self._max_size / max(height, width)
+        image = np.asarray(image, dtype=np.float32)
+        if scale >= 1:
+            return image.copy()
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def estimate_flatfields(
+    sources: Dict[Hashable, Sequence[Hashable]],
+    load_planes: Callable[[Hashable], np.ndarray],
+    num_workers: int,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> Dict[Hashable, np.ndarray]:
+    """
+    sources maps each channel to the images to estimate its flatfield from, and load_planes(source) reads one of them
+    as a (planes, y, x) array (eg: 3 planes for rgb).  The images of all channels are read on a pool of num_workers
+    threads, then the channels are fit in parallel.  Returns channel -> its (planes, y, x) flatfields, for the channels
+    with any images.  progress_callback(channels_done, total_channels) is called from this thread as channels finish.
+    """
+    log = squid.logging.get_logger("estimate_flatfields")
+    estimators: Dict[Hashable, list] = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="flatfield") as executor:
+        reads = {
+            executor.submit(load_planes, source): channel
+            for (channel, channel_sources) in sources.items()
+            for source in channel_sources
+        }
+        for future in concurrent.futures.as_completed(reads):
+            channel = reads[future]
+            try:
+                planes = future.result()
+            except Exception as e:
+                log.warning(f"Couldn't read an image for the {channel} flatfield, skipping it: {e}")
+                continue
+            channel_estimators = estimators.setdefault(
+                channel, [FlatfieldEstimator(len(sources[channel])) for _ in range(len(planes))]
+            )
+            for estimator, plane in zip(channel_estimators, planes):
+                estimator.add(plane)
+
+        fits = {
+            channel: [executor.submit(estimator.estimate) for estimator in channel_estimators]
+            for (channel, channel_estimators) in estimators.items()
+        }
+        flatfields = {}
+        for done_count, (channel, plane_fits) in enumerate(fits.items(), start=1):
+            flatfields[channel] = np.stack([fit.result() for fit in plane_fits])
+            if progress_callback:
+                progress_callback(done_count, len(fits))
+    return flatfields
+
+
+class FlatfieldCache:
+    """
+    Flatfields on disk in cache_dir, keyed by objective, channel, and camera settings (a json friendly dict of
+    anything the flatfield depends on, eg: binned pixel size and image shape).  Each flatfield is a .npy file, with a
+    .json file next to it saying what it is for.
+    """
+
+    def __init__(self, cache_dir: str):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._cache_dir = cache_dir
+
+    @staticmethod
+    def make_key(objective: str, channel: str, camera_settings: dict) -> str:
+        description = json.dumps(
+            {"objective": objective, "channel": channel, "camera_settings": camera_settings}, sort_keys=True
+        )
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def get(self, objective: str, channel: str, camera_settings: dict) -> Optional[np.ndarray]:
+        path = self._path(FlatfieldCache.make_key(objective, channel, camera_settings))
+        if not os.path.exists(path):
+            return None
+        try:
+            return np.load(path)
+        except (OSError, ValueError) as e:
+            self._log.warning(f"Ignoring unreadable cached flatfield {path}: {e}")
+            return None
+
+    def put(self, objective: str, channel: str, camera_settings: dict, flatfield: np.ndarray):
+        key = FlatfieldCache.make_key(objective, channel, camera_settings)
+        os.makedirs(self._cache_dir, exist_ok=True)
+        # Write to a temporary file and move it into place, so readers never see a partly written flatfield.
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            np.save(f, np.asarray(flatfield, dtype=np.float32))
+        os.replace(temp_path, path)
+        with open(os.path.join(self._cache_dir, f"{key}.json"), "w") as f:
+            json.dump(
+                {
+                    "objective": objective,
+                    "channel": channel,
+                    "camera_settings": camera_settings,
+                    "shape": list(flatfield.shape),
+                    "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                },
+                f,
+                indent=2,
+            )
+        self._log.info(f"Cached flatfield for {objective=}, {channel=}, {camera_settings=} at {path}")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._cache_dir, f"{key}.npy")
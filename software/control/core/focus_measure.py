@@ -0,0 +1,118 @@
+"""
+Focus measures for contrast autofocus, computed off of the autofocus thread.
+
+A FocusMeasureEngine crops each image to the autofocus ROI, bins it, and scores it with one or more focus measure
+operators on a small pool of threads, so an autofocus can score frame N while it moves to (and images) frame N+1.
+The grayscale conversion and binning are shared by all of the operators.  Scores of binned images aren't comparable
+with utils.calculate_focus_measure scores of full resolution ones, but autofocus only compares scores with each other.
+"""
+
+import concurrent.futures
+import time
+from typing import Dict, Optional, Sequence
+
+import cv2
+import numpy as np
+
+from control._def import FocusMeasureOperator
+import control.utils
+import squid.logging
+
+
+class FocusMeasureEngine:
+    # Timers (in the TimingManager given to __init__) for how long scoring an image takes on a worker thread, and for
+    # how long result() callers end up waiting on scores.  If scoring is off the critical path, waits are ~0.
+    SCORE_TIMER = "focus_measure"
+    WAIT_TIMER = "focus_measure_wait"
+
+    def __init__(
+        self,
+        operators: Sequence[FocusMeasureOperator],
+        crop_width: Optional[int],
+        crop_height: Optional[int],
+        binning: int = 1,
+        num_workers: int = 1,
+        timing: Optional[control.utils.TimingManager] = None,
+    ):
+        if not operators:
+            raise ValueError("FocusMeasureEngine needs at least one operator.")
+        if binning < 1:
+            raise ValueError(f"binning must be >= 1, but got {binning}")
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._operators = tuple(operators)
+        self._crop_width = crop_width
+        self._crop_height = crop_height
+        self._binning = binning
+        self._timing = timing if timing else control.utils.TimingManager(self.__class__.__name__)
+        # Create these up front, since TimingManager.get_timer isn't thread safe.
+        self._score_timer = self._timing.get_timer(FocusMeasureEngine.SCORE_TIMER)
+        self._wait_timer = self._timing.get_timer(FocusMeasureEngine.WAIT_TIMER)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_workers, thread_name_prefix="focus_measure"
+        )
+
+    def submit(self, image: np.ndarray) -> concurrent.futures.Future:
+        """
+        Start scoring image.  Returns a future with the {operator: focus measure} of the image.  The image is not
+        copied, so it must not change until the future is done.
+        """
+        roi = control.utils.crop_image(image, self._crop_width, self._crop_height)
+        return self._executor.submit(self._score_timed, roi)
+
+    def result(self, future: concurrent.futures.Future) -> Dict[FocusMeasureOperator, float]:
+        """
+        Wait for the scores of a future from submit().  The wait is timed, so prefer this over future.result().
+        """
+        start = time.perf_counter()
+        try:
+            return future.result()
+        finally:
+            self._wait_timer.add_interval(start, time.perf_counter())
+
+    def score(self, image: np.ndarray) -> Dict[FocusMeasureOperator, float]:
+        """
+        Score image on this thread.
+        """
+        return self._score_timed(control.utils.crop_image(image, self._crop_width, self._crop_height))
+
+    def get_timing(self) -> control.utils.TimingManager:
+        return self._timing
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _score_timed(self, roi: np.ndarray) -> Dict[FocusMeasureOperator, float]:
+        start = time.perf_counter()
+        try:
+            return self._score(roi)
+        finally:
+            self._score_timer.add_interval(start, time.perf_counter())
+
+    def _score(self, roi: np.ndarray) -> Dict[FocusMeasureOperator, float]:
+        if len(roi.shape) == 3:
+            roi = cv2.cvtColor(roi, cv2.COLOR_RGB2GRAY)
+        roi = np.asarray(roi, dtype=np.float32)
+        if self._binning > 1:
+            height, width = roi.shape
+            size = (max(1, width // self._binning), max(1, height // self._binning))
+            roi = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+
+        scores = {}
+        for operator in self._operators:
+            if operator == FocusMeasureOperator.LAPE:
+                scores[operator] = float(np.mean(np.square(cv2.Laplacian(roi, cv2.CV_32F))))
+            elif operator == FocusMeasureOperator.GLVA:
+                scores[operator] = float(np.std(roi))
+            elif operator == FocusMeasureOperator.TENENGRAD:
+                sobel_x = cv2.Sobel(roi, cv2.CV_32F, 1, 0, ksize=3)
+                sobel_y = cv2.Sobel(roi, cv2.CV_32F, 0, 1, ksize=3)
+                scores[operator] = float(np.sum(cv2.magnitude(sobel_x, sobel_y)))
+            else:
+                raise ValueError(f"Invalid focus measure operator: {operator}")
+        return scores
@@ -0,0 +1,116 @@
+"""
+Online focus surface for predicting the in focus z of upcoming fovs from autofocus results.
+
+FocusMap fits a surface once through points gathered up front.  OnlineFocusSurface instead gets a point every time an
+autofocus succeeds during an acquisition, and keeps a Bayesian linear regression of focus z on a quadratic in x and y
+(an offset, a tilt, and a bowl or saddle shaped warp) up to date with it.  Along with each prediction it gives the
+prediction's standard deviation, so callers can skip autofocus where the surface is already known well enough and
+autofocus where it isn't (far from any point, or after a while without any).
+"""
+
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+
+class OnlineFocusSurface:
+    # Features are 1, x, y, x^2, x*y, y^2, with x and y in units of length_scale_mm from the first point.
+    NUM_FEATURES = 6
+
+    def __init__(
+        self,
+        length_scale_mm: float = 10.0,
+        measurement_noise_um: float = 1.0,
+        tilt_prior_um: float = 20.0,
+        warp_prior_um: float = 10.0,
+        memory_half_life_s: float = 600.0,
+        time_fn: Callable[[], float] = time.monotonic,
+    ):
+        """
+        measurement_noise_um is the autofocus repeatability.  tilt_prior_um and warp_prior_um are how much z is
+        expected to change from tilt and from warp over length_scale_mm, before any points are seen.  Points lose
+        half of their weight every memory_half_life_s, so the surface follows slow focus drift.
+        """
+        self._length_scale_mm = length_scale_mm
+        self._noise_var_mm2 = (measurement_noise_um / 1000) ** 2
+        # The offset (from the first point's z) is barely constrained, the rest are regularized by the priors.
+        prior_std_mm = np.array([1e3, tilt_prior_um, tilt_prior_um, warp_prior_um, warp_prior_um, warp_prior_um]) / 1000
+        self._prior_information = np.diag(1 / prior_std_mm**2)
+        self._memory_half_life_s = memory_half_life_s
+        self._time_fn = time_fn
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (x, y, z) of the first point.  Everything is fit relative to it.
+            self._origin_mm: Optional[Tuple[float, float, float]] = None
+            self._data_information = np.zeros((self.NUM_FEATURES, self.NUM_FEATURES))
+            self._data_vector = np.zeros(self.NUM_FEATURES)
+            self._point_count = 0
+            self._last_decay_time = self._time_fn()
+            # How much bigger prediction errors have been than the predicted standard deviations (as a variance
+            # ratio, never below 1).  This grows when the surface is more complicated than a quadratic.
+            self._error_scale = 1.0
+
+    def get_point_count(self) -> int:
+        with self._lock:
+            return self._point_count
+
+    def add_point(self, x_mm: float, y_mm: float, z_mm: float) -> Optional[float]:
+        """
+        Add an in focus (x, y, z).  Returns how far (in mm) z was from the prediction before this point was added, or
+        None if there was no prediction yet.
+        """
+        with self._lock:
+            self._decay()
+            if self._origin_mm is None:
+                self._origin_mm = (x_mm, y_mm, z_mm)
+
+            error_mm = None
+            features = self._features(x_mm, y_mm)
+            if self._point_count:
+                predicted_z_mm, predicted_var_mm2 = self._predict(features)
+                error_mm = z_mm - predicted_z_mm
+                # Smoothly follow how well calibrated the predictions have been.
+                self._error_scale = max(1.0, 0.8 * self._error_scale + 0.2 * error_mm**2 / predicted_var_mm2)
+
+            self._data_information += np.outer(features, features) / self._noise_var_mm2
+            self._data_vector += features * (z_mm - self._origin_mm[2]) / self._noise_var_mm2
+            self._point_count += 1
+            return error_mm
+
+    def predict(self, x_mm: float, y_mm: float) -> Optional[Tuple[float, float]]:
+        """
+        Returns the predicted in focus (z_mm, standard deviation in mm) at (x_mm, y_mm), or None if there are no
+        points yet.
+        """
+        with self._lock:
+            if not self._point_count:
+                return None
+            self._decay()
+            z_mm, var_mm2 = self._predict(self._features(x_mm, y_mm))
+            return z_mm, float(np.sqrt(var_mm2))
+
+    def _predict(self, features: np.ndarray) -> Tuple[float, float]:
+        information = self._prior_information + self._data_information
+        weights = np.linalg.solve(information, self._data_vector)
+        parameter_var_mm2 = features @ np.linalg.solve(information, features)
+        return self._origin_mm[2] + float(features @ weights), float(
+            self._error_scale * (self._noise_var_mm2 + parameter_var_mm2)
+        )
+
+    def _features(self, x_mm: float, y_mm: float) -> np.ndarray:
+        x = (x_mm - self._origin_mm[0]) / self._length_scale_mm
+        y = (y_mm - self._origin_mm[1]) / self._length_scale_mm
+        return np.array([1.0, x, y, x * x, x * y, y * y])
+
+    def _decay(self):
+        now = self._time_fn()
+        if self._memory_half_life_s > 0 and now > self._last_decay_time:
+            weight = 0.5 ** ((now - self._last_decay_time) / self._memory_half_life_s)
+            self._data_information *= weight
+            self._data_vector *= weight
+        self._last_decay_time = now
@@ -0,0 +1,282 @@
+"""
+Background image writing for acquisitions.
+
+Writing images to disk (imageio/tifffile) can easily take longer than a camera exposure, so we do not want it to
+happen in the camera frame callback.  The ImageWriterPool here runs write jobs on a small set of worker threads
+instead.  Each worker has its own bounded queue, so if the disk can't keep up, submit() blocks and the acquisition
+slows down to match instead of us piling up images in memory.
+
+MultiPageTiffWriterCache keeps the multi-page tiff for the fov currently being written open across frames, so that
+saving a frame doesn't require re-opening (and re-parsing) an ever growing file.
+"""
+
+import os
+import queue
+import threading
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+import tifffile
+
+import squid.logging
+
+
+class ImageWriterError(RuntimeError):
+    pass
+
+
+class ImageWriterPool:
+    """
+    Runs write jobs (any callable) on num_workers background threads.
+
+    All jobs submitted with the same key are run by the same worker in the order they were submitted.  Use this to
+    keep jobs that share state (eg: all the images of a single fov going into one multi-page tiff) in order, while
+    letting jobs for different keys run in parallel.
+
+    If num_workers is 0, jobs are run synchronously in submit().
+
+    Exceptions raised by jobs are logged, recorded, and passed to error_callback (from the worker thread).  They do
+    not stop the pool, so it is up to the owner to decide whether to abort.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        num_workers: int,
+        max_queue_size: int,
+        error_callback: Optional[Callable[[Exception], None]] = None,
+        name: str = "ImageWriterPool",
+    ):
+        if num_workers < 0:
+            raise ValueError(f"num_workers must be >= 0, but got {num_workers}")
+        if max_queue_size < 1:
+            raise ValueError(f"max_queue_size must be >= 1, but got {max_queue_size}")
+
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._name = name
+        self._error_callback = error_callback
+        self._errors: List[Exception] = []
+
+        # Number of jobs that have been submitted but have not finished running, in total and per worker.  These
+        # and _closed are protected by _outstanding_cv.
+        self._outstanding = 0
+        self._worker_outstanding: List[int] = [0] * num_workers
+        self._outstanding_cv = threading.Condition()
+        self._closed = False
+
+        self._queues: List[queue.Queue] = [queue.Queue(max_queue_size) for _ in range(num_workers)]
+        self._threads: List[threading.Thread] = [
+            threading.Thread(target=self._worker_loop, args=(idx,), name=f"{name}-{idx}", daemon=True)
+            for idx in range(num_workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, key: Hashable, fn: Callable, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) for running on the worker responsible for key.  This blocks if that worker's
+        queue is full.
+        """
+        worker_idx = hash(key) % len(self._queues) if self._queues else None
+        with self._outstanding_cv:
+            if self._closed:
+                raise ImageWriterError(f"Cannot submit to {self._name} after it has been closed.")
+            self._outstanding += 1
+            if worker_idx is not None:
+                self._worker_outstanding[worker_idx] += 1
+
+        if worker_idx is None:
+            self._run_job(fn, args, kwargs)
+            return
+
+        self._queues[worker_idx].put((fn, args, kwargs))
+
+    def flush(self, timeout_s: Optional[float] = None) -> bool:
+        """
+        Block until all submitted jobs have finished running.  Returns False if we timed out first.
+        """
+        with self._outstanding_cv:
+            return self._outstanding_cv.wait_for(lambda: self._outstanding == 0, timeout=timeout_s)
+
+    def close(self, timeout_s: Optional[float] = None) -> bool:
+        """
+        Stop accepting jobs, wait for all submitted jobs to finish, then stop and join the workers.  Returns False if
+        the jobs did not finish within the timeout.  In that case the workers are not joined, and keep running until
+        they have finished what they have (including jobs that were still being submitted when we closed), so
+        anything the jobs write to must be left open.
+        """
+        with self._outstanding_cv:
+            self._closed = True
+        flushed = self.flush(timeout_s)
+        if not flushed:
+            self._log.error(
+                f"{self._name} still has {self.get_outstanding_count()} jobs running after {timeout_s} [s], "
+                "not waiting for its workers to stop."
+            )
+        for q in self._queues:
+            # Workers with a full queue stop on their own once they have run everything (see _worker_loop), so never
+            # block here.
+            try:
+                q.put_nowait(ImageWriterPool._STOP)
+            except queue.Full:
+                pass
+        if flushed:
+            for t in self._threads:
+                t.join()
+        return flushed
+
+    def get_outstanding_count(self) -> int:
+        with self._outstanding_cv:
+            return self._outstanding
+
+    def get_errors(self) -> List[Exception]:
+        with self._outstanding_cv:
+            return list(self._errors)
+
+    def _worker_loop(self, worker_idx: int):
+        job_queue = self._queues[worker_idx]
+        while True:
+            job = job_queue.get()
+            if job is not ImageWriterPool._STOP:
+                fn, args, kwargs = job
+                self._run_job(fn, args, kwargs, worker_idx)
+            # Nothing can be submitted once we're closed, so once everything submitted to us has run we're done.  Until
+            # then, keep going even after a stop, since a submit() that raced with close() may still be putting its job.
+            with self._outstanding_cv:
+                if self._closed and self._worker_outstanding[worker_idx] == 0:
+                    return
+
+    def _run_job(self, fn, args, kwargs, worker_idx: Optional[int] = None):
+        try:
+            fn(*args, **kwargs)
+        except Exception as e:
+            self._log.exception(f"Image write job failed in {self._name}")
+            with self._outstanding_cv:
+                self._errors.append(e)
+            if self._error_callback:
+                try:
+                    self._error_callback(e)
+                except Exception:
+                    self._log.exception(f"Error callback raised in {self._name}")
+        finally:
+            with self._outstanding_cv:
+                self._outstanding -= 1
+                if worker_idx is not None:
+                    self._worker_outstanding[worker_idx] -= 1
+                self._outstanding_cv.notify_all()
+
+
+class MultiPageTiffWriterCache:
+    """
+    Writes frames into per-fov multi-page tiff stacks, keeping the stack that a thread is currently writing to open
+    until that thread moves on to a different key.
+
+    Each stack is created with its full shape (eg: [z, channel, y, x]) the first time a frame for its key comes in,
+    and the hyperstack metadata is written once at that point.  Frames are then written straight into their slot
+    through a memory map, so writing a frame costs the same no matter how deep the stack is.  If an acquisition
+    stops part way through a stack, the slots that were never written are left as zeros.
+
+    This is meant to be used from ImageWriterPool workers, where all frames for a key are written by the same
+    thread.  close_all() must only be called when no writes are in progress (eg: after ImageWriterPool.flush()).
+    """
+
+    # These are the only pixel types ImageJ hyperstacks support.  Anything else is written as a plain shaped tiff.
+    IMAGEJ_DTYPES = (np.uint8, np.uint16, np.float32)
+
+    def __init__(self):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._lock = threading.Lock()
+        # thread ident -> (key, path, memory mapped stack)
+        self._open_stacks: Dict[int, Tuple[Hashable, str, np.memmap]] = {}
+
+    def write(
+        self,
+        key: Hashable,
+        path: str,
+        image: np.ndarray,
+        index: Tuple[int, ...],
+        stack_shape: Tuple[int, ...],
+        stack_axes: str,
+        metadata: Optional[dict] = None,
+    ):
+        """
+        Write image into the stack at path, at position index (which must be within stack_shape).  stack_axes
+        names the stack_shape dimensions using the tifffile/ImageJ axes letters (eg: "ZC").  metadata is only
+        used when the stack is first created, and should contain string values only.
+        """
+        if len(index) != len(stack_shape) or len(stack_axes) != len(stack_shape):
+            raise ValueError(f"index={index}, stack_shape={stack_shape}, and stack_axes={stack_axes} must match.")
+
+        thread_id = threading.get_ident()
+        with self._lock:
+            current = self._open_stacks.get(thread_id)
+
+        if current is not None and current[0] != key:
+            self._close(thread_id)
+            current = None
+
+        if current is None:
+            stack = self._open_stack(path, image, stack_shape, stack_axes, metadata)
+            current = (key, path, stack)
+            with self._lock:
+                self._open_stacks[thread_id] = current
+
+        stack = current[2]
+        if stack.shape[len(index) :] != image.shape or stack.dtype != image.dtype:
+            raise ValueError(
+                f"Image with shape={image.shape}, dtype={image.dtype} does not fit in stack at '{path}' with "
+                f"shape={stack.shape}, dtype={stack.dtype}"
+            )
+        stack[index] = image
+
+    def close_all(self):
+        with self._lock:
+            thread_ids = list(self._open_stacks.keys())
+        for thread_id in thread_ids:
+            self._close(thread_id)
+
+    def _close(self, thread_id: int):
+        with self._lock:
+            key, path, stack = self._open_stacks.pop(thread_id)
+        self._log.debug(f"Closing multi-page tiff for key={key} at '{path}'")
+        stack.flush()
+        del stack
+
+    def _open_stack(
+        self, path: str, image: np.ndarray, stack_shape: Tuple[int, ...], stack_axes: str, metadata: Optional[dict]
+    ) -> np.memmap:
+        if os.path.exists(path):
+            # This happens if a late frame comes in after we already moved on from this key.
+            self._log.debug(f"Re-opening existing multi-page tiff at '{path}'")
+            return tifffile.memmap(path, mode="r+")
+
+        is_rgb = image.ndim == 3
+        axes = stack_axes + ("YXS" if is_rgb else "YX")
+        # ImageJ only knows about multichannel images as separate grayscale channels, so only use it for rgb if
+        # there is a single channel.
+        use_imagej = image.dtype in MultiPageTiffWriterCache.IMAGEJ_DTYPES and not (
+            is_rgb and "C" in stack_axes and stack_shape[stack_axes.index("C")] > 1
+        )
+
+        self._log.debug(f"Creating multi-page tiff with axes={axes} at '{path}'")
+        if use_imagej:
+            ij_metadata = {"axes": axes}
+            if metadata:
+                ij_metadata["Properties"] = {str(k): str(v) for (k, v) in metadata.items()}
+            return tifffile.memmap(
+                path,
+                shape=tuple(stack_shape) + image.shape,
+                dtype=image.dtype,
+                imagej=True,
+                photometric="rgb" if is_rgb else "minisblack",
+                metadata=ij_metadata,
+            )
+        else:
+            return tifffile.memmap(
+                path,
+                shape=tuple(stack_shape) + image.shape,
+                dtype=image.dtype,
+                photometric="rgb" if is_rgb else "minisblack",
+                metadata={"axes": axes, **(metadata or {})},
+            )
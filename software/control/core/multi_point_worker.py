@@ -1,3 +1,5 @@
+import collections
+import math
 import os
 import threading
 import time
@@ -7,7 +9,6 @@ from datetime import datetime
 
 import cv2
 import imageio as iio
-import tifffile
 import numpy as np
 from numpy.typing import NDArray
 import pandas as pd
@@ -20,9 +21,14 @@ from PyQt5.QtWidgets import QApplication
 
 from control._def import *
 from control import utils, utils_acquisition
+from control.core.flatfield import FlatfieldCache, FlatfieldEstimator, flatfield_camera_settings
+from control.core.focus_tracking import OnlineFocusSurface
+from control.core.image_writer import ImageWriterPool, MultiPageTiffWriterCache
+from control.microcontroller import Microcontroller
 from control.piezo import PiezoStage
 from control.utils_config import ChannelMode
-from squid.abc import AbstractCamera, CameraFrame
+from squid.abc import AbstractCamera, CameraFrame, FrameOverflowPolicy
+from squid.stage.cephla import CephlaStage
 import squid.logging
 
 try:
@@ -44,9 +50,14 @@ class CaptureInfo:
     region_id: int
     fov: int
     configuration_idx: int
+    time_point: int
 
 
 class MultiPointWorker(QObject):
+    # For MULTIPOINT_FOCUS_TRACKING.  When moving z down to a predicted focus z during an xy move, stop this far below
+    # it so that the final move to it (once the xy move is done) comes from below, like the stage's own backlash
+    # compensation.
+    FOCUS_TRACKING_Z_UNDERSHOOT_MM = 0.005
 
     finished = Signal()
     image_to_display = Signal(np.ndarray)
@@ -118,8 +129,34 @@ class MultiPointWorker(QObject):
 
         self.count = 0
 
-        self.merged_image = None
-        self.image_count = 0
+        # Merged images are built up one channel at a time on the image writer threads, so keep them keyed by
+        # file id (and lock around them) instead of assuming only one fov is in flight at a time.
+        self._merged_images = {}
+        self._merged_images_lock = threading.Lock()
+
+        # Images are saved on background threads so that disk writes don't block the frame callback.  All images
+        # for a given fov go to the same writer thread so they are written in order.
+        self._image_writer = ImageWriterPool(
+            num_workers=MULTIPOINT_IMAGE_WRITER_THREADS,
+            max_queue_size=MULTIPOINT_IMAGE_WRITER_QUEUE_SIZE,
+            error_callback=self._on_image_writer_error,
+            name="MultiPointImageWriter",
+        )
+        # For FileSavingOption.MULTI_PAGE_TIFF, this keeps the stack for the current fov open across frames.
+        self._multi_page_tiff_writers = MultiPageTiffWriterCache()
+        # For FileSavingOption.OME_ZARR, this is created at the start of run()
+        self._ome_zarr_writer = None
+
+        # Coordinates of every image in the current time point.  See initialize_coordinates_dataframe.
+        self._coordinates: Optional[utils_acquisition.CoordinatesBuffer] = None
+        self._coordinates_csv_path: Optional[str] = None
+
+        # For MULTIPOINT_PIPELINED_ACQUISITION.  The fov after the one we're currently acquiring, the (x_mm, y_mm,
+        # timeout_s) of an xy move that has been started but not waited for, and a config that was already set
+        # while the stage was settling (so the next _select_config of it can be skipped).
+        self._next_coordinate_mm = None
+        self._pending_xy_move = None
+        self._preselected_config: Optional[ChannelMode] = None
 
         # This is for keeping track of whether or not we have the last image we tried to capture.
         # NOTE(imo): Once we do overlapping triggering, we'll want to keep a queue of images we are expecting.
@@ -136,6 +173,29 @@ class MultiPointWorker(QObject):
         # This is only touched via the image callback path.  Don't touch it outside of there!
         self._current_round_images = {}
 
+        # For MULTIPOINT_SEQUENCED_Z_STACK.  Whether this acquisition can use sequenced z stacks (decided at the
+        # start of run), and the capture infos of the frames a running z stack sequence will still send us in order.
+        # The event is set once all of the sequence's frames have come in.
+        self._use_sequenced_z_stack = False
+        self._sequenced_capture_infos = collections.deque()
+        self._sequenced_capture_infos_lock = threading.Lock()
+        self._sequenced_frames_received = threading.Event()
+        self._sequenced_frames_received.set()
+
+        # For MULTIPOINT_FLATFIELD.  Channel name -> its cached flatfield (or None if there isn't one), and channel
+        # name -> the (objective, camera settings, estimator) sampling the frames of each channel without one.  These
+        # are only touched via the image callback path, until the end of run.
+        self._flatfield_cache = FlatfieldCache(FLATFIELD_CACHE_DIR) if MULTIPOINT_FLATFIELD else None
+        self._flatfields = {}
+        self._flatfield_estimators = {}
+
+        # For MULTIPOINT_FOCUS_TRACKING.  The focus surface fit to every successful autofocus so far (or None if we
+        # aren't tracking focus), the predicted focus z of the fov we're moving to (or at) if we moved z to one, and
+        # whether that fov needs an autofocus (None if the surface wasn't used for it).
+        self._focus_surface = OnlineFocusSurface() if self._can_track_focus() else None
+        self._predicted_z_mm: Optional[float] = None
+        self._focus_tracking_af_due: Optional[bool] = None
+
     def update_use_piezo(self, value):
         self.use_piezo = value
         self._log.info(f"MultiPointWorker: updated use_piezo to {value}")
@@ -144,8 +204,15 @@ class MultiPointWorker(QObject):
         this_image_callback_id = None
         try:
             self.start_time = time.perf_counter_ns()
+            self._use_sequenced_z_stack = self._can_sequence_z_stack()
+            if FILE_SAVING_OPTION == FileSavingOption.OME_ZARR:
+                self._ome_zarr_writer = self._create_ome_zarr_writer()
             self.camera.start_streaming()
-            this_image_callback_id = self.camera.add_frame_callback(self._image_callback)
+            this_image_callback_id = self.camera.add_frame_callback(
+                self._image_callback,
+                max_queue_size=MULTIPOINT_FRAME_CALLBACK_QUEUE_SIZE,
+                overflow_policy=FrameOverflowPolicy.BLOCK,
+            )
 
             while self.time_point < self.Nt:
                 # check if abort acquisition has been requested
@@ -204,12 +271,44 @@ class MultiPointWorker(QObject):
             # We do this above, but there are some paths that skip the proper end of the acquisition so make
             # sure to always wait for final images here before removing our callback.
             self._wait_for_outstanding_callback_images()
-            self._log.debug(self._timing.get_report())
+            # Remove our callback before closing the writer, so a late frame can't be submitted to a closed writer.
             if this_image_callback_id:
+                self._log.debug(f"Image callback stats: {self.camera.get_frame_callback_stats(this_image_callback_id)}")
                 self.camera.remove_frame_callback(this_image_callback_id)
+            if self._image_writer.close(MULTIPOINT_IMAGE_WRITER_FLUSH_TIMEOUT_S):
+                self._multi_page_tiff_writers.close_all()
+            else:
+                self._log.error("Image writer threads did not finish, leaving their multi-page tiffs open.")
+            self._log.debug(self._timing.get_report())
+            if self._flatfield_cache is not None:
+                self._save_estimated_flatfields()
         if not self.headless:
             self.finished.emit()
 
+    def _create_ome_zarr_writer(self):
+        # Only import this here so that zarr is only needed if saving to OME-Zarr
+        from control.core.ome_zarr_writer import OmeZarrHcsWriter
+
+        return OmeZarrHcsWriter(
+            path=os.path.join(self.base_path, self.experiment_ID, "acquisition.ome.zarr"),
+            region_fov_counts={
+                region_id: len(coordinates) for (region_id, coordinates) in self.scan_region_fov_coords_mm.items()
+            },
+            channel_names=[config.name for config in self.selected_configurations],
+            nt=self.Nt,
+            nz=self.NZ,
+            pixel_size_um=self.objectiveStore.get_pixel_size_factor() * self.camera.get_pixel_size_binned_um(),
+            delta_z_um=self.deltaZ * 1000,
+            dt_s=self.dt,
+        )
+
+    def _write_coordinates(self, current_path) -> pd.DataFrame:
+        coordinates_pd = self.coordinates_pd
+        coordinates_pd.to_csv(os.path.join(current_path, "coordinates.csv"), index=False, header=True)
+        if self._ome_zarr_writer:
+            self._ome_zarr_writer.write_coordinates(self.time_point, coordinates_pd)
+        return coordinates_pd
+
     def _wait_for_outstanding_callback_images(self):
         # If there are outstanding frames, wait for them to come in.
         self._log.info("Waiting for any outstanding frames.")
@@ -223,6 +322,17 @@ class MultiPointWorker(QObject):
         self._ready_for_next_trigger.set()
         self._image_callback_idle.set()
 
+        self._log.info(f"Waiting for {self._image_writer.get_outstanding_count()} images to finish saving.")
+        if not self._image_writer.flush(MULTIPOINT_IMAGE_WRITER_FLUSH_TIMEOUT_S):
+            # The writer threads may still be writing into the open multi-page tiffs, so leave them open.
+            self._log.error("Timed out waiting for images to finish saving!")
+            return
+        self._multi_page_tiff_writers.close_all()
+
+    def _on_image_writer_error(self, e: Exception):
+        self._log.error(f"Failed to save image, aborting acquisition! Error: {e}")
+        self.multiPointController.request_abort_aquisition()
+
     def wait_till_operation_is_completed(self):
         self.microcontroller.wait_till_operation_is_completed()
 
@@ -238,8 +348,8 @@ class MultiPointWorker(QObject):
 
         slide_path = os.path.join(self.base_path, self.experiment_ID)
 
-        # create a dataframe to save coordinates
-        self.initialize_coordinates_dataframe()
+        # create a buffer to save coordinates
+        self.initialize_coordinates_dataframe(current_path)
 
         # init z parameters, z range
         self.initialize_z_stack()
@@ -248,17 +358,17 @@ class MultiPointWorker(QObject):
             self.run_coordinate_acquisition(current_path)
 
         # finished region scan
-        self.coordinates_pd.to_csv(os.path.join(current_path, "coordinates.csv"), index=False, header=True)
+        coordinates_pd = self._write_coordinates(current_path)
 
         # Emit the xyz data for plotting
-        if len(self.coordinates_pd) > 1:
-            x = self.coordinates_pd["x (mm)"].values
-            y = self.coordinates_pd["y (mm)"].values
+        if len(coordinates_pd) > 1:
+            x = coordinates_pd["x (mm)"].values
+            y = coordinates_pd["y (mm)"].values
 
             # When performing a z-stack (NZ > 1), only use the bottom z position for each (x,y) location
             if self.NZ > 1:
                 # Create a copy to avoid modifying the original dataframe
-                plot_df = self.coordinates_pd.copy()
+                plot_df = coordinates_pd.copy()
 
                 # Group by x, y, region and get the minimum z value for each group
                 if "z_piezo (um)" in plot_df.columns:
@@ -282,11 +392,11 @@ class MultiPointWorker(QObject):
                 region = plot_df["region"].values
             else:
                 # For single z acquisitions, use all points as before
-                if "z_piezo (um)" in self.coordinates_pd.columns:
-                    z = self.coordinates_pd["z (um)"].values + self.coordinates_pd["z_piezo (um)"].values
+                if "z_piezo (um)" in coordinates_pd.columns:
+                    z = coordinates_pd["z (um)"].values + coordinates_pd["z_piezo (um)"].values
                 else:
-                    z = self.coordinates_pd["z (um)"].values
-                region = self.coordinates_pd["region"].values
+                    z = coordinates_pd["z (um)"].values
+                region = coordinates_pd["region"].values
 
             x = np.array(x).astype(float)
             y = np.array(y).astype(float)
@@ -308,27 +418,57 @@ class MultiPointWorker(QObject):
 
         self.z_pos = self.stage.get_pos().z_mm  # zpos at the beginning of the scan
 
-    def initialize_coordinates_dataframe(self):
+    @property
+    def coordinates_pd(self) -> pd.DataFrame:
+        """
+        The coordinates captured so far in this time point.  This builds a new DataFrame on every access, so
+        grab it once instead of accessing it repeatedly.
+        """
+        return self._coordinates.to_dataframe()
+
+    @coordinates_pd.setter
+    def coordinates_pd(self, df: pd.DataFrame):
+        # For custom multipoint scripts that build up the DataFrame themselves.
+        self._coordinates = utils_acquisition.CoordinatesBuffer.from_dataframe(df)
+
+    def initialize_coordinates_dataframe(self, current_path: Optional[str] = None):
         base_columns = ["z_level", "x (mm)", "y (mm)", "z (um)", "time"]
         piezo_column = ["z_piezo (um)"] if self.use_piezo else []
-        self.coordinates_pd = pd.DataFrame(columns=["region", "fov"] + base_columns + piezo_column)
+        self._coordinates = utils_acquisition.CoordinatesBuffer(["region", "fov"] + base_columns + piezo_column)
+        # If we have a path, coordinates are periodically flushed here so they survive a crash mid acquisition.
+        self._coordinates_csv_path = os.path.join(current_path, "coordinates.csv") if current_path else None
 
     def update_coordinates_dataframe(self, region_id, z_level, pos: squid.abc.Pos, fov=None):
-        base_data = {
-            "z_level": [z_level],
-            "x (mm)": [pos.x_mm],
-            "y (mm)": [pos.y_mm],
-            "z (um)": [pos.z_mm * 1000],
-            "time": [datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")],
+        row = {
+            "region": region_id,
+            "fov": fov,
+            "z_level": z_level,
+            "x (mm)": pos.x_mm,
+            "y (mm)": pos.y_mm,
+            "z (um)": pos.z_mm * 1000,
+            "time": datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f"),
         }
-        piezo_data = {"z_piezo (um)": [self.z_piezo_um]} if self.use_piezo else {}
+        if self.use_piezo:
+            row["z_piezo (um)"] = self.z_piezo_um
 
-        new_row = pd.DataFrame({"region": [region_id], "fov": [fov], **base_data, **piezo_data})
+        self._coordinates.append(row)
 
-        self.coordinates_pd = pd.concat([self.coordinates_pd, new_row], ignore_index=True)
+        if (
+            self._coordinates_csv_path
+            and MULTIPOINT_COORDINATES_FLUSH_ROWS > 0
+            and self._coordinates.get_unflushed_row_count() >= MULTIPOINT_COORDINATES_FLUSH_ROWS
+        ):
+            self._coordinates.flush_csv(self._coordinates_csv_path)
 
     def move_to_coordinate(self, coordinate_mm):
         print("moving to coordinate", coordinate_mm)
+        if MULTIPOINT_PIPELINED_ACQUISITION:
+            self._move_to_coordinate_pipelined(coordinate_mm)
+            return
+
+        # Start moving z to the predicted focus first, so it moves while x and y do.
+        self._start_focus_prediction(coordinate_mm)
+
         x_mm = coordinate_mm[0]
         self.stage.move_x_to(x_mm)
         self._sleep(SCAN_STABILIZATION_TIME_MS_X / 1000)
@@ -341,6 +481,146 @@ class MultiPointWorker(QObject):
         if len(coordinate_mm) == 3:
             z_mm = coordinate_mm[2]
             self.move_to_z_level(z_mm)
+        elif self._predicted_z_mm is not None:
+            self.move_to_z_level(self._predicted_z_mm)
+
+    def start_xy_move(self, coordinate_mm):
+        """
+        Start moving x and y to coordinate_mm at the same time, without waiting for the move to finish.  The next
+        move_to_coordinate to the same coordinate only waits for this move instead of starting a new one.
+        """
+        x_mm = coordinate_mm[0]
+        y_mm = coordinate_mm[1]
+        current_pos = self.stage.get_pos()
+        stage_config = self.stage.get_config()
+        max_speed = min(stage_config.X_AXIS.MAX_SPEED, stage_config.Y_AXIS.MAX_SPEED)
+        distance_mm = max(abs(x_mm - current_pos.x_mm), abs(y_mm - current_pos.y_mm))
+        # Same idea as the stage's own move timeouts: give it 3x the "infinite acceleration" move time, but at least
+        # a few seconds.
+        timeout_s = max(3.0, 3 * distance_mm / max(max_speed, 0.1))
+
+        self.stage.move_x_to(x_mm, blocking=False)
+        self.stage.move_y_to(y_mm, blocking=False)
+        self._start_focus_prediction(coordinate_mm)
+        self._pending_xy_move = (x_mm, y_mm, timeout_s)
+
+    def _move_to_coordinate_pipelined(self, coordinate_mm):
+        x_mm = coordinate_mm[0]
+        y_mm = coordinate_mm[1]
+        if not self._pending_xy_move or self._pending_xy_move[:2] != (x_mm, y_mm):
+            self.start_xy_move(coordinate_mm)
+        timeout_s = self._pending_xy_move[2]
+        self._pending_xy_move = None
+
+        with self._timing.get_timer("wait_for_xy_move"):
+            self.stage.wait_for_idle(timeout_s)
+            if self.stage.get_state().busy:
+                raise TimeoutError(f"Move to x={x_mm} [mm], y={y_mm} [mm] did not finish within {timeout_s} [s].")
+
+        # Both axes moved together, so they settle together.  Use the settle time to get the microscope ready for
+        # the first image at this position.
+        settle_done_time = time.time() + max(SCAN_STABILIZATION_TIME_MS_X, SCAN_STABILIZATION_TIME_MS_Y) / 1000
+
+        # check if z is included in the coordinate
+        if len(coordinate_mm) == 3:
+            z_mm = coordinate_mm[2]
+            self.move_to_z_level(z_mm)
+        elif self._predicted_z_mm is not None:
+            self.move_to_z_level(self._predicted_z_mm)
+
+        first_config = self._get_first_config_at_position()
+        if first_config:
+            self._select_config(first_config)
+            self._preselected_config = first_config
+
+        self._sleep(max(0.0, settle_done_time - time.time()))
+
+    def _start_focus_prediction(self, coordinate_mm):
+        """
+        For MULTIPOINT_FOCUS_TRACKING, predict the focus z at coordinate_mm from the focus surface, decide whether the
+        fov there needs an autofocus, and start moving z to the prediction without waiting for the move to finish.
+        The caller must move z to self._predicted_z_mm (if it isn't None) once the xy move is done.
+        """
+        self._predicted_z_mm = None
+        self._focus_tracking_af_due = None
+        if self._focus_surface is None or len(coordinate_mm) == 3:
+            return
+
+        prediction = self._focus_surface.predict(coordinate_mm[0], coordinate_mm[1])
+        if prediction is None:
+            self._focus_tracking_af_due = True
+            return
+        z_mm, std_mm = prediction
+        self._focus_tracking_af_due = std_mm * 1000 > MULTIPOINT_FOCUS_TRACKING_MAX_UNCERTAINTY_UM
+        self._predicted_z_mm = z_mm
+        self._log.debug(
+            f"Predicted focus z={z_mm} [mm] (std={std_mm * 1000:.2f} [um]) at x={coordinate_mm[0]} [mm], "
+            f"y={coordinate_mm[1]} [mm], autofocus due={self._focus_tracking_af_due}"
+        )
+
+        premove_z_mm = z_mm
+        if premove_z_mm < self.stage.get_pos().z_mm:
+            premove_z_mm -= MultiPointWorker.FOCUS_TRACKING_Z_UNDERSHOOT_MM
+        self.stage.move_z_to(premove_z_mm, blocking=False)
+
+    def _add_focus_point(self):
+        """
+        For MULTIPOINT_FOCUS_TRACKING, add the current position to the focus surface after a successful autofocus.
+        """
+        if self._focus_surface is None:
+            return
+        pos = self.stage.get_pos()
+        error_mm = self._focus_surface.add_point(pos.x_mm, pos.y_mm, pos.z_mm)
+        if error_mm is not None:
+            self._log.debug(
+                f"Focus surface prediction was off by {error_mm * 1000:.2f} [um] at x={pos.x_mm} [mm], y={pos.y_mm} [mm]"
+            )
+
+    def _can_track_focus(self) -> bool:
+        if not MULTIPOINT_FOCUS_TRACKING or not (self.do_autofocus or self.do_reflection_af):
+            return False
+
+        reason = None
+        if self.use_piezo:
+            reason = "z stacks use the piezo"
+        elif (
+            self.do_reflection_af
+            and self.microscope
+            and self.microscope.laserAutofocusController
+            and self.microscope.laserAutofocusController.piezo is not None
+        ):
+            reason = "laser af moves the piezo, not the stage"
+        elif RUN_CUSTOM_MULTIPOINT and "multipoint_custom_script_entry" in globals():
+            reason = "a custom multipoint script is in use"
+
+        if reason:
+            self._log.warning(f"Not tracking focus since {reason}.")
+            return False
+        return True
+
+    def _autofocus_due(self) -> bool:
+        if self._focus_tracking_af_due is not None:
+            return self._focus_tracking_af_due
+        return self.af_fov_count % Acquisition.NUMBER_OF_FOVS_PER_AF == 0
+
+    def _get_first_config_at_position(self) -> Optional[ChannelMode]:
+        """
+        Returns the config that acquire_at_position will select first via _select_config at the next position, or
+        None if we can't know that ahead of time.
+        """
+        if RUN_CUSTOM_MULTIPOINT and "multipoint_custom_script_entry" in globals():
+            return None
+        if not self.selected_configurations:
+            return None
+        first_config = self.selected_configurations[0]
+        if "USB Spectrometer" in first_config.name or "RGB" in first_config.name:
+            return None
+        if self._will_do_contrast_autofocus():
+            configuration_name_AF = MULTIPOINT_AUTOFOCUS_CHANNEL
+            return self.channelConfigurationManager.get_channel_configuration_by_name(
+                self.objectiveStore.current_objective, configuration_name_AF
+            )
+        return first_config
 
     def move_to_z_level(self, z_mm):
         print("moving z")
@@ -350,6 +630,12 @@ class MultiPointWorker(QObject):
     def run_coordinate_acquisition(self, current_path):
         n_regions = len(self.scan_region_coords_mm)
 
+        # A flat list of every fov's coordinate, so that pipelined acquisition can find the one after the current fov
+        all_coordinates_mm = [
+            coordinate_mm for coordinates in self.scan_region_fov_coords_mm.values() for coordinate_mm in coordinates
+        ]
+        coordinate_index = 0
+
         for region_index, (region_id, coordinates) in enumerate(self.scan_region_fov_coords_mm.items()):
 
             self.signal_acquisition_progress.emit(region_index + 1, n_regions, self.time_point)
@@ -358,6 +644,10 @@ class MultiPointWorker(QObject):
             self.total_scans = self.num_fovs * self.NZ * len(self.selected_configurations)
 
             for fov_count, coordinate_mm in enumerate(coordinates):
+                coordinate_index += 1
+                self._next_coordinate_mm = (
+                    all_coordinates_mm[coordinate_index] if coordinate_index < len(all_coordinates_mm) else None
+                )
                 with self._timing.get_timer("move_to_coordinate"):
                     self.move_to_coordinate(coordinate_mm)
                 with self._timing.get_timer("acquire_at_position"):
@@ -384,6 +674,11 @@ class MultiPointWorker(QObject):
         if self.use_piezo:
             self.z_piezo_um = self.piezo.position
 
+        if self._use_sequenced_z_stack:
+            self.acquire_z_stack_sequenced(region_id, current_path, fov)
+            self.move_z_back_after_stack()
+            return
+
         for z_level in range(self.NZ):
             file_ID = f"{region_id}_{fov:0{FILE_ID_PADDING}}_{z_level:0{FILE_ID_PADDING}}"
 
@@ -428,6 +723,11 @@ class MultiPointWorker(QObject):
                 )
                 self.signal_region_progress.emit(current_image, self.total_scans)
 
+            # All the exposures at this position are done, so in pipelined mode we can start moving to the next one
+            # while we finish up here.
+            if MULTIPOINT_PIPELINED_ACQUISITION and self.NZ == 1 and self._next_coordinate_mm is not None:
+                self.start_xy_move(self._next_coordinate_mm)
+
             # updates coordinates df
             self.update_coordinates_dataframe(region_id, z_level, acquire_pos, fov)
             self.signal_register_current_fov.emit(acquire_pos.x_mm, acquire_pos.y_mm)
@@ -446,32 +746,45 @@ class MultiPointWorker(QObject):
             self.move_z_back_after_stack()
 
     def _select_config(self, config: ChannelMode):
+        preselected_config = self._preselected_config
+        self._preselected_config = None
+        if config is preselected_config and self.liveController.currentConfiguration is config:
+            return
+
         self.signal_current_configuration.emit(config)
         self.liveController.set_microscope_mode(config)
         self.wait_till_operation_is_completed()
 
+    def _will_do_contrast_autofocus(self):
+        # contrast-based AF; perform AF only if when not taking z stack or doing z stack from center
+        return (
+            not self.do_reflection_af
+            and ((self.NZ == 1) or self.z_stacking_config == "FROM CENTER")
+            and (self.do_autofocus)
+            and self._autofocus_due()
+        )
+
     def perform_autofocus(self, region_id, fov):
         if not self.do_reflection_af:
-            # contrast-based AF; perform AF only if when not taking z stack or doing z stack from center
-            if (
-                ((self.NZ == 1) or self.z_stacking_config == "FROM CENTER")
-                and (self.do_autofocus)
-                and (self.af_fov_count % Acquisition.NUMBER_OF_FOVS_PER_AF == 0)
-            ):
+            if self._will_do_contrast_autofocus():
                 configuration_name_AF = MULTIPOINT_AUTOFOCUS_CHANNEL
                 config_AF = self.channelConfigurationManager.get_channel_configuration_by_name(
                     self.objectiveStore.current_objective, configuration_name_AF
                 )
                 self._select_config(config_AF)
-                if (
-                    self.af_fov_count % Acquisition.NUMBER_OF_FOVS_PER_AF == 0
-                ) or self.autofocusController.use_focus_map:
+                if self._autofocus_due() or self.autofocusController.use_focus_map:
                     self.autofocusController.autofocus()
                     self.autofocusController.wait_till_autofocus_has_completed()
+                    # With a focus map, autofocus() only moves to the map's z, so there is nothing new to learn.
+                    if not self.autofocusController.use_focus_map:
+                        self._add_focus_point()
+        elif self._focus_tracking_af_due is False:
+            self._log.info("skipping laser reflection af, the focus surface prediction is good enough")
         else:
             self._log.info("laser reflection af")
             try:
-                self.microscope.laserAutofocusController.move_to_target(0)
+                if self.microscope.laserAutofocusController.move_to_target(0):
+                    self._add_focus_point()
             except Exception as e:
                 file_ID = f"{region_id}_focus_camera.bmp"
                 saving_path = os.path.join(self.base_path, self.experiment_ID, str(self.time_point), file_ID)
@@ -504,10 +817,22 @@ class MultiPointWorker(QObject):
             self._image_callback_idle.clear()
             with self._timing.get_timer("_image_callback"):
                 self._log.debug(f"In Image callback for frame_id={camera_frame.frame_id}")
-                info = self._current_capture_info
-                self._current_capture_info = None
-
-                self._ready_for_next_trigger.set()
+                with self._sequenced_capture_infos_lock:
+                    if self._sequenced_capture_infos:
+                        info = self._sequenced_capture_infos.popleft()
+                        if not self._sequenced_capture_infos:
+                            self._sequenced_frames_received.set()
+                    else:
+                        info = self._current_capture_info
+                        self._current_capture_info = None
+
+                        self._ready_for_next_trigger.set()
+                        if info:
+                            # The exposure is over by now, so we can use the stage position from the middle of it
+                            # instead of the position from before the trigger.
+                            info.position = self.stage.get_pos_at(
+                                info.capture_time + info.configuration.exposure_time / 2000
+                            )
                 if not info:
                     self._log.error("In image callback, no current capture info! Something is wrong. Aborting.")
                     self.multiPointController.request_abort_aquisition()
@@ -519,24 +844,88 @@ class MultiPointWorker(QObject):
                     self.multiPointController.request_abort_aquisition()
                     return
 
+                # Only what is displayed gets flatfield corrected, the saved images stay raw.
+                display_image = image
+                if self._flatfield_cache is not None and len(image.shape) == 2:
+                    with self._timing.get_timer("flatfield"):
+                        display_image = self._flatfield_correct_for_display(image, info.configuration.name)
+                # A corrected image is a new array, so it isn't tied to a pooled frame.
+                display_is_pooled = camera_frame.is_pooled() and display_image is image
+
                 height, width = image.shape[:2]
                 with self._timing.get_timer("crop_image"):
                     image_to_display = utils.crop_image(
-                        image,
+                        display_image,
                         round(width * self.display_resolution_scaling),
                         round(height * self.display_resolution_scaling),
                     )
+                    # The display can't release pooled frames, so it gets its own copy.
+                    if display_is_pooled:
+                        image_to_display = image_to_display.copy()
                 with self._timing.get_timer("image_to_display*.emit"):
                     self.image_to_display.emit(image_to_display)
                     self.image_to_display_multi.emit(image_to_display, info.configuration.illumination_source)
 
-                with self._timing.get_timer("save_image"):
-                    self.save_image(image, info, camera_frame.is_color())
+                # This only blocks if the writer queue is full, aka the disk is not keeping up.
+                with self._timing.get_timer("enqueue_save_image"):
+                    # The writer holds on to the frame, so it keeps a reference until the image is saved.
+                    camera_frame.retain()
+                    try:
+                        self._image_writer.submit(
+                            (info.region_id, info.fov), self._save_frame_timed, camera_frame, info
+                        )
+                    except Exception:
+                        camera_frame.release()
+                        raise
                 with self._timing.get_timer("update_napari"):
-                    self.update_napari(image, info)
+                    self.update_napari(display_image, info, copy=display_is_pooled)
         finally:
             self._image_callback_idle.set()
 
+    def _flatfield_correct_for_display(self, image: np.ndarray, channel_name: str) -> np.ndarray:
+        """
+        Returns image corrected with the channel's cached flatfield.  For channels without one, the image is added to
+        the channel's flatfield sample instead (see _save_estimated_flatfields), and returned as is.
+        """
+        if channel_name not in self._flatfields:
+            objective = self.objectiveStore.current_objective
+            camera_settings = flatfield_camera_settings(self.camera.get_pixel_size_binned_um(), image.shape)
+            flatfield = self._flatfield_cache.get(objective, channel_name, camera_settings)
+            self._flatfields[channel_name] = flatfield
+            if flatfield is None:
+                self._log.info(f"No cached flatfield for {channel_name}, sampling its images to estimate one.")
+                self._flatfield_estimators[channel_name] = (
+                    objective,
+                    camera_settings,
+                    FlatfieldEstimator(FLATFIELD_NUM_SAMPLES),
+                )
+
+        flatfield = self._flatfields[channel_name]
+        if flatfield is None:
+            self._flatfield_estimators[channel_name][2].add(image)
+            return image
+        corrected = image / flatfield
+        if np.issubdtype(image.dtype, np.integer):
+            corrected = corrected.clip(0, np.iinfo(image.dtype).max)
+        return corrected.astype(image.dtype)
+
+    def _save_estimated_flatfields(self):
+        """
+        Estimate the flatfields of the channels sampled during the acquisition, and cache them for later acquisitions
+        and stitching.  Channels with fewer than FLATFIELD_NUM_SAMPLES images are skipped.
+        """
+        for channel_name, (objective, camera_settings, estimator) in self._flatfield_estimators.items():
+            sample_count = estimator.get_sample_count()
+            if sample_count < FLATFIELD_NUM_SAMPLES:
+                self._log.info(f"Only {sample_count} images of {channel_name}, not estimating its flatfield.")
+                continue
+            try:
+                flatfield = estimator.estimate()
+                self._flatfield_cache.put(objective, channel_name, camera_settings, flatfield)
+            except Exception:
+                self._log.exception(f"Couldn't estimate the flatfield of {channel_name}")
+        self._flatfield_estimators = {}
+
     def _frame_wait_timeout_s(self):
         return (self.camera.get_total_frame_time() / 1e3) + 10
 
@@ -573,6 +962,7 @@ class MultiPointWorker(QObject):
         # NOTE(imo): One level up from acquire_camera_image, we have acquire_pos.  We're careful to use that as
         # much as we can, but don't use it here because we'd rather take the position as close as possible to the
         # real capture time for the image info.  Ideally we'd use this position for the caller's acquire_pos as well.
+        # The image callback replaces this with the stage's position history at the middle of the exposure.
         current_capture_info = CaptureInfo(
             position=self.stage.get_pos(),
             z_index=k,
@@ -583,6 +973,7 @@ class MultiPointWorker(QObject):
             region_id=region_id,
             fov=fov,
             configuration_idx=config_idx,
+            time_point=self.time_point,
         )
         self._current_capture_info = current_capture_info
         self.camera.send_trigger(illumination_time=camera_illumination_time)
@@ -598,6 +989,152 @@ class MultiPointWorker(QObject):
         if not self.headless:
             QApplication.processEvents()
 
+    def _can_sequence_z_stack(self) -> bool:
+        if not MULTIPOINT_SEQUENCED_Z_STACK or self.NZ <= 1:
+            return False
+
+        reason = None
+        if self.liveController.trigger_mode != TriggerMode.HARDWARE:
+            reason = "it needs hardware triggering"
+        elif ENABLE_NL5 and NL5_USE_DOUT:
+            reason = "the NL5 triggers the camera"
+        elif not self.use_piezo and not isinstance(self.stage, CephlaStage):
+            reason = "the z stage is not driven by the microcontroller"
+        elif self._z_stack_sequence_settle_time_ms() > Microcontroller.MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS:
+            reason = (
+                f"its settle time of {self._z_stack_sequence_settle_time_ms()} [ms] is more than the microcontroller "
+                f"supports ({Microcontroller.MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS} [ms])"
+            )
+        elif RUN_CUSTOM_MULTIPOINT and "multipoint_custom_script_entry" in globals():
+            reason = "a custom multipoint script is in use"
+        elif any("RGB" in config.name or "USB Spectrometer" in config.name for config in self.selected_configurations):
+            reason = "RGB and spectrometer channels need per plane acquisition"
+        elif (
+            self.microscope.laserAutofocusController and self.microscope.laserAutofocusController.characterization_mode
+        ):
+            reason = "laser af characterization mode needs per plane acquisition"
+
+        if reason:
+            self._log.warning(f"Not using sequenced z stacks since {reason}.")
+            return False
+        return True
+
+    def _z_stack_sequence_settle_time_ms(self):
+        if self.use_piezo:
+            # For per plane hardware triggering the piezo settles while we wait on the round trip to the
+            # microcontroller, but here the trigger follows right after the move.
+            return MULTIPOINT_PIEZO_DELAY_MS
+        return SCAN_STABILIZATION_TIME_MS_Z
+
+    def acquire_z_stack_sequenced(self, region_id, current_path, fov):
+        """
+        Acquire the z stack at this fov by having the microcontroller step through it and trigger the camera at each
+        plane.  Since the camera exposure can't change mid sequence, each channel gets its own pass through the
+        stack.  The stack starts at the current position and, like the per plane loop, ends at its top plane.
+        """
+        start_pos = self.stage.get_pos()
+        start_z_piezo_um = self.z_piezo_um if self.use_piezo else None
+        n_configs = len(self.selected_configurations)
+
+        def plane_pos(z_level) -> squid.abc.Pos:
+            # The piezo moves the objective, so for piezo stacks the stage stays put.
+            return squid.abc.Pos(
+                x_mm=start_pos.x_mm,
+                y_mm=start_pos.y_mm,
+                z_mm=start_pos.z_mm if self.use_piezo else start_pos.z_mm + z_level * self.deltaZ,
+                theta_rad=start_pos.theta_rad,
+            )
+
+        for config_idx, config in enumerate(self.selected_configurations):
+            if config_idx > 0:
+                # Go back to the bottom of the stack for this channel's pass.
+                if self.use_piezo:
+                    self.piezo.move_to(start_z_piezo_um)
+                else:
+                    self.stage.move_z_to(start_pos.z_mm)
+                    self._sleep(SCAN_STABILIZATION_TIME_MS_Z / 1000)
+
+            capture_infos = [
+                CaptureInfo(
+                    position=plane_pos(z_level),
+                    z_index=z_level,
+                    capture_time=time.time(),
+                    configuration=config,
+                    save_directory=current_path,
+                    file_id=f"{region_id}_{fov:0{FILE_ID_PADDING}}_{z_level:0{FILE_ID_PADDING}}",
+                    region_id=region_id,
+                    fov=fov,
+                    configuration_idx=config_idx,
+                    time_point=self.time_point,
+                )
+                for z_level in range(self.NZ)
+            ]
+            with self._timing.get_timer("acquire_z_stack_sequence"):
+                if not self._run_z_stack_sequence(config, capture_infos):
+                    break
+
+            self.signal_region_progress.emit(
+                (fov * self.NZ + self.NZ - 1) * n_configs + config_idx + 1, self.total_scans
+            )
+
+        for z_level in range(self.NZ):
+            pos = plane_pos(z_level)
+            if self.use_piezo:
+                self.z_piezo_um = start_z_piezo_um + z_level * self.deltaZ * 1000
+            self.update_coordinates_dataframe(region_id, z_level, pos, fov)
+            self.signal_register_current_fov.emit(pos.x_mm, pos.y_mm)
+            self.af_fov_count = self.af_fov_count + 1
+
+        if self.multiPointController.abort_acqusition_requested:
+            self.handle_acquisition_abort(current_path, region_id)
+
+    def _run_z_stack_sequence(self, config: ChannelMode, capture_infos: List[CaptureInfo]) -> bool:
+        self._select_config(config)
+
+        # Any frames from the last non sequenced trigger need to be in before we queue up the sequence's frames.
+        if not self._ready_for_next_trigger.wait(self._frame_wait_timeout_s()):
+            self._log.error("Frame callback never set _have_last_triggered_image callback! Aborting acquisition.")
+            self.multiPointController.request_abort_aquisition()
+            return False
+
+        if self.use_piezo:
+            self.microcontroller.set_z_stack_sequence_piezo_step_um(self.deltaZ * 1000)
+        else:
+            self.microcontroller.set_z_stack_sequence(self.stage.z_mm_to_usteps(self.deltaZ))
+        settle_time_ms = self._z_stack_sequence_settle_time_ms()
+        self.wait_till_operation_is_completed()
+        self.microcontroller.set_z_stack_sequence_trigger(
+            control_illumination=True, illumination_on_time_us=1000 * self.camera.get_exposure_time()
+        )
+        self.wait_till_operation_is_completed()
+
+        with self._sequenced_capture_infos_lock:
+            self._sequenced_capture_infos.extend(capture_infos)
+            self._sequenced_frames_received.clear()
+
+        frame_time_ms = math.ceil(self.camera.get_total_frame_time())
+        self.microcontroller.start_z_stack_sequence(self.NZ, settle_time_ms, frame_time_ms)
+        # The sequence command only completes once the last plane's frame time is over.  Give it plenty of time for
+        # the moves between planes on top of that.
+        plane_time_s = (settle_time_ms + frame_time_ms) / 1000
+        self.microcontroller.wait_till_operation_is_completed(timeout_limit_s=self.NZ * (plane_time_s + 1) + 5)
+
+        frames_received = self._sequenced_frames_received.wait(self._frame_wait_timeout_s())
+        with self._sequenced_capture_infos_lock:
+            missing_frames = len(self._sequenced_capture_infos)
+            self._sequenced_capture_infos.clear()
+            self._sequenced_frames_received.set()
+        if not frames_received:
+            self._log.error(
+                f"Only got {self.NZ - missing_frames} of {self.NZ} frames for z stack sequence! Aborting acquisition."
+            )
+            self.multiPointController.request_abort_aquisition()
+            return False
+
+        if not self.headless:
+            QApplication.processEvents()
+        return True
+
     def _sleep(self, sec):
         self._log.info(f"Sleeping for {sec} [s]")
         self.thread().usleep(max(1, round(sec * 1e6)))
@@ -656,15 +1193,27 @@ class MultiPointWorker(QObject):
                 )
                 np.savetxt(saving_path, data, delimiter=",")
 
+    def _save_frame_timed(self, camera_frame: CameraFrame, info: CaptureInfo):
+        try:
+            self._save_image_timed(camera_frame.frame, info, camera_frame.is_color())
+        finally:
+            camera_frame.release()
+
+    def _save_image_timed(self, image: np.array, info: CaptureInfo, is_color: bool):
+        # Timers are not thread safe, so each writer thread gets its own.
+        with self._timing.get_timer(f"save_image ({threading.current_thread().name})"):
+            self.save_image(image, info, is_color)
+
     def save_image(self, image: np.array, info: CaptureInfo, is_color: bool):
         # NOTE(imo): We silently fall back to individual image saving here.  We should warn or do something.
         if FILE_SAVING_OPTION == FileSavingOption.MULTI_PAGE_TIFF:
+            # The per image positions are in coordinates.csv.  Here we only record what is constant for the fov,
+            # since the stack metadata is written once when the first image of the fov comes in.
             metadata = {
-                "z_level": info.z_index,
-                "channel": info.configuration.name,
-                "channel_index": info.configuration_idx,
                 "region_id": info.region_id,
                 "fov": info.fov,
+                "channels": ",".join(config.name for config in self.selected_configurations),
+                "delta_z_um": self.deltaZ * 1000,
                 "x_mm": info.position.x_mm,
                 "y_mm": info.position.y_mm,
                 "z_mm": info.position.z_mm,
@@ -672,8 +1221,24 @@ class MultiPointWorker(QObject):
             output_path = os.path.join(
                 info.save_directory, f"{info.region_id}_{info.fov:0{FILE_ID_PADDING}}_stack.tiff"
             )
-            with tifffile.TiffWriter(output_path, append=True) as tiff_writer:
-                tiff_writer.write(image, metadata=metadata)
+            self._multi_page_tiff_writers.write(
+                key=(info.save_directory, info.region_id, info.fov),
+                path=output_path,
+                image=image,
+                index=(info.z_index, info.configuration_idx),
+                stack_shape=(self.NZ, len(self.selected_configurations)),
+                stack_axes="ZC",
+                metadata=metadata,
+            )
+        elif FILE_SAVING_OPTION == FileSavingOption.OME_ZARR:
+            self._ome_zarr_writer.write(
+                image,
+                time_point=info.time_point,
+                region_id=info.region_id,
+                fov=info.fov,
+                channel_index=info.configuration_idx,
+                z_index=info.z_index,
+            )
         else:
             saved_image = utils_acquisition.save_image(
                 image=image,
@@ -687,26 +1252,33 @@ class MultiPointWorker(QObject):
                 self._save_merged_image(saved_image, info.file_id, info.save_directory)
 
     def _save_merged_image(self, image: np.array, file_ID: str, current_path: str):
-        self.image_count += 1
+        with self._merged_images_lock:
+            merged_image, image_count = self._merged_images.get(file_ID, (None, 0))
+            image_count += 1
 
-        if self.image_count == 1:
-            self.merged_image = image
-        else:
-            self.merged_image = np.maximum(self.merged_image, image)
+            if image_count == 1:
+                # Images can be views of pooled camera frames that get reused, so keep our own copy.
+                merged_image = image.copy()
+            else:
+                merged_image = np.maximum(merged_image, image)
 
-            if self.image_count == len(self.selected_configurations):
-                if image.dtype == np.uint16:
-                    saving_path = os.path.join(current_path, file_ID + "_merged" + ".tiff")
-                else:
-                    saving_path = os.path.join(current_path, file_ID + "_merged" + "." + Acquisition.IMAGE_FORMAT)
+            if image_count >= len(self.selected_configurations):
+                self._merged_images.pop(file_ID, None)
+            else:
+                self._merged_images[file_ID] = (merged_image, image_count)
+                return
 
-                iio.imwrite(saving_path, self.merged_image)
-                self.image_count = 0
+        if image.dtype == np.uint16:
+            saving_path = os.path.join(current_path, file_ID + "_merged" + ".tiff")
+        else:
+            saving_path = os.path.join(current_path, file_ID + "_merged" + "." + Acquisition.IMAGE_FORMAT)
 
-        return
+        iio.imwrite(saving_path, merged_image)
 
-    def update_napari(self, image, capture_info: CaptureInfo):
+    def update_napari(self, image, capture_info: CaptureInfo, copy: bool = False):
         if not self.performance_mode and (USE_NAPARI_FOR_MOSAIC_DISPLAY or USE_NAPARI_FOR_MULTIPOINT):
+            if copy:
+                image = image.copy()
 
             if not self.init_napari_layers:
                 print("init napari layers")
@@ -808,7 +1380,7 @@ class MultiPointWorker(QObject):
         self.move_to_coordinate(region_center)
 
         # Save coordinates.csv
-        self.coordinates_pd.to_csv(os.path.join(current_path, "coordinates.csv"), index=False, header=True)
+        self._write_coordinates(current_path)
         self.microcontroller.enable_joystick(True)
 
         self._wait_for_outstanding_callback_images()
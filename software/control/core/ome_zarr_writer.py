@@ -0,0 +1,147 @@
+"""
+Streams acquisition images directly into a single OME-Zarr store using the HCS plate layout.
+
+Each region of the acquisition becomes a well (wellplate region ids like "B12" map to row "B", column "12"), and each
+fov in the region is a field of that well.  Each field is a single resolution tczyx image chunked per plane, so every
+frame is written exactly once without any post acquisition conversion.
+"""
+
+import json
+import re
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import zarr
+import ome_zarr.writer
+
+import squid.logging
+
+
+class OmeZarrHcsWriter:
+    _WELL_ID_REGEX = re.compile(r"^([A-Za-z]+)(\d+)$")
+    # Each time point's coordinates table goes in the attributes of its own group under this one.
+    COORDINATES_GROUP = "squid/coordinates"
+
+    def __init__(
+        self,
+        path: str,
+        region_fov_counts: Dict[str, int],
+        channel_names: Sequence[str],
+        nt: int,
+        nz: int,
+        pixel_size_um: float,
+        delta_z_um: float,
+        dt_s: float,
+    ):
+        """
+        region_fov_counts is the number of fovs in each region (in acquisition order), which is needed up front
+        for writing the plate and well metadata.  The field arrays are created when their first image comes in,
+        since that's the first time we know the image shape and dtype.
+        """
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._path = path
+        self._channel_names = list(channel_names)
+        self._nt = nt
+        self._nz = nz
+        self._scale = [
+            dt_s if dt_s > 0 else 1.0,
+            1.0,
+            delta_z_um if delta_z_um != 0 else 1.0,
+            pixel_size_um,
+            pixel_size_um,
+        ]
+        # Protects all zarr metadata/group/array creation.  Writing image data into existing arrays doesn't need
+        # it because every plane is its own chunk.
+        self._lock = threading.Lock()
+        self._field_arrays: Dict[Tuple[str, int], zarr.Array] = {}
+
+        self._well_paths: Dict[str, str] = OmeZarrHcsWriter.get_well_paths(list(region_fov_counts.keys()))
+        rows = sorted({p.split("/")[0] for p in self._well_paths.values()}, key=lambda r: (len(r), r))
+        columns = sorted({p.split("/")[1] for p in self._well_paths.values()}, key=lambda c: (len(c), c))
+
+        self._log.info(f"Creating OME-Zarr HCS store with {len(self._well_paths)} wells at '{path}'")
+        self._root = zarr.open_group(path, mode="w")
+        ome_zarr.writer.write_plate_metadata(self._root, rows, columns, list(self._well_paths.values()))
+        for region_id, fov_count in region_fov_counts.items():
+            well_group = self._require_group(self._well_paths[region_id])
+            ome_zarr.writer.write_well_metadata(well_group, [str(fov) for fov in range(fov_count)])
+
+        self._root.attrs["squid"] = {
+            "channels": self._channel_names,
+            "regions": self._well_paths,
+            "coordinates": OmeZarrHcsWriter.COORDINATES_GROUP,
+        }
+
+    @staticmethod
+    def get_well_paths(region_ids: List[str]) -> Dict[str, str]:
+        """
+        Returns region id -> "row/column" well path.  Wellplate style ids (eg: "A1") use their row and column,
+        all other regions get a row of their own ("R0", "R1", ...) in column "0".
+        """
+        well_paths = {}
+        for idx, region_id in enumerate(region_ids):
+            match = OmeZarrHcsWriter._WELL_ID_REGEX.match(str(region_id))
+            if match:
+                well_paths[region_id] = f"{match.group(1).upper()}/{int(match.group(2))}"
+            else:
+                well_paths[region_id] = f"R{idx}/0"
+
+        if len(set(well_paths.values())) != len(well_paths):
+            # Mixed id styles can collide (eg: "A1" and "a1"), so fall back to one row per region.
+            well_paths = {region_id: f"R{idx}/0" for (idx, region_id) in enumerate(region_ids)}
+
+        return well_paths
+
+    def write(self, image: np.ndarray, time_point: int, region_id: str, fov: int, channel_index: int, z_index: int):
+        if image.ndim != 2:
+            raise ValueError(f"OME-Zarr saving only supports single channel images, but got shape={image.shape}")
+
+        field_array = self._get_field_array(region_id, fov, image)
+        if field_array.shape[3:] != image.shape or field_array.dtype != image.dtype:
+            raise ValueError(
+                f"Image with shape={image.shape}, dtype={image.dtype} does not match field array with "
+                f"shape={field_array.shape}, dtype={field_array.dtype} for {region_id=}, {fov=}"
+            )
+        field_array[time_point, channel_index, z_index] = image
+
+    def write_coordinates(self, time_point: int, coordinates: pd.DataFrame):
+        """
+        Store the coordinates table for this time point (the same data as its coordinates.csv) in the attributes
+        of the COORDINATES_GROUP/<time_point> group, so that each time point only ever writes its own table.
+        """
+        # Round trip through json so that numpy scalar types and NaNs become plain json values.
+        table = json.loads(coordinates.to_json(orient="split", index=False))
+        with self._lock:
+            time_point_group = self._require_group(f"{OmeZarrHcsWriter.COORDINATES_GROUP}/{time_point}")
+            time_point_group.attrs["coordinates"] = table
+
+    def _require_group(self, group_path: str):
+        group = self._root
+        for part in group_path.split("/"):
+            group = group.require_group(part)
+        return group
+
+    def _get_field_array(self, region_id: str, fov: int, image: np.ndarray) -> zarr.Array:
+        key = (region_id, fov)
+        field_array = self._field_arrays.get(key)
+        if field_array is not None:
+            return field_array
+
+        with self._lock:
+            if key not in self._field_arrays:
+                field_group = self._require_group(f"{self._well_paths[region_id]}/{fov}")
+                height, width = image.shape
+                self._field_arrays[key] = field_group.zeros(
+                    name="0",
+                    shape=(self._nt, len(self._channel_names), self._nz, height, width),
+                    chunks=(1, 1, 1, height, width),
+                    dtype=image.dtype,
+                )
+                ome_zarr.writer.write_multiscales_metadata(
+                    field_group,
+                    [{"path": "0", "coordinateTransformations": [{"type": "scale", "scale": self._scale}]}],
+                    axes="tczyx",
+                )
+            return self._field_arrays[key]
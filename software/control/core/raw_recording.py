@@ -0,0 +1,291 @@
+"""
+Raw continuous recording, for recording at full camera frame rate.
+
+Writing one image file per frame (what ImageSaver does) can't keep up with fast cameras.  Instead, a raw recording
+copies frames, as is, into large preallocated memory-mapped chunk files and appends a small fixed size record
+(frame_id, timestamp, chunk, offset) per frame to an index file.  The os writes the mapped pages back to disk in the
+background, so recording a frame costs about one memcpy.
+
+A raw recording directory looks like:
+    recording.json      the frame shape and dtype, plus the chunk layout
+    index.bin           one RAW_RECORDING_INDEX_DTYPE record per frame, in recording order
+    chunk_00000.raw     frames_per_chunk frames back to back, then chunk_00001.raw, etc
+
+Use RawRecording to read one back, or convert_raw_recording to turn it into a tiff stack or zarr array afterwards.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Iterator, Optional
+
+import numpy as np
+
+import squid.logging
+from control.core.stream_metrics import FrameStreamMetrics
+from squid.abc import AbstractCamera, CameraFrame, FrameOverflowPolicy
+
+RAW_RECORDING_FORMAT_VERSION = 1
+RAW_RECORDING_METADATA_FILE = "recording.json"
+RAW_RECORDING_INDEX_FILE = "index.bin"
+RAW_RECORDING_METRICS_FILE = "recording_metrics.json"
+RAW_RECORDING_INDEX_DTYPE = np.dtype([("frame_id", "<i8"), ("timestamp", "<f8"), ("chunk", "<u4"), ("offset", "<u8")])
+
+
+def _chunk_file_name(chunk_idx: int) -> str:
+    return f"chunk_{chunk_idx:05}.raw"
+
+
+class RawRecordingWriter:
+    """
+    Writes frames into a raw recording directory.  All frames must have the same shape and dtype, which come from
+    the first frame.  This is not thread safe, so only write from one thread.
+    """
+
+    # Index records are flushed to disk every this many frames, so a crash loses at most this many index entries.
+    INDEX_FLUSH_FRAMES = 100
+
+    def __init__(self, directory: str, chunk_size_bytes: int):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._directory = directory
+        self._chunk_size_bytes = chunk_size_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._frame_shape = None
+        self._frame_dtype = None
+        self._frames_per_chunk = 0
+
+        self._chunk: Optional[np.memmap] = None
+        self._chunk_idx = -1
+        self._chunk_frame_count = 0
+        self._frame_count = 0
+        self._index_file = open(os.path.join(directory, RAW_RECORDING_INDEX_FILE), "wb")
+        self._closed = False
+
+    def write(self, frame: np.ndarray, frame_id: int, timestamp: float):
+        if self._closed:
+            raise ValueError(f"Cannot write to raw recording at '{self._directory}' after it has been closed.")
+        if self._frame_shape is None:
+            self._start_recording(frame)
+        elif frame.shape != self._frame_shape or frame.dtype != self._frame_dtype:
+            raise ValueError(
+                f"Frame with shape={frame.shape}, dtype={frame.dtype} does not match the recording's "
+                f"shape={self._frame_shape}, dtype={self._frame_dtype}"
+            )
+
+        if self._chunk is None or self._chunk_frame_count >= self._frames_per_chunk:
+            self._next_chunk()
+
+        self._chunk[self._chunk_frame_count] = frame
+        offset = self._chunk_frame_count * self._chunk[0].nbytes
+        self._index_file.write(
+            np.array([(frame_id, timestamp, self._chunk_idx, offset)], dtype=RAW_RECORDING_INDEX_DTYPE).tobytes()
+        )
+        self._chunk_frame_count += 1
+        self._frame_count += 1
+        if self._frame_count % RawRecordingWriter.INDEX_FLUSH_FRAMES == 0:
+            self._index_file.flush()
+
+    def get_frame_count(self) -> int:
+        return self._frame_count
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._close_chunk()
+        self._index_file.close()
+        self._write_metadata()
+
+    def _start_recording(self, frame: np.ndarray):
+        self._frame_shape = frame.shape
+        self._frame_dtype = frame.dtype
+        self._frames_per_chunk = max(1, self._chunk_size_bytes // frame.nbytes)
+        self._write_metadata()
+
+    def _write_metadata(self):
+        if self._frame_shape is None:
+            return
+        with open(os.path.join(self._directory, RAW_RECORDING_METADATA_FILE), "w") as f:
+            json.dump(
+                {
+                    "version": RAW_RECORDING_FORMAT_VERSION,
+                    "shape": list(self._frame_shape),
+                    "dtype": self._frame_dtype.str,
+                    "frames_per_chunk": self._frames_per_chunk,
+                    # Only final once the recording is closed, the index is the source of truth.
+                    "frame_count": self._frame_count,
+                },
+                f,
+                indent=2,
+            )
+
+    def _next_chunk(self):
+        self._close_chunk()
+        self._chunk_idx += 1
+        self._chunk_frame_count = 0
+        self._chunk = np.memmap(
+            os.path.join(self._directory, _chunk_file_name(self._chunk_idx)),
+            dtype=self._frame_dtype,
+            mode="w+",
+            shape=(self._frames_per_chunk,) + tuple(self._frame_shape),
+        )
+
+    def _close_chunk(self):
+        if self._chunk is None:
+            return
+        chunk_path = self._chunk.filename
+        used_bytes = self._chunk_frame_count * self._chunk[0].nbytes
+        self._chunk.flush()
+        # The mapping has to be gone before we can shrink the file.
+        del self._chunk
+        self._chunk = None
+        if used_bytes < os.path.getsize(chunk_path):
+            os.truncate(chunk_path, used_bytes)
+
+
+class RawRecording:
+    """
+    Read access to a raw recording directory.  Frames are read-only views of the memory-mapped chunk files.
+    """
+
+    def __init__(self, directory: str):
+        self._directory = directory
+        with open(os.path.join(directory, RAW_RECORDING_METADATA_FILE), "r") as f:
+            metadata = json.load(f)
+        if metadata["version"] != RAW_RECORDING_FORMAT_VERSION:
+            raise ValueError(f"Unsupported raw recording version {metadata['version']} at '{directory}'")
+        self.frame_shape = tuple(metadata["shape"])
+        self.frame_dtype = np.dtype(metadata["dtype"])
+        self.index = np.fromfile(os.path.join(directory, RAW_RECORDING_INDEX_FILE), dtype=RAW_RECORDING_INDEX_DTYPE)
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def get_frame(self, idx: int) -> np.ndarray:
+        record = self.index[idx]
+        chunk = self._get_chunk(int(record["chunk"]))
+        frame_bytes = int(np.prod(self.frame_shape)) * self.frame_dtype.itemsize
+        return (
+            chunk[int(record["offset"]) : int(record["offset"]) + frame_bytes]
+            .view(self.frame_dtype)
+            .reshape(self.frame_shape)
+        )
+
+    def frames(self) -> Iterator[np.ndarray]:
+        for idx in range(len(self)):
+            yield self.get_frame(idx)
+
+    def _get_chunk(self, chunk_idx: int) -> np.memmap:
+        if chunk_idx not in self._chunks:
+            self._chunks[chunk_idx] = np.memmap(
+                os.path.join(self._directory, _chunk_file_name(chunk_idx)), dtype=np.uint8, mode="r"
+            )
+        return self._chunks[chunk_idx]
+
+
+def convert_raw_recording(directory: str, output_path: str, output_format: str = "tiff"):
+    """
+    Convert the raw recording in directory into a single file at output_path, with frames in recording order.
+
+    output_format "tiff" writes a (bigtiff) multi-page tiff with one page per frame.  "zarr" writes a zarr group with
+    a "frames" array chunked per frame, plus "frame_ids" and "timestamps" arrays.
+    """
+    recording = RawRecording(directory)
+    if output_format == "tiff":
+        import tifffile
+
+        with tifffile.TiffWriter(output_path, bigtiff=True) as tiff:
+            for frame in recording.frames():
+                tiff.write(frame, contiguous=True)
+    elif output_format == "zarr":
+        # Only import this here so that zarr is only needed if converting to zarr
+        import zarr
+
+        root = zarr.open_group(output_path, mode="w")
+        frames = root.zeros(
+            name="frames",
+            shape=(len(recording),) + recording.frame_shape,
+            chunks=(1,) + recording.frame_shape,
+            dtype=recording.frame_dtype,
+        )
+        for idx, frame in enumerate(recording.frames()):
+            frames[idx] = frame
+        root.zeros(name="frame_ids", shape=(len(recording),), dtype="i8")[:] = recording.index["frame_id"]
+        root.zeros(name="timestamps", shape=(len(recording),), dtype="f8")[:] = recording.index["timestamp"]
+    else:
+        raise ValueError(f"Unknown raw recording output format '{output_format}', must be 'tiff' or 'zarr'")
+
+
+class RawFrameRecorder:
+    """
+    Records every frame from a camera into a raw recording.
+
+    Frames come in through a queued frame callback that blocks the camera (instead of dropping frames) if the disk
+    falls behind, so a recording either has every frame or slows the camera down.  Frames the camera itself drops
+    show up as frame_id gaps in metrics, which are saved next to the recording when it stops.
+    """
+
+    def __init__(
+        self,
+        camera: AbstractCamera,
+        directory: str,
+        chunk_size_bytes: int,
+        max_queue_size: int,
+        metrics_log_interval_s: float = 0,
+    ):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self.metrics = FrameStreamMetrics("raw recording", log_interval_s=metrics_log_interval_s)
+        self._camera = camera
+        self._directory = directory
+        self._chunk_size_bytes = chunk_size_bytes
+        self._max_queue_size = max_queue_size
+        self._writer: Optional[RawRecordingWriter] = None
+        self._callback_id = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._writer:
+                raise ValueError(f"Already recording to '{self._directory}'")
+            self._writer = RawRecordingWriter(self._directory, self._chunk_size_bytes)
+            self.metrics.reset()
+        self._callback_id = self._camera.add_frame_callback(
+            self._on_frame, max_queue_size=self._max_queue_size, overflow_policy=FrameOverflowPolicy.BLOCK
+        )
+
+    def stop(self) -> int:
+        """
+        Stop recording once the frames already queued are written.  Returns the number of frames recorded.
+        """
+        if self._callback_id is not None:
+            self._log.info(f"Frame callback stats: {self._camera.get_frame_callback_stats(self._callback_id)}")
+            self._camera.remove_frame_callback(self._callback_id)
+            self._callback_id = None
+
+        with self._lock:
+            if not self._writer:
+                return 0
+            self._writer.close()
+            frame_count = self._writer.get_frame_count()
+            self._writer = None
+        self.metrics.save_json(os.path.join(self._directory, RAW_RECORDING_METRICS_FILE))
+        self._log.info(f"Recorded {frame_count} frames to '{self._directory}'")
+        return frame_count
+
+    def get_frame_count(self) -> int:
+        with self._lock:
+            return self._writer.get_frame_count() if self._writer else 0
+
+    def _on_frame(self, frame: CameraFrame):
+        self.metrics.frame_received(frame.frame_id)
+        with self._lock:
+            if self._writer:
+                self._writer.write(frame.frame, frame.frame_id, frame.timestamp)
+                # Frame timestamps are time.time() at capture, so this includes time spent in the callback queue.
+                self.metrics.frame_written(frame.frame.nbytes, time.time() - frame.timestamp)
+        stats = self._camera.get_frame_callback_stats(self._callback_id)
+        if stats:
+            self.metrics.queue_depth_changed(stats.queued_count)
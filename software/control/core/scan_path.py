@@ -0,0 +1,167 @@
+"""
+Stage travel time estimates, and ordering of scan positions to minimize stage travel time.
+
+Moves are modelled with a trapezoidal velocity profile per axis (accelerate at MAX_ACCELERATION up to MAX_SPEED, cruise,
+then decelerate), using the axis settings from the stage's StageConfig.  Depending on how the acquisition moves the
+stage, x and y either move at the same time (the move takes as long as the slower axis) or one after the other (the
+move takes the sum of the two).
+"""
+
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from squid.config import AxisConfig, StageConfig
+
+# Past this many points, the 2-opt improvement step (which is O(n^2) per pass) is skipped and we only use the
+# nearest neighbor ordering.
+MAX_POINTS_FOR_2OPT = 2000
+MAX_2OPT_PASSES = 50
+
+
+def axis_move_time_s(distance_mm, axis_config: AxisConfig):
+    """
+    The time it takes an axis to move distance_mm (a float or numpy array of distances), starting and ending at rest.
+    """
+    distance_mm = np.abs(np.asarray(distance_mm, dtype=float))
+    max_speed = axis_config.MAX_SPEED
+    max_acceleration = axis_config.MAX_ACCELERATION
+    if max_acceleration <= 0:
+        return distance_mm / max_speed
+
+    # Moves shorter than this never reach max speed, so they are all acceleration then deceleration.
+    full_speed_distance_mm = max_speed**2 / max_acceleration
+    return np.where(
+        distance_mm >= full_speed_distance_mm,
+        distance_mm / max_speed + max_speed / max_acceleration,
+        2 * np.sqrt(distance_mm / max_acceleration),
+    )
+
+
+def get_move_times_s(
+    from_xy_mm: np.ndarray, to_xy_mm: np.ndarray, stage_config: StageConfig, concurrent_xy: bool
+) -> np.ndarray:
+    """
+    Move times from each of the from_xy_mm points to each of the to_xy_mm points (both [N, 2] arrays).  Returns a
+    [len(from_xy_mm), len(to_xy_mm)] array.
+    """
+    from_xy_mm = np.asarray(from_xy_mm, dtype=float).reshape(-1, 2)
+    to_xy_mm = np.asarray(to_xy_mm, dtype=float).reshape(-1, 2)
+    x_times = axis_move_time_s(from_xy_mm[:, None, 0] - to_xy_mm[None, :, 0], stage_config.X_AXIS)
+    y_times = axis_move_time_s(from_xy_mm[:, None, 1] - to_xy_mm[None, :, 1], stage_config.Y_AXIS)
+    return np.maximum(x_times, y_times) if concurrent_xy else x_times + y_times
+
+
+def get_path_time_s(
+    xy_mm: Sequence[Sequence[float]],
+    stage_config: StageConfig,
+    concurrent_xy: bool,
+    start_xy_mm: Optional[Sequence[float]] = None,
+) -> float:
+    """
+    The total travel time for visiting xy_mm in order, optionally starting at start_xy_mm.
+    """
+    points = [p[:2] for p in xy_mm]
+    if start_xy_mm is not None:
+        points = [start_xy_mm[:2]] + points
+    if len(points) < 2:
+        return 0.0
+    points = np.asarray(points, dtype=float)
+    x_times = axis_move_time_s(np.diff(points[:, 0]), stage_config.X_AXIS)
+    y_times = axis_move_time_s(np.diff(points[:, 1]), stage_config.Y_AXIS)
+    return float(np.sum(np.maximum(x_times, y_times) if concurrent_xy else x_times + y_times))
+
+
+def get_optimized_order(
+    xy_mm: Sequence[Sequence[float]],
+    stage_config: StageConfig,
+    concurrent_xy: bool,
+    start_xy_mm: Optional[Sequence[float]] = None,
+) -> List[int]:
+    """
+    Returns the indices of xy_mm in an order that visits all of them with a short total travel time.  This is a
+    nearest neighbor tour improved with 2-opt, so it is not guaranteed to be optimal.
+
+    If start_xy_mm is given, the path starts there (eg: the current stage position).  Otherwise it starts at the
+    first point.
+    """
+    n = len(xy_mm)
+    if n <= 2 and start_xy_mm is None:
+        return list(range(n))
+
+    points = [p[:2] for p in xy_mm]
+    if start_xy_mm is not None:
+        points = [start_xy_mm[:2]] + points
+    # Node 0 is always the start of the path.  The extra last row and column is a dummy node that is 0 time away
+    # from everything, which lets 2-opt treat the open end of the path like any other edge.
+    m = len(points)
+    times = np.zeros((m + 1, m + 1))
+    times[:m, :m] = get_move_times_s(points, points, stage_config, concurrent_xy)
+
+    route = _nearest_neighbor_route(times[:m, :m])
+    if m <= MAX_POINTS_FOR_2OPT:
+        route = _two_opt(route, times)
+
+    if start_xy_mm is not None:
+        return [node - 1 for node in route[1:]]
+    return list(route)
+
+
+def get_best_order(
+    candidate_orders: Sequence[Sequence[int]],
+    xy_mm: Sequence[Sequence[float]],
+    stage_config: StageConfig,
+    concurrent_xy: bool,
+    start_xy_mm: Optional[Sequence[float]] = None,
+) -> Tuple[List[int], float]:
+    """
+    Returns the order (and its travel time) with the shortest travel time out of candidate_orders.
+    """
+    best_order = None
+    best_time_s = float("inf")
+    for order in candidate_orders:
+        time_s = get_path_time_s([xy_mm[i] for i in order], stage_config, concurrent_xy, start_xy_mm)
+        if time_s < best_time_s:
+            best_order = list(order)
+            best_time_s = time_s
+    return best_order, best_time_s
+
+
+def _nearest_neighbor_route(times: np.ndarray) -> np.ndarray:
+    m = times.shape[0]
+    visited = np.zeros(m, dtype=bool)
+    route = np.empty(m, dtype=int)
+    route[0] = 0
+    visited[0] = True
+    for idx in range(1, m):
+        candidate_times = np.where(visited, np.inf, times[route[idx - 1]])
+        route[idx] = int(np.argmin(candidate_times))
+        visited[route[idx]] = True
+    return route
+
+
+def _two_opt(route: np.ndarray, times: np.ndarray) -> np.ndarray:
+    """
+    Improve the open path route (which must start at node 0, and stays starting there) by reversing segments of it
+    while that makes it shorter.  times must have the 0 time dummy node as its last row/column.
+    """
+    m = len(route)
+    dummy = times.shape[0] - 1
+    route = np.append(route, dummy)
+    for _ in range(MAX_2OPT_PASSES):
+        improved = False
+        for i in range(1, m - 1):
+            a = route[i - 1]
+            b = route[i]
+            c = route[i + 1 : m]
+            d = route[i + 2 : m + 1]
+            # Reversing route[i:j+1] replaces edges a->b and c->d with a->c and b->d.
+            delta = times[a, c] + times[b, d] - times[a, b] - times[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = i + 1 + best
+                route[i : j + 1] = route[i : j + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route[:m]
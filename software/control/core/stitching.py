@@ -0,0 +1,606 @@
+"""
+Parallel, chunk at a time stitching of tiles into a chunked (eg: zarr) tczyx array.
+
+Placing tiles one at a time into the output means every output chunk under a tile gets read, modified, and written
+again for each tile that overlaps it.  Instead, ChunkedTileStitcher works out which tiles land in each output chunk,
+then builds each chunk in memory from its tiles and writes it exactly once.  Chunks are built concurrently on a pool
+of worker threads (tile reading, flatfield correction, and zarr compression all release the GIL).
+
+Tiles usually span several chunks, so loaded tiles are cached and shared between chunks and dropped as soon as the
+last chunk that needs them is done.  Chunks are built in raster order, so only about a row of tiles is loaded at once.
+
+StreamingPyramidBuilder builds the lower resolution levels of a multiscale pyramid as the stitcher finishes chunks:
+each finished chunk is downsampled into its quarter of the chunk above it, and a chunk is written (and passed on up)
+as soon as all of its quarters are in.  So no level is ever read back from the store, and only the partly filled
+chunks along the current row of each level are held in memory.
+
+GlobalTileRegistration places tiles using every overlap between them instead of just their stage coordinates: it
+phase correlates all overlapping pairs of tiles (in batches of stacked overlap strips, on a pool of worker threads),
+then solves for the tile positions that best agree with all of the pairwise offsets in a weighted least squares
+sense.  Pairs that don't correlate well fall back to the offset between their stage coordinates.
+"""
+
+import collections
+import concurrent.futures
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import scipy.fft
+import scipy.sparse
+import scipy.sparse.linalg
+import scipy.spatial
+
+import squid.logging
+
+
+@dataclass(frozen=True)
+class TilePlacement:
+    """
+    Where part of one tile goes in a tczyx output.
+
+    Rows [crop_top, crop_top + height) and columns [crop_left, crop_left + width) of plane `plane` of the tile loaded
+    from `source` go at output[t, c, z, y : y + height, x : x + width].  Anything outside the output is clipped.
+    """
+
+    source: Hashable
+    plane: int
+    t: int
+    c: int
+    z: int
+    y: int
+    x: int
+    crop_top: int
+    crop_left: int
+    height: int
+    width: int
+
+
+class _TileCache:
+    """
+    Loads each tile source once, and holds on to it until all the chunks that need it have released it.
+    """
+
+    def __init__(self, load_fn: Callable[[Hashable], np.ndarray], ref_counts: Dict[Hashable, int]):
+        self._load_fn = load_fn
+        self._ref_counts = dict(ref_counts)
+        self._lock = threading.Lock()
+        self._tiles: Dict[Hashable, np.ndarray] = {}
+        self._source_locks: Dict[Hashable, threading.Lock] = {}
+
+    def get(self, source: Hashable) -> np.ndarray:
+        with self._lock:
+            source_lock = self._source_locks.setdefault(source, threading.Lock())
+        # Only one thread loads a given source, and loading one source doesn't hold up getting the others.
+        with source_lock:
+            if source not in self._tiles:
+                self._tiles[source] = self._load_fn(source)
+            return self._tiles[source]
+
+    def release(self, source: Hashable):
+        with self._lock:
+            self._ref_counts[source] -= 1
+            if self._ref_counts[source] <= 0:
+                self._tiles.pop(source, None)
+                self._source_locks.pop(source, None)
+
+    def get_loaded_count(self) -> int:
+        with self._lock:
+            return len(self._tiles)
+
+
+class StreamingPyramidBuilder:
+    """
+    Fills in levels[1:] of a multiscale pyramid of 5D tczyx arrays (eg: zarr.Arrays) from chunks of levels[0] as they
+    are finished.  Each level is a 2x (in y and x) mean downsampling of the level below it (dropping any odd last row
+    or column), and all levels must share the same yx chunk size, one t, c, z plane at a time.
+
+    Call expect_chunks() with the keys of every levels[0] chunk that will be added, then add_chunk() each of them
+    (from any thread) with its data.  Chunks that are never expected are taken to be zeros, and so are the chunks
+    above them, which are never written, so the levels should start out as zeros.
+    """
+
+    def __init__(self, levels: Sequence):
+        for lower, upper in zip(levels, levels[1:]):
+            expected_shape = tuple(lower.shape[:3]) + (lower.shape[3] // 2, lower.shape[4] // 2)
+            if tuple(upper.shape) != expected_shape:
+                raise ValueError(f"Pyramid level of shape {upper.shape} should be {expected_shape}")
+            if tuple(upper.chunks) != tuple(levels[0].chunks):
+                raise ValueError(f"All pyramid levels must have chunks {levels[0].chunks}, but got {upper.chunks}")
+        if tuple(levels[0].chunks[:3]) != (1, 1, 1) or any(size % 2 for size in levels[0].chunks[3:]):
+            raise ValueError(
+                f"Pyramid chunks must be one t, c, z plane and even in y and x, but got {levels[0].chunks}"
+            )
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._levels = list(levels)
+        self._lock = threading.Lock()
+        # Per level (starting at 1): (t, c, z, chunk_row, chunk_col) -> how many chunks below it are still to come
+        self._remaining: List[Dict[Tuple[int, int, int, int, int], int]] = [{} for _ in self._levels[1:]]
+        # Per level (starting at 1): chunk key -> the chunk being filled in
+        self._pending: List[Dict[Tuple[int, int, int, int, int], np.ndarray]] = [{} for _ in self._levels[1:]]
+
+    def expect_chunks(self, chunk_keys: Sequence[Tuple[int, int, int, int, int]]):
+        """
+        chunk_keys are the (t, c, z, chunk_row, chunk_col) of the levels[0] chunks that will be added.
+        """
+        with self._lock:
+            keys = set(chunk_keys)
+            for level in range(1, len(self._levels)):
+                remaining = collections.Counter(
+                    parent for parent in (self._parent_key(level, key) for key in keys) if parent is not None
+                )
+                self._remaining[level - 1] = dict(remaining)
+                self._pending[level - 1] = {}
+                keys = set(remaining)
+
+    def add_chunk(self, chunk_key: Tuple[int, int, int, int, int], chunk: np.ndarray):
+        """
+        The levels[0] chunk at chunk_key is done, and holds chunk.  Any chunks above it that this finishes are
+        written before this returns.
+        """
+        self._add_chunk(0, chunk_key, chunk)
+
+    def finish(self):
+        """
+        Write any chunks still waiting on chunks below them (which there should only be if not every expected chunk
+        was added), treating the missing chunks as zeros.
+        """
+        for level in range(1, len(self._levels)):
+            with self._lock:
+                unfinished = sorted(self._remaining[level - 1])
+                pending = self._pending[level - 1]
+                self._remaining[level - 1] = {}
+                self._pending[level - 1] = {}
+            if unfinished:
+                self._log.warning(f"{len(unfinished)} chunks of pyramid level {level} were missing some of their data")
+            for chunk_key in unfinished:
+                if chunk_key in pending:
+                    chunk = pending[chunk_key]
+                    self._write_chunk(level, chunk_key, chunk)
+                else:
+                    chunk = np.zeros(self._chunk_shape(level, chunk_key), dtype=self._levels[level].dtype)
+                self._add_chunk(level, chunk_key, chunk)
+
+    def _add_chunk(self, level: int, chunk_key: Tuple[int, int, int, int, int], chunk: np.ndarray):
+        """
+        Downsample chunk (at chunk_key in level) into the chunk above it, and write and pass that on up if this was
+        the last chunk it was waiting on.
+        """
+        for parent_level in range(level + 1, len(self._levels)):
+            parent_key = self._parent_key(parent_level, chunk_key)
+            if parent_key is None:
+                return
+            # Downsample outside of the lock, so that chunks can be downsampled in parallel.
+            height, width = chunk.shape[0] // 2 * 2, chunk.shape[1] // 2 * 2
+            downsampled = chunk[:height, :width].reshape(height // 2, 2, width // 2, 2).mean(axis=(1, 3))
+            chunk_height, chunk_width = self._levels[parent_level].chunks[3:]
+            y = chunk_key[3] % 2 * chunk_height // 2
+            x = chunk_key[4] % 2 * chunk_width // 2
+
+            with self._lock:
+                pending = self._pending[parent_level - 1]
+                remaining = self._remaining[parent_level - 1]
+                if parent_key not in remaining:
+                    raise ValueError(
+                        f"Pyramid level {parent_level - 1} chunk {chunk_key} was not expected, or was already added"
+                    )
+                parent = pending.get(parent_key)
+                if parent is None:
+                    parent = np.zeros(
+                        self._chunk_shape(parent_level, parent_key), dtype=self._levels[parent_level].dtype
+                    )
+                    pending[parent_key] = parent
+                parent[y : y + downsampled.shape[0], x : x + downsampled.shape[1]] = downsampled
+                remaining[parent_key] -= 1
+                if remaining[parent_key] > 0:
+                    return
+                del remaining[parent_key]
+                del pending[parent_key]
+
+            self._write_chunk(parent_level, parent_key, parent)
+            chunk_key, chunk = parent_key, parent
+
+    def _parent_key(self, level: int, chunk_key: Tuple[int, int, int, int, int]):
+        """
+        The key of the chunk in level that chunk_key (in level - 1) goes into, or None if none of it makes it there.
+        """
+        t, c, z, chunk_row, chunk_col = chunk_key
+        parent_key = (t, c, z, chunk_row // 2, chunk_col // 2)
+        height, width = self._levels[level].shape[3:]
+        chunk_height, chunk_width = self._levels[level].chunks[3:]
+        if (chunk_row * chunk_height // 2 >= height) or (chunk_col * chunk_width // 2 >= width):
+            return None
+        return parent_key
+
+    def _chunk_shape(self, level: int, chunk_key: Tuple[int, int, int, int, int]) -> Tuple[int, int]:
+        height, width = self._levels[level].shape[3:]
+        chunk_height, chunk_width = self._levels[level].chunks[3:]
+        return (
+            min(chunk_height, height - chunk_key[3] * chunk_height),
+            min(chunk_width, width - chunk_key[4] * chunk_width),
+        )
+
+    def _write_chunk(self, level: int, chunk_key: Tuple[int, int, int, int, int], chunk: np.ndarray):
+        t, c, z, chunk_row, chunk_col = chunk_key
+        chunk_height, chunk_width = self._levels[level].chunks[3:]
+        y = chunk_row * chunk_height
+        x = chunk_col * chunk_width
+        self._levels[level][t, c, z, y : y + chunk.shape[0], x : x + chunk.shape[1]] = chunk
+
+
+class ChunkedTileStitcher:
+    """
+    Stitches TilePlacements into output, a 5D tczyx array (eg: a zarr.Array) chunked one plane at a time in t, c,
+    and z.
+
+    load_tile(source) returns the (already corrected) planes of a tile as a (planes, height, width) array, and is
+    called from the worker threads.  Where tiles overlap, tiles later in the placements win.  Chunks no tile touches
+    are never written, so output should start out as zeros.  If there is a pyramid (with output as its level 0), each
+    chunk is also added to it once written.
+    """
+
+    def __init__(
+        self,
+        output,
+        load_tile: Callable[[Hashable], np.ndarray],
+        num_workers: int,
+        pyramid: Optional[StreamingPyramidBuilder] = None,
+    ):
+        if len(output.shape) != 5:
+            raise ValueError(f"Stitching output must be 5D (t, c, z, y, x), but got shape {output.shape}")
+        if tuple(output.chunks[:3]) != (1, 1, 1):
+            raise ValueError(f"Stitching output must be chunked one t, c, z plane at a time, but got {output.chunks}")
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, but got {num_workers}")
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._output = output
+        self._load_tile = load_tile
+        self._num_workers = num_workers
+        self._pyramid = pyramid
+
+    def group_by_chunk(
+        self, placements: Sequence[TilePlacement]
+    ) -> Dict[Tuple[int, int, int, int, int], List[TilePlacement]]:
+        """
+        Returns (t, c, z, chunk_row, chunk_col) -> the placements that overlap that output chunk, in placement order.
+        The chunks are in raster order, with the channels of each chunk next to each other (since a multi plane tile,
+        eg: rgb, feeds several channels).
+        """
+        height, width = self._output.shape[3:]
+        chunk_height, chunk_width = self._output.chunks[3:]
+        chunks = collections.defaultdict(list)
+        for placement in placements:
+            y_start, y_end, x_start, x_end = ChunkedTileStitcher._clip(placement, height, width)
+            if y_start >= y_end or x_start >= x_end:
+                continue
+            for chunk_row in range(y_start // chunk_height, (y_end - 1) // chunk_height + 1):
+                for chunk_col in range(x_start // chunk_width, (x_end - 1) // chunk_width + 1):
+                    chunks[(placement.t, placement.c, placement.z, chunk_row, chunk_col)].append(placement)
+
+        def raster_order(item):
+            t, c, z, chunk_row, chunk_col = item[0]
+            return t, z, chunk_row, chunk_col, c
+
+        return dict(sorted(chunks.items(), key=raster_order))
+
+    def stitch(
+        self, placements: Sequence[TilePlacement], progress_callback: Optional[Callable[[int, int], None]] = None
+    ):
+        """
+        Build and write every output chunk that has tiles in it.  progress_callback(chunks_done, total_chunks) is
+        called from this thread as chunks finish.
+        """
+        chunks = self.group_by_chunk(placements)
+        ref_counts = collections.Counter(p.source for chunk_placements in chunks.values() for p in chunk_placements)
+        cache = _TileCache(self._load_tile, ref_counts)
+        total_chunks = len(chunks)
+        if self._pyramid is not None:
+            self._pyramid.expect_chunks(chunks.keys())
+        self._log.info(
+            f"Stitching {len(placements)} tile placements into {total_chunks} chunks with {self._num_workers} workers"
+        )
+
+        # Only keep a few chunks per worker in flight, so that chunks (and the tiles they need) are worked on close to
+        # raster order instead of all over the output at once.
+        max_in_flight = 4 * self._num_workers
+        done_count = 0
+        chunk_iter = iter(chunks.items())
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._num_workers, thread_name_prefix="stitch_chunk"
+        ) as executor:
+            in_flight = set()
+            while True:
+                for chunk_key, chunk_placements in chunk_iter:
+                    in_flight.add(executor.submit(self._build_and_write_chunk, chunk_key, chunk_placements, cache))
+                    if len(in_flight) >= max_in_flight:
+                        break
+                if not in_flight:
+                    break
+                finished, in_flight = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    # Re-raise any errors here, so a failed chunk fails the stitch.
+                    future.result()
+                    done_count += 1
+                    if progress_callback:
+                        progress_callback(done_count, total_chunks)
+
+        if self._pyramid is not None:
+            self._pyramid.finish()
+
+    def _build_and_write_chunk(self, chunk_key, chunk_placements: List[TilePlacement], cache: _TileCache):
+        t, c, z, chunk_row, chunk_col = chunk_key
+        height, width = self._output.shape[3:]
+        chunk_height, chunk_width = self._output.chunks[3:]
+        chunk_y = chunk_row * chunk_height
+        chunk_x = chunk_col * chunk_width
+        chunk = np.zeros(
+            (min(chunk_height, height - chunk_y), min(chunk_width, width - chunk_x)), dtype=self._output.dtype
+        )
+
+        for placement in chunk_placements:
+            try:
+                tile = cache.get(placement.source)[placement.plane]
+                y_start, y_end, x_start, x_end = ChunkedTileStitcher._clip(placement, height, width)
+                y_start = max(y_start, chunk_y)
+                y_end = min(y_end, chunk_y + chunk.shape[0])
+                x_start = max(x_start, chunk_x)
+                x_end = min(x_end, chunk_x + chunk.shape[1])
+                tile_y = placement.crop_top + y_start - placement.y
+                tile_x = placement.crop_left + x_start - placement.x
+                chunk[y_start - chunk_y : y_end - chunk_y, x_start - chunk_x : x_end - chunk_x] = tile[
+                    tile_y : tile_y + y_end - y_start, tile_x : tile_x + x_end - x_start
+                ]
+            finally:
+                cache.release(placement.source)
+
+        self._output[t, c, z, chunk_y : chunk_y + chunk.shape[0], chunk_x : chunk_x + chunk.shape[1]] = chunk
+        if self._pyramid is not None:
+            self._pyramid.add_chunk(chunk_key, chunk)
+
+    @staticmethod
+    def _clip(placement: TilePlacement, height: int, width: int) -> Tuple[int, int, int, int]:
+        """
+        Returns the (y_start, y_end, x_start, x_end) output region of placement, clipped to the output.
+        """
+        return (
+            max(placement.y, 0),
+            min(placement.y + placement.height, height),
+            max(placement.x, 0),
+            min(placement.x + placement.width, width),
+        )
+
+
+def find_overlapping_pairs(
+    positions: np.ndarray, tile_shape: Tuple[int, int], min_overlap: int = 8
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Given the (y, x) pixel positions of the top left of tiles of tile_shape (height, width), returns the
+    (horizontal_pairs, vertical_pairs) of neighbouring tiles as (pairs, 2) arrays of tile indices.  Horizontal pairs
+    are side by side with the left tile first, and vertical pairs are one above the other with the top tile first.
+    Each pair overlaps by at least min_overlap pixels.  Diagonal neighbours are left out.
+    """
+    height, width = tile_shape
+    positions = np.asarray(positions, dtype=float)
+    no_pairs = np.zeros((0, 2), dtype=int)
+    if len(positions) < 2:
+        return no_pairs, no_pairs
+
+    candidates = scipy.spatial.cKDTree(positions).query_pairs(r=np.hypot(height, width), output_type="ndarray")
+    if not len(candidates):
+        return no_pairs, no_pairs
+    dy, dx = (positions[candidates[:, 1]] - positions[candidates[:, 0]]).T
+
+    side_by_side = np.abs(dx) / width >= np.abs(dy) / height
+    horizontal = side_by_side & (dx != 0) & (np.abs(dy) < height / 2) & (width - np.abs(dx) >= min_overlap)
+    vertical = ~side_by_side & (np.abs(dx) < width / 2) & (height - np.abs(dy) >= min_overlap)
+
+    def oriented(mask, forward):
+        pairs = candidates[mask]
+        pairs = np.where(forward[mask][:, np.newaxis], pairs, pairs[:, ::-1])
+        return pairs[np.lexsort((pairs[:, 1], pairs[:, 0]))]
+
+    return oriented(horizontal, dx > 0), oriented(vertical, dy > 0)
+
+
+def phase_correlate_stack(
+    references: np.ndarray, movings: np.ndarray, workers: int = 1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Phase correlates each (height, width) image in the (n, height, width) stack references with the image at the
+    same index in movings.  Returns the (n, 2) integer (dy, dx) shifts such that references[i][y, x] ~
+    movings[i][y - dy, x - dx], and the confidence of each: how many standard deviations the correlation peak is above
+    the mean of the correlation surface (0 if there is nothing to correlate, eg: a blank image).  Shifts wrap around,
+    so they are only unambiguous within half the image size.
+    """
+    n, height, width = references.shape
+
+    def spectrum(images):
+        # No window: overlap strips are narrow, and tapering them throws away most of what there is to correlate.
+        images = np.asarray(images, dtype=np.float32)
+        return scipy.fft.rfft2(images - images.mean(axis=(1, 2), keepdims=True), workers=workers)
+
+    cross_power = spectrum(references) * np.conj(spectrum(movings))
+    magnitude = np.abs(cross_power)
+    cross_power = np.divide(cross_power, magnitude, out=np.zeros_like(cross_power), where=magnitude > 1e-12)
+    correlation = scipy.fft.irfft2(cross_power, s=(height, width), workers=workers).reshape(n, -1)
+
+    peaks = correlation.argmax(axis=1)
+    peak_values = correlation[np.arange(n), peaks]
+    std = correlation.std(axis=1)
+    confidences = np.divide(peak_values - correlation.mean(axis=1), std, out=np.zeros_like(std), where=std > 1e-12)
+
+    shifts = np.stack(np.unravel_index(peaks, (height, width)), axis=1)
+    shifts[shifts[:, 0] > height // 2, 0] -= height
+    shifts[shifts[:, 1] > width // 2, 1] -= width
+    return shifts, confidences
+
+
+def solve_tile_positions(
+    stage_positions: np.ndarray,
+    pairs: np.ndarray,
+    offsets: np.ndarray,
+    weights: np.ndarray,
+    stage_weight: float = 1e-3,
+) -> np.ndarray:
+    """
+    Returns the (n, 2) tile positions p that minimize
+        sum_k weights[k] * |p[pairs[k, 1]] - p[pairs[k, 0]] - offsets[k]|^2
+        + stage_weight * sum_i |p[i] - stage_positions[i]|^2
+
+    The pairwise offsets do all of the work, the small stage_weight term only pins down where each connected group
+    of tiles sits as a whole (and where tiles with no pairs at all go).  y and x are independent, so this is one
+    sparse (graph laplacian plus a diagonal) solve per axis.
+    """
+    stage_positions = np.asarray(stage_positions, dtype=float)
+    n = len(stage_positions)
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+    offsets = np.asarray(offsets, dtype=float).reshape(-1, 2)
+    weights = np.asarray(weights, dtype=float)
+    first, second = pairs.T
+
+    rows = np.concatenate([first, second, first, second, np.arange(n)])
+    cols = np.concatenate([first, second, second, first, np.arange(n)])
+    values = np.concatenate([weights, weights, -weights, -weights, np.full(n, stage_weight)])
+    normal_matrix = scipy.sparse.csc_matrix((values, (rows, cols)), shape=(n, n))
+
+    rhs = stage_weight * stage_positions
+    np.add.at(rhs, second, weights[:, np.newaxis] * offsets)
+    np.add.at(rhs, first, -weights[:, np.newaxis] * offsets)
+
+    solve = scipy.sparse.linalg.factorized(normal_matrix)
+    return np.stack([solve(rhs[:, axis]) for axis in range(2)], axis=1)
+
+
+class GlobalTileRegistration:
+    """
+    Registers a set of overlapping tiles against each other all at once.
+
+    load_tile(index) returns the 2D image of tile index to register with (or None if there isn't one, in which case
+    all of its pairs fall back to stage coordinates), and is called from the worker threads.  register() finds all
+    overlapping pairs of tiles from their stage positions, phase correlates the overlap strips of every pair, and
+    solves for the tile positions that best agree with the pairwise offsets, each weighted by its confidence.  Pairs
+    with a confidence below min_confidence, or whose offset is more than max_stage_error away from what the stage
+    coordinates say, are weak: they keep the offset from the stage coordinates with a small weight, so a tile with
+    only weak pairs follows its neighbours instead of jumping back to where the stage says it is.
+
+    After register(), pairs, offsets, confidences, and reliable hold the details of every pair.
+    """
+
+    def __init__(
+        self,
+        load_tile: Callable[[int], Optional[np.ndarray]],
+        tile_shape: Tuple[int, int],
+        num_workers: int,
+        min_confidence: float = 10.0,
+        weak_pair_weight: float = 0.1,
+        max_stage_error: Optional[float] = None,
+        batch_size: int = 16,
+    ):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be >= 1, but got {num_workers}")
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._load_tile = load_tile
+        self._tile_shape = tuple(tile_shape)
+        self._num_workers = num_workers
+        self._min_confidence = min_confidence
+        self._weak_pair_weight = weak_pair_weight
+        self._max_stage_error = max_stage_error
+        self._batch_size = batch_size
+
+        self.pairs = np.zeros((0, 2), dtype=int)
+        self.offsets = np.zeros((0, 2))
+        self.confidences = np.zeros(0)
+        self.reliable = np.zeros(0, dtype=bool)
+
+    def register(self, stage_positions: np.ndarray) -> np.ndarray:
+        """
+        Given the (n, 2) (y, x) stage positions of the tiles in pixels, returns their registered (n, 2) (y, x)
+        positions in pixels (in the same frame as the stage positions, not rounded).  Tiles in raster order keep the
+        number of tiles loaded at once down to about a row of them.
+        """
+        stage_positions = np.asarray(stage_positions, dtype=float)
+        horizontal_pairs, vertical_pairs = find_overlapping_pairs(stage_positions, self._tile_shape)
+        self.pairs = np.concatenate([horizontal_pairs, vertical_pairs])
+        stage_offsets = stage_positions[self.pairs[:, 1]] - stage_positions[self.pairs[:, 0]]
+        self._log.info(
+            f"Registering {len(stage_positions)} tiles: {len(horizontal_pairs)} horizontal and {len(vertical_pairs)}"
+            f" vertical overlapping pairs, with {self._num_workers} workers"
+        )
+
+        self.offsets = stage_offsets.copy()
+        self.confidences = np.zeros(len(self.pairs))
+        if len(horizontal_pairs):
+            self._measure(horizontal_pairs, stage_offsets[: len(horizontal_pairs)], 1, 0)
+        if len(vertical_pairs):
+            self._measure(vertical_pairs, stage_offsets[len(horizontal_pairs) :], 0, len(horizontal_pairs))
+
+        self.reliable = self.confidences >= self._min_confidence
+        if self._max_stage_error is not None:
+            self.reliable &= np.abs(self.offsets - stage_offsets).max(axis=1, initial=0) <= self._max_stage_error
+        self.offsets[~self.reliable] = stage_offsets[~self.reliable]
+        self._log.info(f"{np.count_nonzero(self.reliable)} of {len(self.pairs)} pairs registered reliably")
+
+        weights = np.where(self.reliable, self.confidences, self._weak_pair_weight)
+        return solve_tile_positions(stage_positions, self.pairs, self.offsets, weights)
+
+    def _measure(self, pairs, stage_offsets, axis, first_pair_index):
+        """
+        Measure the offsets of pairs overlapping along axis (1 for horizontal, 0 for vertical), and store them and
+        their confidences in self.offsets and self.confidences starting at first_pair_index.
+        """
+        # All strips in a direction are the same size, so they can be stacked up and FFT'd together.  Use the typical
+        # overlap: a bit too wide only adds some non overlapping edge, a bit too narrow only loses some of it.
+        tile_size = self._tile_shape[axis]
+        overlap = int(np.clip(round(np.median(tile_size - np.abs(stage_offsets[:, axis]))), 1, tile_size))
+
+        # Pairs come sorted by their first tile, so each tile is dropped soon after the pairs of its row are done.
+        ref_counts = collections.Counter(pairs.ravel().tolist())
+        cache = _TileCache(self._load_tile, ref_counts)
+        batches = [
+            range(start, min(start + self._batch_size, len(pairs))) for start in range(0, len(pairs), self._batch_size)
+        ]
+
+        def measure_batch(batch):
+            try:
+                usable = []
+                strips = []
+                for idx in batch:
+                    first, second = (cache.get(pairs[idx, 0]), cache.get(pairs[idx, 1]))
+                    if first is not None and second is not None:
+                        usable.append(idx)
+                        strips.append(GlobalTileRegistration._overlap_strips(first, second, axis, overlap))
+                if not usable:
+                    return usable, None, None
+                shifts, confidences = phase_correlate_stack(
+                    np.stack([strip for (strip, _) in strips]), np.stack([strip for (_, strip) in strips])
+                )
+                return usable, shifts, confidences
+            finally:
+                for first, second in pairs[batch]:
+                    cache.release(first)
+                    cache.release(second)
+
+        # The overlap strips start tile_size - overlap into the first tile.
+        strip_offset = np.zeros(2)
+        strip_offset[axis] = tile_size - overlap
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self._num_workers, thread_name_prefix="register_tiles"
+        ) as executor:
+            for usable, shifts, confidences in executor.map(measure_batch, batches):
+                if not usable:
+                    continue
+                usable = first_pair_index + np.array(usable)
+                self.offsets[usable] = shifts + strip_offset
+                self.confidences[usable] = confidences
+
+    @staticmethod
+    def _overlap_strips(
+        first: np.ndarray, second: np.ndarray, axis: int, overlap: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The strips of overlap pixels along axis at the end of first and at the start of second.
+        """
+        if axis == 1:
+            return first[:, -overlap:], second[:, :overlap]
+        return first[-overlap:, :], second[:overlap, :]
@@ -0,0 +1,201 @@
+"""
+Throughput and drop accounting for frame streams (live view, recording, image saving).
+
+A FrameStreamMetrics gets told about frames as they move through a stream: received from the camera, dropped
+(eg: a full queue), and written.  From that it keeps counters, a histogram of the latency from queueing to written,
+a per second history of bytes written, a history of queue depth, and the number of frames the camera sent that
+we never saw (gaps in frame_id).  get_snapshot() gives a flat summary for logging or a StatsDisplayWidget, and
+to_dict()/save_json() give everything for saving alongside a recording.
+"""
+
+import collections
+import json
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+import squid.logging
+
+
+class FrameStreamMetrics:
+    # Upper edges of the enqueue to written latency histogram bins, in seconds.  The last bin is everything above.
+    LATENCY_BIN_EDGES_S = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+    # How many seconds of bytes/s and queue depth history to keep.
+    HISTORY_LENGTH_S = 3600
+
+    def __init__(self, name: str, log_interval_s: float = 0):
+        """
+        If log_interval_s > 0, a snapshot is logged every log_interval_s while frames are coming in.
+        """
+        self._log = squid.logging.get_logger(f"{self.__class__.__name__}({name})")
+        self._name = name
+        self._log_interval_s = log_interval_s
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._start_time_s = time.time()
+            self._last_log_time_s = time.monotonic()
+
+            self._received_count = 0
+            self._missed_count = 0
+            self._last_frame_id: Optional[int] = None
+            self._dropped_count = 0
+            self._dropped_frame_ids = collections.deque(maxlen=1000)
+            self._written_count = 0
+            self._written_bytes = 0
+
+            self._latency_counts = [0] * (len(FrameStreamMetrics.LATENCY_BIN_EDGES_S) + 1)
+            self._total_latency_s = 0.0
+            self._max_latency_s = 0.0
+
+            self._queue_depth = 0
+            self._max_queue_depth = 0
+            # (second since start, max queue depth in that second) and (second since start, bytes written in it)
+            self._queue_depth_history = collections.deque(maxlen=FrameStreamMetrics.HISTORY_LENGTH_S)
+            self._bytes_per_s_history = collections.deque(maxlen=FrameStreamMetrics.HISTORY_LENGTH_S)
+
+    def frame_received(self, frame_id: Optional[int] = None):
+        """
+        A frame came in.  Frame ids we skip over are counted as missed (eg: dropped by the camera sdk or by a frame
+        callback queue before we ever saw them).  Pass no frame_id for streams that skip frames on purpose (eg: when
+        saving at a lower rate than the camera's frame rate).
+        """
+        with self._lock:
+            self._received_count += 1
+            if frame_id is not None:
+                if self._last_frame_id is not None and frame_id > self._last_frame_id + 1:
+                    self._missed_count += frame_id - self._last_frame_id - 1
+                self._last_frame_id = frame_id
+        self._maybe_log()
+
+    def resync_frame_id(self, frame_id: int):
+        """
+        A frame came in that we ignored on purpose (eg: while the stream is paused).  It isn't counted as received,
+        but the next frame id gap is only counted from it.
+        """
+        with self._lock:
+            self._last_frame_id = frame_id
+
+    def frame_dropped(self, frame_id: int):
+        """
+        We had a frame, but threw it away (eg: because a queue was full).
+        """
+        with self._lock:
+            self._dropped_count += 1
+            self._dropped_frame_ids.append(frame_id)
+        self._maybe_log()
+
+    def queue_depth_changed(self, depth: int):
+        with self._lock:
+            self._queue_depth = depth
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+            FrameStreamMetrics._add_to_history(self._queue_depth_history, self._elapsed_s(), depth, max)
+
+    def frame_written(self, nbytes: int, latency_s: float):
+        """
+        A frame of nbytes was written, latency_s after it was queued for writing.
+        """
+        with self._lock:
+            self._written_count += 1
+            self._written_bytes += nbytes
+            self._latency_counts[int(np.searchsorted(FrameStreamMetrics.LATENCY_BIN_EDGES_S, latency_s))] += 1
+            self._total_latency_s += latency_s
+            self._max_latency_s = max(self._max_latency_s, latency_s)
+            FrameStreamMetrics._add_to_history(self._bytes_per_s_history, self._elapsed_s(), nbytes, lambda a, b: a + b)
+        self._maybe_log()
+
+    def get_snapshot(self) -> dict:
+        """
+        A flat summary of the metrics so far, with human readable keys.
+        """
+        with self._lock:
+            elapsed_s = max(self._elapsed_s(), 1e-9)
+            bytes_per_s = [b for (_, b) in self._bytes_per_s_history]
+            return {
+                f"{self._name} frames received": self._received_count,
+                f"{self._name} frames missed (frame id gaps)": self._missed_count,
+                f"{self._name} frames dropped": self._dropped_count,
+                f"{self._name} frames written": self._written_count,
+                f"{self._name} receive fps": round(self._received_count / elapsed_s, 2),
+                f"{self._name} write fps": round(self._written_count / elapsed_s, 2),
+                f"{self._name} write MB/s (mean)": round(self._written_bytes / elapsed_s / 1e6, 2),
+                f"{self._name} write MB/s (max 1s)": round(max(bytes_per_s, default=0) / 1e6, 2),
+                f"{self._name} write latency mean [ms]": round(
+                    1000 * self._total_latency_s / self._written_count if self._written_count else 0, 2
+                ),
+                f"{self._name} write latency p99 [ms]": round(1000 * self._latency_percentile_s(0.99), 2),
+                f"{self._name} write latency max [ms]": round(1000 * self._max_latency_s, 2),
+                f"{self._name} queue depth": self._queue_depth,
+                f"{self._name} queue depth max": self._max_queue_depth,
+            }
+
+    def to_dict(self) -> dict:
+        """
+        Everything, including the histograms and histories, in a json friendly dict.
+        """
+        with self._lock:
+            return {
+                "name": self._name,
+                "start_time": self._start_time_s,
+                "elapsed_s": self._elapsed_s(),
+                "frames_received": self._received_count,
+                "frames_missed": self._missed_count,
+                "frames_dropped": self._dropped_count,
+                "dropped_frame_ids": list(self._dropped_frame_ids),
+                "frames_written": self._written_count,
+                "bytes_written": self._written_bytes,
+                "latency_histogram": {
+                    "bin_upper_edges_s": list(FrameStreamMetrics.LATENCY_BIN_EDGES_S) + [None],
+                    "counts": list(self._latency_counts),
+                },
+                "latency_mean_s": self._total_latency_s / self._written_count if self._written_count else 0,
+                "latency_max_s": self._max_latency_s,
+                "max_queue_depth": self._max_queue_depth,
+                "queue_depth_history": [list(s) for s in self._queue_depth_history],
+                "bytes_per_s_history": [list(s) for s in self._bytes_per_s_history],
+            }
+
+    def save_json(self, path: str, extra: Optional[dict] = None):
+        """
+        Save to_dict() to path, with the extra entries (if any) added to it.
+        """
+        with open(path, "w") as f:
+            json.dump({**self.to_dict(), **(extra or {})}, f, indent=2)
+
+    def _elapsed_s(self) -> float:
+        return time.time() - self._start_time_s
+
+    def _latency_percentile_s(self, fraction: float) -> float:
+        """
+        The upper edge of the histogram bin the fraction percentile falls in (or the max for the last bin).
+        """
+        total = sum(self._latency_counts)
+        if not total:
+            return 0.0
+        cumulative = np.cumsum(self._latency_counts)
+        bin_idx = int(np.searchsorted(cumulative, fraction * total))
+        if bin_idx >= len(FrameStreamMetrics.LATENCY_BIN_EDGES_S):
+            return self._max_latency_s
+        return min(FrameStreamMetrics.LATENCY_BIN_EDGES_S[bin_idx], self._max_latency_s)
+
+    @staticmethod
+    def _add_to_history(history, elapsed_s: float, value, combine):
+        second = int(elapsed_s)
+        if history and history[-1][0] == second:
+            history[-1] = (second, combine(history[-1][1], value))
+        else:
+            history.append((second, value))
+
+    def _maybe_log(self):
+        if self._log_interval_s <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_log_time_s < self._log_interval_s:
+                return
+            self._last_log_time_s = now
+        self._log.info(", ".join(f"{k}={v}" for (k, v) in self.get_snapshot().items()))
@@ -67,14 +67,42 @@ from control.custom_multipoint_widget import TemplateMultiPointWidget
 class MovementUpdater(QObject):
     position_after_move = Signal(squid.abc.Pos)
     position = Signal(squid.abc.Pos)
+    # Emitted from the stage's position listener (which is not on the Qt thread) to get us onto the Qt thread.
+    _stage_position_changed = Signal()
 
-    def __init__(self, stage: squid.abc.AbstractStage, movement_threshhold_mm=0.0001, *args, **kwargs):
+    def __init__(
+        self, stage: squid.abc.AbstractStage, movement_threshhold_mm=0.0001, update_interval_ms=100, *args, **kwargs
+    ):
         super().__init__(*args, **kwargs)
         self.stage = stage
         self.movement_threshhold_mm = movement_threshhold_mm
         self.previous_pos = None
         self.sent_after_stopped = False
 
+        # Instead of polling the stage all the time, we only run do_update periodically while the stage is moving.
+        # A position change from the stage starts the updates, and they stop once the stage has stopped.
+        self._update_timer = QTimer(self)
+        self._update_timer.setInterval(update_interval_ms)
+        self._update_timer.timeout.connect(self.do_update)
+        self._stage_position_changed.connect(self._start_updates)
+        self._position_listener_id = self.stage.add_position_listener(lambda pos: self._stage_position_changed.emit())
+
+    def _start_updates(self):
+        if not self._update_timer.isActive():
+            self._update_timer.start()
+
+    def start(self):
+        """
+        Start updates (eg: to send the initial position).  They stop on their own once the stage is stopped.
+        """
+        self._start_updates()
+
+    def stop(self):
+        self._update_timer.stop()
+        if self._position_listener_id is not None:
+            self.stage.remove_position_listener(self._position_listener_id)
+            self._position_listener_id = None
+
     def do_update(self):
         pos = self.stage.get_pos()
         # Doing previous_pos initialization like this means we technically miss the first real update,
@@ -95,6 +123,8 @@ class MovementUpdater(QObject):
             # new position for a while.
             self.sent_after_stopped = True
             self.position_after_move.emit(pos)
+            # Nothing is moving, so no need for more updates until the stage tells us it moved again.
+            self._update_timer.stop()
         else:
             self.sent_after_stopped = False
 
@@ -556,14 +586,22 @@ class HighContentScreeningGui(QMainWindow):
             self.camera.set_acquisition_mode(squid.abc.CameraAcquisitionMode.HARDWARE_TRIGGER)
         else:
             self.camera.set_acquisition_mode(squid.abc.CameraAcquisitionMode.SOFTWARE_TRIGGER)
-        self.camera.add_frame_callback(self.streamHandler.on_new_frame)
+        self.camera.add_frame_callback(
+            self.streamHandler.on_new_frame,
+            max_queue_size=STREAM_HANDLER_FRAME_QUEUE_SIZE,
+            overflow_policy=squid.abc.FrameOverflowPolicy.DROP_OLDEST,
+        )
         self.camera.enable_callbacks(enabled=True)
 
         if SUPPORT_LASER_AUTOFOCUS:
             self.camera_focus.set_acquisition_mode(
                 squid.abc.CameraAcquisitionMode.SOFTWARE_TRIGGER
             )  # self.camera.set_continuous_acquisition()
-            self.camera_focus.add_frame_callback(self.streamHandler_focus_camera.on_new_frame)
+            self.camera_focus.add_frame_callback(
+                self.streamHandler_focus_camera.on_new_frame,
+                max_queue_size=STREAM_HANDLER_FRAME_QUEUE_SIZE,
+                overflow_policy=squid.abc.FrameOverflowPolicy.DROP_OLDEST,
+            )
             self.camera_focus.enable_callbacks(enabled=True)
             self.camera_focus.start_streaming()
 
@@ -642,7 +680,7 @@ class HighContentScreeningGui(QMainWindow):
         if USE_SQUID_FILTERWHEEL:
             self.squidFilterWidget = widgets.SquidFilterWidget(self)
 
-        self.recordingControlWidget = widgets.RecordingWidget(self.streamHandler, self.imageSaver)
+        self.recordingControlWidget = widgets.RecordingWidget(self.streamHandler, self.imageSaver, camera=self.camera)
         self.wellplateFormatWidget = widgets.WellplateFormatWidget(
             self.stage, self.navigationViewer, self.streamHandler, self.liveController
         )
@@ -1158,10 +1196,7 @@ class HighContentScreeningGui(QMainWindow):
         # parts would register their interest (instead of us needing to know that they want to hear about the movements
         # here), but as an intermediate pumping it all from one location is better than nothing.
         self.movement_updater = MovementUpdater(self.stage)
-        self.movement_update_timer = QTimer()
-        self.movement_update_timer.setInterval(100)
-        self.movement_update_timer.timeout.connect(self.movement_updater.do_update)
-        self.movement_update_timer.start()
+        self.movement_updater.start()
 
     def makeNapariConnections(self):
         """Initialize all Napari connections in one place"""
@@ -1453,6 +1488,8 @@ class HighContentScreeningGui(QMainWindow):
                     self.wellplateMultiPointWidget.update_live_coordinates
                 )
                 self.is_live_scan_grid_on = True
+                # Position updates only come in when the stage moves, so send one now for the new connection.
+                self.movement_updater.start()
             self.log.debug("live scan grid connected.")
             self.setupSlidePositionController(is_for_wellplate=False)
         else:
@@ -1570,6 +1607,8 @@ class HighContentScreeningGui(QMainWindow):
                     self.wellplateMultiPointWidget.update_live_coordinates
                 )
                 self.is_live_scan_grid_on = True
+                # Position updates only come in when the stage moves, so send one now for the new connection.
+                self.movement_updater.start()
 
         # click to move off during acquisition
         self.navigationWidget.set_click_to_move(not acquisition_started)
@@ -1624,6 +1663,9 @@ class HighContentScreeningGui(QMainWindow):
                 if self.recordTabWidget.currentIndex() == self.recordTabWidget.indexOf(self.wellplateMultiPointWidget)
                 else stitcher.Stitcher
             )
+            stitcher_kwargs = {}
+            if stitcher_class is stitcher.CoordinateStitcher:
+                stitcher_kwargs["use_global_registration"] = self.stitcherWidget.globalRegistrationCheck.isChecked()
             self.stitcherThread = stitcher_class(
                 input_folder=acquisition_path,
                 output_name=output_name,
@@ -1633,6 +1675,7 @@ class HighContentScreeningGui(QMainWindow):
                 use_registration=use_registration,
                 registration_channel=registration_channel,
                 registration_z_level=registration_z_level,
+                **stitcher_kwargs,
             )
 
             self.stitcherWidget.setStitcherThread(self.stitcherThread)
@@ -1693,7 +1736,7 @@ class HighContentScreeningGui(QMainWindow):
             squid.stage.utils.cache_position(pos=self.stage.get_pos(), stage_config=self.stage.get_config())
         except ValueError as e:
             self.log.error(f"Couldn't cache position while closing.  Ignoring and continuing. Error is: {e}")
-        self.movement_update_timer.stop()
+        self.movement_updater.stop()
 
         if USE_ZABER_EMISSION_FILTER_WHEEL:
             self.emission_filter_wheel.set_emission_filter(1)
@@ -134,24 +134,28 @@ class IlluminationController:
         if channel is None:
             channel = self.current_channel
 
+        future = None
         if self.shutter_control_mode == ShutterControlMode.Software:
             self.light_source.set_shutter_state(self.channel_mappings_software[channel], on=True)
         elif self.shutter_control_mode == ShutterControlMode.TTL:
             # self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], self.intensity_settings[channel])
-            self.microcontroller.turn_on_illumination()
+            future = self.microcontroller.turn_on_illumination()
 
         self.is_on[channel] = True
+        return future
 
     def turn_off_illumination(self, channel=None):
         if channel is None:
             channel = self.current_channel
 
+        future = None
         if self.shutter_control_mode == ShutterControlMode.Software:
             self.light_source.set_shutter_state(self.channel_mappings_software[channel], on=False)
         elif self.shutter_control_mode == ShutterControlMode.TTL:
-            self.microcontroller.turn_off_illumination()
+            future = self.microcontroller.turn_off_illumination()
 
         self.is_on[channel] = False
+        return future
 
     def _load_intensity_calibrations(self):
         """Load intensity calibrations for all available wavelengths."""
@@ -191,6 +195,7 @@ class IlluminationController:
         # initialize intensity setting for this channel if it doesn't exist
         if channel not in self.intensity_settings:
             self.intensity_settings[channel] = -1
+        future = None
         if self.intensity_control_mode == IntensityControlMode.Software:
             if intensity != self.intensity_settings[channel]:
                 self.light_source.set_intensity(self.channel_mappings_software[channel], intensity)
@@ -198,15 +203,16 @@ class IlluminationController:
             if self.shutter_control_mode == ShutterControlMode.TTL:
                 # This is needed, because we select the channel in microcontroller set_illumination().
                 # Otherwise, the wrong channel will be opened when turn_on_illumination() is called.
-                self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], intensity)
+                future = self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], intensity)
         else:
             if channel in self.intensity_luts:
                 # Apply LUT to convert power percentage to DAC percent (0-100)
                 dac_percent = self._apply_lut(channel, intensity)
-                self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], dac_percent)
+                future = self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], dac_percent)
             else:
-                self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], intensity)
+                future = self.microcontroller.set_illumination(self.channel_mappings_TTL[channel], intensity)
             self.intensity_settings[channel] = intensity
+        return future
 
     def get_shutter_state(self):
         return self.is_on
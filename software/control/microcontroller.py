@@ -1,15 +1,18 @@
 import abc
+import collections
+import concurrent.futures
 import enum
+import math
 import struct
 import threading
 import time
 from abc import abstractmethod
-from typing import Callable
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Tuple
 
 import numpy as np
 import serial
 import serial.tools.list_ports
-from crc import CrcCalculator, Crc8
 from serial.serialutil import SerialException
 
 import squid.logging
@@ -60,6 +63,118 @@ class CommandAborted(RuntimeError):
         self.command_id = command_id
 
 
+class CommandFuture(concurrent.futures.Future):
+    """
+    The future send_command returns.  On top of completion, it records when the mcu first reported having
+    received the command (see Microcontroller.wait_for_command_received).
+    """
+
+    def __init__(self):
+        super().__init__()
+        # In time.time() seconds, on the same clock as the position updates (see Microcontroller.read_received_packet).
+        self.received_timestamp: Optional[float] = None
+
+
+@dataclass
+class _InFlightCommand:
+    command: bytearray
+    future: CommandFuture
+    send_timestamp: float
+    # Set once the command has been written to the mcu.  Until then, there is nothing to resend.
+    written: bool = False
+    # Set once the mcu reports this command (or a later one) as the last command it received.
+    received: bool = False
+    retry: int = 0
+
+
+def _make_crc8_ccitt_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+
+_CRC8_CCITT_TABLE = _make_crc8_ccitt_table()
+
+
+def crc8_ccitt(data) -> int:
+    """
+    The CRC-8/CCITT checksum (polynomial 0x07) the mcu uses for commands and packets.  data can be any bytes like
+    object (including a memoryview slice), or a sequence of ints.
+    """
+    crc = 0
+    for byte in data:
+        crc = _CRC8_CCITT_TABLE[crc ^ byte]
+    return crc
+
+
+class McuPacketParser:
+    """
+    Frames the mcu's status packets out of the raw bytes read from serial.  Add bytes as they come in with add(),
+    then get_packets() returns all the complete packets with good checksums (in order) as tuples of:
+
+    - command ID (1 byte)
+    - execution status (1 byte)
+    - X pos (4 bytes)
+    - Y pos (4 bytes)
+    - Z pos (4 bytes)
+    - Theta (4 bytes)
+    - buttons and switches (1 byte)
+    - reserved (4 bytes)
+    - CRC (1 byte)
+
+    If a packet sized chunk does not have a valid checksum, its first byte is tossed and we try again from the next
+    byte until we are back in sync.  Partial packets stay buffered until the rest of their bytes come in.
+    """
+
+    PACKET_STRUCT = struct.Struct(">BBiiiiBiB")
+
+    def __init__(self):
+        self._log = squid.logging.get_logger(self.__class__.__name__)
+        self._buffer = bytearray()
+        self._packet_length = MicrocontrollerDef.MSG_LENGTH
+        if McuPacketParser.PACKET_STRUCT.size != self._packet_length:
+            raise ValueError(f"Packet struct size does not match MSG_LENGTH={self._packet_length}")
+
+    def add(self, data: bytes):
+        self._buffer += data
+        # If anything hangs, we may fall way behind the mcu.  In that case, toss everything but the most recent bytes.
+        # This should always be safe to do because the micro sends updates periodically without prompting, and so
+        # we'll always get more updates on the current micro state.
+        if len(self._buffer) >= BUFFER_SIZE_LIMIT:
+            self._log.warning(f"Packet buffer has {len(self._buffer)} bytes, dropping all but the newest packets.")
+            del self._buffer[: -2 * self._packet_length]
+
+    def get_buffered_byte_count(self) -> int:
+        return len(self._buffer)
+
+    def get_packets(self) -> List[tuple]:
+        packets = []
+        packet_length = self._packet_length
+        buffer = self._buffer
+        start = 0
+        with memoryview(buffer) as view:
+            while len(buffer) - start >= packet_length:
+                packet_crc = buffer[start + packet_length - 1]
+                checksum = crc8_ccitt(view[start : start + packet_length - 1])
+                # NOTE(imo): Before April 2025, we didn't send the crc from the micro.  This is
+                # here to support firmware that still sends 0 as the checksum.  This means for
+                # the firmware that does support checksums, we can get fooled by zeros!
+                if checksum == packet_crc or packet_crc == 0:
+                    packets.append(McuPacketParser.PACKET_STRUCT.unpack_from(view, start))
+                    start += packet_length
+                else:
+                    self._log.warning(
+                        f"Bad checksum {checksum} for packet '{list(view[start:start + packet_length])}', tossing first byte"
+                    )
+                    start += 1
+        del buffer[:start]
+        return packets
+
+
 # NOTE(imo): We'll want to pull this out into a common serial impl shared with serial_peripheral.py at some point, but
 # for now ust auto reconnect down at this level.
 class AbstractCephlaMicroSerial(abc.ABC):
@@ -104,6 +219,16 @@ class AbstractCephlaMicroSerial(abc.ABC):
         """
         pass
 
+    @abstractmethod
+    def read_available(self, timeout_s: float, reconnect_tries: int = 0) -> bytes:
+        """
+        Wait up to timeout_s for bytes to come in, then return all of the bytes that are available (which is empty if
+        none came in before the timeout).  Can throw IOError or OSError if the device is in an invalid state.
+
+        reconnect_tries works like it does for read().
+        """
+        pass
+
     @abstractmethod
     def bytes_available(self) -> int:
         """
@@ -142,14 +267,13 @@ class SimSerial(AbstractCephlaMicroSerial):
         - reserved (4 bytes)
         - CRC (1 byte)
         """
-        crc_calculator = CrcCalculator(Crc8.CCITT, table_based=True)
 
         button_state = joystick_button << BIT_POS_JOYSTICK_BUTTON | switch << BIT_POS_SWITCH
         reserved_state = 0  # This is just filler for the 4 reserved bytes.
         response = bytearray(
             struct.pack(">BBiiiiBi", command_id, execution_status, x, y, z, theta, button_state, reserved_state)
         )
-        response.append(crc_calculator.calculate_checksum(response))
+        response.append(crc8_ccitt(response))
         return bytes(response)
 
     def __init__(self):
@@ -157,6 +281,8 @@ class SimSerial(AbstractCephlaMicroSerial):
         # All the public methods must hold this to modify internal state.  Any _ prefixed members are
         # assumed to be called from a context that already holds the lock
         self._update_lock = threading.Lock()
+        # Notified whenever there are bytes to read.  Uses the _update_lock.
+        self._data_available = threading.Condition(self._update_lock)
         self._in_waiting = 0
         self.response_buffer = []
 
@@ -167,6 +293,9 @@ class SimSerial(AbstractCephlaMicroSerial):
         self.joystick_button = False
         self.switch = False
 
+        self.z_stack_sequence_dac = Microcontroller.Z_STACK_SEQUENCE_USE_Z_STEPPER
+        self.z_stack_sequence_step = 0
+
         self._closed = False
 
     @staticmethod
@@ -211,6 +340,18 @@ class SimSerial(AbstractCephlaMicroSerial):
             elif axis == AXIS.XY:
                 self.x = 0
                 self.y = 0
+        elif command_byte == CMD_SET.RESET:
+            # The mcu forces its command id back to 0 on reset, so it reports the reset as command 0.
+            write_bytes = bytearray(write_bytes)
+            write_bytes[0] = 0
+        elif command_byte == CMD_SET.SET_Z_STACK_SEQUENCE:
+            self.z_stack_sequence_dac = write_bytes[2]
+            self.z_stack_sequence_step = self.unpack_position(write_bytes[3:7])
+        elif command_byte == CMD_SET.START_Z_STACK_SEQUENCE:
+            # The sequence finishes at its last plane.  We don't simulate the triggers, or track dac outputs.
+            n_planes = (write_bytes[2] << 8) + write_bytes[3]
+            if self.z_stack_sequence_dac == Microcontroller.Z_STACK_SEQUENCE_USE_Z_STEPPER:
+                self.z += self.z_stack_sequence_step * (n_planes - 1)
 
         self.response_buffer.extend(
             SimSerial.response_bytes_for(
@@ -232,6 +373,8 @@ class SimSerial(AbstractCephlaMicroSerial):
             self.response_buffer.clear()
 
         self._in_waiting = len(self.response_buffer)
+        if self._in_waiting:
+            self._data_available.notify_all()
 
     def close(self):
         with self._update_lock:
@@ -268,6 +411,18 @@ class SimSerial(AbstractCephlaMicroSerial):
             self._update_internal_state()
             return response
 
+    def read_available(self, timeout_s: float, reconnect_tries: int = 0) -> bytes:
+        # Reconnect takes the lock and checks closed too, so let it handle locking for reconnect
+        if self._closed:
+            if not self.reconnect(reconnect_tries):
+                raise IOError("Closed")
+
+        with self._update_lock:
+            self._data_available.wait_for(lambda: len(self.response_buffer) > 0 or self._closed, timeout=timeout_s)
+            response = bytes(self.response_buffer)
+            self._update_internal_state(clear_buffer=True)
+            return response
+
     def bytes_available(self) -> int:
         with self._update_lock:
             self._update_internal_state()
@@ -355,6 +510,26 @@ class MicrocontrollerSerial(AbstractCephlaMicroSerial):
             else:
                 raise
 
+    def read_available(self, timeout_s: float, reconnect_tries: int = 0) -> bytes:
+        try:
+            # Changing the timeout reconfigures the port, so only do it when it actually changes.
+            if self._serial.timeout != timeout_s:
+                self._serial.timeout = timeout_s
+            # This blocks until at least 1 byte comes in (or we time out), then we grab everything else available.
+            data = self._serial.read(1)
+            if data:
+                in_waiting = self._serial.in_waiting
+                if in_waiting:
+                    data += self._serial.read(in_waiting)
+            return data
+        except (IOError, OSError, SerialException) as e:
+            if reconnect_tries > 0:
+                if not self.reconnect(reconnect_tries):
+                    raise
+                return self.read_available(timeout_s, reconnect_tries=0)
+            else:
+                raise
+
     def bytes_available(self) -> int:
         if not self.is_open():
             return 0
@@ -446,6 +621,16 @@ class Microcontroller:
     # The micro has an update time it tries to keep to.  This must be > that time.  As of 2025-04-28, it's 10ms
     # on the micro.  So 0.1 is 10x that.
     STALE_READ_TIMEOUT = 0.1
+    # How often the mcu sends us its status (positions, and the last command it received).
+    STATUS_UPDATE_PERIOD_S = 0.01
+    # How many commands we send before waiting for the oldest to complete.  This must stay well below 256 so
+    # that command ids (which wrap at 256) are unique among the in flight commands.
+    MAX_IN_FLIGHT_COMMANDS = 16
+    # Sentinel for set_z_stack_sequence's dac byte that means "step the z stepper instead of a dac"
+    Z_STACK_SEQUENCE_USE_Z_STEPPER = 0xFF
+    # The largest times start_z_stack_sequence's command has room for.
+    MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS = 0xFF
+    MAX_Z_STACK_SEQUENCE_FRAME_TIME_MS = 0xFFFF
 
     def __init__(self, serial_device: AbstractCephlaMicroSerial, reset_and_initialize=True):
         self.log = squid.logging.get_logger(self.__class__.__name__)
@@ -486,18 +671,26 @@ class Microcontroller:
         #
         # These are called in our busy loop, and so should return immediately!
         self.joystick_event_listeners = []
+        # Like the joystick listeners, this is a list of (id, functions).  These are called from our read loop with
+        # (timestamp_s, (x, y, z, theta) positions in usteps, busy) every time we get new packets from the mcu.  See
+        # add_position_listener().
+        self.position_listeners = []
         self.switch_state = 0
 
         self.last_command = None
-        self.last_command_send_timestamp = time.time()
         self.last_command_aborted_error = None
 
-        self.crc_calculator = CrcCalculator(Crc8.CCITT, table_based=True)
-        self.retry = 0
-
         self.new_packet_callback_external = None
         self.terminate_reading_received_packet_thread = False
+        # This guards _in_flight_commands (and is notified on every received packet).
         self._received_packet_cv = threading.Condition()
+        # Held while a command gets its id and is written, so commands are written in id order.  The read thread
+        # must never take this, since a sender holding it can be waiting on the read thread for room to send.
+        self._send_lock = threading.Lock()
+        # Commands we have sent, but that the mcu hasn't reported as complete yet.  Keyed by command id, in the
+        # order they were sent.  The mcu executes commands in order and only reports on the last command it
+        # received, so when it reports a command as complete all commands sent before it are complete too.
+        self._in_flight_commands: collections.OrderedDict[int, _InFlightCommand] = collections.OrderedDict()
         self.thread_read_received_packet = threading.Thread(target=self.read_received_packet, daemon=True)
         self.thread_read_received_packet.start()
 
@@ -548,6 +741,22 @@ class Microcontroller:
                 f"Asked to remove joystick button listener {id_to_remove}, but it is not a known listener id"
             )
 
+    def add_position_listener(self, listener: Callable[[float, Tuple[int, int, int, int], bool], None]) -> int:
+        """
+        Call listener(timestamp_s, (x, y, z, theta) in usteps, busy) with the latest mcu state every time we receive
+        packets from the mcu.  These are called in our busy loop, and so should return immediately!
+        """
+        next_id = max((t[0] for t in self.position_listeners), default=0) + 1
+        self.log.debug(f"Adding position listener with id={next_id}")
+        self.position_listeners.append((next_id, listener))
+        return next_id
+
+    def remove_position_listener(self, id_to_remove):
+        remaining = [t for t in self.position_listeners if t[0] != id_to_remove]
+        if len(remaining) == len(self.position_listeners):
+            self.log.warning(f"Asked to remove position listener {id_to_remove}, but it is not a known listener id")
+        self.position_listeners = remaining
+
     def enable_joystick(self, enabled: bool):
         self.joystick_listener_events_enabled = enabled
 
@@ -555,11 +764,17 @@ class Microcontroller:
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.RESET
         self.log.debug("reset the microcontroller")
-        self.send_command(cmd)
+        future = self.send_command(cmd)
         # On the microcontroller side, reset forces the command Id back to 0
         # so any responses will look like they are for command id 0.  Force that
-        # here.
+        # here.  Anything sent before the reset is never going to be reported on.
+        with self._received_packet_cv:
+            reset_command = self._in_flight_commands.pop(self._cmd_id)
+            self._fail_in_flight_commands("Microcontroller was reset")
+            self._in_flight_commands[0] = reset_command
+            self._update_in_progress()
         self._cmd_id = 0
+        return future
 
     def initialize_drivers(self):
         self._cmd_id = 0
@@ -578,12 +793,12 @@ class Microcontroller:
     def turn_on_illumination(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.TURN_ON_ILLUMINATION
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def turn_off_illumination(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.TURN_OFF_ILLUMINATION
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_illumination(self, illumination_source, intensity):
         cmd = bytearray(self.tx_buffer_length)
@@ -591,7 +806,7 @@ class Microcontroller:
         cmd[2] = illumination_source
         cmd[3] = int((intensity / 100) * 65535) >> 8
         cmd[4] = int((intensity / 100) * 65535) & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_illumination_led_matrix(self, illumination_source, r, g, b):
         cmd = bytearray(self.tx_buffer_length)
@@ -600,7 +815,7 @@ class Microcontroller:
         cmd[3] = min(int(g * 255), 255)
         cmd[4] = min(int(r * 255), 255)
         cmd[5] = min(int(b * 255), 255)
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def send_hardware_trigger(self, control_illumination=False, illumination_on_time_us=0, trigger_output_ch=0):
         illumination_on_time_us = int(illumination_on_time_us)
@@ -611,7 +826,7 @@ class Microcontroller:
         cmd[4] = (illumination_on_time_us >> 16) & 0xFF
         cmd[5] = (illumination_on_time_us >> 8) & 0xFF
         cmd[6] = illumination_on_time_us & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_strobe_delay_us(self, strobe_delay_us, camera_channel=0):
         cmd = bytearray(self.tx_buffer_length)
@@ -621,14 +836,79 @@ class Microcontroller:
         cmd[4] = (strobe_delay_us >> 16) & 0xFF
         cmd[5] = (strobe_delay_us >> 8) & 0xFF
         cmd[6] = strobe_delay_us & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
+
+    def set_z_stack_sequence(self, step: int, dac: Optional[int] = None):
+        """
+        Set up the z stack sequence to move the z stepper by step usteps between planes, or if dac is given to change
+        that onboard DAC channel's output by step counts between planes.
+        """
+        payload = self._int_to_payload(int(step), 4)
+        cmd = bytearray(self.tx_buffer_length)
+        cmd[1] = CMD_SET.SET_Z_STACK_SEQUENCE
+        cmd[2] = Microcontroller.Z_STACK_SEQUENCE_USE_Z_STEPPER if dac is None else dac
+        cmd[3] = payload >> 24
+        cmd[4] = (payload >> 16) & 0xFF
+        cmd[5] = (payload >> 8) & 0xFF
+        cmd[6] = payload & 0xFF
+        return self.send_command(cmd)
+
+    def set_z_stack_sequence_piezo_step_um(self, step_um: float):
+        """
+        Set up the z stack sequence to move the objective piezo (see set_piezo_um) by step_um between planes.
+        """
+        step = round(65535 * (step_um / OBJECTIVE_PIEZO_RANGE_UM))
+        return self.set_z_stack_sequence(-step if OBJECTIVE_PIEZO_FLIP_DIR else step, dac=7)
+
+    def set_z_stack_sequence_trigger(self, control_illumination=False, illumination_on_time_us=0, trigger_output_ch=0):
+        """
+        Set the camera trigger sent at each plane of the z stack sequence.  See send_hardware_trigger.
+        """
+        illumination_on_time_us = int(illumination_on_time_us)
+        cmd = bytearray(self.tx_buffer_length)
+        cmd[1] = CMD_SET.SET_Z_STACK_SEQUENCE_TRIGGER
+        cmd[2] = (control_illumination << 7) + trigger_output_ch  # MSB: whether illumination is controlled
+        cmd[3] = illumination_on_time_us >> 24
+        cmd[4] = (illumination_on_time_us >> 16) & 0xFF
+        cmd[5] = (illumination_on_time_us >> 8) & 0xFF
+        cmd[6] = illumination_on_time_us & 0xFF
+        return self.send_command(cmd)
+
+    def start_z_stack_sequence(self, n_planes: int, settle_time_ms: int, frame_time_ms: int):
+        """
+        Run the z stack sequence set up with set_z_stack_sequence and set_z_stack_sequence_trigger.  Starting at the
+        current position, the mcu waits settle_time_ms, sends a trigger, waits frame_time_ms for the frame to be
+        captured, then moves to the next plane.  After n_planes it stops at the last plane.  The command is complete
+        once the whole sequence is.  Times are rounded up to whole ms, and must fit in the command (see
+        MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS and MAX_Z_STACK_SEQUENCE_FRAME_TIME_MS).
+        """
+        if not 0 < n_planes <= 0xFFFF:
+            raise ValueError(f"n_planes must be in (0, {0xFFFF}], but got {n_planes}")
+        settle_time_ms = int(math.ceil(settle_time_ms))
+        if not 0 <= settle_time_ms <= Microcontroller.MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS:
+            raise ValueError(
+                f"settle_time_ms must be in [0, {Microcontroller.MAX_Z_STACK_SEQUENCE_SETTLE_TIME_MS}], but got {settle_time_ms}"
+            )
+        frame_time_ms = int(math.ceil(frame_time_ms))
+        if not 0 <= frame_time_ms <= Microcontroller.MAX_Z_STACK_SEQUENCE_FRAME_TIME_MS:
+            raise ValueError(
+                f"frame_time_ms must be in [0, {Microcontroller.MAX_Z_STACK_SEQUENCE_FRAME_TIME_MS}], but got {frame_time_ms}"
+            )
+        cmd = bytearray(self.tx_buffer_length)
+        cmd[1] = CMD_SET.START_Z_STACK_SEQUENCE
+        cmd[2] = n_planes >> 8
+        cmd[3] = n_planes & 0xFF
+        cmd[4] = settle_time_ms
+        cmd[5] = frame_time_ms >> 8
+        cmd[6] = frame_time_ms & 0xFF
+        return self.send_command(cmd)
 
     def set_axis_enable_disable(self, axis, status):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.SET_AXIS_DISABLE_ENABLE
         cmd[2] = axis
         cmd[3] = status
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def _move_axis_usteps(self, usteps, axis_command_code):
         direction = np.sign(usteps)
@@ -656,10 +936,10 @@ class Microcontroller:
         cmd[3] = (payload >> 16) & 0xFF
         cmd[4] = (payload >> 8) & 0xFF
         cmd[5] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def move_x_usteps(self, usteps):
-        self._move_axis_usteps(usteps, CMD_SET.MOVE_X)
+        return self._move_axis_usteps(usteps, CMD_SET.MOVE_X)
 
     def move_x_to_usteps(self, usteps):
         payload = self._int_to_payload(usteps, 4)
@@ -669,10 +949,10 @@ class Microcontroller:
         cmd[3] = (payload >> 16) & 0xFF
         cmd[4] = (payload >> 8) & 0xFF
         cmd[5] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def move_y_usteps(self, usteps):
-        self._move_axis_usteps(usteps, CMD_SET.MOVE_Y)
+        return self._move_axis_usteps(usteps, CMD_SET.MOVE_Y)
 
     def move_y_to_usteps(self, usteps):
         payload = self._int_to_payload(usteps, 4)
@@ -682,10 +962,10 @@ class Microcontroller:
         cmd[3] = (payload >> 16) & 0xFF
         cmd[4] = (payload >> 8) & 0xFF
         cmd[5] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def move_z_usteps(self, usteps):
-        self._move_axis_usteps(usteps, CMD_SET.MOVE_Z)
+        return self._move_axis_usteps(usteps, CMD_SET.MOVE_Z)
 
     def move_z_to_usteps(self, usteps):
         payload = self._int_to_payload(usteps, 4)
@@ -695,13 +975,13 @@ class Microcontroller:
         cmd[3] = (payload >> 16) & 0xFF
         cmd[4] = (payload >> 8) & 0xFF
         cmd[5] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def move_theta_usteps(self, usteps):
-        self._move_axis_usteps(usteps, CMD_SET.MOVE_THETA)
+        return self._move_axis_usteps(usteps, CMD_SET.MOVE_THETA)
 
     def move_w_usteps(self, usteps):
-        self._move_axis_usteps(usteps, CMD_SET.MOVE_W)
+        return self._move_axis_usteps(usteps, CMD_SET.MOVE_W)
 
     def set_off_set_velocity_x(self, off_set_velocity):
         # off_set_velocity is in mm/s
@@ -714,7 +994,7 @@ class Microcontroller:
         cmd[4] = (payload >> 16) & 0xFF
         cmd[5] = (payload >> 8) & 0xFF
         cmd[6] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_off_set_velocity_y(self, off_set_velocity):
         cmd = bytearray(self.tx_buffer_length)
@@ -726,35 +1006,35 @@ class Microcontroller:
         cmd[4] = (payload >> 16) & 0xFF
         cmd[5] = (payload >> 8) & 0xFF
         cmd[6] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_x(self, homing_direction: HomingDirection = _default_x_homing_direction):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.X
         cmd[3] = homing_direction.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_y(self, homing_direction: HomingDirection = _default_y_homing_direction):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.Y
         cmd[3] = homing_direction.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_z(self, homing_direction: HomingDirection = _default_z_homing_direction):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.Z
         cmd[3] = homing_direction.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_theta(self, homing_direction: HomingDirection = _default_theta_homing_direction):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = 3
         cmd[3] = homing_direction.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_xy(
         self,
@@ -766,49 +1046,49 @@ class Microcontroller:
         cmd[2] = AXIS.XY
         cmd[3] = homing_direction_x.value
         cmd[4] = homing_direction_y.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def home_w(self, homing_direction: HomingDirection = _default_w_homing_direction):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.W
         cmd[3] = homing_direction.value
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def zero_x(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.X
         cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def zero_y(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.Y
         cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def zero_z(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.Z
         cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def zero_w(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.W
         cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def zero_theta(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.HOME_OR_ZERO
         cmd[2] = AXIS.THETA
         cmd[3] = HOME_OR_ZERO.ZERO
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def configure_stage_pid(self, axis, transitions_per_revolution, flip_direction=False):
         cmd = bytearray(self.tx_buffer_length)
@@ -818,19 +1098,19 @@ class Microcontroller:
         payload = self._int_to_payload(transitions_per_revolution, 2)
         cmd[4] = (payload >> 8) & 0xFF
         cmd[5] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def turn_on_stage_pid(self, axis):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.ENABLE_STAGE_PID
         cmd[2] = axis
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def turn_off_stage_pid(self, axis):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.DISABLE_STAGE_PID
         cmd[2] = axis
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def turn_off_all_pid(self):
         for primary_axis_id in [AXIS.X, AXIS.Y, AXIS.Z]:
@@ -847,7 +1127,7 @@ class Microcontroller:
 
         cmd[5] = int(pid_i)
         cmd[6] = int(pid_d)
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_lim(self, limit_code, usteps):
         self.log.info(f"Set lim: {limit_code=}, {usteps=}")
@@ -859,14 +1139,14 @@ class Microcontroller:
         cmd[4] = (payload >> 16) & 0xFF
         cmd[5] = (payload >> 8) & 0xFF
         cmd[6] = payload & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_limit_switch_polarity(self, axis, polarity):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.SET_LIM_SWITCH_POLARITY
         cmd[2] = axis
         cmd[3] = polarity
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_home_safety_margin(self, axis, margin):
         margin = abs(margin)
@@ -877,7 +1157,7 @@ class Microcontroller:
         cmd[2] = axis
         cmd[3] = (margin >> 8) & 0xFF
         cmd[4] = (margin) & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def configure_motor_driver(self, axis, microstepping, current_rms, I_hold):
         # current_rms in mA
@@ -894,7 +1174,7 @@ class Microcontroller:
         cmd[4] = current_rms >> 8
         cmd[5] = current_rms & 0xFF
         cmd[6] = int(I_hold * 255)
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_max_velocity_acceleration(self, axis, velocity, acceleration):
         # velocity: max 65535/100 mm/s
@@ -906,7 +1186,7 @@ class Microcontroller:
         cmd[4] = int(velocity * 100) & 0xFF
         cmd[5] = int(acceleration * 10) >> 8
         cmd[6] = int(acceleration * 10) & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_leadscrew_pitch(self, axis, pitch_mm):
         # pitch: max 65535/1000 = 65.535 (mm)
@@ -915,7 +1195,7 @@ class Microcontroller:
         cmd[2] = axis
         cmd[3] = int(pitch_mm * 1000) >> 8
         cmd[4] = int(pitch_mm * 1000) & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def configure_actuators(self):
         # lead screw pitch
@@ -965,7 +1245,7 @@ class Microcontroller:
     def ack_joystick_button_pressed(self):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def analog_write_onboard_DAC(self, dac, value):
         cmd = bytearray(self.tx_buffer_length)
@@ -973,55 +1253,88 @@ class Microcontroller:
         cmd[2] = dac
         cmd[3] = (value >> 8) & 0xFF
         cmd[4] = value & 0xFF
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_piezo_um(self, z_piezo_um):
         dac = int(65535 * (z_piezo_um / OBJECTIVE_PIEZO_RANGE_UM))
         dac = 65535 - dac if OBJECTIVE_PIEZO_FLIP_DIR else dac
-        self.analog_write_onboard_DAC(7, dac)
+        return self.analog_write_onboard_DAC(7, dac)
 
     def configure_dac80508_refdiv_and_gain(self, div, gains):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.SET_DAC80508_REFDIV_GAIN
         cmd[2] = div
         cmd[3] = gains
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def set_pin_level(self, pin, level):
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.SET_PIN_LEVEL
         cmd[2] = pin
         cmd[3] = level
-        self.send_command(cmd)
+        return self.send_command(cmd)
 
     def turn_on_AF_laser(self):
-        self.set_pin_level(MCU_PINS.AF_LASER, 1)
+        return self.set_pin_level(MCU_PINS.AF_LASER, 1)
 
     def turn_off_AF_laser(self):
-        self.set_pin_level(MCU_PINS.AF_LASER, 0)
-
-    def send_command(self, command):
-        self._cmd_id = (self._cmd_id + 1) % 256
-        command[0] = self._cmd_id
-        command[-1] = self.crc_calculator.calculate_checksum(command[:-1])
-        self._serial.write(command, reconnect_tries=Microcontroller.MAX_RECONNECT_COUNT)
-        self.mcu_cmd_execution_in_progress = True
-        self.last_command = command
-        self.last_command_send_timestamp = time.time()
-        self.retry = 0
-
-        if self.last_command_aborted_error is not None:
-            self.log.warning(
-                "Last command aborted and not cleared before new command sent!", self.last_command_aborted_error
-            )
-        self.last_command_aborted_error = None
+        return self.set_pin_level(MCU_PINS.AF_LASER, 0)
+
+    def send_command(self, command) -> CommandFuture:
+        """
+        Send the command, and return a future that completes once the mcu reports it as complete (or that gets a
+        CommandAborted exception if it is aborted).
+
+        Commands are queued on the mcu, so callers can send several commands back to back and then wait once
+        for all of them with wait_for_commands(...) or wait_till_operation_is_completed().  Commands complete in the
+        order they were sent.  If MAX_IN_FLIGHT_COMMANDS are already in flight, this blocks until the oldest
+        completes, so this must not be called from the read thread.
+        """
+        with self._send_lock:
+            with self._received_packet_cv:
+                if self._received_packet_cv.wait_for(
+                    lambda: len(self._in_flight_commands) < Microcontroller.MAX_IN_FLIGHT_COMMANDS,
+                    timeout=Microcontroller.LAST_COMMAND_ACK_TIMEOUT * (Microcontroller.MAX_RETRY_COUNT + 2),
+                ):
+                    if self.last_command_aborted_error is not None:
+                        self.log.warning(
+                            "Last command aborted and not cleared before new command sent!",
+                            self.last_command_aborted_error,
+                        )
+                    self.last_command_aborted_error = None
+                else:
+                    # This leaves the abort error for the next wait to raise.
+                    self.abort_current_command("Timed out waiting for room in the in flight command queue")
+
+                self._cmd_id = (self._cmd_id + 1) % 256
+                command[0] = self._cmd_id
+                command[-1] = crc8_ccitt(command[:-1])
+                in_flight_command = _InFlightCommand(
+                    command=command, future=CommandFuture(), send_timestamp=time.time()
+                )
+                self._in_flight_commands[self._cmd_id] = in_flight_command
+                self.mcu_cmd_execution_in_progress = True
+                self.last_command = command
+
+            # Don't hold up packet processing while we write.
+            self._serial.write(command, reconnect_tries=Microcontroller.MAX_RECONNECT_COUNT)
+            with self._received_packet_cv:
+                in_flight_command.send_timestamp = time.time()
+                in_flight_command.written = True
 
         self._warn_if_reads_stale()
+        return in_flight_command.future
 
     def abort_current_command(self, reason):
-        self.log.error(f"Command id={self._cmd_id} aborted for reason='{reason}'")
-        self.last_command_aborted_error = CommandAborted(reason=reason, command_id=self._cmd_id)
-        self.mcu_cmd_execution_in_progress = False
+        """
+        Abort all in flight commands.  Their futures get a CommandAborted exception, and so does the next wait.
+        """
+        with self._received_packet_cv:
+            self.log.error(f"Command id={self._cmd_id} aborted for reason='{reason}'")
+            self.last_command_aborted_error = CommandAborted(reason=reason, command_id=self._cmd_id)
+            self._fail_in_flight_commands(reason)
+            self._update_in_progress()
+            self._received_packet_cv.notify_all()
 
     def acknowledge_aborted_command(self):
         if self.last_command_aborted_error is None:
@@ -1029,161 +1342,172 @@ class Microcontroller:
 
         self.last_command_aborted_error = None
 
-    def resend_last_command(self):
-        if self.last_command is not None:
-            self._serial.write(self.last_command, reconnect_tries=Microcontroller.MAX_RECONNECT_COUNT)
-            self.mcu_cmd_execution_in_progress = True
-            # We use the retry count for both checksum errors, and to keep track of
-            # timeout re-attempts.
-            self.last_command_send_timestamp = time.time()
-            self.retry = self.retry + 1
-        else:
-            self.log.warning("resend requested with no last_command, something is wrong!")
-            self.abort_current_command("Resend last requested with no last command")
+    def get_in_flight_command_count(self) -> int:
+        with self._received_packet_cv:
+            return len(self._in_flight_commands)
+
+    def _fail_in_flight_commands(self, reason):
+        for command_id, in_flight_command in self._in_flight_commands.items():
+            in_flight_command.future.set_exception(CommandAborted(reason=reason, command_id=command_id))
+        self._in_flight_commands.clear()
+
+    def _update_in_progress(self):
+        self.mcu_cmd_execution_in_progress = len(self._in_flight_commands) > 0
+
+    def _resend_unreceived_commands(self, min_age_s=0.0):
+        """
+        Resend (in order) all of the in flight commands the mcu hasn't reported receiving.  If any of them are out
+        of retries, abort instead.  Nothing is resent if the last resend was less than min_age_s ago.
+        """
+        unreceived = [c for c in self._in_flight_commands.values() if c.written and not c.received]
+        if not unreceived:
+            return
+        last_resend = max((c.send_timestamp for c in unreceived if c.retry > 0), default=None)
+        if last_resend is not None and time.time() - last_resend < min_age_s:
+            return
+        if any(c.retry >= self.MAX_RETRY_COUNT for c in unreceived):
+            self.abort_current_command(
+                reason=f"Command id={unreceived[0].command[0]} failed after {self.MAX_RETRY_COUNT} retries"
+            )
+            return
+        for in_flight_command in unreceived:
+            self._serial.write(in_flight_command.command, reconnect_tries=Microcontroller.MAX_RECONNECT_COUNT)
+            # We use the retry count for both checksum errors, and to keep track of timeout re-attempts.
+            in_flight_command.send_timestamp = time.time()
+            in_flight_command.retry = in_flight_command.retry + 1
+
+    def _on_command_status(self, cmd_id_mcu, execution_status):
+        """
+        Update the in flight commands given the last command id and execution status the mcu reported.
+        """
+        with self._received_packet_cv:
+            if not self._in_flight_commands:
+                return
+
+            if cmd_id_mcu in self._in_flight_commands and execution_status != CMD_EXECUTION_STATUS.CMD_CHECKSUM_ERROR:
+                # Everything up to and including cmd_id_mcu made it to the mcu, and is complete if it says so.
+                complete = execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
+                for command_id in list(self._in_flight_commands.keys()):
+                    in_flight_command = self._in_flight_commands[command_id]
+                    if not in_flight_command.received:
+                        in_flight_command.received = True
+                        in_flight_command.future.received_timestamp = self._last_successful_read_time
+                    if complete:
+                        del self._in_flight_commands[command_id]
+                        in_flight_command.future.set_result(None)
+                        self.log.debug(f"mcu command {command_id} complete")
+                    if command_id == cmd_id_mcu:
+                        break
+                self._update_in_progress()
+            elif execution_status == CMD_EXECUTION_STATUS.CMD_CHECKSUM_ERROR:
+                # On a checksum error, the mcu drops the bad command and everything it received after it.
+                if cmd_id_mcu in self._in_flight_commands:
+                    for command_id in reversed(self._in_flight_commands.keys()):
+                        self._in_flight_commands[command_id].received = False
+                        self._in_flight_commands[command_id].future.received_timestamp = None
+                        if command_id == cmd_id_mcu:
+                            break
+                self.log.error("cmd checksum error, resending commands")
+                # The mcu keeps reporting the error until it gets a good command, so give a resend time to arrive
+                # before resending again.  Otherwise we could send (and execute) a command twice.
+                self._resend_unreceived_commands(min_age_s=self.STALE_READ_TIMEOUT)
+            else:
+                oldest_unreceived = next(
+                    (c for c in self._in_flight_commands.values() if c.written and not c.received), None
+                )
+                if (
+                    oldest_unreceived is not None
+                    and time.time() - oldest_unreceived.send_timestamp > self.LAST_COMMAND_ACK_TIMEOUT
+                ):
+                    self.log.debug(
+                        f"command timed out without an ack after {self.LAST_COMMAND_ACK_TIMEOUT} [s], resending commands"
+                    )
+                    self._resend_unreceived_commands()
 
     def read_received_packet(self):
-        crc_calculator = CrcCalculator(Crc8.CCITT, table_based=True)
+        packet_parser = McuPacketParser()
         last_watchdog_fail_report = time.time()
         watchdog_fail_report_period = 5.0
 
         while not self.terminate_reading_received_packet_thread:
             try:
-                # If anything hangs, we may fall way behind reading the serial buffer.  In that case, toss everything
-                # in the read buffer and start over.  This should always be safe to do because the micro sends updates
-                # periodically without prompting, and so we'll always get more updates on the current micro state.
-                if self._serial.bytes_available() >= BUFFER_SIZE_LIMIT:
-                    self._serial.reset_input_buffer()
-                    continue
-
-                # If we don't at least have enough bytes for a full packet (rx_buffer_length), there's no reason to
-                # waste our time looking for a valid message.  So wait here until we have at least that many bytes.
-                if self._serial.bytes_available() < self.rx_buffer_length:
+                # Block until bytes come in instead of polling, but wake up periodically so we notice termination
+                # and stale reads.
+                data = self._serial.read_available(
+                    timeout_s=Microcontroller.STALE_READ_TIMEOUT, reconnect_tries=Microcontroller.MAX_RECONNECT_COUNT
+                )
+                if not data:
                     if time.time() - last_watchdog_fail_report > watchdog_fail_report_period:
                         last_watchdog_fail_report = time.time()
                         self._warn_if_reads_stale()
-                    # Sleep a negligible amount of time just to give other threads time to run.  Otherwise,
-                    # we run the rise of spinning forever here and not letting progress happen elsewhere.
-                    time.sleep(0.0001)
-                    if not self._serial.is_open():
-                        if not self._serial.reconnect(attempts=Microcontroller.MAX_RECONNECT_COUNT):
-                            self.log.error(
-                                "In read loop, serial device failed to reconnect.  Microcontroller is defunct!"
-                            )
                     continue
 
-                # This helper reads bytes in the order received by serial, and checks that packet-sized chunks
-                # have valid checksums.  IF the first packet size chunk does not have a valid checksum, it tosses
-                # the first byte and keeps going until it either finds a valid checksum packet or runs out of bytes.
-                def get_msg_with_good_checksum():
-                    maybe_msg = []
-                    while self._serial.bytes_available() > 0:
-                        maybe_msg.append(ord(self._serial.read()))
-                        if len(maybe_msg) < self.rx_buffer_length:
-                            continue
-
-                        checksum = crc_calculator.calculate_checksum(maybe_msg[:-1])
-                        # NOTE(imo): Before April 2025, we didn't send the crc from the micro.  This is
-                        # here to support firmware that still sends 0 as the checksum.  This means for
-                        # the firmware that does support checksums, we can get fooled by zeros!
-                        if checksum == maybe_msg[-1] or maybe_msg[-1] == 0:
-                            return maybe_msg
-                        else:
-                            self.log.warning(f"Bad checksum {checksum} for packet '{maybe_msg}, tossing first byte'")
-                            maybe_msg.pop(0)
-                    return None
-
-                msg = get_msg_with_good_checksum()
-
-                if msg is None:
-                    self.log.warning("Back checksums found, skipping.")
+                packet_parser.add(data)
+                packets = packet_parser.get_packets()
+                if not packets:
                     continue
 
-                # parse the message
-                """
-                - command ID (1 byte)
-                - execution status (1 byte)
-                - X pos (4 bytes)
-                - Y pos (4 bytes)
-                - Z pos (4 bytes)
-                - Theta (4 bytes)
-                - buttons and switches (1 byte)
-                - reserved (4 bytes)
-                - CRC (1 byte)
-                """
                 self._last_successful_read_time = time.time()
-                self._cmd_id_mcu = msg[0]
-                self._cmd_execution_status = msg[1]
-                if (self._cmd_id_mcu == self._cmd_id) and (
-                    self._cmd_execution_status == CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS
-                ):
-                    if self.mcu_cmd_execution_in_progress:
-                        self.mcu_cmd_execution_in_progress = False
-                        self.log.debug("mcu command " + str(self._cmd_id) + " complete")
-                elif (
-                    self.mcu_cmd_execution_in_progress
-                    and self._cmd_id_mcu != self._cmd_id
-                    and time.time() - self.last_command_send_timestamp > self.LAST_COMMAND_ACK_TIMEOUT
-                    and self.last_command is not None
-                ):
-                    if self.retry > self.MAX_RETRY_COUNT:
-                        self.abort_current_command(
-                            reason=f"Command timed out without an ack after {self.LAST_COMMAND_ACK_TIMEOUT} [s], and {self.retry} retries"
-                        )
-                    else:
-                        self.log.debug(
-                            f"command timed out without an ack after {self.LAST_COMMAND_ACK_TIMEOUT} [s], resending command"
-                        )
-                        self.resend_last_command()
-                elif (
-                    self.mcu_cmd_execution_in_progress
-                    and self._cmd_execution_status == CMD_EXECUTION_STATUS.CMD_CHECKSUM_ERROR
-                ):
-                    if self.retry > self.MAX_RETRY_COUNT:
-                        self.abort_current_command(reason=f"Checksum error and 10 retries for {self._cmd_id}")
-                    else:
-                        self.log.error("cmd checksum error, resending command")
-                        self.resend_last_command()
-
-                self.x_pos = self._payload_to_int(
-                    msg[2:6], MicrocontrollerDef.N_BYTES_POS
-                )  # unit: microstep or encoder resolution
-                self.y_pos = self._payload_to_int(
-                    msg[6:10], MicrocontrollerDef.N_BYTES_POS
-                )  # unit: microstep or encoder resolution
-                self.z_pos = self._payload_to_int(
-                    msg[10:14], MicrocontrollerDef.N_BYTES_POS
-                )  # unit: microstep or encoder resolution
-                self.theta_pos = self._payload_to_int(
-                    msg[14:18], MicrocontrollerDef.N_BYTES_POS
-                )  # unit: microstep or encoder resolution
-
-                self.button_and_switch_state = msg[18]
-                # joystick button
-                tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
-                joystick_button_pressed = tmp > 0
-                if self.joystick_button_pressed != joystick_button_pressed:
-                    if self.joystick_listener_events_enabled:
-                        for _, listener_fn in self.joystick_event_listeners:
-                            listener_fn(joystick_button_pressed)
-
-                    # The microcontroller wants us to send an ack back only when we see a False -> True
-                    # transition. handle that here.
-                    if joystick_button_pressed:
-                        self.ack_joystick_button_pressed()
-                self.joystick_button_pressed = joystick_button_pressed
-
-                # switch
-                tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
-                self.switch_state = tmp > 0
+                for packet in packets:
+                    self._process_packet(packet)
+
+                if self.position_listeners:
+                    pos = self.get_pos()
+                    busy = self.is_busy()
+                    for _, listener_fn in self.position_listeners:
+                        listener_fn(self._last_successful_read_time, pos, busy)
 
                 with self._received_packet_cv:
                     self._received_packet_cv.notify_all()
 
                 if self.new_packet_callback_external is not None:
                     self.new_packet_callback_external(self)
+            except (IOError, OSError, SerialException) as e:
+                if not self._serial.is_open() and not self._serial.reconnect(
+                    attempts=Microcontroller.MAX_RECONNECT_COUNT
+                ):
+                    self.log.error("In read loop, serial device failed to reconnect.  Microcontroller is defunct!")
+                    # Don't spin on a defunct device.
+                    time.sleep(Microcontroller.STALE_READ_TIMEOUT)
             except Exception as e:
                 self.log.error("Read loop failed, continuing to loop to see if anything can recover.", exc_info=e)
 
+    def _process_packet(self, packet: tuple):
+        """
+        Update our state from a packet from McuPacketParser.get_packets().
+        """
+        (
+            self._cmd_id_mcu,
+            self._cmd_execution_status,
+            self.x_pos,  # unit: microstep or encoder resolution
+            self.y_pos,  # unit: microstep or encoder resolution
+            self.z_pos,  # unit: microstep or encoder resolution
+            self.theta_pos,  # unit: microstep or encoder resolution
+            self.button_and_switch_state,
+            _,
+            _,
+        ) = packet
+        self._on_command_status(self._cmd_id_mcu, self._cmd_execution_status)
+
+        # joystick button
+        tmp = self.button_and_switch_state & (1 << BIT_POS_JOYSTICK_BUTTON)
+        joystick_button_pressed = tmp > 0
+        if self.joystick_button_pressed != joystick_button_pressed:
+            if self.joystick_listener_events_enabled:
+                for _, listener_fn in self.joystick_event_listeners:
+                    listener_fn(joystick_button_pressed)
+
+            # The microcontroller wants us to send an ack back only when we see a False -> True
+            # transition. handle that here.  Sending can block until the read thread (us) frees up room for it, so
+            # it's sent from another thread.
+            if joystick_button_pressed:
+                threading.Thread(target=self.ack_joystick_button_pressed, daemon=True).start()
+        self.joystick_button_pressed = joystick_button_pressed
+
+        # switch
+        tmp = self.button_and_switch_state & (1 << BIT_POS_SWITCH)
+        self.switch_state = tmp > 0
+
     def get_pos(self):
         return self.x_pos, self.y_pos, self.z_pos, self.theta_pos
 
@@ -1196,10 +1520,40 @@ class Microcontroller:
     def set_callback(self, function):
         self.new_packet_callback_external = function
 
+    def wait_for_commands(self, futures: Iterable[concurrent.futures.Future], timeout_limit_s=5):
+        """
+        Wait for the commands with the given futures (as returned by send_command and the command methods) to
+        complete.  Raises TimeoutError if they don't complete in time, or CommandAborted if any of them were aborted.
+        """
+        futures = [f for f in futures if f is not None]
+        done, not_done = concurrent.futures.wait(futures, timeout=timeout_limit_s)
+        if not_done:
+            raise TimeoutError(f"{len(not_done)} of {len(futures)} mcu commands timed out after {timeout_limit_s} [s].")
+        for future in futures:
+            # Raises the CommandAborted if this command was aborted.
+            future.result()
+
+    def wait_for_command_received(self, future: CommandFuture, timeout_limit_s=5) -> float:
+        """
+        Wait for the mcu to report that it received the command with the given future, and return when that report
+        came in (on the same clock as the position updates).  The mcu runs most commands as soon as it receives them
+        and reports the last command it received every STATUS_UPDATE_PERIOD_S, so the command ran within one status
+        period before this.  Raises TimeoutError if the report doesn't come in time, or CommandAborted if the command
+        was aborted.
+        """
+        with self._received_packet_cv:
+            if not self._received_packet_cv.wait_for(
+                lambda: future.received_timestamp is not None or future.done(), timeout=timeout_limit_s
+            ):
+                raise TimeoutError(f"mcu did not report receiving the command after {timeout_limit_s} [s].")
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+            return future.received_timestamp
+
     def wait_till_operation_is_completed(self, timeout_limit_s=5):
         """
-        Wait for the current command to complete.  If the wait times out, the current command isn't touched.  To
-        abort it, you should call the abort_current_command(...) method.
+        Wait for all in flight commands to complete.  If the wait times out, the commands aren't touched.  To
+        abort them, you should call the abort_current_command(...) method.
         """
         with self._received_packet_cv:
 
@@ -1242,4 +1596,4 @@ class Microcontroller:
         cmd = bytearray(self.tx_buffer_length)
         cmd[1] = CMD_SET.SET_ILLUMINATION_INTENSITY_FACTOR
         cmd[2] = int(factor)
-        self.send_command(cmd)
+        return self.send_command(cmd)
@@ -208,12 +208,20 @@ class Microscope(QObject):
         )
 
     def setup_hardware(self):
-        self.camera.add_frame_callback(self.streamHandler.on_new_frame)
+        self.camera.add_frame_callback(
+            self.streamHandler.on_new_frame,
+            max_queue_size=STREAM_HANDLER_FRAME_QUEUE_SIZE,
+            overflow_policy=squid.abc.FrameOverflowPolicy.DROP_OLDEST,
+        )
         self.camera.enable_callbacks(True)
 
         if SUPPORT_LASER_AUTOFOCUS:
             self.camera_focus.set_acquisition_mode(CameraAcquisitionMode.SOFTWARE_TRIGGER)
-            self.camera_focus.add_frame_callback(self.streamHandler_focus_camera.on_new_frame)
+            self.camera_focus.add_frame_callback(
+                self.streamHandler_focus_camera.on_new_frame,
+                max_queue_size=STREAM_HANDLER_FRAME_QUEUE_SIZE,
+                overflow_policy=squid.abc.FrameOverflowPolicy.DROP_OLDEST,
+            )
             self.camera_focus.enable_callbacks(True)
             self.camera_focus.start_streaming()
 
@@ -27,6 +27,9 @@ from aicsimageio.writers import OmeZarrWriter
 from aicsimageio import types
 from basicpy import BaSiC
 
+from control.core.flatfield import FlatfieldCache, estimate_flatfields, flatfield_camera_settings
+from control.core.stitching import ChunkedTileStitcher, GlobalTileRegistration, StreamingPyramidBuilder, TilePlacement
+
 
 class Stitcher(QThread, QObject):
 
@@ -865,6 +868,7 @@ class CoordinateStitcher(QThread, QObject):
         registration_channel="",
         registration_z_level=0,
         overlap_percent=0,
+        use_global_registration=STITCHING_GLOBAL_REGISTRATION,
     ):
         super().__init__()
         self.input_folder = input_folder
@@ -875,6 +879,7 @@ class CoordinateStitcher(QThread, QObject):
         if use_registration:
             self.registration_channel = registration_channel
             self.registration_z_level = registration_z_level
+        self.use_global_registration = use_global_registration
         self.coordinates_df = None
         self.pixel_size_um = None
         self.acquisition_params = None
@@ -894,6 +899,12 @@ class CoordinateStitcher(QThread, QObject):
         self.num_pyramid_levels = 5
         self.flatfields = {}
         self.stitching_data = {}
+        # Indexes into stitching_data, see build_tile_index
+        self.region_keys = {}
+        self.region_positions = {}
+        self.tile_index = {}
+        # region -> (row, col) -> (x_pixel, y_pixel) of the tile, see calculate_global_positions
+        self.registered_positions = {}
         self.dtype = np.uint16
         self.chunks = None
         self.h_shift = (0, 0)
@@ -942,7 +953,7 @@ class CoordinateStitcher(QThread, QObject):
         for t, time_point in enumerate(self.time_points):
             image_folder = os.path.join(self.input_folder, str(time_point))
             coordinates_path = os.path.join(self.input_folder, time_point, "coordinates.csv")
-            coordinates_df = pd.read_csv(coordinates_path)
+            coordinates_df = pd.read_csv(coordinates_path, dtype={"region": str})
 
             print(f"Processing timepoint {time_point}, image folder: {image_folder}")
 
@@ -953,29 +964,32 @@ class CoordinateStitcher(QThread, QObject):
             if not image_files:
                 raise Exception(f"No valid files found in directory for timepoint {time_point}.")
 
-            for file in image_files:
-                parts = file.split("_", 3)
-                region, fov, z_level, channel = parts[0], int(parts[1]), int(parts[2]), os.path.splitext(parts[3])[0]
-                channel = channel.replace("_", " ").replace("full ", "full_")
-
-                coord_row = coordinates_df[
-                    (coordinates_df["region"] == region)
-                    & (coordinates_df["fov"] == fov)
-                    & (coordinates_df["z_level"] == z_level)
-                ]
-
-                if coord_row.empty:
-                    print(f"Warning: No matching coordinates found for file {file}")
-                    continue
+            files_df = pd.DataFrame(
+                [self.parse_image_file_name(file) for file in image_files],
+                columns=["file", "region", "fov", "z_level", "channel"],
+            )
+            # Join every file with its coordinates in one go, using the first coordinates row for each
+            # (region, fov, z_level) if there are several.
+            coordinates_df = coordinates_df.drop_duplicates(subset=["region", "fov", "z_level"], keep="first")
+            files_df = files_df.merge(
+                coordinates_df[["region", "fov", "z_level", "x (mm)", "y (mm)", "z (um)"]],
+                on=["region", "fov", "z_level"],
+                how="left",
+                sort=False,
+            )
 
-                coord_row = coord_row.iloc[0]
+            unmatched = files_df["x (mm)"].isna()
+            for file in files_df.loc[unmatched, "file"]:
+                print(f"Warning: No matching coordinates found for file {file}")
+            files_df = files_df[~unmatched]
 
+            for file, region, fov, z_level, channel, x_mm, y_mm, z_um in files_df.itertuples(index=False, name=None):
                 key = (t, region, fov, z_level, channel)
                 self.stitching_data[key] = {
                     "filepath": os.path.join(image_folder, file),
-                    "x": coord_row["x (mm)"],
-                    "y": coord_row["y (mm)"],
-                    "z": coord_row["z (um)"],
+                    "x": x_mm,
+                    "y": y_mm,
+                    "z": z_um,
                     "channel": channel,
                     "z_level": z_level,
                     "region": region,
@@ -983,16 +997,18 @@ class CoordinateStitcher(QThread, QObject):
                     "t": t,
                 }
 
-                self.regions.add(region)
-                self.channel_names.add(channel)
-                max_z = max(max_z, z_level)
-                max_fov = max(max_fov, fov)
+            self.regions.update(files_df["region"])
+            self.channel_names.update(files_df["channel"])
+            if not files_df.empty:
+                max_z = max(max_z, int(files_df["z_level"].max()))
+                max_fov = max(max_fov, int(files_df["fov"].max()))
 
         self.regions = sorted(self.regions)
         self.channel_names = sorted(self.channel_names)
         self.num_t = len(self.time_points)
         self.num_z = max_z + 1
         self.num_fovs_per_region = max_fov + 1
+        self.build_tile_index()
 
         # Set up image parameters based on the first image
         first_key = list(self.stitching_data.keys())[0]
@@ -1030,6 +1046,46 @@ class CoordinateStitcher(QThread, QObject):
         print(f"{self.num_c} Channels: {self.mono_channel_names}")
         print(f"{len(self.regions)} Regions: {self.regions}")
 
+    @staticmethod
+    def parse_image_file_name(file):
+        """
+        Returns (file, region, fov, z_level, channel) for an acquisition image file name like
+        "A1_0_2_Fluorescence_488_nm_Ex.tiff".
+        """
+        parts = file.split("_", 3)
+        region, fov, z_level, channel = parts[0], int(parts[1]), int(parts[2]), os.path.splitext(parts[3])[0]
+        channel = channel.replace("_", " ").replace("full ", "full_")
+        return file, region, fov, z_level, channel
+
+    def build_tile_index(self):
+        """
+        Index stitching_data so that per region and per tile lookups don't have to scan through all of it:
+            region_keys: region -> the stitching_data keys in the region, in stitching_data order
+            region_positions: region -> the (sorted x positions, sorted y positions) of the region's tiles
+            tile_index: region -> (row, col, channel, z_level) -> the stitching_data key of the first matching tile
+        Each stitching_data entry also gets the "row" and "col" of its tile in its region's grid.
+        """
+        self.region_keys = {}
+        for key in self.stitching_data:
+            self.region_keys.setdefault(key[1], []).append(key)
+
+        self.region_positions = {}
+        self.tile_index = {}
+        for region, keys in self.region_keys.items():
+            x_positions = sorted(set(self.stitching_data[key]["x"] for key in keys))
+            y_positions = sorted(set(self.stitching_data[key]["y"] for key in keys))
+            self.region_positions[region] = (x_positions, y_positions)
+            col_of_x = {x: col for col, x in enumerate(x_positions)}
+            row_of_y = {y: row for row, y in enumerate(y_positions)}
+
+            region_index = {}
+            for key in keys:
+                tile_info = self.stitching_data[key]
+                tile_info["row"] = row_of_y[tile_info["y"]]
+                tile_info["col"] = col_of_x[tile_info["x"]]
+                region_index.setdefault((tile_info["row"], tile_info["col"], key[4], key[3]), key)
+            self.tile_index[region] = region_index
+
     def get_channel_color(self, channel_name):
         color_map = {
             "405": 0x0000FF,  # Blue
@@ -1047,15 +1103,17 @@ class CoordinateStitcher(QThread, QObject):
         return 0xFFFFFF  # Default to white if no match found
 
     def calculate_output_dimensions(self, region):
-        region_data = [tile_info for key, tile_info in self.stitching_data.items() if key[1] == region]
-
-        if not region_data:
+        if region not in self.region_positions:
             raise ValueError(f"No data found for region {region}")
 
-        self.x_positions = sorted(set(tile_info["x"] for tile_info in region_data))
-        self.y_positions = sorted(set(tile_info["y"] for tile_info in region_data))
+        self.x_positions, self.y_positions = self.region_positions[region]
 
-        if self.use_registration:  # Add extra space for shifts
+        if region in self.registered_positions:
+            positions = np.array(list(self.registered_positions[region].values()))
+            width_pixels = int(positions[:, 0].max()) + self.input_width
+            height_pixels = int(positions[:, 1].max()) + self.input_height
+
+        elif self.use_registration:  # Add extra space for shifts
             num_cols = len(self.x_positions)
             num_rows = len(self.y_positions)
 
@@ -1092,7 +1150,7 @@ class CoordinateStitcher(QThread, QObject):
             max_dimension = 1
 
         # Calculate the number of pyramid levels
-        self.num_pyramid_levels = math.ceil(np.log2(max(width_pixels, height_pixels) / 1024 * max_dimension))
+        self.num_pyramid_levels = max(1, math.ceil(np.log2(max(width_pixels, height_pixels) / 1024 * max_dimension)))
         print("# Pyramid levels:", self.num_pyramid_levels)
         return width_pixels, height_pixels
 
@@ -1100,86 +1158,70 @@ class CoordinateStitcher(QThread, QObject):
         width, height = self.calculate_output_dimensions(region)
         self.output_shape = (self.num_t, self.num_c, self.num_z, height, width)
         print(f"Output shape for region {region}: {self.output_shape}")
-        return da.zeros(self.output_shape, dtype=self.dtype, chunks=self.chunks)
+        # Stitching writes straight into the full resolution array in the output store.
+        return self.get_region_image_group(region).zeros(
+            name="0", shape=self.output_shape, chunks=self.chunks, dtype=self.dtype, overwrite=True
+        )
 
     def get_flatfields(self, progress_callback=None):
-        def process_images(images, channel_name):
-            if images.size == 0:
-                print(f"WARNING: No images found for channel {channel_name}")
-                return
-
-            if images.ndim != 3 and images.ndim != 4:
-                raise ValueError(
-                    f"Images must be 3 or 4-dimensional array, with dimension of (T, Y, X) or (T, Z, Y, X). Got shape {images.shape}"
-                )
+        """
+        Fill self.flatfields with each output channel's flatfield, from the flatfield cache if it has one for this
+        objective, channel, and camera, otherwise estimated from a random sample of FLATFIELD_NUM_SAMPLES tiles per
+        time point (and then cached).  Only the sampled tiles are read.
+        """
+        cache = FlatfieldCache(FLATFIELD_CACHE_DIR)
+        objective = self.acquisition_params.get("objective", {}).get("name", "")
+        camera_settings = flatfield_camera_settings(
+            self.acquisition_params.get("sensor_pixel_size_um", 0), (self.input_height, self.input_width)
+        )
 
-            basic = BaSiC(get_darkfield=False, smoothness_flatfield=1)
-            basic.fit(images)
-            channel_index = self.mono_channel_names.index(channel_name)
-            self.flatfields[channel_index] = basic.flatfield
-            if progress_callback:
-                progress_callback(channel_index + 1, self.num_c)
+        channel_keys = {}
+        for key in self.stitching_data:
+            channel_keys.setdefault(key[4], {}).setdefault(key[0], []).append(key)
 
+        flatfields = {}
+        sources = {}
         for channel in self.channel_names:
-            print(f"Calculating {channel} flatfield...")
-            images = []
-            for t in self.time_points:
-                time_images = [
-                    dask_imread(tile["filepath"])[0]
-                    for key, tile in self.stitching_data.items()
-                    if tile["channel"] == channel and key[0] == int(t)
-                ]
-                if not time_images:
-                    print(f"WARNING: No images found for channel {channel} at timepoint {t}")
-                    continue
-                random.shuffle(time_images)
-                selected_tiles = time_images[: min(32, len(time_images))]
-                images.extend(selected_tiles)
+            channel_indices = self.get_mono_channel_indices(channel)
+            cached = [cache.get(objective, self.mono_channel_names[idx], camera_settings) for idx in channel_indices]
+            if all(flatfield is not None for flatfield in cached):
+                print(f"Using cached {channel} flatfield")
+                flatfields.update(zip(channel_indices, cached))
+                continue
 
-            if not images:
+            sources[channel] = []
+            for t, time_point in enumerate(self.time_points):
+                time_keys = channel_keys.get(channel, {}).get(t, [])
+                if not time_keys:
+                    print(f"WARNING: No images found for channel {channel} at timepoint {time_point}")
+                    continue
+                sources[channel].extend(random.sample(time_keys, min(FLATFIELD_NUM_SAMPLES, len(time_keys))))
+            if not sources[channel]:
                 print(f"WARNING: No images found for channel {channel} across all timepoints")
-                continue
+                del sources[channel]
 
-            images = np.array(images)
+        if sources:
+            print(f"Calculating {list(sources)} flatfields...")
+            # self.flatfields is still empty, so load_tile_planes reads the sampled tiles uncorrected.
+            estimated = estimate_flatfields(
+                sources, self.load_tile_planes, num_workers=STITCHING_NUM_WORKERS, progress_callback=progress_callback
+            )
+            for channel, channel_flatfields in estimated.items():
+                for channel_idx, flatfield in zip(self.get_mono_channel_indices(channel), channel_flatfields):
+                    flatfields[channel_idx] = flatfield
+                    cache.put(objective, self.mono_channel_names[channel_idx], camera_settings, flatfield)
 
-            if images.ndim == 3:
-                # Images are in the shape (N, Y, X)
-                process_images(images, channel)
-            elif images.ndim == 4:
-                if images.shape[-1] == 3:
-                    # Images are in the shape (N, Y, X, 3) for RGB images
-                    images_r = images[..., 0]
-                    images_g = images[..., 1]
-                    images_b = images[..., 2]
-                    channel = channel.split("_")[0]
-                    process_images(images_r, channel + "_R")
-                    process_images(images_g, channel + "_G")
-                    process_images(images_b, channel + "_B")
-                else:
-                    # Images are in the shape (N, Z, Y, X)
-                    process_images(images, channel)
-            else:
-                raise ValueError(f"Unexpected number of dimensions in images array: {images.ndim}")
+        self.flatfields = flatfields
 
     def calculate_shifts(self, region):
-        region_data = [v for k, v in self.stitching_data.items() if k[1] == region]
-
         # Get unique x and y positions
-        x_positions = sorted(set(tile["x"] for tile in region_data))
-        y_positions = sorted(set(tile["y"] for tile in region_data))
+        x_positions, y_positions = self.region_positions[region]
 
         # Initialize shifts
         self.h_shift = (0, 0)
         self.v_shift = (0, 0)
 
-        # Set registration channel if not already set
-        if not self.registration_channel:
-            self.registration_channel = self.channel_names[0]
-        elif self.registration_channel not in self.channel_names:
-            print(
-                f"Warning: Specified registration channel '{self.registration_channel}' not found. Using {self.channel_names[0]}."
-            )
-            self.registration_channel = self.channel_names[0]
+        self.check_registration_channel()
 
         max_x_overlap = round(self.input_width * self.overlap_percent / 2 / 100)
         max_y_overlap = round(self.input_height * self.overlap_percent / 2 / 100)
@@ -1189,19 +1231,18 @@ class CoordinateStitcher(QThread, QObject):
         center_x_index = (len(x_positions) - 1) // 2
         center_y_index = (len(y_positions) - 1) // 2
 
-        center_x = x_positions[center_x_index]
-        center_y = y_positions[center_y_index]
-
-        right_x = None
-        bottom_y = None
+        right_x_index = None
+        bottom_y_index = None
 
         # Calculate horizontal shift
         if center_x_index + 1 < len(x_positions):
-            right_x = x_positions[center_x_index + 1]
+            right_x_index = center_x_index + 1
             center_tile = self.get_tile(
-                region, center_x, center_y, self.registration_channel, self.registration_z_level
+                region, center_y_index, center_x_index, self.registration_channel, self.registration_z_level
+            )
+            right_tile = self.get_tile(
+                region, center_y_index, right_x_index, self.registration_channel, self.registration_z_level
             )
-            right_tile = self.get_tile(region, right_x, center_y, self.registration_channel, self.registration_z_level)
 
             if center_tile is not None and right_tile is not None:
                 self.h_shift = self.calculate_horizontal_shift(center_tile, right_tile, max_x_overlap)
@@ -1210,12 +1251,12 @@ class CoordinateStitcher(QThread, QObject):
 
         # Calculate vertical shift
         if center_y_index + 1 < len(y_positions):
-            bottom_y = y_positions[center_y_index + 1]
+            bottom_y_index = center_y_index + 1
             center_tile = self.get_tile(
-                region, center_x, center_y, self.registration_channel, self.registration_z_level
+                region, center_y_index, center_x_index, self.registration_channel, self.registration_z_level
             )
             bottom_tile = self.get_tile(
-                region, center_x, bottom_y, self.registration_channel, self.registration_z_level
+                region, bottom_y_index, center_x_index, self.registration_channel, self.registration_z_level
             )
 
             if center_tile is not None and bottom_tile is not None:
@@ -1223,11 +1264,13 @@ class CoordinateStitcher(QThread, QObject):
             else:
                 print(f"Warning: Missing tiles for vertical shift calculation in region {region}.")
 
-        if self.scan_pattern == "S-Pattern" and right_x and bottom_y:
+        if self.scan_pattern == "S-Pattern" and right_x_index is not None and bottom_y_index is not None:
             center_tile = self.get_tile(
-                region, center_x, bottom_y, self.registration_channel, self.registration_z_level
+                region, bottom_y_index, center_x_index, self.registration_channel, self.registration_z_level
+            )
+            right_tile = self.get_tile(
+                region, bottom_y_index, right_x_index, self.registration_channel, self.registration_z_level
             )
-            right_tile = self.get_tile(region, right_x, bottom_y, self.registration_channel, self.registration_z_level)
 
             if center_tile is not None and right_tile is not None:
                 self.h_shift_rev = self.calculate_horizontal_shift(center_tile, right_tile, max_x_overlap)
@@ -1238,6 +1281,59 @@ class CoordinateStitcher(QThread, QObject):
 
         print(f"Calculated Uni-Directional Shifts - Horizontal: {self.h_shift}, Vertical: {self.v_shift}")
 
+    def check_registration_channel(self):
+        # Set registration channel if not already set
+        if not self.registration_channel:
+            self.registration_channel = self.channel_names[0]
+        elif self.registration_channel not in self.channel_names:
+            print(
+                f"Warning: Specified registration channel '{self.registration_channel}' not found. Using {self.channel_names[0]}."
+            )
+            self.registration_channel = self.channel_names[0]
+
+    def calculate_global_positions(self, region):
+        """
+        Register every overlapping pair of tiles in region against each other, and solve for the pixel positions of
+        the tiles that best agree with all of the pairs (see GlobalTileRegistration).  Pairs that don't correlate
+        well, and tiles with no registration channel image, fall back to stage coordinates.  Sets
+        self.registered_positions[region].
+        """
+        self.check_registration_channel()
+        x_positions, y_positions = self.region_positions[region]
+        grid = sorted(
+            set((self.stitching_data[key]["row"], self.stitching_data[key]["col"]) for key in self.region_keys[region])
+        )
+        stage_positions = np.array(
+            [
+                (
+                    (y_positions[row] - y_positions[0]) * 1000 / self.pixel_size_um,
+                    (x_positions[col] - x_positions[0]) * 1000 / self.pixel_size_um,
+                )
+                for (row, col) in grid
+            ]
+        )
+        registration_keys = [
+            self.tile_index[region].get((row, col, self.registration_channel, self.registration_z_level))
+            for (row, col) in grid
+        ]
+
+        def load_registration_tile(idx):
+            if registration_keys[idx] is None:
+                return None
+            # Register rgb tiles on their mean.
+            return self.load_tile_planes(registration_keys[idx]).mean(axis=0)
+
+        registration = GlobalTileRegistration(
+            load_registration_tile, (self.input_height, self.input_width), num_workers=STITCHING_NUM_WORKERS
+        )
+        positions = registration.register(stage_positions)
+        positions = np.round(positions - positions.min(axis=0)).astype(int)
+        self.registered_positions[region] = {(row, col): (x, y) for ((row, col), (y, x)) in zip(grid, positions)}
+        print(
+            f"Registered {np.count_nonzero(registration.reliable)} of {len(registration.pairs)} overlapping tile pairs"
+            f" in region {region}, the rest use stage coordinates"
+        )
+
     def calculate_horizontal_shift(self, img1, img2, max_overlap):
         img1 = self.normalize_image(img1)
         img2 = self.normalize_image(img2)
@@ -1264,22 +1360,19 @@ class CoordinateStitcher(QThread, QObject):
         shift, error, diffphase = phase_cross_correlation(img1_overlap, img2_overlap, upsample_factor=10)
         return round(shift[0] - img1_overlap.shape[0]), round(shift[1])
 
-    def get_tile(self, region, x, y, channel, z_level):
-        for key, value in self.stitching_data.items():
-            if (
-                key[1] == region
-                and value["x"] == x
-                and value["y"] == y
-                and value["channel"] == channel
-                and value["z_level"] == z_level
-            ):
-                try:
-                    return dask_imread(value["filepath"])[0]
-                except FileNotFoundError:
-                    print(f"Warning: Tile file not found: {value['filepath']}")
-                    return None
-        print(f"Warning: No matching tile found for region {region}, x={x}, y={y}, channel={channel}, z={z_level}")
-        return None
+    def get_tile(self, region, row, col, channel, z_level):
+        key = self.tile_index.get(region, {}).get((row, col, channel, z_level))
+        if key is None:
+            print(
+                f"Warning: No matching tile found for region {region}, row={row}, col={col}, channel={channel}, z={z_level}"
+            )
+            return None
+        filepath = self.stitching_data[key]["filepath"]
+        try:
+            return dask_imread(filepath)[0]
+        except FileNotFoundError:
+            print(f"Warning: Tile file not found: {filepath}")
+            return None
 
     def normalize_image(self, img):
         img_min, img_max = img.min(), img.max()
@@ -1307,138 +1400,144 @@ class CoordinateStitcher(QThread, QObject):
         except Exception as e:
             print(f"Error in visualize_image: {e}")
 
-    def stitch_and_save_region(self, region, progress_callback=None):
-        stitched_images = self.init_output(region)  # sets self.x_positions, self.y_positions
-        region_data = {k: v for k, v in self.stitching_data.items() if k[1] == region}
-        total_tiles = len(region_data)
-        processed_tiles = 0
-
-        x_min = min(self.x_positions)
-        y_min = min(self.y_positions)
-
-        for key, tile_info in region_data.items():
-            t, _, fov, z_level, channel = key
-            tile = dask_imread(tile_info["filepath"])[0]
-            if self.use_registration:
-                self.col_index = self.x_positions.index(tile_info["x"])
-                self.row_index = self.y_positions.index(tile_info["y"])
-
-                if self.scan_pattern == "S-Pattern" and self.row_index % 2 == self.h_shift_rev_odd:
-                    h_shift = self.h_shift_rev
-                else:
-                    h_shift = self.h_shift
-
-                # Initialize starting coordinates based on tile position and shift
-                x_pixel = int(self.col_index * (self.input_width + h_shift[1]))
-                y_pixel = int(self.row_index * (self.input_height + self.v_shift[0]))
-
-                # Apply horizontal shift effect on y-coordinate
-                if h_shift[0] < 0:
-                    y_pixel += int(
-                        (len(self.x_positions) - 1 - self.col_index) * abs(h_shift[0])
-                    )  # Fov moves up as cols go right
-                else:
-                    y_pixel += int(self.col_index * h_shift[0])  # Fov moves down as cols go right
-
-                # Apply vertical shift effect on x-coordinate
-                if self.v_shift[1] < 0:
-                    x_pixel += int(
-                        (len(self.y_positions) - 1 - self.row_index) * abs(self.v_shift[1])
-                    )  # Fov moves left as rows go down
-                else:
-                    x_pixel += int(self.row_index * self.v_shift[1])  # Fov moves right as rows go down
-
-            else:
-                # Calculate base position
-                x_pixel = int((tile_info["x"] - x_min) * 1000 / self.pixel_size_um)
-                y_pixel = int((tile_info["y"] - y_min) * 1000 / self.pixel_size_um)
-
-            self.place_tile(stitched_images, tile, x_pixel, y_pixel, z_level, channel, t)
+    def get_mono_channel_indices(self, channel):
+        """
+        Returns the output channel index of each plane of channel's tiles (3 for rgb channels, otherwise 1).
+        """
+        if self.is_rgb[channel]:
+            channel = channel.split("_")[0]
+            return [self.mono_channel_names.index(f"{channel}_{color}") for color in ["R", "G", "B"]]
+        return [self.mono_channel_names.index(channel)]
+
+    def get_tile_position(self, tile_info):
+        """
+        Returns the (x_pixel, y_pixel) of the top left of the tile in the region's output, and its
+        (row_index, col_index) in the region's grid of tiles.  Needs self.x_positions and self.y_positions for the
+        tile's region (see calculate_output_dimensions).
+        """
+        col_index = tile_info["col"]
+        row_index = tile_info["row"]
+
+        if tile_info["region"] in self.registered_positions:
+            x_pixel, y_pixel = self.registered_positions[tile_info["region"]][(row_index, col_index)]
+            return x_pixel, y_pixel, row_index, col_index
+
+        if not self.use_registration:
+            x_pixel = int((tile_info["x"] - min(self.x_positions)) * 1000 / self.pixel_size_um)
+            y_pixel = int((tile_info["y"] - min(self.y_positions)) * 1000 / self.pixel_size_um)
+            return x_pixel, y_pixel, row_index, col_index
+
+        h_shift = self.get_h_shift(row_index)
 
-            processed_tiles += 1
-            if progress_callback:
-                progress_callback(processed_tiles, total_tiles)
+        # Initialize starting coordinates based on tile position and shift
+        x_pixel = int(col_index * (self.input_width + h_shift[1]))
+        y_pixel = int(row_index * (self.input_height + self.v_shift[0]))
 
-        self.starting_saving.emit(False)
-        if len(self.regions) > 1:
-            self.save_region_to_hcs_ome_zarr(region, stitched_images)
+        # Apply horizontal shift effect on y-coordinate
+        if h_shift[0] < 0:
+            y_pixel += int((len(self.x_positions) - 1 - col_index) * abs(h_shift[0]))  # Fov moves up as cols go right
         else:
-            # self.save_as_ome_zarr(region, stitched_images)
-            self.save_region_to_ome_zarr(
-                region, stitched_images
-            )  # bugs: when starting to save, main gui lags and disconnects
-
-    def place_tile(self, stitched_images, tile, x_pixel, y_pixel, z_level, channel, t):
-        if len(tile.shape) == 2:
-            # Handle 2D grayscale image
-            channel_idx = self.mono_channel_names.index(channel)
-            self.place_single_channel_tile(stitched_images, tile, x_pixel, y_pixel, z_level, channel_idx, t)
+            y_pixel += int(col_index * h_shift[0])  # Fov moves down as cols go right
 
-        elif len(tile.shape) == 3:
-            if tile.shape[2] == 3:
-                # Handle RGB image
-                channel = channel.split("_")[0]
-                for i, color in enumerate(["R", "G", "B"]):
-                    channel_idx = self.mono_channel_names.index(f"{channel}_{color}")
-                    self.place_single_channel_tile(
-                        stitched_images, tile[:, :, i], x_pixel, y_pixel, z_level, channel_idx, t
+        # Apply vertical shift effect on x-coordinate
+        if self.v_shift[1] < 0:
+            x_pixel += int(
+                (len(self.y_positions) - 1 - row_index) * abs(self.v_shift[1])
+            )  # Fov moves left as rows go down
+        else:
+            x_pixel += int(row_index * self.v_shift[1])  # Fov moves right as rows go down
+
+        return x_pixel, y_pixel, row_index, col_index
+
+    def get_h_shift(self, row_index):
+        if self.scan_pattern == "S-Pattern" and row_index % 2 == self.h_shift_rev_odd:
+            return self.h_shift_rev
+        return self.h_shift
+
+    def get_tile_crop(self, row_index, col_index):
+        """
+        Returns the (top, bottom, left, right) number of pixels to crop off of the tile at row_index, col_index.  With
+        registration, half of each overlap is cropped off of each of the tiles in it.  With global registration, the
+        overlaps aren't all the same, so tiles are placed whole (later tiles on top).
+        """
+        if not self.use_registration or self.use_global_registration:
+            return 0, 0, 0, 0
+
+        h_shift = self.get_h_shift(row_index)
+        v_crop = max(0, (-self.v_shift[0] // 2) - abs(h_shift[0]) // 2)
+        h_crop = max(0, (-h_shift[1] // 2) - abs(self.v_shift[1]) // 2)
+        top_crop = v_crop if row_index > 0 else 0
+        bottom_crop = v_crop if row_index < len(self.y_positions) - 1 else 0
+        left_crop = h_crop if col_index > 0 else 0
+        right_crop = h_crop if col_index < len(self.x_positions) - 1 else 0
+        return top_crop, bottom_crop, left_crop, right_crop
+
+    def get_region_tile_placements(self, region):
+        """
+        Returns a TilePlacement for each plane of each tile in region, with the stitching_data key as the source.
+        """
+        placements = []
+        for key in self.region_keys[region]:
+            tile_info = self.stitching_data[key]
+            t, _, _, z_level, channel = key
+            x_pixel, y_pixel, row_index, col_index = self.get_tile_position(tile_info)
+            top_crop, bottom_crop, left_crop, right_crop = self.get_tile_crop(row_index, col_index)
+            for plane, channel_idx in enumerate(self.get_mono_channel_indices(channel)):
+                placements.append(
+                    TilePlacement(
+                        source=key,
+                        plane=plane,
+                        t=t,
+                        c=channel_idx,
+                        z=z_level,
+                        y=y_pixel + top_crop,
+                        x=x_pixel + left_crop,
+                        crop_top=top_crop,
+                        crop_left=left_crop,
+                        height=self.input_height - top_crop - bottom_crop,
+                        width=self.input_width - left_crop - right_crop,
                     )
-            elif tile.shape[0] == 1:
-                channel_idx = self.mono_channel_names.index(channel)
-                self.place_single_channel_tile(stitched_images, tile[0], x_pixel, y_pixel, z_level, channel_idx, t)
+                )
+        return placements
+
+    def load_tile_planes(self, key):
+        """
+        Read the tile for stitching_data key, and return its flatfield corrected planes as a (planes, y, x) array.
+        """
+        channel = key[4]
+        # Use the synchronous scheduler, since this already runs in one of many stitching worker threads.
+        tile = dask_imread(self.stitching_data[key]["filepath"])[0].compute(scheduler="synchronous")
+        if len(tile.shape) == 2:
+            planes = tile[np.newaxis]
+        elif len(tile.shape) == 3 and tile.shape[2] == 3:
+            planes = np.moveaxis(tile, 2, 0)
+        elif len(tile.shape) == 3 and tile.shape[0] == 1:
+            planes = tile
         else:
             raise ValueError(f"Unexpected tile shape: {tile.shape}")
 
-    def place_single_channel_tile(self, stitched_images, tile, x_pixel, y_pixel, z_level, channel_idx, t):
-        if len(stitched_images.shape) != 5:
-            raise ValueError(
-                f"Unexpected stitched_images shape: {stitched_images.shape}. Expected 5D array (t, c, z, y, x)."
-            )
-
         if self.apply_flatfield:
-            tile = self.apply_flatfield_correction(tile, channel_idx)
-
-        if self.use_registration:
-            if self.scan_pattern == "S-Pattern" and self.row_index % 2 == self.h_shift_rev_odd:
-                h_shift = self.h_shift_rev
-            else:
-                h_shift = self.h_shift
-
-            # Determine crop for tile edges
-            top_crop = max(0, (-self.v_shift[0] // 2) - abs(h_shift[0]) // 2) if self.row_index > 0 else 0  # if y
-            bottom_crop = (
-                max(0, (-self.v_shift[0] // 2) - abs(h_shift[0]) // 2)
-                if self.row_index < len(self.y_positions) - 1
-                else 0
-            )
-            left_crop = max(0, (-h_shift[1] // 2) - abs(self.v_shift[1]) // 2) if self.col_index > 0 else 0
-            right_crop = (
-                max(0, (-h_shift[1] // 2) - abs(self.v_shift[1]) // 2)
-                if self.col_index < len(self.x_positions) - 1
-                else 0
+            planes = np.stack(
+                [
+                    self.apply_flatfield_correction(plane, channel_idx)
+                    for plane, channel_idx in zip(planes, self.get_mono_channel_indices(channel))
+                ]
             )
+        return planes
 
-            # Apply cropping to the tile
-            tile = tile[top_crop : tile.shape[0] - bottom_crop, left_crop : tile.shape[1] - right_crop]
-
-            # Adjust x_pixel and y_pixel based on cropping
-            x_pixel += left_crop
-            y_pixel += top_crop
+    def stitch_and_save_region(self, region, progress_callback=None):
+        stitched_images = self.init_output(region)  # sets self.x_positions, self.y_positions
+        pyramid = StreamingPyramidBuilder(self.init_pyramid(region, stitched_images))
+        placements = self.get_region_tile_placements(region)
 
-        y_end = min(y_pixel + tile.shape[0], stitched_images.shape[3])
-        x_end = min(x_pixel + tile.shape[1], stitched_images.shape[4])
+        # Every output chunk is built from its tiles and written once, in parallel, straight into the zarr store.  The
+        # lower resolution levels are built up from each chunk as it is written, so nothing is read back.
+        ChunkedTileStitcher(
+            stitched_images, self.load_tile_planes, num_workers=STITCHING_NUM_WORKERS, pyramid=pyramid
+        ).stitch(placements, progress_callback=progress_callback)
 
-        try:
-            stitched_images[t, channel_idx, z_level, y_pixel:y_end, x_pixel:x_end] = tile[
-                : y_end - y_pixel, : x_end - x_pixel
-            ]
-        except Exception as e:
-            print(f"ERROR: Failed to place tile. Details: {str(e)}")
-            print(
-                f"DEBUG: t:{t}, channel_idx:{channel_idx}, z_level:{z_level}, y:{y_pixel}-{y_end}, x:{x_pixel}-{x_end}"
-            )
-            print(f"DEBUG: tile slice shape: {tile[:y_end-y_pixel, :x_end-x_pixel].shape}")
-            raise
+        self.starting_saving.emit(False)
+        self.write_region_metadata(region)
 
     def apply_flatfield_correction(self, tile, channel_idx):
         if channel_idx in self.flatfields:
@@ -1462,10 +1561,16 @@ class CoordinateStitcher(QThread, QObject):
             pyramid.append(downsampled)
         return pyramid
 
-    def save_region_to_hcs_ome_zarr(self, region, stitched_images):
+    def get_region_image_group(self, region):
+        """
+        The zarr group the region's multiscale image goes in: a well in an hcs plate when there are multiple regions,
+        otherwise the root of the output.
+        """
         output_path = os.path.join(self.input_folder, self.output_name)
         store = ome_zarr.io.parse_url(output_path, mode="a").store
         root = zarr.group(store=store)
+        if len(self.regions) <= 1:
+            return root
 
         row, col = region[0], region[1:]
         row_group = root.require_group(row)
@@ -1477,24 +1582,55 @@ class CoordinateStitcher(QThread, QObject):
             }
             ome_zarr.writer.write_well_metadata(well_group, well_metadata["images"])
 
-        image_group = well_group.require_group("0")
+        return well_group.require_group("0")
+
+    def init_pyramid(self, region, stitched_images):
+        """
+        Create the (empty) lower resolution levels of the region's pyramid next to the full resolution
+        stitched_images, each half the size of the one before it, and return all of the levels.
+        """
+        image_group = self.get_region_image_group(region)
+        levels = [stitched_images]
+        for i in range(1, self.num_pyramid_levels):
+            t, c, z, height, width = levels[-1].shape
+            levels.append(
+                image_group.zeros(
+                    name=str(i),
+                    shape=(t, c, z, height // 2, width // 2),
+                    chunks=self.chunks,
+                    dtype=self.dtype,
+                    overwrite=True,
+                )
+            )
+        return levels
+
+    def write_region_metadata(self, region):
+        """
+        Write the multiscales and omero metadata for the region's pyramid.
+        """
+        image_group = self.get_region_image_group(region)
+        name = f"{region}" if len(self.regions) > 1 else "stitched_image"
 
-        pyramid = self.generate_pyramid(stitched_images, self.num_pyramid_levels)
-        coordinate_transformations = [
-            [
+        datasets = []
+        for i in range(self.num_pyramid_levels):
+            scale = 2**i
+            datasets.append(
                 {
-                    "type": "scale",
-                    "scale": [
-                        1,
-                        1,
-                        self.acquisition_params.get("dz(um)", 1),
-                        self.pixel_size_um * (2**i),
-                        self.pixel_size_um * (2**i),
+                    "path": str(i),
+                    "coordinateTransformations": [
+                        {
+                            "type": "scale",
+                            "scale": [
+                                1,
+                                1,
+                                self.acquisition_params.get("dz(um)", 1),
+                                self.pixel_size_um * scale,
+                                self.pixel_size_um * scale,
+                            ],
+                        }
                     ],
                 }
-            ]
-            for i in range(self.num_pyramid_levels)
-        ]
+            )
 
         axes = [
             {"name": "t", "type": "time", "unit": "second"},
@@ -1504,31 +1640,22 @@ class CoordinateStitcher(QThread, QObject):
             {"name": "x", "type": "space", "unit": "micrometer"},
         ]
 
-        # Prepare channels metadata
-        omero_channels = [
-            {
-                "label": name,
-                "color": f"{color:06X}",
-                "window": {"start": 0, "end": np.iinfo(self.dtype).max, "min": 0, "max": np.iinfo(self.dtype).max},
-            }
-            for name, color in zip(self.mono_channel_names, self.channel_colors)
-        ]
-
-        omero = {"name": f"{region}", "version": "0.4", "channels": omero_channels}
+        ome_zarr.writer.write_multiscales_metadata(image_group, datasets, axes=axes, name=name)
 
+        omero = {
+            "name": name,
+            "version": "0.4",
+            "channels": [
+                {
+                    "label": channel_name,
+                    "color": f"{color:06X}",
+                    "window": {"start": 0, "end": np.iinfo(self.dtype).max, "min": 0, "max": np.iinfo(self.dtype).max},
+                }
+                for channel_name, color in zip(self.mono_channel_names, self.channel_colors)
+            ],
+        }
         image_group.attrs["omero"] = omero
 
-        # Write the multiscale image data and metadata
-        ome_zarr.writer.write_multiscale(
-            pyramid=pyramid,
-            group=image_group,
-            chunks=self.chunks,
-            axes=axes,
-            coordinate_transformations=coordinate_transformations,
-            storage_options=dict(chunks=self.chunks),
-            name=f"{region}",
-        )
-
     def save_as_ome_zarr(self, region, stitched_images):
         output_path = os.path.join(self.input_folder, self.output_name)
         dz_um = self.acquisition_params.get("dz(um)", None)
@@ -1563,69 +1690,6 @@ class CoordinateStitcher(QThread, QObject):
             chunk_dims=self.chunks,
         )
 
-    def save_region_to_ome_zarr(self, region, stitched_images):
-        output_path = os.path.join(self.input_folder, self.output_name)
-        store = ome_zarr.io.parse_url(output_path, mode="a").store
-        root = zarr.group(store=store)
-
-        # Generate the pyramid
-        pyramid = self.generate_pyramid(stitched_images, self.num_pyramid_levels)
-
-        datasets = []
-        for i in range(self.num_pyramid_levels):
-            scale = 2**i
-            datasets.append(
-                {
-                    "path": str(i),
-                    "coordinateTransformations": [
-                        {
-                            "type": "scale",
-                            "scale": [
-                                1,
-                                1,
-                                self.acquisition_params.get("dz(um)", 1),
-                                self.pixel_size_um * scale,
-                                self.pixel_size_um * scale,
-                            ],
-                        }
-                    ],
-                }
-            )
-
-        axes = [
-            {"name": "t", "type": "time", "unit": "second"},
-            {"name": "c", "type": "channel"},
-            {"name": "z", "type": "space", "unit": "micrometer"},
-            {"name": "y", "type": "space", "unit": "micrometer"},
-            {"name": "x", "type": "space", "unit": "micrometer"},
-        ]
-
-        ome_zarr.writer.write_multiscales_metadata(root, datasets, axes=axes, name="stitched_image")
-
-        omero = {
-            "name": "stitched_image",
-            "version": "0.4",
-            "channels": [
-                {
-                    "label": name,
-                    "color": f"{color:06X}",
-                    "window": {"start": 0, "end": np.iinfo(self.dtype).max, "min": 0, "max": np.iinfo(self.dtype).max},
-                }
-                for name, color in zip(self.mono_channel_names, self.channel_colors)
-            ],
-        }
-        root.attrs["omero"] = omero
-
-        coordinate_transformations = [dataset["coordinateTransformations"] for dataset in datasets]
-
-        ome_zarr.writer.write_multiscale(
-            pyramid=pyramid,
-            group=root,
-            axes="tczyx",
-            coordinate_transformations=coordinate_transformations,
-            storage_options=dict(chunks=self.chunks),
-        )
-
     def write_stitched_plate_metadata(self):
         output_path = os.path.join(self.input_folder, self.output_name)
         store = ome_zarr.io.parse_url(output_path, mode="a").store
@@ -1716,13 +1780,17 @@ class CoordinateStitcher(QThread, QObject):
         if len(self.regions) > 1:
             self.write_stitched_plate_metadata()
 
-        if self.use_registration:
+        if self.use_registration and not self.use_global_registration:
             print(f"\nCalculating shifts for region {self.regions[0]}...")
             self.calculate_shifts(self.regions[0])
 
         for region in self.regions:
             wtime = time.time()
 
+            if self.use_registration and self.use_global_registration:
+                print(f"\nRegistering tiles in region {region}...")
+                self.calculate_global_positions(region)
+
             # if self.use_registration:
             #     print(f"\nCalculating shifts for region {region}...")
             #     self.calculate_shifts(region)
@@ -1763,17 +1831,17 @@ class CoordinateStitcher(QThread, QObject):
 
         self.write_fov_plate_metadata(root)
 
-        total_fovs = sum(
-            len(set([k[2] for k in self.stitching_data.keys() if k[1] == region])) for region in self.regions
-        )
+        total_fovs = sum(len(set(k[2] for k in self.region_keys[region])) for region in self.regions)
         processed_fovs = 0
 
         for region in self.regions:
-            region_data = {k: v for k, v in self.stitching_data.items() if k[1] == region}
+            region_fov_data = {}
+            for key in self.region_keys[region]:
+                region_fov_data.setdefault(key[2], {})[key] = self.stitching_data[key]
             well_group = self.write_fov_well_metadata(root, region)
 
             for fov_idx in range(self.num_fovs_per_region):
-                fov_data = {k: v for k, v in region_data.items() if k[2] == fov_idx}
+                fov_data = region_fov_data.get(fov_idx, {})
 
                 if not fov_data:
                     continue  # Skip if no data for this FOV index
@@ -66,6 +66,34 @@ def calculate_focus_measure(image, method=FocusMeasureOperator.LAPE):
     return focus_measure
 
 
+def fit_focus_peak(z_mm, focus_measures, fit_half_width: int = 2) -> float:
+    """
+    Returns the z of the peak of a focus measure vs z curve, from a Gaussian fit (a parabola through the log of the
+    focus measures, or through the focus measures themselves if any aren't positive) to the best focus measure and up
+    to fit_half_width points on either side of it.  If the best focus measure is at either end of the curve, or the
+    points around it don't make a peak, this is the z of the best focus measure.
+    """
+    order = np.argsort(z_mm, kind="stable")
+    z_mm = np.asarray(z_mm, dtype=float)[order]
+    focus_measures = np.asarray(focus_measures, dtype=float)[order]
+    best_idx = int(np.argmax(focus_measures))
+    best_z_mm = float(z_mm[best_idx])
+    if best_idx == 0 or best_idx == len(z_mm) - 1:
+        return best_z_mm
+
+    fit_z_mm = z_mm[max(0, best_idx - fit_half_width) : best_idx + fit_half_width + 1]
+    fit_measures = focus_measures[max(0, best_idx - fit_half_width) : best_idx + fit_half_width + 1]
+    if len(np.unique(fit_z_mm)) < 3:
+        return best_z_mm
+    if np.all(fit_measures > 0):
+        fit_measures = np.log(fit_measures)
+    # Fit around the best z, so the fit is well conditioned even though z is in mm.
+    a, b, _ = np.polyfit(fit_z_mm - best_z_mm, fit_measures, 2)
+    if a >= 0:
+        return best_z_mm
+    return float(np.clip(best_z_mm - b / (2 * a), fit_z_mm[0], fit_z_mm[-1]))
+
+
 def unsigned_to_signed(unsigned_array, N):
     signed = 0
     for i in range(N):
@@ -81,33 +109,38 @@ class FlipVariant(enum.Enum):
     BOTH = "Both"
 
 
-def rotate_and_flip_image(image, rotate_image_angle: float, flip_image: Optional[FlipVariant]):
-    ret_image = image.copy()
+def rotate_and_flip_view(image, rotate_image_angle: float, flip_image: Optional[FlipVariant]):
+    """
+    Same as rotate_and_flip_image, but returns a (possibly negatively strided) view of image instead of a copy.  Use
+    np.ascontiguousarray (or np.copyto) on the result if you need to hand it to something that wants real memory.
+    """
+    ret_image = image
     if rotate_image_angle and rotate_image_angle != 0:
-        """
-        # ROTATE_90_CLOCKWISE
-        # ROTATE_90_COUNTERCLOCKWISE
-        """
+        # np.rot90 with k > 0 rotates counterclockwise
         if rotate_image_angle == 90:
-            ret_image = cv2.rotate(ret_image, cv2.ROTATE_90_CLOCKWISE)
+            ret_image = np.rot90(ret_image, k=-1)
         elif rotate_image_angle == -90:
-            ret_image = cv2.rotate(ret_image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+            ret_image = np.rot90(ret_image, k=1)
         elif rotate_image_angle == 180:
-            ret_image = cv2.rotate(ret_image, cv2.ROTATE_180)
+            ret_image = np.rot90(ret_image, k=2)
         else:
             raise ValueError(f"Unhandled rotation: {rotate_image_angle}")
 
     if flip_image is not None:
         if flip_image == FlipVariant.VERTICAL:
-            ret_image = cv2.flip(ret_image, 0)
+            ret_image = ret_image[::-1, ...]
         elif flip_image == FlipVariant.HORIZONTAL:
-            ret_image = cv2.flip(ret_image, 1)
+            ret_image = ret_image[:, ::-1, ...]
         elif flip_image == FlipVariant.BOTH:
-            ret_image = cv2.flip(ret_image, -1)
+            ret_image = ret_image[::-1, ::-1, ...]
 
     return ret_image
 
 
+def rotate_and_flip_image(image, rotate_image_angle: float, flip_image: Optional[FlipVariant]):
+    return rotate_and_flip_view(image, rotate_image_angle, flip_image).copy()
+
+
 def generate_dpc(im_left, im_right):
     # Normalize the images
     im_left = im_left.astype(float) / 255
@@ -492,6 +525,13 @@ class TimingManager:
             self._log.debug(f"Stopping name={self._name} with elapsed={this_pair.elapsed()} [s]")
             self._last_start = None
 
+        def add_interval(self, start: float, stop: float):
+            """
+            Record an interval timed elsewhere with time.perf_counter(), eg: by worker threads that can't share this
+            timer's start() and stop().
+            """
+            self._timing_pairs.append(TimingManager.TimingPair(start, stop))
+
         def get_intervals(self):
             return [tp.elapsed() for tp in self._timing_pairs]
 
@@ -4,8 +4,10 @@ images, etc.
 """
 
 import os
+from typing import Any, Dict, List
 
 import numpy as np
+import pandas as pd
 import cv2
 import imageio
 
@@ -58,3 +60,66 @@ def return_pseudo_colored_image(image: np.array, config):
         image = np.stack([image] * 3, axis=-1)
 
     return image
+
+
+class CoordinatesBuffer:
+    """
+    Append-only, column oriented storage for the per image coordinates (the rows of coordinates.csv) of an
+    acquisition.
+
+    Appending a row is O(1), and the rows are only turned into a DataFrame when asked for.  flush_csv can be called
+    as rows come in to write just the new rows to disk, so that a crash part way through an acquisition still
+    leaves the coordinates captured so far.
+    """
+
+    def __init__(self, columns: List[str]):
+        self._columns = list(columns)
+        self._data: Dict[str, List[Any]] = {column: [] for column in self._columns}
+        self._row_count = 0
+        # The number of rows already written by flush_csv.
+        self._flushed_row_count = 0
+
+    @staticmethod
+    def from_dataframe(df: pd.DataFrame) -> "CoordinatesBuffer":
+        buffer = CoordinatesBuffer(list(df.columns))
+        for column in buffer._columns:
+            buffer._data[column] = df[column].tolist()
+        buffer._row_count = len(df)
+        return buffer
+
+    def __len__(self):
+        return self._row_count
+
+    def get_columns(self) -> List[str]:
+        return list(self._columns)
+
+    def append(self, row: Dict[str, Any]):
+        """
+        Append a row.  The row must have a value for exactly the columns of this buffer.
+        """
+        if len(row) != len(self._columns) or any(column not in row for column in self._columns):
+            raise ValueError(f"Row with columns {list(row.keys())} does not match buffer columns {self._columns}")
+        for column in self._columns:
+            self._data[column].append(row[column])
+        self._row_count += 1
+
+    def get_unflushed_row_count(self) -> int:
+        return self._row_count - self._flushed_row_count
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self._data, columns=self._columns)
+
+    def flush_csv(self, path: str):
+        """
+        Write all rows that have not been written yet to the csv at path.  The first flush (re)creates the file
+        with a header, and subsequent flushes append to it.
+        """
+        if self._flushed_row_count and not self.get_unflushed_row_count():
+            return
+        start = self._flushed_row_count
+        new_rows = pd.DataFrame(
+            {column: values[start:] for (column, values) in self._data.items()}, columns=self._columns
+        )
+        is_first_flush = self._flushed_row_count == 0
+        new_rows.to_csv(path, mode="w" if is_first_flush else "a", index=False, header=is_first_flush)
+        self._flushed_row_count = self._row_count
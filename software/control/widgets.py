@@ -5,6 +5,7 @@ from typing import Optional
 
 import squid.logging
 from control.core.core import TrackingController, MultiPointController, LiveController
+from control.core.raw_recording import RawFrameRecorder
 from control.microcontroller import Microcontroller
 from control.piezo import PiezoStage
 import control.utils as utils
@@ -1953,10 +1954,13 @@ class PiezoWidget(QFrame):
 
 
 class RecordingWidget(QFrame):
-    def __init__(self, streamHandler, imageSaver, main=None, *args, **kwargs):
+    def __init__(self, streamHandler, imageSaver, main=None, camera: Optional[AbstractCamera] = None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.imageSaver = imageSaver  # for saving path control
         self.streamHandler = streamHandler
+        # With a camera, we can also do raw recording of every frame (instead of saving images at the save fps).
+        self.camera = camera
+        self.raw_recorder: Optional[RawFrameRecorder] = None
         self.base_path_is_set = False
         self.add_components()
         self.setFrameStyle(QFrame.Panel | QFrame.Raised)
@@ -1988,6 +1992,12 @@ class RecordingWidget(QFrame):
         self.entry_timeLimit.setSingleStep(1)
         self.entry_timeLimit.setValue(-1)
 
+        self.checkbox_raw = QCheckBox("Raw (all frames)")
+        self.checkbox_raw.setToolTip(
+            "Record every frame at the full camera frame rate into raw chunk files, which can be converted to tiff or zarr afterwards."
+        )
+        self.checkbox_raw.setVisible(self.camera is not None)
+
         self.btn_record = QPushButton("Record")
         self.btn_record.setCheckable(True)
         self.btn_record.setChecked(False)
@@ -2007,16 +2017,24 @@ class RecordingWidget(QFrame):
         grid_line3.addWidget(self.entry_saveFPS, 0, 1)
         grid_line3.addWidget(QLabel("Time Limit (s)"), 0, 2)
         grid_line3.addWidget(self.entry_timeLimit, 0, 3)
+        grid_line3.addWidget(self.checkbox_raw, 0, 4)
 
         self.grid = QVBoxLayout()
         self.grid.addLayout(grid_line1)
         self.grid.addLayout(grid_line2)
         self.grid.addLayout(grid_line3)
         self.grid.addWidget(self.btn_record)
+        self.stats_display = StatsDisplayWidget()
+        self.grid.addWidget(self.stats_display)
         self.setLayout(self.grid)
 
-        # add and display a timer - to be implemented
-        # self.timer = QTimer()
+        # Stops raw recordings at the time limit (the image saver does this for normal recordings).
+        self.raw_recording_timer = QTimer()
+        self.raw_recording_timer.setSingleShot(True)
+
+        # Refreshes the frame count, drop, and throughput stats while recording.
+        self.stats_timer = QTimer()
+        self.stats_timer.setInterval(1000)
 
         # connections
         self.btn_setSavingDir.clicked.connect(self.set_saving_dir)
@@ -2024,6 +2042,8 @@ class RecordingWidget(QFrame):
         self.entry_saveFPS.valueChanged.connect(self.streamHandler.set_save_fps)
         self.entry_timeLimit.valueChanged.connect(self.imageSaver.set_recording_time_limit)
         self.imageSaver.stop_recording.connect(self.stop_recording)
+        self.raw_recording_timer.timeout.connect(self.stop_recording)
+        self.stats_timer.timeout.connect(self.update_stats)
 
     def set_saving_dir(self):
         dialog = QFileDialog()
@@ -2042,19 +2062,66 @@ class RecordingWidget(QFrame):
         if pressed:
             self.lineEdit_experimentID.setEnabled(False)
             self.btn_setSavingDir.setEnabled(False)
+            self.checkbox_raw.setEnabled(False)
             self.imageSaver.start_new_experiment(self.lineEdit_experimentID.text())
-            self.streamHandler.start_recording()
+            if self.checkbox_raw.isChecked():
+                self.start_raw_recording()
+            else:
+                self.streamHandler.start_recording()
+            self.stats_timer.start()
         else:
-            self.streamHandler.stop_recording()
+            self.stop_raw_recording()
+            self.stop_image_recording()
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
+            self.checkbox_raw.setEnabled(True)
+
+    def start_raw_recording(self):
+        # Stats shown while recording should only cover the recording.
+        self.streamHandler.metrics.reset()
+        self.raw_recorder = RawFrameRecorder(
+            self.camera,
+            os.path.join(self.imageSaver.base_path, self.imageSaver.experiment_ID),
+            chunk_size_bytes=RAW_RECORDING_CHUNK_SIZE_MB * 1024 * 1024,
+            max_queue_size=RAW_RECORDING_FRAME_QUEUE_SIZE,
+            metrics_log_interval_s=FRAME_STREAM_METRICS_LOG_INTERVAL_S,
+        )
+        self.raw_recorder.start()
+        if self.entry_timeLimit.value() > 0:
+            self.raw_recording_timer.start(self.entry_timeLimit.value() * 1000)
+
+    def stop_raw_recording(self):
+        self.raw_recording_timer.stop()
+        if self.raw_recorder:
+            self.raw_recorder.stop()
+            self.update_stats()
+            self.stats_timer.stop()
+            self.raw_recorder = None
+
+    def stop_image_recording(self):
+        if self.streamHandler.save_image_flag:
+            self.streamHandler.stop_recording()
+            # Saved into the experiment folder once the images still queued are written.
+            self.imageSaver.save_metrics(stream_metrics=self.streamHandler.metrics)
+            self.update_stats()
+            self.stats_timer.stop()
+
+    def update_stats(self):
+        stats = self.streamHandler.metrics.get_snapshot()
+        if self.raw_recorder:
+            stats.update(self.raw_recorder.metrics.get_snapshot())
+        else:
+            stats.update(self.imageSaver.metrics.get_snapshot())
+        self.stats_display.display_stats(stats)
 
     # stop_recording can be called by imageSaver
     def stop_recording(self):
         self.lineEdit_experimentID.setEnabled(True)
         self.btn_record.setChecked(False)
-        self.streamHandler.stop_recording()
+        self.stop_raw_recording()
+        self.stop_image_recording()
         self.btn_setSavingDir.setEnabled(True)
+        self.checkbox_raw.setEnabled(True)
 
 
 class NavigationWidget(QFrame):
@@ -2433,7 +2500,6 @@ class StatsDisplayWidget(QFrame):
         self.setLayout(self.layout)
 
     def display_stats(self, stats):
-        print("displaying parasite stats")
         locale.setlocale(locale.LC_ALL, "")
         self.table_widget.setRowCount(len(stats))
         row = 0
@@ -6120,6 +6186,15 @@ class StitcherWidget(QFrame):
         self.registrationZCombo.setVisible(False)
         self.rowLayout2.addWidget(self.registrationZCombo)
 
+        # Register all overlapping tile pairs instead of only the center ones
+        self.globalRegistrationCheck = QCheckBox("Global", self)
+        self.globalRegistrationCheck.setToolTip(
+            "Register every overlapping pair of tiles, and place all tiles to best agree with them"
+        )
+        self.globalRegistrationCheck.setChecked(STITCHING_GLOBAL_REGISTRATION)
+        self.globalRegistrationCheck.setVisible(False)
+        self.rowLayout2.addWidget(self.globalRegistrationCheck)
+
         self.layout.addLayout(self.rowLayout1)
         self.layout.addLayout(self.rowLayout2)
         self.setLayout(self.layout)
@@ -6152,6 +6227,7 @@ class StitcherWidget(QFrame):
         self.registrationChannelCombo.setVisible(checked)
         self.registrationZLabel.setVisible(checked)
         self.registrationZCombo.setVisible(checked)
+        self.globalRegistrationCheck.setVisible(checked)
 
     def updateRegistrationChannels(self, selected_channels):
         self.registrationChannelCombo.clear()  # Clear existing items
@@ -7942,11 +8018,14 @@ class TriggerControlWidget(QFrame):
 
 
 class MultiCameraRecordingWidget(QFrame):
-    def __init__(self, streamHandler, imageSaver, channels, main=None, *args, **kwargs):
+    def __init__(self, streamHandler, imageSaver, channels, main=None, cameras=None, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.imageSaver = imageSaver  # for saving path control
         self.streamHandler = streamHandler
         self.channels = channels
+        # With a camera per channel, we can also do raw recording of every frame.
+        self.cameras = cameras
+        self.raw_recorders = {}
         self.base_path_is_set = False
         self.add_components()
         self.setFrameStyle(QFrame.Panel | QFrame.Raised)
@@ -7976,6 +8055,9 @@ class MultiCameraRecordingWidget(QFrame):
         self.entry_timeLimit.setSingleStep(1)
         self.entry_timeLimit.setValue(-1)
 
+        self.checkbox_raw = QCheckBox("Raw (all frames)")
+        self.checkbox_raw.setVisible(self.cameras is not None)
+
         self.btn_record = QPushButton("Record")
         self.btn_record.setCheckable(True)
         self.btn_record.setChecked(False)
@@ -7995,7 +8077,8 @@ class MultiCameraRecordingWidget(QFrame):
         grid_line3.addWidget(self.entry_saveFPS, 0, 1)
         grid_line3.addWidget(QLabel("Time Limit (s)"), 0, 2)
         grid_line3.addWidget(self.entry_timeLimit, 0, 3)
-        grid_line3.addWidget(self.btn_record, 0, 4)
+        grid_line3.addWidget(self.checkbox_raw, 0, 4)
+        grid_line3.addWidget(self.btn_record, 0, 5)
 
         self.grid = QGridLayout()
         self.grid.addLayout(grid_line1, 0, 0)
@@ -8003,8 +8086,10 @@ class MultiCameraRecordingWidget(QFrame):
         self.grid.addLayout(grid_line3, 2, 0)
         self.setLayout(self.grid)
 
-        # add and display a timer - to be implemented
-        # self.timer = QTimer()
+        # Stops raw recordings at the time limit (the image savers do this for normal recordings).
+        self.raw_recording_timer = QTimer()
+        self.raw_recording_timer.setSingleShot(True)
+        self.raw_recording_timer.timeout.connect(self.stop_recording)
 
         # connections
         self.btn_setSavingDir.clicked.connect(self.set_saving_dir)
@@ -8036,22 +8121,49 @@ class MultiCameraRecordingWidget(QFrame):
             experiment_ID = self.lineEdit_experimentID.text()
             experiment_ID = experiment_ID + "_" + datetime.now().strftime("%Y-%m-%d_%H-%M-%S.%f")
             utils.ensure_directory_exists(os.path.join(self.save_dir_base, experiment_ID))
+            self.checkbox_raw.setEnabled(False)
             for channel in self.channels:
                 self.imageSaver[channel].start_new_experiment(os.path.join(experiment_ID, channel), add_timestamp=False)
-                self.streamHandler[channel].start_recording()
+                if self.checkbox_raw.isChecked():
+                    self.raw_recorders[channel] = RawFrameRecorder(
+                        self.cameras[channel],
+                        os.path.join(self.save_dir_base, experiment_ID, channel),
+                        chunk_size_bytes=RAW_RECORDING_CHUNK_SIZE_MB * 1024 * 1024,
+                        max_queue_size=RAW_RECORDING_FRAME_QUEUE_SIZE,
+                        metrics_log_interval_s=FRAME_STREAM_METRICS_LOG_INTERVAL_S,
+                    )
+                    self.raw_recorders[channel].start()
+                else:
+                    self.streamHandler[channel].start_recording()
+            if self.raw_recorders and self.entry_timeLimit.value() > 0:
+                self.raw_recording_timer.start(self.entry_timeLimit.value() * 1000)
         else:
-            for channel in self.channels:
-                self.streamHandler[channel].stop_recording()
+            self.stop_raw_recording()
+            self.stop_image_recording()
             self.lineEdit_experimentID.setEnabled(True)
             self.btn_setSavingDir.setEnabled(True)
+            self.checkbox_raw.setEnabled(True)
+
+    def stop_raw_recording(self):
+        self.raw_recording_timer.stop()
+        for recorder in self.raw_recorders.values():
+            recorder.stop()
+        self.raw_recorders = {}
+
+    def stop_image_recording(self):
+        for channel in self.channels:
+            if self.streamHandler[channel].save_image_flag:
+                self.streamHandler[channel].stop_recording()
+                self.imageSaver[channel].save_metrics(stream_metrics=self.streamHandler[channel].metrics)
 
     # stop_recording can be called by imageSaver
     def stop_recording(self):
         self.lineEdit_experimentID.setEnabled(True)
         self.btn_record.setChecked(False)
-        for channel in self.channels:
-            self.streamHandler[channel].stop_recording()
+        self.stop_raw_recording()
+        self.stop_image_recording()
         self.btn_setSavingDir.setEnabled(True)
+        self.checkbox_raw.setEnabled(True)
 
 
 class WaveformDisplay(QFrame):
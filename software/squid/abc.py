@@ -1,9 +1,11 @@
 import dataclasses
+import functools
 from contextlib import contextmanager
 from abc import ABC, abstractmethod
-from typing import Callable, Optional, Tuple, Sequence, List
+from typing import Callable, Dict, Optional, Tuple, Sequence, List
 import abc
 import enum
+import threading
 import time
 
 import pydantic
@@ -13,6 +15,9 @@ from dataclasses import dataclass
 import squid.logging
 from squid.config import AxisConfig, StageConfig, CameraConfig, CameraPixelFormat
 from squid.exceptions import SquidTimeout
+from squid.stage.position_history import PositionHistory
+from squid.camera.frame_pool import FrameBufferPool
+from squid.camera.frame_dispatch import FrameCallbackDispatcher, FrameCallbackStats, FrameOverflowPolicy
 import control.utils
 
 
@@ -143,6 +148,15 @@ class AbstractStage(metaclass=abc.ABCMeta):
         self._config = stage_config
         self._log = squid.logging.get_logger(self.__class__.__name__)
 
+        # Implementations that learn about positions as they change (eg: from a read thread or poller) should pass
+        # them to _on_new_position, which keeps this history and notifies the position listeners.
+        self._position_history = PositionHistory()
+        self._position_listeners_lock = threading.Lock()
+        # This is a list of (id, functions) to call when the position changes.  See add_position_listener.
+        self._position_listeners = []
+        # The (position, busy) we last got in _on_new_position
+        self._last_position: Optional[Tuple[Pos, bool]] = None
+
     @abc.abstractmethod
     def move_x(self, rel_mm: float, blocking: bool = True):
         pass
@@ -205,6 +219,54 @@ class AbstractStage(metaclass=abc.ABCMeta):
     def get_config(self) -> StageConfig:
         return self._config
 
+    def get_pos_at(self, timestamp_s: float) -> Pos:
+        """
+        Returns the position of the stage at timestamp_s (in time.time() seconds), interpolated from the recent
+        position history.  If this stage doesn't have a position history, this is the current position.
+        """
+        position = self._position_history.get_pos_at(timestamp_s)
+        if position is None:
+            return self.get_pos()
+        x_mm, y_mm, z_mm, theta_rad = position
+        return Pos(x_mm=x_mm, y_mm=y_mm, z_mm=z_mm, theta_rad=theta_rad)
+
+    def add_position_listener(self, listener: Callable[[Pos], None]) -> int:
+        """
+        Call listener with the new position whenever the stage's position changes, and once more when the stage
+        stops being busy.  Returns an id that can be used with remove_position_listener.
+
+        Listeners are called from whatever thread the stage learns about new positions on (eg: the microcontroller
+        read thread), so they must return quickly and not call back into the stage's move methods.
+        """
+        with self._position_listeners_lock:
+            listener_id = max((t[0] for t in self._position_listeners), default=0) + 1
+            self._position_listeners.append((listener_id, listener))
+        return listener_id
+
+    def remove_position_listener(self, listener_id: int):
+        with self._position_listeners_lock:
+            remaining = [t for t in self._position_listeners if t[0] != listener_id]
+            if len(remaining) == len(self._position_listeners):
+                self._log.warning(f"Asked to remove position listener {listener_id}, but it is not a known listener id")
+            self._position_listeners = remaining
+
+    def _on_new_position(self, timestamp_s: float, pos: Pos, busy: bool):
+        self._position_history.add(timestamp_s, pos.x_mm, pos.y_mm, pos.z_mm, pos.theta_rad)
+
+        last = self._last_position
+        self._last_position = (pos, busy)
+        stopped = last is not None and last[1] and not busy
+        if last is not None and last[0] == pos and not stopped:
+            return
+
+        with self._position_listeners_lock:
+            listeners = [t[1] for t in self._position_listeners]
+        for listener in listeners:
+            try:
+                listener(pos)
+            except Exception as e:
+                self._log.exception(f"Position listener failed: {e}")
+
     def wait_for_idle(self, timeout_s):
         start_time = time.time()
         while time.time() < start_time + timeout_s:
@@ -252,15 +314,61 @@ class CameraFrame:
     frame_format: CameraFrameFormat
     frame_pixel_format: CameraPixelFormat
 
+    # If the frame's memory came from a camera's FrameBufferPool, this gives it back.  See retain and release.
+    release_fn: Optional[Callable[[], None]] = dataclasses.field(default=None, repr=False, compare=False)
+    _ref_count: int = dataclasses.field(default=1, init=False, repr=False, compare=False)
+    _ref_lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, init=False, repr=False, compare=False)
+
     def is_color(self):
         return CameraPixelFormat.is_color_format(self.frame_pixel_format)
 
+    def is_pooled(self) -> bool:
+        """
+        True if this frame's memory will be reused for a later frame once all references to it are released.  If
+        so, anyone who wants to hold on to the frame (or a view of it) after their frame callback returns must
+        either retain() it (and release() it when done) or make a copy.
+        """
+        with self._ref_lock:
+            return self.release_fn is not None
+
+    def retain(self) -> "CameraFrame":
+        """
+        Take a reference to this frame so its memory is not reused until a matching release().  Returns self.
+        """
+        with self._ref_lock:
+            if self._ref_count <= 0 and self.release_fn is not None:
+                raise ValueError(f"Cannot retain frame_id={self.frame_id}, it has already been released.")
+            self._ref_count += 1
+        return self
+
+    def release(self):
+        """
+        Drop a reference to this frame.  Once all references are gone, a pooled frame's memory goes back to its pool.
+        """
+        with self._ref_lock:
+            self._ref_count -= 1
+            if self._ref_count != 0 or self.release_fn is None:
+                return
+            release_fn = self.release_fn
+        release_fn()
+
+    def detach(self) -> "CameraFrame":
+        """
+        Take this frame out of its pool for good, so that its memory is never reused and it can be held on to
+        without reference counting.  Returns self.
+        """
+        with self._ref_lock:
+            self.release_fn = None
+        return self
+
 
 class CameraError(RuntimeError):
     pass
 
 
 class AbstractCamera(metaclass=abc.ABCMeta):
+    FRAME_CALLBACK_STOP_TIMEOUT_S = 10.0
+
     @staticmethod
     def calculate_new_roi_for_binning(old_binning, old_roi, new_binning) -> Tuple[int, int, int, int]:
         """
@@ -314,6 +422,11 @@ class AbstractCamera(metaclass=abc.ABCMeta):
         # to do more than that.
         self._frame_callbacks: List[Tuple[int, Callable[[CameraFrame], None]]] = []
         self._frame_callbacks_enabled = True
+        # The dispatchers of callbacks that were added with a queue, by callback id.
+        self._frame_callback_dispatchers: Dict[int, FrameCallbackDispatcher] = {}
+
+        # Recycled frame memory for implementations that use _process_raw_frame_pooled.
+        self._frame_pool = FrameBufferPool()
 
     @contextmanager
     def _pause_streaming(self):
@@ -340,13 +453,27 @@ class AbstractCamera(metaclass=abc.ABCMeta):
     def get_callbacks_enabled(self) -> bool:
         return self._frame_callbacks_enabled
 
-    def add_frame_callback(self, frame_callback: Callable[[CameraFrame], None]) -> int:
+    def add_frame_callback(
+        self,
+        frame_callback: Callable[[CameraFrame], None],
+        max_queue_size: Optional[int] = None,
+        overflow_policy: FrameOverflowPolicy = FrameOverflowPolicy.BLOCK,
+    ) -> int:
         """
-        Adds a new callback that will be called with the receipt of every new frame.  This callback
-        should not block for a long time because it will be called in the frame receiving hot path!
+        Adds a new callback that will be called with the receipt of every new frame.
+
+        By default, the callback is called directly in the frame receiving hot path so it should not block for a long
+        time!  If max_queue_size is given, the callback instead gets its own thread that frames are handed to
+        through a queue of up to max_queue_size frames (queued frames are retained for you), and overflow_policy
+        says what happens when a frame comes in while that queue is full.  See get_frame_callback_stats for how
+        the callback is keeping up.
 
         This np.ndarray is shared with all callbacks, so you should make a copy if you need to modify it.
 
+        If the frame is_pooled(), its memory is reused for a later frame once the callbacks return.  Callbacks that
+        hold on to the frame (eg: queue it for writing) must retain() it and release() it when done, and anything
+        handed off to places that can't release it (eg: qt signals) must be a copy.
+
         Returns the callback ID that can be used to remove the callback later if needed.
         """
         try:
@@ -354,11 +481,25 @@ class AbstractCamera(metaclass=abc.ABCMeta):
         except ValueError:
             next_id = 1
 
+        if max_queue_size is not None:
+            dispatcher = FrameCallbackDispatcher(
+                name=f"{getattr(frame_callback, '__qualname__', 'callback')}_{next_id}",
+                callback=frame_callback,
+                max_queue_size=max_queue_size,
+                overflow_policy=overflow_policy,
+            )
+            self._frame_callback_dispatchers[next_id] = dispatcher
+            frame_callback = dispatcher.put
+
         self._frame_callbacks.append((next_id, frame_callback))
 
         return next_id
 
     def remove_frame_callback(self, callback_id):
+        """
+        Removes the callback with callback_id.  For queued callbacks, this waits (for up to
+        FRAME_CALLBACK_STOP_TIMEOUT_S) for the frames already in its queue to be handled first.
+        """
         try:
             idx_to_remove = [t[0] for t in self._frame_callbacks].index(callback_id)
             self._log.debug(f"Removing callback with id={callback_id} at idx={idx_to_remove}.")
@@ -366,6 +507,19 @@ class AbstractCamera(metaclass=abc.ABCMeta):
         except ValueError:
             self._log.warning(f"No callback with id={callback_id}, cannot remove it.")
 
+        dispatcher = self._frame_callback_dispatchers.pop(callback_id, None)
+        if dispatcher:
+            dispatcher.stop(AbstractCamera.FRAME_CALLBACK_STOP_TIMEOUT_S)
+            self._log.debug(f"Callback with id={callback_id} stopped with stats: {dispatcher.get_stats()}")
+
+    def get_frame_callback_stats(self, callback_id) -> Optional[FrameCallbackStats]:
+        """
+        Returns the delivery stats (latency, drops, etc) of the queued callback with callback_id, or None if there is
+        no such queued callback.
+        """
+        dispatcher = self._frame_callback_dispatchers.get(callback_id, None)
+        return dispatcher.get_stats() if dispatcher else None
+
     def _propogate_frame(self, camera_frame: CameraFrame):
         """
         Implementations can call this to propogate a new frame to all registered callbacks.  You should
@@ -535,25 +689,98 @@ class AbstractCamera(metaclass=abc.ABCMeta):
     def get_is_streaming(self):
         pass
 
-    def _process_raw_frame(self, raw_frame: np.array) -> np.array:
+    def _process_raw_frame(self, raw_frame: np.array, copy: bool = False, out: Optional[np.ndarray] = None) -> np.array:
         """
         Takes a raw nd array from a camera, and processes it such that it can be used directly in a
         CameraFrame as the frame field.  This takes care of rotating, resizing, etc the raw frame such that
         it respects this camera's settings.
 
+        To avoid copying full frames around, the rotation, flip, and crop are all done as views of raw_frame and the
+        result is only copied once (and only the cropped pixels) when needed.  If there is no rotation or flip, the
+        returned frame is a view into raw_frame.  So:
+          * If your driver reuses raw_frame's memory for later frames (eg: an sdk owned read buffer), pass copy=True.
+          * If you have a preallocated buffer of the processed frame's shape and dtype (see
+            get_processed_frame_shape), pass it as out and the processed frame will be written there and returned.
+
         Your camera's image callback should use this.
         """
+        image = self._get_processed_view(raw_frame)
+
+        if out is not None:
+            if out.shape != image.shape or out.dtype != image.dtype:
+                raise ValueError(
+                    f"Output buffer has shape={out.shape}, dtype={out.dtype} but frame has shape={image.shape}, dtype={image.dtype}"
+                )
+            np.copyto(out, image)
+            return out
+
+        # Rotated or flipped views have negative or swapped strides, which lots of consumers (eg: cv2) can't use
+        # directly, so those always get materialized.  Plain crops of raw_frame are fine to hand out as is.
+        if copy or not AbstractCamera._is_crop_view(image):
+            return image.copy()
+
+        return image
+
+    def _process_raw_frame_pooled(
+        self, raw_frame: np.ndarray, raw_frame_from_pool: bool = False
+    ) -> Tuple[np.ndarray, Callable[[], None]]:
+        """
+        Like _process_raw_frame, but the processed frame lives in memory from this camera's frame pool.  Returns the
+        processed frame and the function that gives its memory back to the pool, which should be passed to the
+        CameraFrame as its release_fn.
+
+        If your driver can fill a buffer from self._frame_pool.acquire with the raw frame, pass that as raw_frame with
+        raw_frame_from_pool=True.  Then frames that only need a crop don't get copied at all.  Otherwise raw_frame
+        is copied into a pooled buffer, so it can be reused by the driver as soon as this returns.
+        """
+        image = self._get_processed_view(raw_frame)
+        if raw_frame_from_pool and AbstractCamera._is_crop_view(image):
+            return image, functools.partial(self._frame_pool.release, raw_frame)
+
+        processed_frame = self._frame_pool.acquire(image.shape, image.dtype)
+        np.copyto(processed_frame, image)
+        if raw_frame_from_pool:
+            self._frame_pool.release(raw_frame)
+        return processed_frame, functools.partial(self._frame_pool.release, processed_frame)
+
+    def _get_processed_view(self, raw_frame: np.ndarray) -> np.ndarray:
+        """
+        The rotated, flipped, and cropped raw_frame as a (possibly negatively strided) view of it.
+        """
         # Apply rotation and flip
-        image = control.utils.rotate_and_flip_image(
+        image = control.utils.rotate_and_flip_view(
             raw_frame, rotate_image_angle=self._config.rotate_image_angle, flip_image=self._config.flip
         )
 
         # Apply software crop
         # Crop size should be scaled wrt the binning factor as the crop_width and crop_height are defined wrt the unbinned image size.
         crop_width, crop_height = self.get_crop_size()
-        image = control.utils.crop_image(image, crop_width, crop_height)
+        return control.utils.crop_image(image, crop_width, crop_height)
 
-        return image
+    @staticmethod
+    def _is_crop_view(image: np.ndarray) -> bool:
+        """
+        True if image is laid out in memory like a (possibly cropped) C ordered array.
+        """
+        min_stride = image.itemsize
+        for axis in reversed(range(image.ndim)):
+            if axis == image.ndim - 1 and image.strides[axis] != image.itemsize:
+                return False
+            if image.strides[axis] < min_stride:
+                return False
+            min_stride = image.strides[axis] * image.shape[axis]
+        return True
+
+    def get_processed_frame_shape(self, raw_frame_shape: Tuple[int, ...]) -> Tuple[int, ...]:
+        """
+        Returns the shape of the frame _process_raw_frame will produce for a raw frame of raw_frame_shape.
+        """
+        rotated_shape = list(raw_frame_shape)
+        if self._config.rotate_image_angle in (90, -90):
+            rotated_shape[0], rotated_shape[1] = rotated_shape[1], rotated_shape[0]
+        crop_width, crop_height = self.get_crop_size()
+        # A zero stride array lets us reuse crop_image's rounding without allocating a frame.
+        return control.utils.crop_image(np.broadcast_to(np.uint8(0), rotated_shape), crop_width, crop_height).shape
 
     def get_crop_size(self) -> Tuple[int, int]:
         """
@@ -588,6 +815,8 @@ class AbstractCamera(metaclass=abc.ABCMeta):
         This calls read_frame, but also fills in all the information such that you get a CameraFrame.  The
         frame in the CameraFrame will have had _process_raw_frame called on it already.
 
+        Callers of this don't know about frame pooling, so implementations should detach() the frame they return.
+
         Might return None if getting a frame timed out, or another error occurred.
         """
         pass
@@ -0,0 +1,166 @@
+import collections
+import enum
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import squid.logging
+
+
+class FrameOverflowPolicy(enum.Enum):
+    """
+    What a FrameCallbackDispatcher does with a new frame when its subscriber's queue is full.
+    """
+
+    # Throw away the oldest queued frame to make room (eg: for displays, which only care about the latest frame).
+    DROP_OLDEST = "Drop Oldest"
+    # Throw away the new frame.
+    DROP_NEWEST = "Drop Newest"
+    # Block the camera's frame thread until there is room (eg: for acquisitions, which can't lose frames).
+    BLOCK = "Block"
+
+
+@dataclass
+class FrameCallbackStats:
+    delivered_count: int
+    dropped_count: int
+    queued_count: int
+    # Time from a frame being queued to its callback starting.
+    mean_latency_s: float
+    max_latency_s: float
+    # Time spent in the callback.
+    mean_callback_time_s: float
+
+
+class FrameCallbackDispatcher:
+    """
+    Calls a frame callback on its own thread, with frames delivered through a bounded queue, so that a slow
+    subscriber doesn't hold up the camera's frame thread (or any other subscriber).
+
+    Frames are retain()ed while queued and released once the callback returns (or the frame is dropped), so
+    pooled frames stay valid until the subscriber is done with them.  Frames only need to support retain and
+    release, so this doesn't depend on squid.abc.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        callback: Callable,
+        max_queue_size: int,
+        overflow_policy: FrameOverflowPolicy = FrameOverflowPolicy.BLOCK,
+    ):
+        if max_queue_size < 1:
+            raise ValueError(f"FrameCallbackDispatcher max_queue_size must be >= 1, but got {max_queue_size}")
+        self._log = squid.logging.get_logger(f"{self.__class__.__name__}({name})")
+        self._callback = callback
+        self._max_queue_size = max_queue_size
+        self._overflow_policy = overflow_policy
+
+        # (frame, queued_time_s) pairs, oldest first
+        self._queue = collections.deque()
+        self._cv = threading.Condition()
+        self._running = True
+        self._busy = False
+
+        self._delivered_count = 0
+        self._dropped_count = 0
+        self._total_latency_s = 0.0
+        self._max_latency_s = 0.0
+        self._total_callback_time_s = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f"frame_callback_{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, frame):
+        """
+        Queue frame for the callback, handling a full queue based on our overflow policy.
+        """
+        dropped_frame = None
+        with self._cv:
+            if not self._running:
+                return
+            if len(self._queue) >= self._max_queue_size:
+                if self._overflow_policy == FrameOverflowPolicy.DROP_NEWEST:
+                    self._dropped_count += 1
+                    return
+                elif self._overflow_policy == FrameOverflowPolicy.DROP_OLDEST:
+                    dropped_frame, _ = self._queue.popleft()
+                    self._dropped_count += 1
+                else:
+                    self._cv.wait_for(lambda: len(self._queue) < self._max_queue_size or not self._running)
+                    if not self._running:
+                        return
+            self._queue.append((frame.retain(), time.monotonic()))
+            self._cv.notify_all()
+
+        if dropped_frame is not None:
+            dropped_frame.release()
+
+    def wait_for_idle(self, timeout_s: Optional[float] = None) -> bool:
+        """
+        Block until all queued frames have gone through the callback.  Returns False if we timed out first.
+        """
+        with self._cv:
+            return self._cv.wait_for(lambda: not self._queue and not self._busy, timeout=timeout_s)
+
+    def stop(self, timeout_s: Optional[float] = None):
+        """
+        Let the callback finish the frames already queued (for up to timeout_s), then stop the dispatch thread.  Any
+        frames still queued after that are dropped.
+        """
+        if threading.current_thread() is not self._thread and not self.wait_for_idle(timeout_s):
+            self._log.warning(f"Timed out waiting for {len(self._queue)} queued frames, dropping them.")
+
+        with self._cv:
+            self._running = False
+            dropped_frames = [frame for (frame, _) in self._queue]
+            self._dropped_count += len(dropped_frames)
+            self._queue.clear()
+            self._cv.notify_all()
+        for frame in dropped_frames:
+            frame.release()
+
+        if threading.current_thread() is not self._thread:
+            self._thread.join(timeout_s)
+
+    def get_stats(self) -> FrameCallbackStats:
+        with self._cv:
+            return FrameCallbackStats(
+                delivered_count=self._delivered_count,
+                dropped_count=self._dropped_count,
+                queued_count=len(self._queue),
+                mean_latency_s=self._total_latency_s / self._delivered_count if self._delivered_count else 0.0,
+                max_latency_s=self._max_latency_s,
+                mean_callback_time_s=(
+                    self._total_callback_time_s / self._delivered_count if self._delivered_count else 0.0
+                ),
+            )
+
+    def _run(self):
+        while True:
+            with self._cv:
+                self._cv.wait_for(lambda: self._queue or not self._running)
+                if not self._running:
+                    return
+                frame, queued_time_s = self._queue.popleft()
+                self._busy = True
+                # Let a blocked put() know there's room.
+                self._cv.notify_all()
+
+            start_time_s = time.monotonic()
+            try:
+                self._callback(frame)
+            except Exception:
+                self._log.exception("Frame callback raised, continuing with the next frame.")
+            finally:
+                frame.release()
+                end_time_s = time.monotonic()
+                with self._cv:
+                    latency_s = start_time_s - queued_time_s
+                    self._delivered_count += 1
+                    self._total_latency_s += latency_s
+                    self._max_latency_s = max(self._max_latency_s, latency_s)
+                    self._total_callback_time_s += end_time_s - start_time_s
+                    self._busy = False
+                    self._cv.notify_all()
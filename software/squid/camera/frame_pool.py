@@ -0,0 +1,75 @@
+import collections
+import threading
+from typing import Tuple
+
+import numpy as np
+
+
+class FrameBufferPool:
+    """
+    A thread safe pool of reusable frame buffers.  Cameras acquire a buffer for each new frame, and the buffer comes
+    back here once everyone is done with the frame (see CameraFrame.release) so that the next frame can reuse it
+    instead of allocating a new one.
+
+    Only max_free_buffers are kept around once released.  Past that (or when buffers of a new shape or dtype are
+    needed, eg: after a binning change), the oldest free buffers are dropped and left for the garbage collector.
+
+    This doesn't depend on squid.abc so that AbstractCamera can use it.
+    """
+
+    def __init__(self, max_free_buffers: int = 8):
+        if max_free_buffers < 0:
+            raise ValueError(f"FrameBufferPool max_free_buffers must be >= 0, but got {max_free_buffers}")
+        self._max_free_buffers = max_free_buffers
+        self._lock = threading.Lock()
+        self._free_buffers = collections.deque()
+        self._allocated_count = 0
+        self._reused_count = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """
+        Returns a C contiguous buffer of the given shape and dtype.  Its contents are whatever the last user of it
+        left there, so callers must fill all of it.
+        """
+        shape = tuple(shape)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            for idx, buffer in enumerate(self._free_buffers):
+                if buffer.shape == shape and buffer.dtype == dtype:
+                    del self._free_buffers[idx]
+                    self._reused_count += 1
+                    return buffer
+            self._allocated_count += 1
+
+        return np.empty(shape, dtype=dtype)
+
+    def release(self, buffer: np.ndarray):
+        """
+        Give a buffer from acquire back to the pool.  The caller must not use it after this.
+        """
+        with self._lock:
+            self._free_buffers.append(buffer)
+            while len(self._free_buffers) > self._max_free_buffers:
+                self._free_buffers.popleft()
+
+    def clear(self):
+        with self._lock:
+            self._free_buffers.clear()
+
+    def get_free_count(self) -> int:
+        with self._lock:
+            return len(self._free_buffers)
+
+    def get_allocated_count(self) -> int:
+        """
+        The number of times acquire had to allocate a new buffer because no free one matched.
+        """
+        with self._lock:
+            return self._allocated_count
+
+    def get_reused_count(self) -> int:
+        """
+        The number of times acquire handed out a recycled buffer.
+        """
+        with self._lock:
+            return self._reused_count
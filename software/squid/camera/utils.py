@@ -136,6 +136,7 @@ class SimulatedCamera(AbstractCamera):
         self._frame_id = 0
         self._current_raw_frame = None
         self._current_frame = None
+        self._frame_lock = threading.Lock()
 
         self._exposure_time_ms = None
         self.set_exposure_time(20)  # Just some random sane default since that isn't specified in our config.
@@ -313,7 +314,8 @@ class SimulatedCamera(AbstractCamera):
 
     @debug_log
     def read_camera_frame(self) -> CameraFrame:
-        return self._current_frame
+        with self._frame_lock:
+            return self._current_frame.detach() if self._current_frame else None
 
     @debug_log
     def get_white_balance_gains(self) -> Tuple[float, float, float]:
@@ -379,15 +381,24 @@ class SimulatedCamera(AbstractCamera):
 
         self._frame_id += 1
 
-        self._current_frame = CameraFrame(
+        processed_frame, release_fn = self._process_raw_frame_pooled(self._current_raw_frame)
+        camera_frame = CameraFrame(
             frame_id=self._frame_id,
             timestamp=time.time(),
-            frame=self._process_raw_frame(self._current_raw_frame),
+            frame=processed_frame,
             frame_format=self.get_frame_format(),
             frame_pixel_format=self.get_pixel_format(),
+            release_fn=release_fn,
         )
 
-        self._propogate_frame(self._current_frame)
+        with self._frame_lock:
+            old_frame = self._current_frame
+            self._current_frame = camera_frame
+        # Our reference to the old frame goes away with it, and we keep one to camera_frame while it's current.
+        if old_frame:
+            old_frame.release()
+
+        self._propogate_frame(camera_frame)
 
     @debug_log
     def get_ready_for_trigger(self) -> bool:
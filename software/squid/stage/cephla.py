@@ -1,4 +1,5 @@
 import math
+import time
 from typing import Optional
 
 import control.microcontroller
@@ -27,6 +28,10 @@ class CephlaStage(AbstractStage):
         self._configure_axis(_def.AXIS.Y, stage_config.Y_AXIS)
         self._configure_axis(_def.AXIS.Z, stage_config.Z_AXIS)
 
+        # Start the position history off with where we are now, then keep it up to date from the microcontroller.
+        self._on_new_position(time.time(), self.get_pos(), self._microcontroller.is_busy())
+        self._microcontroller.add_position_listener(self._on_microcontroller_position)
+
     def _configure_axis(self, microcontroller_axis_number: int, axis_config: AxisConfig):
         if axis_config.USE_ENCODER:
             # TODO(imo): The original navigationController had a "flip_direction" on configure_encoder, but it was unused in the implementation?
@@ -135,8 +140,13 @@ class CephlaStage(AbstractStage):
                 self._calc_move_timeout(abs_mm - self.get_pos().z_mm, self.get_config().Z_AXIS.MAX_SPEED)
             )
 
+    def _on_microcontroller_position(self, timestamp_s, pos_usteps, busy):
+        self._on_new_position(timestamp_s, self._usteps_to_pos(pos_usteps), busy)
+
     def get_pos(self) -> Pos:
-        pos_usteps = self._microcontroller.get_pos()
+        return self._usteps_to_pos(self._microcontroller.get_pos())
+
+    def _usteps_to_pos(self, pos_usteps) -> Pos:
         x_mm = self._config.X_AXIS.convert_to_real_units(pos_usteps[0])
         y_mm = self._config.Y_AXIS.convert_to_real_units(pos_usteps[1])
         z_mm = self._config.Z_AXIS.convert_to_real_units(pos_usteps[2])
@@ -190,25 +200,19 @@ class CephlaStage(AbstractStage):
             self._microcontroller.wait_till_operation_is_completed(theta_timeout)
 
     def zero(self, x: bool, y: bool, z: bool, theta: bool, blocking: bool = True):
+        # Zeroing doesn't move anything, so send all the zero commands and then wait for them once.
+        zero_commands = []
         if x:
-            self._microcontroller.zero_x()
-        if blocking:
-            self._microcontroller.wait_till_operation_is_completed()
-
+            zero_commands.append(self._microcontroller.zero_x())
         if y:
-            self._microcontroller.zero_y()
-        if blocking:
-            self._microcontroller.wait_till_operation_is_completed()
-
+            zero_commands.append(self._microcontroller.zero_y())
         if z:
-            self._microcontroller.zero_z()
-        if blocking:
-            self._microcontroller.wait_till_operation_is_completed()
-
+            zero_commands.append(self._microcontroller.zero_z())
         if theta:
-            self._microcontroller.zero_theta()
+            zero_commands.append(self._microcontroller.zero_theta())
+
         if blocking:
-            self._microcontroller.wait_till_operation_is_completed()
+            self._microcontroller.wait_for_commands(zero_commands)
 
     def set_limits(
         self,
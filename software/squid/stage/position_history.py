@@ -0,0 +1,74 @@
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class PositionHistory:
+    """
+    A fixed size, thread safe ring buffer of timestamped (x_mm, y_mm, z_mm, theta_rad) stage positions.  Stages feed
+    this as they learn about new positions so that callers can ask where the stage was at some time in the recent
+    past (eg: when an exposure happened) without having polled at that time.
+
+    This doesn't depend on squid.abc so that AbstractStage can use it.  Positions go in and come out as plain tuples.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        if capacity < 2:
+            raise ValueError(f"PositionHistory capacity must be at least 2, but got {capacity}")
+        self._lock = threading.Lock()
+        # Each row is (timestamp_s, x_mm, y_mm, z_mm, theta_rad), in a ring starting at _start.
+        self._entries = np.zeros((capacity, 5))
+        self._start = 0
+        self._count = 0
+
+    def add(self, timestamp_s: float, x_mm: float, y_mm: float, z_mm: float, theta_rad: Optional[float]):
+        """
+        Add a position.  Timestamps should only ever increase, but if a position comes in with a timestamp at or
+        before the latest one it replaces the latest one (so the history stays in time order).
+        """
+        theta_rad = np.nan if theta_rad is None else theta_rad
+        with self._lock:
+            capacity = len(self._entries)
+            if self._count and timestamp_s <= self._entries[(self._start + self._count - 1) % capacity, 0]:
+                idx = (self._start + self._count - 1) % capacity
+                timestamp_s = self._entries[idx, 0]
+            elif self._count < capacity:
+                idx = (self._start + self._count) % capacity
+                self._count += 1
+            else:
+                idx = self._start
+                self._start = (self._start + 1) % capacity
+            self._entries[idx] = (timestamp_s, x_mm, y_mm, z_mm, theta_rad)
+
+    def __len__(self):
+        return self._count
+
+    def get_latest(self) -> Optional[Tuple[float, float, float, float, Optional[float]]]:
+        """
+        Returns the latest (timestamp_s, x_mm, y_mm, z_mm, theta_rad), or None if the history is empty.
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            return PositionHistory._to_tuple(self._entries[(self._start + self._count - 1) % len(self._entries)])
+
+    def get_pos_at(self, timestamp_s: float) -> Optional[Tuple[float, float, float, Optional[float]]]:
+        """
+        Returns the (x_mm, y_mm, z_mm, theta_rad) position at timestamp_s, linearly interpolated between the
+        positions around it.  Times before the oldest or after the newest position get the oldest or newest
+        position.  Returns None if the history is empty.
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            entries = np.roll(self._entries, -self._start, axis=0)[: self._count]
+
+        timestamps = entries[:, 0]
+        position = [float(np.interp(timestamp_s, timestamps, entries[:, axis])) for axis in range(1, 5)]
+        return PositionHistory._to_tuple([timestamp_s] + position)[1:]
+
+    @staticmethod
+    def _to_tuple(entry) -> Tuple[float, float, float, float, Optional[float]]:
+        timestamp_s, x_mm, y_mm, z_mm, theta_rad = (float(v) for v in entry)
+        return timestamp_s, x_mm, y_mm, z_mm, None if np.isnan(theta_rad) else theta_rad
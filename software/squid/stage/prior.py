@@ -237,6 +237,8 @@ class PriorStage(AbstractStage):
         x, y, z = map(int, response.split(","))
         self.x_pos = x
         self.y_pos = y
+        pos = Pos(x_mm=self._steps_to_mm(self.x_pos), y_mm=self._steps_to_mm(self.y_pos), z_mm=0, theta_rad=0)
+        self._on_new_position(time.time(), pos, self.is_busy)
 
     def get_pos(self) -> Pos:
         self._ensure_pos_polling_thread()
@@ -0,0 +1,51 @@
+from dataclasses import dataclass
+from typing import Callable
+
+import pytest
+
+import tests.tools
+from control.microcontroller import Microcontroller
+from squid.abc import AbstractCamera
+from squid.stage.cephla import CephlaStage
+
+
+@dataclass
+class SimulatedHardware:
+    """
+    A simulated microcontroller, with the stage and camera that go with it.  Tests stand in for the optics (and any
+    timing the simulators don't have) by wrapping their methods with wrap(...), and by giving the camera a frame
+    source with set_frame_source(...).  Everything is put back at the end of the test.
+    """
+
+    microcontroller: Microcontroller
+    stage: CephlaStage
+    camera: AbstractCamera
+    monkeypatch: pytest.MonkeyPatch
+
+    def wrap(self, obj, method_name: str, wrapper: Callable):
+        """
+        Replace obj.method_name with a method that calls wrapper(original_method, *args, **kwargs).
+        """
+        original = getattr(obj, method_name)
+
+        def wrapped(*args, **kwargs):
+            return wrapper(original, *args, **kwargs)
+
+        self.monkeypatch.setattr(obj, method_name, wrapped)
+
+    def set_frame_source(self, read_frame: Callable):
+        """
+        Make the camera's read_frame() return read_frame().
+        """
+        self.monkeypatch.setattr(self.camera, "read_frame", read_frame)
+
+
+@pytest.fixture
+def simulated_hardware(monkeypatch) -> SimulatedHardware:
+    microcontroller = tests.tools.get_test_microcontroller()
+    return SimulatedHardware(
+        microcontroller=microcontroller,
+        stage=tests.tools.get_test_stage(microcontroller),
+        camera=tests.tools.get_test_camera(),
+        monkeypatch=monkeypatch,
+    )
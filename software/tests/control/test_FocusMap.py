@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from control.core.core import FocusMap
+
+
+def _focus_points():
+    points = {}
+    for region_id, x_offset in (("A1", 0.0), ("B2", 5.0)):
+        points[region_id] = [
+            (x, y, 1.0 + 0.01 * x - 0.02 * y + 0.001 * x * y)
+            for x in (x_offset, x_offset + 1.0, x_offset + 2.0)
+            for y in (0.0, 1.5, 3.0)
+        ]
+    return points
+
+
+@pytest.mark.parametrize("method", ["spline", "rbf"])
+@pytest.mark.parametrize("fit_by_region", [False, True])
+def test_focus_map_interpolate_regions_matches_interpolate(method, fit_by_region):
+    focus_map = FocusMap()
+    focus_map.set_method(method)
+    focus_map.set_fit_by_region(fit_by_region)
+    focus_map.fit(_focus_points())
+
+    region_coords = {
+        "A1": [(0.5, 0.5), (1.2, 2.9, 5.0), (1.9, 0.1)],
+        "B2": [(5.1, 2.0)],
+    }
+    z_by_region = focus_map.interpolate_regions(region_coords)
+
+    assert list(z_by_region.keys()) == ["A1", "B2"]
+    for region_id, coords_list in region_coords.items():
+        expected = [focus_map.interpolate(coords[0], coords[1], region_id) for coords in coords_list]
+        np.testing.assert_allclose(z_by_region[region_id], expected)
+
+
+def test_focus_map_caches_surface_fits():
+    focus_map = FocusMap()
+    focus_map.set_method("rbf")
+    focus_map.set_fit_by_region(True)
+    focus_map.fit(_focus_points())
+    first_fits = dict(focus_map.region_surface_fits)
+
+    focus_map.fit(_focus_points())
+    assert all(focus_map.region_surface_fits[region_id] is fit for region_id, fit in first_fits.items())
+
+    # A different smoothing factor is a different fit.
+    focus_map.smoothing_factor = 0.5
+    focus_map.fit(_focus_points())
+    assert all(focus_map.region_surface_fits[region_id] is not fit for region_id, fit in first_fits.items())
@@ -1,6 +1,14 @@
+import time
+from types import SimpleNamespace
+
 import tests.control.gui_test_stubs as gts
 import pytest
 
+import control.core.multi_point_worker
+from control._def import FILE_ID_PADDING, TriggerMode
+from control.core.focus_tracking import OnlineFocusSurface
+from control.core.multi_point_worker import MultiPointWorker
+
 
 # Make sure we can create a multi point controller and worker with out default config
 @pytest.mark.skip(
@@ -37,3 +45,266 @@ def test_multi_point_worker_init_bugs(qtbot):
     multi_point_controller_for_true.request_abort_aquisition()
     # This will throw if the attribute doesn't exist
     napari_layer_for_true = multi_point_controller_for_true.multiPointWorker.init_napari_layers
+
+
+def _make_headless_worker(tmp_path, nx=3, ny=1, nz=1, num_configs=2, do_autofocus=False):
+    """
+    A MultiPointWorker for a single region of nx by ny fovs on the simulated hardware, ready for a run() on this
+    thread.  With do_autofocus, it does a (short) contrast autofocus.
+    """
+    multi_point_controller = gts.get_test_multi_point_controller()
+    multi_point_controller.set_base_path(str(tmp_path))
+    multi_point_controller.start_new_experiment("unit test experiment")
+    config_names = [
+        config.name
+        for config in multi_point_controller.channelConfigurationManager.get_configurations(
+            multi_point_controller.objectiveStore.current_objective
+        )
+    ]
+    multi_point_controller.set_selected_configurations(config_names[:num_configs])
+    multi_point_controller.set_NZ(nz)
+    multi_point_controller.set_deltaZ(1.5)
+    multi_point_controller.set_Nt(1)
+    multi_point_controller.set_af_flag(do_autofocus)
+    multi_point_controller.autofocusController.set_N(5)
+    multi_point_controller.autofocusController.set_deltaZ(2)
+
+    stage_config = multi_point_controller.stage.get_config()
+    scan_coordinates = multi_point_controller.scanCoordinates
+    scan_coordinates.clear_regions()
+    scan_coordinates.add_flexible_region(
+        "A1", stage_config.X_AXIS.MIN_POSITION + 5, stage_config.Y_AXIS.MIN_POSITION + 5, 1.0, nx, ny, 0
+    )
+    multi_point_controller.scan_region_coords_mm = list(scan_coordinates.region_centers.values())
+    multi_point_controller.scan_region_names = list(scan_coordinates.region_centers.keys())
+    multi_point_controller.scan_region_fov_coords_mm = scan_coordinates.region_fov_coordinates
+    multi_point_controller.z_range = [1.0, 1.01]
+
+    multi_point_controller.parent = SimpleNamespace(laserAutofocusController=None, performance_mode=True)
+    multi_point_controller.headless = True
+    multi_point_controller.abort_acqusition_requested = False
+    multi_point_controller.timestamp_acquisition_started = time.time()
+    return MultiPointWorker(multi_point_controller)
+
+
+def test_multi_point_worker_pipelined_moves(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(control.core.multi_point_worker, "MULTIPOINT_PIPELINED_ACQUISITION", True)
+    # Long enough that selecting a config (which is slow on the simulated camera) fits in the settle time.
+    monkeypatch.setattr(control.core.multi_point_worker, "SCAN_STABILIZATION_TIME_MS_X", 150)
+    monkeypatch.setattr(control.core.multi_point_worker, "SCAN_STABILIZATION_TIME_MS_Y", 250)
+    worker = _make_headless_worker(tmp_path)
+    fov_coordinates = worker.scan_region_fov_coords_mm["A1"]
+    assert len(fov_coordinates) == 3
+
+    # (what, detail, time) of everything we care about, in the order they finished.
+    events = []
+
+    def record(obj, method_name, describe):
+        method = getattr(obj, method_name)
+
+        def recorded(*args, **kwargs):
+            result = method(*args, **kwargs)
+            events.append((method_name, describe(*args, **kwargs), time.time()))
+            return result
+
+        monkeypatch.setattr(obj, method_name, recorded)
+
+    record(worker.stage, "move_x_to", lambda x_mm, blocking=True: (round(x_mm, 6), blocking))
+    record(worker.stage, "move_y_to", lambda y_mm, blocking=True: (round(y_mm, 6), blocking))
+    record(worker.stage, "wait_for_idle", lambda timeout_s: None)
+    record(worker.liveController, "set_microscope_mode", lambda config: config.name)
+    record(worker, "acquire_camera_image", lambda config, file_ID, *args, **kwargs: (file_ID, config.name))
+    record(worker, "_sleep", lambda sec: sec)
+
+    worker.run()
+
+    config_names = [config.name for config in worker.selected_configurations]
+    captures = [(idx, event) for idx, event in enumerate(events) if event[0] == "acquire_camera_image"]
+    assert [detail for (_, (_, detail, _)) in captures] == [
+        (f"A1_{fov:0{FILE_ID_PADDING}}_{0:0{FILE_ID_PADDING}}", name) for fov in range(3) for name in config_names
+    ]
+
+    xy_moves = [(idx, event) for idx, event in enumerate(events) if event[0] in ("move_x_to", "move_y_to")]
+    # Every move is started without waiting for it, x and y together.
+    assert all(not blocking for (_, (_, (_, blocking), _)) in xy_moves)
+    assert [
+        (x_detail[0], y_detail[0])
+        for ((_, (_, x_detail, _)), (_, (_, y_detail, _))) in zip(xy_moves[::2], xy_moves[1::2])
+    ] == [(round(x_mm, 6), round(y_mm, 6)) for (x_mm, y_mm, *_) in fov_coordinates]
+
+    for fov in range(3):
+        move_idx = xy_moves[2 * fov][0]
+        fov_capture_idxs = [idx for (idx, _) in captures[fov * len(config_names) : (fov + 1) * len(config_names)]]
+        if fov > 0:
+            # The move to this fov started as soon as the last fov's captures were done.
+            previous_last_capture_idx = captures[fov * len(config_names) - 1][0]
+            assert previous_last_capture_idx < move_idx
+            assert not [event for event in events[previous_last_capture_idx + 1 : move_idx] if event[0] == "_sleep"]
+        assert move_idx < fov_capture_idxs[0]
+
+        # Once the move is done, the first config is selected while xy settles (for the longer of the two settle
+        # times, not both), and isn't selected again for its capture.
+        wait_idx = next(idx for idx in range(move_idx, len(events)) if events[idx][0] == "wait_for_idle")
+        between = events[wait_idx : fov_capture_idxs[0]]
+        assert [detail for (what, detail, _) in between if what == "set_microscope_mode"] == [config_names[0]]
+        sleeps = [(detail, done_time) for (what, detail, done_time) in between if what == "_sleep"]
+        assert 0 < sum(sleep_s for (sleep_s, _) in sleeps) <= 0.25
+        settle_done_time = sleeps[0][1]
+        assert settle_done_time - events[wait_idx][2] >= 0.25 - 0.005
+        # Only the second config needs a select between the captures.
+        between_captures = events[fov_capture_idxs[0] : fov_capture_idxs[-1]]
+        assert [detail for (what, detail, _) in between_captures if what == "set_microscope_mode"] == config_names[1:]
+
+
+def test_multi_point_worker_focus_tracking(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(control.core.multi_point_worker, "MULTIPOINT_FOCUS_TRACKING", True)
+    worker = _make_headless_worker(tmp_path, nx=4, num_configs=1, do_autofocus=True)
+    fov_coordinates = worker.scan_region_fov_coords_mm["A1"]
+
+    # A flat, tilted sample that the surface is already confident about, until its points go stale.
+    now_s = [0.0]
+    worker._focus_surface = OnlineFocusSurface(memory_half_life_s=60, time_fn=lambda: now_s[0])
+    x0_mm, y0_mm = fov_coordinates[0]
+    for dx_mm in (-1, 0, 1, 2, 3, 4, 5):
+        for dy_mm in (-1, 0, 1):
+            worker._focus_surface.add_point(x0_mm + dx_mm, y0_mm + dy_mm, 0.9 + 0.001 * dx_mm)
+    point_count = worker._focus_surface.get_point_count()
+    predicted_z_mm = [worker._focus_surface.predict(x_mm, y_mm)[0] for (x_mm, y_mm) in fov_coordinates]
+    assert all(worker._focus_surface.predict(x_mm, y_mm)[1] * 1000 < 2 for (x_mm, y_mm) in fov_coordinates)
+    worker.stage.move_z_to(1.0)
+
+    # (what, detail) of everything we care about, in order.
+    events = []
+    move_z_to = worker.stage.move_z_to
+    autofocus = worker.autofocusController.autofocus
+    acquire_camera_image = worker.acquire_camera_image
+
+    def recorded_move_z_to(z_mm, blocking=True):
+        events.append(("move_z_to", (z_mm, blocking, worker.stage.get_pos().z_mm)))
+        move_z_to(z_mm, blocking)
+
+    def recorded_autofocus(*args, **kwargs):
+        events.append(("autofocus", None))
+        return autofocus(*args, **kwargs)
+
+    def recorded_acquire_camera_image(config, file_ID, *args, **kwargs):
+        events.append(("acquire_camera_image", (file_ID, worker.stage.get_pos().z_mm)))
+        acquire_camera_image(config, file_ID, *args, **kwargs)
+        if file_ID.startswith(f"A1_{1:0{FILE_ID_PADDING}}"):
+            # Long enough that the surface forgets everything it had.
+            now_s[0] += 3600
+
+    monkeypatch.setattr(worker.stage, "move_z_to", recorded_move_z_to)
+    monkeypatch.setattr(worker.autofocusController, "autofocus", recorded_autofocus)
+    monkeypatch.setattr(worker, "acquire_camera_image", recorded_acquire_camera_image)
+
+    worker.run()
+
+    capture_idxs = [idx for (idx, (what, _)) in enumerate(events) if what == "acquire_camera_image"]
+    assert len(capture_idxs) == len(fov_coordinates)
+    fov_events = [events[start:end] for (start, end) in zip([0] + capture_idxs[:-1], capture_idxs)]
+
+    # The surface is confident at the first two fovs, so z goes straight to the prediction without an autofocus.
+    # z starts moving during the xy move, stopping short of the prediction when it's moving down.
+    for fov in (0, 1):
+        assert ("autofocus", None) not in fov_events[fov]
+        z_moves = [detail for (what, detail) in fov_events[fov] if what == "move_z_to"]
+        # (The acquisition starts with a move to the start of its z range.)
+        premove_z_mm, _, z_before_mm = next(z_move for z_move in z_moves if not z_move[1])
+        expected_premove_z_mm = predicted_z_mm[fov]
+        if predicted_z_mm[fov] < z_before_mm:
+            expected_premove_z_mm -= MultiPointWorker.FOCUS_TRACKING_Z_UNDERSHOOT_MM
+        assert premove_z_mm == pytest.approx(expected_premove_z_mm)
+        assert z_moves[-1][:2] == (pytest.approx(predicted_z_mm[fov]), True)
+        assert events[capture_idxs[fov]][1][1] == pytest.approx(predicted_z_mm[fov], abs=1e-4)
+    assert predicted_z_mm[0] < 1.0
+
+    # Once the surface's points are stale, autofocus is due again, and each one that succeeds adds a point.
+    assert [what for (what, _) in fov_events[2]].count("autofocus") == 1
+    autofocus_count = sum(what == "autofocus" for (what, _) in events)
+    assert worker._focus_surface.get_point_count() == point_count + autofocus_count
+
+
+def test_multi_point_worker_sequenced_z_stack(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(control.core.multi_point_worker, "MULTIPOINT_SEQUENCED_Z_STACK", True)
+    nz = 4
+    worker = _make_headless_worker(tmp_path, nx=2, nz=nz)
+    worker.update_use_piezo(False)
+    delta_z_mm = worker.deltaZ
+    camera = worker.camera
+    microcontroller = worker.microcontroller
+    # The test camera isn't wired up to the microcontroller for hardware triggering, and the sequence below never
+    # needs these anyway.
+    monkeypatch.setattr(camera, "_hw_trigger_fn", lambda illumination_time: True)
+    monkeypatch.setattr(camera, "_hw_set_strobe_delay_ms_fn", lambda strobe_delay_ms: True)
+    worker.liveController.set_trigger_mode(TriggerMode.HARDWARE)
+
+    # The simulated microcontroller doesn't trigger the camera during a sequence, so do that here, remembering the
+    # plane each frame was triggered at.
+    plane_of_frame_id = {}
+    start_z_stack_sequence = microcontroller.start_z_stack_sequence
+
+    def triggering_start_z_stack_sequence(n_planes, settle_time_ms, frame_time_ms):
+        result = start_z_stack_sequence(n_planes, settle_time_ms, frame_time_ms)
+        for plane in range(n_planes):
+            camera.send_trigger()
+            plane_of_frame_id[camera.get_frame_id()] = plane
+        return result
+
+    # (z index, file id, frame's z, frame id) of every saved frame.
+    saved = []
+    save_frame_timed = worker._save_frame_timed
+
+    def recorded_save_frame_timed(camera_frame, info):
+        saved.append((info.z_index, info.file_id, info.position.z_mm, camera_frame.frame_id))
+        return save_frame_timed(camera_frame, info)
+
+    # The z at the start of each fov's stack, and after it's done.
+    stack_z_mm = []
+    acquire_z_stack_sequenced = worker.acquire_z_stack_sequenced
+    move_z_back_after_stack = worker.move_z_back_after_stack
+
+    def recorded_acquire_z_stack_sequenced(*args, **kwargs):
+        stack_z_mm.append(worker.stage.get_pos().z_mm)
+        acquire_z_stack_sequenced(*args, **kwargs)
+
+    def recorded_move_z_back_after_stack():
+        move_z_back_after_stack()
+        stack_z_mm.append(worker.stage.get_pos().z_mm)
+
+    monkeypatch.setattr(microcontroller, "start_z_stack_sequence", triggering_start_z_stack_sequence)
+    monkeypatch.setattr(worker, "_save_frame_timed", recorded_save_frame_timed)
+    monkeypatch.setattr(worker, "acquire_z_stack_sequenced", recorded_acquire_z_stack_sequenced)
+    monkeypatch.setattr(worker, "move_z_back_after_stack", recorded_move_z_back_after_stack)
+
+    worker.run()
+
+    assert worker._use_sequenced_z_stack
+    num_configs = len(worker.selected_configurations)
+    assert len(saved) == 2 * num_configs * nz
+    assert len(stack_z_mm) == 2 * 2
+    for fov in range(2):
+        start_z_mm, end_z_mm = stack_z_mm[2 * fov : 2 * fov + 2]
+        assert end_z_mm == pytest.approx(start_z_mm, abs=1e-4)
+        fov_saved = [s for s in saved if s[1].startswith(f"A1_{fov:0{FILE_ID_PADDING}}_")]
+        assert len(fov_saved) == num_configs * nz
+        for z_index, file_id, z_mm, frame_id in fov_saved:
+            # Each channel's pass through the stack gets its frames in plane order.
+            assert plane_of_frame_id[frame_id] == z_index
+            assert file_id == f"A1_{fov:0{FILE_ID_PADDING}}_{z_index:0{FILE_ID_PADDING}}"
+            assert z_mm == pytest.approx(start_z_mm + z_index * delta_z_mm)
+
+
+def test_multi_point_worker_does_not_sequence_z_stack_with_long_settle_time(qtbot, tmp_path, monkeypatch):
+    monkeypatch.setattr(control.core.multi_point_worker, "MULTIPOINT_SEQUENCED_Z_STACK", True)
+    worker = _make_headless_worker(tmp_path, nx=1, nz=4)
+    worker.update_use_piezo(False)
+    camera = worker.camera
+    monkeypatch.setattr(camera, "_hw_trigger_fn", lambda illumination_time: True)
+    monkeypatch.setattr(camera, "_hw_set_strobe_delay_ms_fn", lambda strobe_delay_ms: True)
+    worker.liveController.set_trigger_mode(TriggerMode.HARDWARE)
+    assert worker._can_sequence_z_stack()
+
+    # More than the sequence command has room for.
+    monkeypatch.setattr(control.core.multi_point_worker, "SCAN_STABILIZATION_TIME_MS_Z", 300)
+    assert not worker._can_sequence_z_stack()
@@ -0,0 +1,195 @@
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import control.core.core
+import control.microcontroller
+from control._def import AXIS, TriggerMode
+from squid.abc import Pos
+
+START_Z_MM = 1.0
+# Between two of the stepped autofocus' z positions, so the sweep's fit has something to do.
+FOCUS_Z_MM = START_Z_MM + 0.0033
+DELTA_Z_UM = 2
+N = 11
+
+
+class FocusSample:
+    """
+    Stands in for the simulated hardware's optics and timing.  The simulated stage gets to where it's sent right
+    away, so non-blocking z moves are made to take as long as they would at the last z velocity sent to the
+    microcontroller (as far as get_pos_at and the camera can tell).  The camera sees a texture that gets blurrier
+    the further the stage was from FOCUS_Z_MM in the middle of the camera's last triggered exposure.  Triggers
+    take trigger_latency_s to get to the microcontroller, which reports them right away (so monkeypatch its status
+    period to 0 when checking frame timing).
+    """
+
+    def __init__(self, hardware, timed_sweeps=True, trigger_latency_s=0.0):
+        microcontroller = hardware.microcontroller
+        self._stage = hardware.stage
+        self._sweep = None
+        self._trigger_time = None
+        self._texture = np.random.default_rng(3).integers(0, 4096, size=(256, 256)).astype(np.float32)
+        # The simulated camera's getters are slow (they log their callers), so don't hold up the sweep with them.
+        camera = hardware.camera
+        self._trigger_to_mid_exposure_s = (camera.get_strobe_time() + camera.get_exposure_time() / 2) / 1000
+        self.z_velocities = []
+        # The z of each frame the camera saw during a sweep.
+        self.frame_z_mm = []
+
+        def spy_set_max_velocity_acceleration(set_max_velocity_acceleration, axis, velocity, acceleration):
+            if axis == AXIS.Z:
+                self.z_velocities.append(velocity)
+            return set_max_velocity_acceleration(axis, velocity, acceleration)
+
+        def spy_send_hardware_trigger(send_hardware_trigger, *args, **kwargs):
+            time.sleep(trigger_latency_s)
+            future = send_hardware_trigger(*args, **kwargs)
+            # The simulated microcontroller triggers as soon as it gets the command, and reports getting it right
+            # away.
+            self._trigger_time = microcontroller.wait_for_command_received(future)
+            return future
+
+        def timed_move_z_to(move_z_to, abs_mm, blocking=True):
+            if blocking:
+                self._sweep = None
+            else:
+                self._sweep = (time.time(), self._stage.get_pos().z_mm, abs_mm, self.z_velocities[-1])
+            move_z_to(abs_mm, blocking)
+
+        hardware.wrap(microcontroller, "set_max_velocity_acceleration", spy_set_max_velocity_acceleration)
+        hardware.wrap(microcontroller, "send_hardware_trigger", spy_send_hardware_trigger)
+        hardware.set_frame_source(self.read_frame)
+        if timed_sweeps:
+            hardware.wrap(self._stage, "move_z_to", timed_move_z_to)
+            hardware.monkeypatch.setattr(self._stage, "get_pos_at", self.get_pos_at)
+
+    def get_pos_at(self, timestamp_s):
+        pos = self._stage.get_pos()
+        if self._sweep is None:
+            return pos
+        start_time, start_z_mm, target_z_mm, velocity = self._sweep
+        z_mm = min(target_z_mm, start_z_mm + velocity * (timestamp_s - start_time))
+        return Pos(x_mm=pos.x_mm, y_mm=pos.y_mm, z_mm=z_mm, theta_rad=pos.theta_rad)
+
+    def read_frame(self):
+        if self._sweep is not None and self._trigger_time is not None:
+            z_mm = self.get_pos_at(self._trigger_time + self._trigger_to_mid_exposure_s).z_mm
+            self.frame_z_mm.append(z_mm)
+        else:
+            z_mm = self._stage.get_pos().z_mm
+        sigma = 0.5 + 2000 * abs(z_mm - FOCUS_Z_MM)
+        return cv2.GaussianBlur(self._texture, (0, 0), sigma).astype(np.uint16)
+
+
+def _make_worker(hardware, trigger_mode):
+    hardware.camera.set_exposure_time(17)
+    live_controller = SimpleNamespace(
+        trigger_mode=trigger_mode,
+        currentConfiguration=SimpleNamespace(name="BF LED matrix full"),
+        turn_on_illumination=lambda: None,
+        turn_off_illumination=lambda: None,
+    )
+    autofocus_controller = control.core.core.AutoFocusController(
+        hardware.camera, hardware.stage, live_controller, hardware.microcontroller
+    )
+    autofocus_controller.set_N(N)
+    autofocus_controller.set_deltaZ(DELTA_Z_UM)
+    autofocus_controller.set_crop(200, 200)
+    hardware.stage.move_z_to(START_Z_MM)
+
+    return control.core.core.AutofocusWorker(autofocus_controller)
+
+
+def test_sweep_autofocus_moves_to_fitted_peak(qtbot, monkeypatch, simulated_hardware):
+    monkeypatch.setattr(control.core.core, "AF_CONTINUOUS_SWEEP", True)
+    monkeypatch.setattr(control.microcontroller.Microcontroller, "STATUS_UPDATE_PERIOD_S", 0)
+    stage = simulated_hardware.stage
+    worker = _make_worker(simulated_hardware, TriggerMode.HARDWARE)
+    sample = FocusSample(simulated_hardware)
+    assert worker._can_sweep()
+
+    worker.run_autofocus()
+
+    # Closer than any of the frames' z positions can get (they're 2 um apart).
+    assert stage.get_pos().z_mm == pytest.approx(FOCUS_Z_MM, abs=0.0005)
+    # Swept at one frame per deltaZ, then back to full speed.
+    frame_interval_s = simulated_hardware.camera.get_total_frame_time() / 1000
+    assert sample.z_velocities == [
+        pytest.approx(DELTA_Z_UM / 1000 / frame_interval_s),
+        stage.get_config().Z_AXIS.MAX_SPEED,
+    ]
+
+
+def test_sweep_autofocus_frame_z_ignores_trigger_latency(qtbot, monkeypatch, simulated_hardware):
+    monkeypatch.setattr(control.microcontroller.Microcontroller, "STATUS_UPDATE_PERIOD_S", 0)
+    worker = _make_worker(simulated_hardware, TriggerMode.HARDWARE)
+    # At the sweep speed, this is a whole deltaZ.
+    sample = FocusSample(simulated_hardware, trigger_latency_s=0.02)
+    fit_focus_peak = control.core.core.utils.fit_focus_peak
+    fit_z_mm = []
+
+    def recorded_fit_focus_peak(z_mm, focus_measures):
+        fit_z_mm.extend(z_mm)
+        return fit_focus_peak(z_mm, focus_measures)
+
+    monkeypatch.setattr(control.core.core.utils, "fit_focus_peak", recorded_fit_focus_peak)
+
+    assert worker.run_sweep_autofocus()
+
+    assert len(fit_z_mm) >= 3
+    assert fit_z_mm == pytest.approx(sample.frame_z_mm, abs=1e-6)
+
+
+def test_sweep_autofocus_restores_z_velocity_on_error(qtbot, monkeypatch, simulated_hardware):
+    stage = simulated_hardware.stage
+    worker = _make_worker(simulated_hardware, TriggerMode.HARDWARE)
+    sample = FocusSample(simulated_hardware)
+
+    def broken_read_frame():
+        raise RuntimeError("camera went away")
+
+    simulated_hardware.set_frame_source(broken_read_frame)
+    with pytest.raises(RuntimeError):
+        worker.run_sweep_autofocus()
+
+    assert len(sample.z_velocities) == 2
+    assert sample.z_velocities[-1] == stage.get_config().Z_AXIS.MAX_SPEED
+
+
+def _stepped_focus_z_mm():
+    # The stepped autofocus ends up at the step closest to focus (give or take the stage's resolution).
+    bottom_z_mm = START_Z_MM - DELTA_Z_UM / 1000 * (round(N / 2) - 1)
+    return bottom_z_mm + DELTA_Z_UM / 1000 * round((FOCUS_Z_MM - bottom_z_mm) / (DELTA_Z_UM / 1000))
+
+
+def test_sweep_autofocus_falls_back_to_stepped_without_hardware_trigger(qtbot, monkeypatch, simulated_hardware):
+    monkeypatch.setattr(control.core.core, "AF_CONTINUOUS_SWEEP", True)
+    stage = simulated_hardware.stage
+    worker = _make_worker(simulated_hardware, TriggerMode.SOFTWARE)
+    sample = FocusSample(simulated_hardware)
+    assert not worker._can_sweep()
+
+    worker.run_autofocus()
+
+    assert sample.z_velocities == []
+    assert stage.get_pos().z_mm == pytest.approx(_stepped_focus_z_mm(), abs=DELTA_Z_UM / 1000 / 4)
+
+
+def test_sweep_autofocus_falls_back_to_stepped_when_it_cant_fit(qtbot, monkeypatch, simulated_hardware):
+    monkeypatch.setattr(control.core.core, "AF_CONTINUOUS_SWEEP", True)
+    stage = simulated_hardware.stage
+    worker = _make_worker(simulated_hardware, TriggerMode.HARDWARE)
+    # Without timed sweeps, the stage is at the top of the range by the first frame, so there's nothing to fit.
+    sample = FocusSample(simulated_hardware, timed_sweeps=False)
+
+    assert not worker.run_sweep_autofocus()
+    assert stage.get_pos().z_mm == pytest.approx(START_Z_MM, abs=1e-4)
+
+    worker.run_autofocus()
+
+    assert sample.z_velocities[-1] == stage.get_config().Z_AXIS.MAX_SPEED
+    assert stage.get_pos().z_mm == pytest.approx(_stepped_focus_z_mm(), abs=DELTA_Z_UM / 1000 / 4)
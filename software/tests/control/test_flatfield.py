@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+import control.core.flatfield
+from control.core.flatfield import FlatfieldCache, FlatfieldEstimator, estimate_flatfields, flatfield_camera_settings
+
+
+@pytest.fixture
+def mean_image_fit(monkeypatch):
+    # Stand in for BaSiC with something quick and predictable: the normalized mean of the sampled images.
+    fit_shapes = []
+
+    def fit(images):
+        fit_shapes.append(images.shape)
+        mean = images.mean(axis=0)
+        return mean / mean.mean()
+
+    monkeypatch.setattr(control.core.flatfield, "fit_flatfield", fit)
+    return fit_shapes
+
+
+def test_flatfield_estimator_samples_and_restores_shape(mean_image_fit):
+    estimator = FlatfieldEstimator(num_samples=5, max_size=32, seed=1)
+    assert estimator.estimate() is None
+
+    gradient = np.linspace(0.5, 1.5, 100, dtype=np.float32)[np.newaxis, :].repeat(60, axis=0)
+    for idx in range(50):
+        estimator.add((1000 * (idx % 3 + 1) * gradient).astype(np.uint16))
+    assert estimator.get_sample_count() == 5
+
+    flatfield = estimator.estimate()
+    # Fit on downsampled images, but returned at full size.
+    assert mean_image_fit == [(5, 19, 32)]
+    assert flatfield.shape == (60, 100)
+    np.testing.assert_allclose(flatfield, gradient, rtol=0.05)
+
+    with pytest.raises(ValueError):
+        estimator.add(np.zeros((30, 100), dtype=np.uint16))
+    with pytest.raises(ValueError):
+        estimator.add(np.zeros((60, 100, 3), dtype=np.uint16))
+
+
+def test_estimate_flatfields_reads_sources_in_parallel(mean_image_fit):
+    rng = np.random.default_rng(2)
+    tiles = {f"mono_{idx}": rng.integers(1, 1000, size=(1, 16, 20), dtype=np.uint16) for idx in range(4)}
+    tiles.update({f"rgb_{idx}": rng.integers(1, 1000, size=(3, 16, 20), dtype=np.uint16) for idx in range(3)})
+
+    def load_planes(source):
+        if source == "missing":
+            raise FileNotFoundError(source)
+        return tiles[source]
+
+    progress = []
+    flatfields = estimate_flatfields(
+        {"mono": ["mono_0", "mono_1", "missing", "mono_3"], "rgb": ["rgb_0", "rgb_1", "rgb_2"], "empty": ["missing"]},
+        load_planes,
+        num_workers=3,
+        progress_callback=lambda done, total: progress.append((done, total)),
+    )
+
+    assert set(flatfields) == {"mono", "rgb"}
+    assert flatfields["mono"].shape == (1, 16, 20)
+    assert flatfields["rgb"].shape == (3, 16, 20)
+    expected_rgb = np.stack([tiles[f"rgb_{idx}"] for idx in range(3)]).mean(axis=0)
+    np.testing.assert_allclose(
+        flatfields["rgb"], expected_rgb / expected_rgb.mean(axis=(1, 2), keepdims=True), rtol=1e-5
+    )
+    assert progress == [(1, 2), (2, 2)]
+
+
+def test_flatfield_cache_round_trip(tmp_path):
+    cache = FlatfieldCache(str(tmp_path / "flatfields"))
+    settings = flatfield_camera_settings(3.45, (60, 100))
+    flatfield = np.linspace(0.5, 1.5, 6000, dtype=np.float32).reshape(60, 100)
+
+    assert cache.get("20x", "Fluorescence 488 nm Ex", settings) is None
+    cache.put("20x", "Fluorescence 488 nm Ex", settings, flatfield)
+    np.testing.assert_array_equal(cache.get("20x", "Fluorescence 488 nm Ex", settings), flatfield)
+
+    # Anything else the flatfield depends on gets its own entry.
+    assert cache.get("10x", "Fluorescence 488 nm Ex", settings) is None
+    assert cache.get("20x", "Fluorescence 561 nm Ex", settings) is None
+    assert cache.get("20x", "Fluorescence 488 nm Ex", flatfield_camera_settings(6.9, (30, 50))) is None
+    # Equal settings written differently are the same entry.
+    assert (
+        cache.get("20x", "Fluorescence 488 nm Ex", flatfield_camera_settings(np.float64(3.45), [60, 100])) is not None
+    )
+    assert len(list((tmp_path / "flatfields").glob("*.tmp"))) == 0
+
+
+def test_flatfield_cache_ignores_unreadable_files(tmp_path):
+    cache = FlatfieldCache(str(tmp_path))
+    settings = flatfield_camera_settings(3.45, (60, 100))
+    key = FlatfieldCache.make_key("20x", "BF LED matrix full_R", settings)
+    (tmp_path / f"{key}.npy").write_bytes(b"not a flatfield")
+    assert cache.get("20x", "BF LED matrix full_R", settings) is None
@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+
+import control.utils
+from control._def import FocusMeasureOperator
+from control.core.focus_measure import FocusMeasureEngine
+
+ALL_OPERATORS = [FocusMeasureOperator.LAPE, FocusMeasureOperator.GLVA, FocusMeasureOperator.TENENGRAD]
+
+
+def _blurred_images():
+    rng = np.random.default_rng(7)
+    sharp = rng.integers(0, 4096, size=(300, 400)).astype(np.float32)
+    return [cv2.GaussianBlur(sharp, (0, 0), sigma).astype(np.uint16) for sigma in (0.5, 1.5, 3, 6)]
+
+
+@pytest.mark.parametrize("binning", [1, 2, 4])
+def test_focus_measure_engine_ranks_sharper_images_higher(binning):
+    images = _blurred_images()
+    with FocusMeasureEngine(ALL_OPERATORS, 200, 200, binning=binning, num_workers=3) as engine:
+        futures = [engine.submit(image) for image in images]
+        scores = [engine.result(future) for future in futures]
+
+    for operator in ALL_OPERATORS:
+        operator_scores = [image_scores[operator] for image_scores in scores]
+        assert operator_scores == sorted(operator_scores, reverse=True)
+
+
+def test_focus_measure_engine_matches_unbinned_calculate_focus_measure():
+    image = _blurred_images()[1]
+    with FocusMeasureEngine(ALL_OPERATORS, 100, 120, binning=1) as engine:
+        scores = engine.score(image)
+    roi = control.utils.crop_image(image, 100, 120)
+    for operator in ALL_OPERATORS:
+        assert scores[operator] == pytest.approx(control.utils.calculate_focus_measure(roi, operator), rel=1e-4)
+
+
+def test_focus_measure_engine_reports_timing():
+    timing = control.utils.TimingManager("test")
+    with FocusMeasureEngine([FocusMeasureOperator.LAPE], None, None, binning=2, timing=timing) as engine:
+        engine.result(engine.submit(_blurred_images()[0]))
+        engine.score(_blurred_images()[0])
+
+    assert len(timing.get_intervals(FocusMeasureEngine.SCORE_TIMER)) == 2
+    assert len(timing.get_intervals(FocusMeasureEngine.WAIT_TIMER)) == 1
+
+
+def test_focus_measure_engine_rejects_bad_args():
+    with pytest.raises(ValueError):
+        FocusMeasureEngine([], 100, 100)
+    with pytest.raises(ValueError):
+        FocusMeasureEngine([FocusMeasureOperator.LAPE], 100, 100, binning=0)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from control.core.focus_tracking import OnlineFocusSurface
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _focus_z_mm(x_mm, y_mm):
+    # A tilted and slightly warped sample, in mm.
+    return 2.0 + 0.002 * x_mm - 0.001 * y_mm + 0.0001 * (x_mm - 5) ** 2
+
+
+def test_online_focus_surface_predicts_nothing_without_points():
+    surface = OnlineFocusSurface()
+    assert surface.predict(1.0, 2.0) is None
+    assert surface.add_point(1.0, 2.0, 3.0) is None
+    assert surface.get_point_count() == 1
+
+
+def test_online_focus_surface_recovers_tilted_warped_sample():
+    surface = OnlineFocusSurface(measurement_noise_um=0.5)
+    rng = np.random.default_rng(3)
+    for x_mm in np.linspace(0, 10, 5):
+        for y_mm in np.linspace(0, 10, 5):
+            surface.add_point(x_mm, y_mm, _focus_z_mm(x_mm, y_mm) + rng.normal(0, 0.0005))
+
+    for x_mm, y_mm in ((2.5, 7.5), (6.1, 3.3), (9.0, 9.0)):
+        z_mm, std_mm = surface.predict(x_mm, y_mm)
+        assert z_mm == pytest.approx(_focus_z_mm(x_mm, y_mm), abs=0.001)
+        assert std_mm < 0.002
+
+
+def test_online_focus_surface_uncertainty_grows_with_distance_and_time():
+    clock = FakeClock()
+    surface = OnlineFocusSurface(memory_half_life_s=60, time_fn=clock)
+    for x_mm, y_mm in ((0, 0), (1, 0), (0, 1), (1, 1)):
+        surface.add_point(x_mm, y_mm, _focus_z_mm(x_mm, y_mm))
+
+    _, near_std_mm = surface.predict(0.5, 0.5)
+    _, far_std_mm = surface.predict(20, 20)
+    assert far_std_mm > 2 * near_std_mm
+
+    clock.now = 600
+    _, later_std_mm = surface.predict(0.5, 0.5)
+    assert later_std_mm > 2 * near_std_mm
+
+
+def test_online_focus_surface_inflates_uncertainty_when_predictions_miss():
+    surface = OnlineFocusSurface(measurement_noise_um=0.5)
+    for x_mm in range(4):
+        surface.add_point(x_mm, 0, 1.0)
+    _, calibrated_std_mm = surface.predict(1.5, 0)
+
+    # Jumps the quadratic can't follow.
+    for x_mm in range(4, 10):
+        surface.add_point(x_mm, 0, 1.0 + 0.02 * (x_mm % 2))
+    _, inflated_std_mm = surface.predict(1.5, 0)
+    assert inflated_std_mm > 2 * calibrated_std_mm
+
+    surface.reset()
+    assert surface.get_point_count() == 0
+    assert surface.predict(1.5, 0) is None
@@ -0,0 +1,177 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import tifffile
+
+from control.core.image_writer import ImageWriterPool, ImageWriterError, MultiPageTiffWriterCache
+
+
+@pytest.mark.parametrize("num_workers", [0, 1, 3])
+def test_image_writer_pool_runs_jobs_in_order_per_key(num_workers):
+    results = {}
+    results_lock = threading.Lock()
+
+    def job(key, value):
+        with results_lock:
+            results.setdefault(key, []).append(value)
+
+    pool = ImageWriterPool(num_workers=num_workers, max_queue_size=2)
+    for value in range(50):
+        for key in ("a", "b", "c"):
+            pool.submit(key, job, key, value)
+
+    assert pool.close(timeout_s=5)
+    assert pool.get_outstanding_count() == 0
+    for key in ("a", "b", "c"):
+        assert results[key] == list(range(50))
+
+
+def test_image_writer_pool_back_pressure():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    pool = ImageWriterPool(num_workers=1, max_queue_size=1)
+    pool.submit(0, blocking_job)
+    assert started.wait(1)
+    # The worker is busy, so this fills the queue.
+    pool.submit(0, lambda: None)
+
+    submit_returned = threading.Event()
+
+    def submit_one_more():
+        pool.submit(0, lambda: None)
+        submit_returned.set()
+
+    submitter = threading.Thread(target=submit_one_more, daemon=True)
+    submitter.start()
+    assert not submit_returned.wait(0.2)
+    assert not pool.flush(timeout_s=0.1)
+
+    release.set()
+    assert submit_returned.wait(1)
+    assert pool.close(timeout_s=1)
+
+
+def test_image_writer_pool_close_times_out_without_blocking():
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    pool = ImageWriterPool(num_workers=1, max_queue_size=1)
+    pool.submit(0, blocking_job)
+    assert started.wait(1)
+    # Fill the queue, so the stop can't be queued behind it.
+    pool.submit(0, lambda: None)
+
+    assert not pool.close(timeout_s=0.1)
+    assert pool.get_outstanding_count() == 2
+
+    # The worker finishes what it has, then stops on its own.
+    release.set()
+    assert pool.flush(timeout_s=1)
+    pool._threads[0].join(1)
+    assert not pool._threads[0].is_alive()
+
+
+def test_image_writer_pool_runs_jobs_submitted_during_close():
+    release = threading.Event()
+    started = threading.Event()
+    ran = []
+
+    def blocking_job():
+        started.set()
+        release.wait()
+
+    pool = ImageWriterPool(num_workers=1, max_queue_size=1)
+    pool.submit(0, blocking_job)
+    assert started.wait(1)
+    pool.submit(0, lambda: ran.append(1))
+    # This one is accepted, but blocks on the full queue until after we close.
+    submitter = threading.Thread(target=pool.submit, args=(0, lambda: ran.append(2)), daemon=True)
+    submitter.start()
+    time.sleep(0.1)
+
+    assert not pool.close(timeout_s=0.1)
+    with pytest.raises(ImageWriterError):
+        pool.submit(0, lambda: ran.append(3))
+
+    release.set()
+    submitter.join(1)
+    assert pool.flush(timeout_s=1)
+    assert ran == [1, 2]
+    assert pool.get_outstanding_count() == 0
+    pool._threads[0].join(1)
+    assert not pool._threads[0].is_alive()
+
+
+def test_image_writer_pool_reports_errors():
+    errors = []
+
+    def bad_job():
+        raise IOError("disk full")
+
+    pool = ImageWriterPool(num_workers=2, max_queue_size=4, error_callback=errors.append)
+    pool.submit(0, bad_job)
+    pool.submit(1, lambda: None)
+    assert pool.close(timeout_s=1)
+
+    assert len(errors) == 1
+    assert isinstance(errors[0], IOError)
+    assert pool.get_errors() == errors
+
+    with pytest.raises(ImageWriterError):
+        pool.submit(0, lambda: None)
+
+
+def test_multi_page_tiff_writer_cache(tmp_path):
+    cache = MultiPageTiffWriterCache()
+    n_z = 3
+    n_c = 2
+
+    def path_for(fov):
+        return str(tmp_path / f"A1_{fov}_stack.tiff")
+
+    for fov in range(2):
+        for z in range(n_z):
+            for c in range(n_c):
+                image = np.full((8, 10), 100 * fov + 10 * z + c, dtype=np.uint16)
+                cache.write(
+                    key=fov,
+                    path=path_for(fov),
+                    image=image,
+                    index=(z, c),
+                    stack_shape=(n_z, n_c),
+                    stack_axes="ZC",
+                    metadata={"fov": fov},
+                )
+    cache.close_all()
+
+    for fov in range(2):
+        with tifffile.TiffFile(path_for(fov)) as tiff:
+            assert tiff.is_imagej
+            assert tiff.imagej_metadata["Properties"]["fov"] == str(fov)
+            series = tiff.series[0]
+            assert series.axes == "ZCYX"
+            stack = series.asarray()
+        assert stack.shape == (n_z, n_c, 8, 10)
+        for z in range(n_z):
+            for c in range(n_c):
+                assert np.all(stack[z, c] == 100 * fov + 10 * z + c)
+
+
+def test_multi_page_tiff_writer_cache_rejects_mismatched_image(tmp_path):
+    cache = MultiPageTiffWriterCache()
+    path = str(tmp_path / "stack.tiff")
+    cache.write(0, path, np.zeros((4, 4), dtype=np.uint8), (0,), (2,), "Z")
+    with pytest.raises(ValueError):
+        cache.write(0, path, np.zeros((4, 5), dtype=np.uint8), (1,), (2,), "Z")
+    cache.close_all()
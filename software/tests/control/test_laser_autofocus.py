@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+import tests.control.gui_test_stubs as gts
+from control._def import SpotDetectionMode
+from control.core.core import LaserAFSettingManager, LaserAutofocusController
+from squid.abc import CameraAcquisitionMode
+
+PIXEL_TO_UM = 0.5
+X_REFERENCE = 200
+START_Z_MM = 1.0
+
+
+class LaserSpot:
+    """
+    Stands in for the focus camera's optics on the simulated hardware: while the simulated microcontroller has the
+    AF laser on, the camera sees a spot that moves by 1 / PIXEL_TO_UM pixels per um the stage is away from
+    START_Z_MM.  The simulated stage only moves move_fraction of each relative z move, so laser AF needs to close
+    the loop.
+    """
+
+    def __init__(self, hardware, move_fraction=1.0):
+        self._stage = hardware.stage
+        self.laser_on = False
+        self.laser_toggles = 0
+        self.frame_count = 0
+        self.frames_without_laser = 0
+
+        def spy_turn_on_AF_laser(turn_on_AF_laser):
+            self.laser_on = True
+            self.laser_toggles += 1
+            turn_on_AF_laser()
+
+        def spy_turn_off_AF_laser(turn_off_AF_laser):
+            self.laser_on = False
+            self.laser_toggles += 1
+            turn_off_AF_laser()
+
+        def partial_move_z(move_z, rel_mm, blocking=True):
+            move_z(rel_mm * move_fraction, blocking)
+
+        hardware.wrap(hardware.microcontroller, "turn_on_AF_laser", spy_turn_on_AF_laser)
+        hardware.wrap(hardware.microcontroller, "turn_off_AF_laser", spy_turn_off_AF_laser)
+        hardware.wrap(self._stage, "move_z", partial_move_z)
+        hardware.set_frame_source(self.read_frame)
+
+    def get_z_um(self):
+        return 1000 * (self._stage.get_pos().z_mm - START_Z_MM)
+
+    def read_frame(self):
+        self.frame_count += 1
+        if not self.laser_on:
+            self.frames_without_laser += 1
+            return np.zeros((256, 400), dtype=np.uint8)
+        spot_x = X_REFERENCE + self.get_z_um() / PIXEL_TO_UM
+        x = np.arange(400)
+        y = np.arange(256)
+        spot = np.exp(-((x[None, :] - spot_x) ** 2) / (2 * 8**2) - (y[:, None] - 128) ** 2 / (2 * 8**2))
+        return (200 * spot).astype(np.uint8)
+
+
+def _make_controller(hardware, tmp_path, z_um, move_fraction=1.0):
+    hardware.camera.set_acquisition_mode(CameraAcquisitionMode.SOFTWARE_TRIGGER)
+    hardware.stage.move_z_to(START_Z_MM)
+    laser_spot = LaserSpot(hardware, move_fraction)
+
+    laser_af_setting_manager = LaserAFSettingManager()
+    laser_af_setting_manager.set_profile_path(tmp_path)
+    controller = LaserAutofocusController(
+        hardware.microcontroller,
+        hardware.camera,
+        None,
+        hardware.stage,
+        objectiveStore=gts.get_test_objective_store(),
+        laserAFSettingManager=laser_af_setting_manager,
+    )
+    controller.laser_af_properties = controller.laser_af_properties.model_copy(
+        update={
+            "pixel_to_um": PIXEL_TO_UM,
+            "spot_detection_mode": SpotDetectionMode.SINGLE,
+            "laser_af_averaging_n": 3,
+            "displacement_success_window_um": 0.5,
+        }
+    )
+    assert controller.set_reference()
+    hardware.stage.move_z_to(START_Z_MM + z_um / 1000)
+    laser_spot.laser_toggles = 0
+    laser_spot.frame_count = 0
+    return controller, laser_spot
+
+
+def test_move_to_target_keeps_laser_on_and_reuses_the_final_frame(simulated_hardware, tmp_path):
+    controller, laser_spot = _make_controller(simulated_hardware, tmp_path, z_um=10.0)
+
+    assert controller.move_to_target(0, max_moves=1)
+
+    assert laser_spot.get_z_um() == pytest.approx(0, abs=0.5)
+    assert laser_spot.laser_toggles == 2
+    assert not laser_spot.laser_on
+    assert laser_spot.frames_without_laser == 0
+    # The averaged measurement before the move, then one frame for the cross correlation check.
+    assert laser_spot.frame_count == controller.laser_af_properties.laser_af_averaging_n + 1
+
+
+def test_move_to_target_closes_the_loop(simulated_hardware, tmp_path):
+    controller, laser_spot = _make_controller(simulated_hardware, tmp_path, z_um=10.0, move_fraction=0.9)
+
+    assert controller.move_to_target(0, max_moves=1)
+    assert abs(laser_spot.get_z_um()) > 0.5
+
+    controller.stage.move_z_to(START_Z_MM + 0.01)
+    laser_spot.frame_count = 0
+    assert controller.move_to_target(0, max_moves=5)
+    assert abs(laser_spot.get_z_um()) <= 0.5
+    # 10 um -> 1 um -> 0.1 um, so two moves with one frame after each.
+    assert laser_spot.frame_count == controller.laser_af_properties.laser_af_averaging_n + 2
+    assert not laser_spot.laser_on
+    assert laser_spot.frames_without_laser == 0
+
+
+def test_move_to_target_moves_back_when_alignment_check_fails(simulated_hardware, tmp_path):
+    controller, laser_spot = _make_controller(simulated_hardware, tmp_path, z_um=10.0)
+    # A reference that the spot can never match.
+    controller.reference_crop = np.random.default_rng(0).normal(size=controller.reference_crop.shape)
+
+    assert not controller.move_to_target(0, max_moves=3)
+    assert laser_spot.get_z_um() == pytest.approx(10.0, abs=0.2)
+    assert not laser_spot.laser_on
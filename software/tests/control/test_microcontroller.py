@@ -1,3 +1,4 @@
+import struct
 import time
 
 import pytest
@@ -200,3 +201,203 @@ def test_home_directions():
             hm(homing_direction=d)
             wait()
             assert test_micro.last_command[3] == d.value
+
+
+def test_z_stack_sequence_ends_at_last_plane():
+    micro = get_test_micro()
+
+    micro.move_z_to_usteps(1000)
+    micro.wait_till_operation_is_completed()
+
+    micro.set_z_stack_sequence(step=25)
+    micro.wait_till_operation_is_completed()
+    micro.set_z_stack_sequence_trigger(control_illumination=True, illumination_on_time_us=5000)
+    micro.wait_till_operation_is_completed()
+    micro.start_z_stack_sequence(n_planes=9, settle_time_ms=5, frame_time_ms=20)
+    micro.wait_till_operation_is_completed()
+    assert_pos_almost_equal((0, 0, 1000 + 8 * 25, 0), micro.get_pos())
+
+    # Piezo sequences don't move the z stepper.
+    micro.set_z_stack_sequence_piezo_step_um(1.5)
+    micro.wait_till_operation_is_completed()
+    micro.start_z_stack_sequence(n_planes=9, settle_time_ms=5, frame_time_ms=20)
+    micro.wait_till_operation_is_completed()
+    assert_pos_almost_equal((0, 0, 1000 + 8 * 25, 0), micro.get_pos())
+
+    with pytest.raises(ValueError):
+        micro.start_z_stack_sequence(n_planes=0, settle_time_ms=5, frame_time_ms=20)
+    # Times that don't fit in the command aren't silently clamped.
+    with pytest.raises(ValueError):
+        micro.start_z_stack_sequence(n_planes=3, settle_time_ms=300, frame_time_ms=20)
+    with pytest.raises(ValueError):
+        micro.start_z_stack_sequence(n_planes=3, settle_time_ms=5, frame_time_ms=70000)
+
+
+def test_microcontroller_queued_commands():
+    micro = get_test_micro()
+
+    futures = [
+        micro.move_x_to_usteps(1000),
+        micro.move_y_to_usteps(2000),
+        micro.set_illumination(0, 50),
+        micro.move_z_usteps(300),
+        micro.move_z_usteps(300),
+    ]
+    micro.wait_for_commands(futures)
+
+    assert all(f.done() for f in futures)
+    assert micro.get_in_flight_command_count() == 0
+    assert not micro.is_busy()
+    assert_pos_almost_equal((1000, 2000, 600, 0), micro.get_pos())
+
+
+def test_microcontroller_resends_after_checksum_error():
+    class CorruptingSimSerial(control.microcontroller.SimSerial):
+        def __init__(self):
+            super().__init__()
+            self.corrupt_next_write = False
+
+        def _respond_to(self, write_bytes):
+            if not self.corrupt_next_write:
+                return super()._respond_to(write_bytes)
+
+            # Act like the mcu got a bad checksum, and dropped the command.
+            self.corrupt_next_write = False
+            self.response_buffer.extend(
+                control.microcontroller.SimSerial.response_bytes_for(
+                    write_bytes[0],
+                    control._def.CMD_EXECUTION_STATUS.CMD_CHECKSUM_ERROR,
+                    self.x,
+                    self.y,
+                    self.z,
+                    self.theta,
+                    self.joystick_button,
+                    self.switch,
+                )
+            )
+            self._update_internal_state()
+
+    serial = CorruptingSimSerial()
+    micro = control.microcontroller.Microcontroller(serial_device=serial)
+
+    serial.corrupt_next_write = True
+    future = micro.move_x_usteps(1234)
+    micro.wait_for_commands([future])
+
+    assert_pos_almost_equal((1234, 0, 0, 0), micro.get_pos())
+
+
+class StalledSimSerial(control.microcontroller.SimSerial):
+    """
+    A SimSerial that reports commands as in progress (instead of completing them) until complete is set.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.complete = False
+        self.written_commands = []
+
+    def _respond_to(self, write_bytes):
+        self.written_commands.append(write_bytes[1])
+        if self.complete:
+            return super()._respond_to(write_bytes)
+        self.respond_with_status(write_bytes[0], control._def.CMD_EXECUTION_STATUS.IN_PROGRESS)
+
+    def respond_with_status(self, command_id, execution_status):
+        self.response_buffer.extend(
+            control.microcontroller.SimSerial.response_bytes_for(
+                command_id,
+                execution_status,
+                self.x,
+                self.y,
+                self.z,
+                self.theta,
+                self.joystick_button,
+                self.switch,
+            )
+        )
+        self._update_internal_state()
+
+    def push_status(self, command_id, execution_status):
+        with self._update_lock:
+            self.respond_with_status(command_id, execution_status)
+
+
+def test_microcontroller_keeps_abort_error_after_in_flight_timeout(monkeypatch):
+    monkeypatch.setattr(control.microcontroller.Microcontroller, "MAX_IN_FLIGHT_COMMANDS", 2)
+    monkeypatch.setattr(control.microcontroller.Microcontroller, "LAST_COMMAND_ACK_TIMEOUT", 0.02)
+    micro = control.microcontroller.Microcontroller(serial_device=StalledSimSerial(), reset_and_initialize=False)
+
+    stalled = [micro.move_x_usteps(10), micro.move_y_usteps(10)]
+    # There's no room, and the stalled commands never finish, so this aborts them.
+    micro.move_z_usteps(10)
+
+    assert all(isinstance(f.exception(timeout=0), control.microcontroller.CommandAborted) for f in stalled)
+    with pytest.raises(control.microcontroller.CommandAborted):
+        micro.wait_till_operation_is_completed()
+
+
+def test_microcontroller_reports_when_commands_are_received():
+    micro = control.microcontroller.Microcontroller(serial_device=StalledSimSerial(), reset_and_initialize=False)
+
+    before = time.time()
+    future = micro.send_hardware_trigger()
+    # The mcu has it, but it isn't done.
+    received_time = micro.wait_for_command_received(future, timeout_limit_s=1)
+    assert before <= received_time <= time.time()
+    assert not future.done()
+
+
+def test_microcontroller_joystick_ack_does_not_block_reads(monkeypatch):
+    monkeypatch.setattr(control.microcontroller.Microcontroller, "MAX_IN_FLIGHT_COMMANDS", 2)
+    serial = StalledSimSerial()
+    micro = control.microcontroller.Microcontroller(serial_device=serial, reset_and_initialize=False)
+
+    futures = [micro.move_x_usteps(10), micro.move_y_usteps(10)]
+    # The ack has to wait for room, which only the read thread can make by processing the next packets.
+    serial.joystick_button = True
+    serial.push_status(micro._cmd_id, control._def.CMD_EXECUTION_STATUS.IN_PROGRESS)
+    serial.complete = True
+    serial.push_status(micro._cmd_id, control._def.CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS)
+
+    micro.wait_for_commands(futures, timeout_limit_s=1)
+    deadline = time.time() + 1
+    while control._def.CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED not in serial.written_commands and time.time() < deadline:
+        time.sleep(0.01)
+    assert control._def.CMD_SET.ACK_JOYSTICK_BUTTON_PRESSED in serial.written_commands
+    micro.wait_till_operation_is_completed(timeout_limit_s=1)
+
+
+def test_crc8_ccitt_matches_crc_library():
+    crc = pytest.importorskip("crc")
+    calculator = crc.CrcCalculator(crc.Crc8.CCITT, table_based=True)
+    data = bytes(range(7, 200, 3))
+
+    assert control.microcontroller.crc8_ccitt(data) == calculator.calculate_checksum(data)
+    assert control.microcontroller.crc8_ccitt(memoryview(data)[5:28]) == calculator.calculate_checksum(data[5:28])
+
+
+def test_packet_parser_resyncs_and_buffers_partial_packets():
+    def packet(cmd_id, x):
+        # Use non zero reserved bytes, since a misaligned packet ending in a 0 looks like one from old firmware
+        # without checksums.
+        body = struct.pack(
+            ">BBiiiiBi", cmd_id, control._def.CMD_EXECUTION_STATUS.COMPLETED_WITHOUT_ERRORS, x, -2, 3, 4, 1, 0x01020304
+        )
+        return body + bytes([control.microcontroller.crc8_ccitt(body)])
+
+    parser = control.microcontroller.McuPacketParser()
+    stream = b"\x13\x37" + packet(1, 100) + packet(2, -200) + packet(3, 300)
+
+    # Feed it in odd sized chunks so packets get split across reads.
+    packets = []
+    for idx in range(0, len(stream), 17):
+        parser.add(stream[idx : idx + 17])
+        packets.extend(parser.get_packets())
+
+    assert [(p[0], p[2], p[3], p[6]) for p in packets] == [(1, 100, -2, 1), (2, -200, -2, 1), (3, 300, -2, 1)]
+    assert parser.get_buffered_byte_count() == 0
+
+    parser.add(packet(4, 400)[:10])
+    assert parser.get_packets() == []
+    assert parser.get_buffered_byte_count() == 10
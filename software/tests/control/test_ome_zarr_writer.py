@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import zarr
+
+from control.core.ome_zarr_writer import OmeZarrHcsWriter
+
+
+def test_ome_zarr_hcs_well_paths():
+    assert OmeZarrHcsWriter.get_well_paths(["A1", "B12", "AA3"]) == {"A1": "A/1", "B12": "B/12", "AA3": "AA/3"}
+    assert OmeZarrHcsWriter.get_well_paths(["current"]) == {"current": "R0/0"}
+    assert OmeZarrHcsWriter.get_well_paths(["A1", "a1"]) == {"A1": "R0/0", "a1": "R1/0"}
+
+
+def test_ome_zarr_hcs_writer(tmp_path):
+    path = str(tmp_path / "acquisition.ome.zarr")
+    channels = ["BF", "Fluorescence 488 nm Ex"]
+    writer = OmeZarrHcsWriter(
+        path=path,
+        region_fov_counts={"A1": 2, "B3": 1},
+        channel_names=channels,
+        nt=2,
+        nz=3,
+        pixel_size_um=0.5,
+        delta_z_um=1.5,
+        dt_s=0,
+    )
+
+    for t in range(2):
+        for region_id, fov_count in (("A1", 2), ("B3", 1)):
+            for fov in range(fov_count):
+                for z in range(3):
+                    for c in range(len(channels)):
+                        image = np.full((6, 8), 1000 * t + 100 * fov + 10 * z + c, dtype=np.uint16)
+                        writer.write(image, time_point=t, region_id=region_id, fov=fov, channel_index=c, z_index=z)
+        writer.write_coordinates(t, pd.DataFrame({"region": ["A1"], "fov": [0], "x (mm)": [1.5], "z (um)": [np.nan]}))
+
+    root = zarr.open_group(path, mode="r")
+    field = root["A/1/1/0"]
+    assert field.shape == (2, 2, 3, 6, 8)
+    assert field.dtype == np.uint16
+    assert np.all(field[1, 1, 2] == 1000 + 100 + 20 + 1)
+    assert np.all(root["B/3/0/0"][0, 0, 1] == 10)
+
+    squid_attrs = root.attrs["squid"]
+    assert squid_attrs["channels"] == channels
+    assert squid_attrs["regions"] == {"A1": "A/1", "B3": "B/3"}
+    coordinates = root[f"{squid_attrs['coordinates']}/1"].attrs["coordinates"]
+    assert coordinates["columns"] == ["region", "fov", "x (mm)", "z (um)"]
+    assert coordinates["data"] == [["A1", 0, 1.5, None]]
+    assert "0" in root[squid_attrs["coordinates"]]
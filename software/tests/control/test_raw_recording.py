@@ -0,0 +1,98 @@
+import json
+
+import numpy as np
+import pytest
+import tifffile
+
+import squid.camera.utils
+import squid.config
+from control.core.raw_recording import RawFrameRecorder, RawRecording, RawRecordingWriter, convert_raw_recording
+
+
+def _write_frames(directory, frames, chunk_size_bytes):
+    writer = RawRecordingWriter(str(directory), chunk_size_bytes=chunk_size_bytes)
+    for idx, frame in enumerate(frames):
+        writer.write(frame, frame_id=idx + 10, timestamp=idx * 0.01)
+    writer.close()
+    return writer
+
+
+def test_raw_recording_round_trip(tmp_path):
+    rng = np.random.default_rng(3)
+    frames = [rng.integers(0, 65535, size=(12, 17), dtype=np.uint16) for _ in range(11)]
+    # 4 frames per chunk, so the last chunk is only partly used.
+    _write_frames(tmp_path, frames, chunk_size_bytes=4 * frames[0].nbytes + 5)
+
+    assert sorted(p.name for p in tmp_path.glob("chunk_*.raw")) == [
+        "chunk_00000.raw",
+        "chunk_00001.raw",
+        "chunk_00002.raw",
+    ]
+    # The unused part of the last chunk is trimmed off.
+    assert (tmp_path / "chunk_00002.raw").stat().st_size == 3 * frames[0].nbytes
+
+    recording = RawRecording(str(tmp_path))
+    assert len(recording) == len(frames)
+    assert list(recording.index["frame_id"]) == list(range(10, 21))
+    np.testing.assert_allclose(recording.index["timestamp"], np.arange(11) * 0.01)
+    for expected, actual in zip(frames, recording.frames()):
+        np.testing.assert_array_equal(actual, expected)
+
+
+def test_raw_recording_rejects_mismatched_frames(tmp_path):
+    writer = RawRecordingWriter(str(tmp_path), chunk_size_bytes=1024)
+    writer.write(np.zeros((4, 4), dtype=np.uint8), frame_id=1, timestamp=0)
+    with pytest.raises(ValueError):
+        writer.write(np.zeros((4, 5), dtype=np.uint8), frame_id=2, timestamp=0)
+    with pytest.raises(ValueError):
+        writer.write(np.zeros((4, 4), dtype=np.uint16), frame_id=2, timestamp=0)
+    writer.close()
+    assert len(RawRecording(str(tmp_path))) == 1
+
+
+@pytest.mark.parametrize("output_format", ["tiff", "zarr"])
+def test_convert_raw_recording(tmp_path, output_format):
+    rng = np.random.default_rng(4)
+    frames = [rng.integers(0, 255, size=(8, 6), dtype=np.uint8) for _ in range(5)]
+    _write_frames(tmp_path / "raw", frames, chunk_size_bytes=2 * frames[0].nbytes)
+
+    output_path = str(tmp_path / f"converted.{output_format}")
+    convert_raw_recording(str(tmp_path / "raw"), output_path, output_format)
+
+    if output_format == "tiff":
+        converted = tifffile.imread(output_path)
+    else:
+        zarr = pytest.importorskip("zarr")
+        root = zarr.open_group(output_path, mode="r")
+        converted = root["frames"][:]
+        assert list(root["frame_ids"][:]) == list(range(10, 15))
+    np.testing.assert_array_equal(converted, np.stack(frames))
+
+    with pytest.raises(ValueError):
+        convert_raw_recording(str(tmp_path / "raw"), output_path, "bmp")
+
+
+def test_raw_frame_recorder_records_every_frame(tmp_path):
+    sim_cam = squid.camera.utils.get_camera(squid.config.get_camera_config(), simulated=True)
+    recorder = RawFrameRecorder(sim_cam, str(tmp_path), chunk_size_bytes=64 * 1024 * 1024, max_queue_size=4)
+    recorder.start()
+    expected_frames = []
+    for _ in range(20):
+        sim_cam.send_trigger()
+        expected_frames.append(sim_cam.read_frame().copy())
+    assert recorder.stop() == 20
+
+    # Frames after stopping aren't recorded.
+    sim_cam.send_trigger()
+
+    recording = RawRecording(str(tmp_path))
+    assert list(recording.index["frame_id"]) == list(range(1, 21))
+    for expected, actual in zip(expected_frames, recording.frames()):
+        np.testing.assert_array_equal(actual, expected)
+
+    with open(tmp_path / "recording_metrics.json", "r") as f:
+        metrics = json.load(f)
+    assert metrics["frames_received"] == 20
+    assert metrics["frames_written"] == 20
+    assert metrics["frames_missed"] == 0
+    assert metrics["bytes_written"] == 20 * expected_frames[0].nbytes
@@ -0,0 +1,86 @@
+import itertools
+
+import numpy as np
+import pytest
+
+import control.core.scan_path as scan_path
+import squid.config
+import tests.control.gui_test_stubs as gts
+
+
+def test_axis_move_time():
+    axis = squid.config.get_stage_config().X_AXIS
+    full_speed_distance = axis.MAX_SPEED**2 / axis.MAX_ACCELERATION
+
+    assert scan_path.axis_move_time_s(0, axis) == 0
+    # Short moves never get to max speed
+    short = full_speed_distance / 4
+    assert scan_path.axis_move_time_s(short, axis) == pytest.approx(2 * np.sqrt(short / axis.MAX_ACCELERATION))
+    # Long moves cruise at max speed
+    long = full_speed_distance * 4
+    assert scan_path.axis_move_time_s(-long, axis) == pytest.approx(
+        long / axis.MAX_SPEED + axis.MAX_SPEED / axis.MAX_ACCELERATION
+    )
+
+
+@pytest.mark.parametrize("concurrent_xy", [True, False])
+def test_optimized_order_matches_brute_force_for_small_paths(concurrent_xy):
+    stage_config = squid.config.get_stage_config()
+    rng = np.random.default_rng(1234)
+    points = rng.uniform(0, 100, size=(7, 2)).tolist()
+    start = (0.0, 0.0)
+
+    order = scan_path.get_optimized_order(points, stage_config, concurrent_xy, start)
+    assert sorted(order) == list(range(len(points)))
+
+    optimized_time = scan_path.get_path_time_s([points[i] for i in order], stage_config, concurrent_xy, start)
+    best_time = min(
+        scan_path.get_path_time_s([points[i] for i in perm], stage_config, concurrent_xy, start)
+        for perm in itertools.permutations(range(len(points)))
+    )
+    # This is a heuristic, so just make sure it's close.
+    assert optimized_time <= 1.1 * best_time
+
+
+def test_optimized_order_beats_row_order_for_sparse_wells():
+    stage_config = squid.config.get_stage_config()
+    rng = np.random.default_rng(5678)
+    # A sparse selection of wells in a 384 well plate (16 rows x 24 columns, 4.5 mm spacing)
+    wells = sorted({(int(r), int(c)) for (r, c) in zip(rng.integers(0, 16, 40), rng.integers(0, 24, 40))})
+    points = [(c * 4.5, r * 4.5) for (r, c) in wells]
+
+    row_order_time = scan_path.get_path_time_s(points, stage_config, concurrent_xy=True, start_xy_mm=(0, 0))
+    order = scan_path.get_optimized_order(points, stage_config, True, (0, 0))
+    optimized_time = scan_path.get_path_time_s([points[i] for i in order], stage_config, True, (0, 0))
+    assert optimized_time < row_order_time
+
+    best_order, best_time = scan_path.get_best_order(
+        [list(range(len(points))), order], points, stage_config, True, (0, 0)
+    )
+    assert best_order == order
+    assert best_time == pytest.approx(optimized_time)
+
+
+def test_scan_coordinates_optimized_sort(qtbot):
+    mpc = gts.get_test_multi_point_controller()
+    scan_coordinates = mpc.scanCoordinates
+    scan_coordinates.clear_regions()
+
+    x_min = mpc.stage.get_config().X_AXIS.MIN_POSITION + 1
+    y_min = mpc.stage.get_config().Y_AXIS.MIN_POSITION + 1
+    # Regions added in an order that zig zags back and forth across the stage.
+    for idx, offset in enumerate([0, 20, 2, 18, 4, 16]):
+        scan_coordinates.add_flexible_region(f"R{idx}", x_min + offset, y_min + 1, 0, 3, 2, 10)
+    all_fovs = sorted(tuple(c) for coords in scan_coordinates.region_fov_coordinates.values() for c in coords)
+
+    mpc.stage.move_x_to(x_min)
+    mpc.stage.move_y_to(y_min)
+    before_s = scan_coordinates.get_estimated_travel_time_s()
+    scan_coordinates.acquisition_pattern = "Optimized"
+    scan_coordinates.sort_coordinates()
+    after_s = scan_coordinates.get_estimated_travel_time_s()
+
+    assert after_s < before_s
+    assert list(scan_coordinates.region_centers.keys()) == ["R0", "R2", "R4", "R5", "R3", "R1"]
+    assert list(scan_coordinates.region_fov_coordinates.keys()) == list(scan_coordinates.region_centers.keys())
+    assert all_fovs == sorted(tuple(c) for coords in scan_coordinates.region_fov_coordinates.values() for c in coords)
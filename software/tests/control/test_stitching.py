@@ -0,0 +1,317 @@
+import collections
+import json
+import threading
+
+import numpy as np
+import pytest
+import tifffile
+import zarr
+
+from control.core.stitching import (
+    ChunkedTileStitcher,
+    GlobalTileRegistration,
+    StreamingPyramidBuilder,
+    TilePlacement,
+    find_overlapping_pairs,
+    phase_correlate_stack,
+    solve_tile_positions,
+)
+
+
+def _random_placements(rng, sources, output_shape, tile_size):
+    placements = []
+    for source in sources:
+        t = int(rng.integers(0, output_shape[0]))
+        z = int(rng.integers(0, output_shape[2]))
+        # Some tiles hang off of the top/left and bottom/right of the output.
+        y = int(rng.integers(-tile_size // 2, output_shape[3]))
+        x = int(rng.integers(-tile_size // 2, output_shape[4]))
+        crop_top, crop_left = (int(v) for v in rng.integers(0, 4, size=2))
+        for plane in range(output_shape[1]):
+            placements.append(
+                TilePlacement(
+                    source=source,
+                    plane=plane,
+                    t=t,
+                    c=plane,
+                    z=z,
+                    y=y,
+                    x=x,
+                    crop_top=crop_top,
+                    crop_left=crop_left,
+                    height=tile_size - crop_top - int(rng.integers(0, 4)),
+                    width=tile_size - crop_left - int(rng.integers(0, 4)),
+                )
+            )
+    return placements
+
+
+def _place_serially(output_shape, placements, tiles):
+    expected = np.zeros(output_shape, dtype=np.uint16)
+    for p in placements:
+        tile = tiles[p.source][p.plane, p.crop_top : p.crop_top + p.height, p.crop_left : p.crop_left + p.width]
+        y_start, x_start = max(p.y, 0), max(p.x, 0)
+        y_end, x_end = min(p.y + p.height, output_shape[3]), min(p.x + p.width, output_shape[4])
+        if y_start < y_end and x_start < x_end:
+            expected[p.t, p.c, p.z, y_start:y_end, x_start:x_end] = tile[
+                y_start - p.y : y_end - p.y, x_start - p.x : x_end - p.x
+            ]
+    return expected
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_chunked_tile_stitcher_matches_serial_placement(num_workers):
+    rng = np.random.default_rng(11)
+    output_shape = (2, 3, 2, 70, 90)
+    tile_size = 24
+    sources = [f"tile_{idx}" for idx in range(40)]
+    tiles = {s: rng.integers(1, 65535, size=(3, tile_size, tile_size), dtype=np.uint16) for s in sources}
+    placements = _random_placements(rng, sources, output_shape, tile_size)
+
+    load_counts = collections.Counter()
+    load_lock = threading.Lock()
+
+    def load_tile(source):
+        with load_lock:
+            load_counts[source] += 1
+        return tiles[source]
+
+    output = zarr.zeros(shape=output_shape, chunks=(1, 1, 1, 16, 16), dtype=np.uint16)
+    progress = []
+    ChunkedTileStitcher(output, load_tile, num_workers=num_workers).stitch(
+        placements, progress_callback=lambda done, total: progress.append((done, total))
+    )
+
+    np.testing.assert_array_equal(output[:], _place_serially(output_shape, placements, tiles))
+    # Every tile is read once, no matter how many chunks or channels it ends up in.
+    assert set(load_counts.values()) == {1}
+    assert progress[-1][0] == progress[-1][1] == len(progress)
+
+
+def test_chunked_tile_stitcher_groups_by_chunk():
+    output = zarr.zeros(shape=(1, 2, 1, 40, 40), chunks=(1, 1, 1, 16, 16), dtype=np.uint16)
+    stitcher = ChunkedTileStitcher(output, lambda source: None, num_workers=1)
+    placement = TilePlacement(
+        source="a", plane=0, t=0, c=1, z=0, y=10, x=30, crop_top=0, crop_left=0, height=10, width=20
+    )
+    off_the_edge = TilePlacement(
+        source="b", plane=0, t=0, c=0, z=0, y=50, x=0, crop_top=0, crop_left=0, height=10, width=10
+    )
+
+    chunks = stitcher.group_by_chunk([placement, off_the_edge])
+    assert list(chunks.keys()) == [(0, 1, 0, 0, 1), (0, 1, 0, 0, 2), (0, 1, 0, 1, 1), (0, 1, 0, 1, 2)]
+    assert all(chunk_placements == [placement] for chunk_placements in chunks.values())
+
+
+def test_chunked_tile_stitcher_rejects_bad_output():
+    with pytest.raises(ValueError):
+        ChunkedTileStitcher(np.zeros((4, 4)), lambda source: None, num_workers=1)
+    with pytest.raises(ValueError):
+        ChunkedTileStitcher(
+            zarr.zeros(shape=(1, 2, 1, 8, 8), chunks=(1, 2, 1, 8, 8), dtype=np.uint16),
+            lambda source: None,
+            num_workers=1,
+        )
+
+
+def _textured_image(rng, shape):
+    # Smooth random texture, so overlaps have something to correlate but aren't white noise.
+    noise = rng.random((shape[0] // 4 + 2, shape[1] // 4 + 2))
+    image = np.kron(noise, np.ones((4, 4)))[: shape[0], : shape[1]]
+    return image + 0.1 * rng.random(shape)
+
+
+def test_phase_correlate_stack_finds_shifts():
+    rng = np.random.default_rng(3)
+    image = _textured_image(rng, (200, 200))
+    shifts = [(0, 0), (3, -7), (-5, 12)]
+    references = np.stack([image[50:114, 50:114] for _ in shifts])
+    movings = np.stack([image[50 + dy : 114 + dy, 50 + dx : 114 + dx] for (dy, dx) in shifts])
+
+    found, confidences = phase_correlate_stack(references, np.concatenate([movings[:2], np.ones((1, 64, 64))]))
+    np.testing.assert_array_equal(found[:2], shifts[:2])
+    assert confidences[0] > 10 and confidences[1] > 10
+    # Nothing to correlate against a blank image.
+    assert confidences[2] == 0
+
+
+def test_find_overlapping_pairs():
+    positions = [(0, 0), (2, 90), (90, -3), (92, 88), (300, 300)]
+    horizontal, vertical = find_overlapping_pairs(positions, (100, 100))
+    np.testing.assert_array_equal(horizontal, [[0, 1], [2, 3]])
+    np.testing.assert_array_equal(vertical, [[0, 2], [1, 3]])
+
+
+def test_solve_tile_positions_prefers_pairs_over_stage():
+    stage = np.array([(0, 0), (0, 10), (0, 20)], dtype=float)
+    positions = solve_tile_positions(stage, [(0, 1), (1, 2)], [(1, 12), (-1, 12)], [1, 1], stage_weight=1e-6)
+    np.testing.assert_allclose(positions - positions[0], [(0, 0), (1, 12), (0, 24)], atol=1e-3)
+    # The group as a whole stays where the stage put it.
+    np.testing.assert_allclose(positions.mean(axis=0), stage.mean(axis=0), atol=1e-3)
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_global_tile_registration_recovers_positions(num_workers):
+    rng = np.random.default_rng(5)
+    tile_shape = (128, 160)
+    rows, cols = (4, 5)
+    nominal = np.array([(row * 104, col * 128) for row in range(rows) for col in range(cols)], dtype=float)
+    # The stage is off by a few pixels at each tile.
+    true_positions = nominal + rng.integers(-4, 5, size=nominal.shape)
+    true_positions -= true_positions.min(axis=0)
+    image = _textured_image(rng, (rows * 128 + 16, cols * 160 + 16))
+    tiles = [image[y : y + tile_shape[0], x : x + tile_shape[1]] for (y, x) in true_positions.astype(int)]
+    blank_tile = 7
+    tiles[blank_tile] = None
+
+    registration = GlobalTileRegistration(lambda idx: tiles[idx], tile_shape, num_workers=num_workers, batch_size=4)
+    positions = registration.register(nominal)
+
+    assert len(registration.pairs) == rows * (cols - 1) + (rows - 1) * cols
+    with_blank = (registration.pairs == blank_tile).any(axis=1)
+    assert registration.reliable[~with_blank].all()
+    assert not registration.reliable[with_blank].any()
+
+    registered = np.delete(np.round(positions - positions[0]), blank_tile, axis=0)
+    np.testing.assert_array_equal(registered, np.delete(true_positions - true_positions[0], blank_tile, axis=0))
+    # The blank tile follows its neighbours, using the stage offsets to them.
+    assert np.abs(positions[blank_tile] - positions[0] - (true_positions[blank_tile] - true_positions[0])).max() < 8
+
+
+def _downsample_levels(level0, num_levels):
+    levels = [level0]
+    for _ in range(1, num_levels):
+        previous = levels[-1]
+        height, width = previous.shape[3] // 2 * 2, previous.shape[4] // 2 * 2
+        blocks = previous[..., :height, :width].reshape(previous.shape[:3] + (height // 2, 2, width // 2, 2))
+        levels.append(blocks.mean(axis=(4, 6)).astype(previous.dtype))
+    return levels
+
+
+def _pyramid_levels(shape, num_levels, chunks=(1, 1, 1, 16, 16)):
+    levels = []
+    for _ in range(num_levels):
+        levels.append(zarr.zeros(shape=shape, chunks=chunks, dtype=np.uint16))
+        shape = shape[:3] + (shape[3] // 2, shape[4] // 2)
+    return levels
+
+
+@pytest.mark.parametrize("num_workers", [1, 4])
+def test_streaming_pyramid_matches_downsampling_level_0(num_workers):
+    rng = np.random.default_rng(13)
+    output_shape = (1, 2, 2, 125, 151)
+    tile_size = 24
+    # Few enough tiles that some chunks (and the chunks above them) are never touched.
+    sources = [f"tile_{idx}" for idx in range(12)]
+    tiles = {s: rng.integers(1, 65535, size=(2, tile_size, tile_size), dtype=np.uint16) for s in sources}
+    placements = _random_placements(rng, sources, output_shape, tile_size)
+
+    levels = _pyramid_levels(output_shape, 4)
+    pyramid = StreamingPyramidBuilder(levels)
+    ChunkedTileStitcher(levels[0], tiles.get, num_workers=num_workers, pyramid=pyramid).stitch(placements)
+
+    expected = _downsample_levels(levels[0][:], len(levels))
+    for level, expected_level in zip(levels[1:], expected[1:]):
+        np.testing.assert_array_equal(level[:], expected_level)
+    assert not any(pyramid._pending) and not any(pyramid._remaining)
+
+
+def test_streaming_pyramid_finish_fills_in_missing_chunks():
+    levels = _pyramid_levels((1, 1, 1, 64, 64), 3)
+    pyramid = StreamingPyramidBuilder(levels)
+    pyramid.expect_chunks([(0, 0, 0, row, col) for row in range(4) for col in range(4)])
+    for row in range(4):
+        for col in range(4):
+            if (row, col) != (3, 3):
+                chunk = np.full((16, 16), 100 * row + col, dtype=np.uint16)
+                levels[0][0, 0, 0, row * 16 : row * 16 + 16, col * 16 : col * 16 + 16] = chunk
+                pyramid.add_chunk((0, 0, 0, row, col), chunk)
+
+    # Everything not waiting on the missing chunk is already written.
+    assert levels[1][0, 0, 0, 8, 8] == 101
+    assert levels[1][0, 0, 0, 16, 16] == 0
+    pyramid.finish()
+    expected = _downsample_levels(levels[0][:], len(levels))
+    for level, expected_level in zip(levels[1:], expected[1:]):
+        np.testing.assert_array_equal(level[:], expected_level)
+
+
+def test_streaming_pyramid_rejects_bad_levels():
+    with pytest.raises(ValueError):
+        StreamingPyramidBuilder(_pyramid_levels((1, 1, 1, 64, 64), 2) + _pyramid_levels((1, 1, 1, 64, 64), 1))
+    with pytest.raises(ValueError):
+        StreamingPyramidBuilder(_pyramid_levels((1, 1, 1, 64, 64), 2, chunks=(1, 1, 1, 15, 16)))
+
+
+def _write_acquisition(folder, files_and_images, coordinates_rows):
+    (folder / "acquisition parameters.json").write_text(
+        json.dumps(
+            {
+                "objective": {"magnification": 20, "tube_lens_f_mm": 180},
+                "sensor_pixel_size_um": 3.45,
+                "tube_lens_mm": 180,
+            }
+        )
+    )
+    time_point_folder = folder / "0"
+    time_point_folder.mkdir()
+    for file, image in files_and_images.items():
+        tifffile.imwrite(str(time_point_folder / file), image)
+    (time_point_folder / "coordinates.csv").write_text(
+        "region,fov,z_level,x (mm),y (mm),z (um),time\n"
+        + "".join(f"{','.join(str(v) for v in row)},0\n" for row in coordinates_rows)
+    )
+
+
+def _coordinate_stitcher(input_folder):
+    # Not all of the stitcher's dependencies are always installed.
+    stitcher = pytest.importorskip("control.stitcher", exc_type=ImportError)
+    coordinate_stitcher = stitcher.CoordinateStitcher(str(input_folder))
+    coordinate_stitcher.get_time_points()
+    coordinate_stitcher.parse_filenames()
+    return coordinate_stitcher
+
+
+def test_coordinate_stitcher_indexes_tiles(tmp_path, capsys):
+    # A 2x2 grid in a region whose name would lose its leading 0 if it were read as a number, with fovs in
+    # S-pattern order.
+    fov_positions = {0: (1.0, 2.0), 1: (1.5, 2.0), 2: (1.5, 2.4), 3: (1.0, 2.4)}
+    channels = {"Fluorescence_488_nm_Ex": "Fluorescence 488 nm Ex", "BF_LED_matrix_full": "BF LED matrix full"}
+    files_and_images = {}
+    for fov in fov_positions:
+        for channel_index, channel in enumerate(channels):
+            files_and_images[f"01_{fov}_0_{channel}.tiff"] = np.full((6, 8), 10 * fov + channel_index, np.uint16)
+    # No coordinates for this one.
+    files_and_images["01_7_0_Fluorescence_488_nm_Ex.tiff"] = np.zeros((6, 8), np.uint16)
+
+    coordinates_rows = [("01", fov, 0, x, y, 100.0 + fov) for fov, (x, y) in fov_positions.items()]
+    # Only the first row of a (region, fov, z_level) counts.
+    coordinates_rows.append(("01", 0, 0, 9.0, 9.0, 0.0))
+    _write_acquisition(tmp_path, files_and_images, coordinates_rows)
+
+    coordinate_stitcher = _coordinate_stitcher(tmp_path)
+
+    assert "No matching coordinates found for file 01_7_0_Fluorescence_488_nm_Ex.tiff" in capsys.readouterr().out
+    assert coordinate_stitcher.regions == ["01"]
+    assert coordinate_stitcher.channel_names == sorted(channels.values())
+    assert len(coordinate_stitcher.stitching_data) == len(fov_positions) * len(channels)
+
+    tile_info = coordinate_stitcher.stitching_data[(0, "01", 2, 0, "Fluorescence 488 nm Ex")]
+    assert (tile_info["x"], tile_info["y"], tile_info["z"]) == (1.5, 2.4, 102.0)
+    assert coordinate_stitcher.region_positions["01"] == ([1.0, 1.5], [2.0, 2.4])
+    rows_and_cols = {
+        key[2]: (tile_info["row"], tile_info["col"]) for key, tile_info in coordinate_stitcher.stitching_data.items()
+    }
+    assert rows_and_cols == {0: (0, 0), 1: (0, 1), 2: (1, 1), 3: (1, 0)}
+
+    for fov, (row, col) in rows_and_cols.items():
+        for channel_index, channel in enumerate(channels.values()):
+            tile = coordinate_stitcher.get_tile("01", row, col, channel, 0)
+            np.testing.assert_array_equal(np.asarray(tile), np.full((6, 8), 10 * fov + channel_index))
+
+    capsys.readouterr()
+    assert coordinate_stitcher.get_tile("01", 2, 0, "Fluorescence 488 nm Ex", 0) is None
+    assert coordinate_stitcher.get_tile("01", 0, 0, "Fluorescence 488 nm Ex", 1) is None
+    assert coordinate_stitcher.get_tile("01", 0, 0, "Fluorescence 561 nm Ex", 0) is None
+    assert coordinate_stitcher.get_tile("1", 0, 0, "Fluorescence 488 nm Ex", 0) is None
+    assert capsys.readouterr().out.count("No matching tile found") == 4
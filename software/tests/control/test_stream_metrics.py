@@ -0,0 +1,141 @@
+import json
+
+import numpy as np
+
+import control.core.core
+import squid.abc
+from control.core.stream_metrics import FrameStreamMetrics
+from squid.config import CameraPixelFormat
+
+
+def test_frame_stream_metrics_counts():
+    metrics = FrameStreamMetrics("test")
+    for frame_id in [1, 2, 5, 6, 10]:
+        metrics.frame_received(frame_id)
+    metrics.frame_dropped(6)
+    metrics.frame_received()
+
+    snapshot = metrics.get_snapshot()
+    assert snapshot["test frames received"] == 6
+    # 3, 4, 7, 8, and 9 never showed up
+    assert snapshot["test frames missed (frame id gaps)"] == 5
+    assert snapshot["test frames dropped"] == 1
+
+    metrics.reset()
+    assert metrics.get_snapshot()["test frames received"] == 0
+    assert metrics.get_snapshot()["test frames missed (frame id gaps)"] == 0
+
+
+def test_frame_stream_metrics_resync_frame_id():
+    metrics = FrameStreamMetrics("test")
+    metrics.frame_received(1)
+    # 2 through 5 were skipped on purpose, so aren't missed.
+    metrics.resync_frame_id(5)
+    metrics.frame_received(6)
+    metrics.frame_received(8)
+
+    snapshot = metrics.get_snapshot()
+    assert snapshot["test frames received"] == 3
+    assert snapshot["test frames missed (frame id gaps)"] == 1
+
+
+def _camera_frame(frame_id):
+    return squid.abc.CameraFrame(
+        frame_id=frame_id,
+        timestamp=0.0,
+        frame=np.zeros((8, 8), dtype=np.uint8),
+        frame_format=squid.abc.CameraFrameFormat.RAW,
+        frame_pixel_format=CameraPixelFormat.MONO8,
+    )
+
+
+def test_stream_handler_metrics():
+    accept_frames = True
+    stream_handler = control.core.core.StreamHandler(accept_new_frame_fn=lambda: accept_frames)
+
+    for frame_id in [1, 2, 4]:
+        stream_handler.on_new_frame(_camera_frame(frame_id))
+    accept_frames = False
+    for frame_id in [5, 6]:
+        stream_handler.on_new_frame(_camera_frame(frame_id))
+    accept_frames = True
+    stream_handler.on_new_frame(_camera_frame(7))
+
+    snapshot = stream_handler.metrics.get_snapshot()
+    assert snapshot["stream frames received"] == 4
+    assert snapshot["stream frames missed (frame id gaps)"] == 1
+
+    stream_handler.start_recording()
+    snapshot = stream_handler.metrics.get_snapshot()
+    assert snapshot["stream frames received"] == 0
+    assert snapshot["stream frames missed (frame id gaps)"] == 0
+
+
+def test_frame_stream_metrics_write_latency_and_throughput():
+    metrics = FrameStreamMetrics("test")
+    for latency_s in [0.0005] * 98 + [0.03, 6.0]:
+        metrics.frame_written(1000, latency_s)
+    for depth in [1, 4, 2]:
+        metrics.queue_depth_changed(depth)
+
+    snapshot = metrics.get_snapshot()
+    assert snapshot["test frames written"] == 100
+    assert snapshot["test write MB/s (max 1s)"] == 0.1
+    assert snapshot["test write latency max [ms]"] == 6000
+    # The 99th of 100 frames is in the (0.02, 0.05] bin.
+    assert snapshot["test write latency p99 [ms]"] == 50
+    assert snapshot["test queue depth"] == 2
+    assert snapshot["test queue depth max"] == 4
+
+    metrics_dict = metrics.to_dict()
+    assert metrics_dict["bytes_written"] == 100 * 1000
+    assert sum(metrics_dict["latency_histogram"]["counts"]) == 100
+    assert metrics_dict["latency_histogram"]["counts"][0] == 98
+    assert metrics_dict["latency_histogram"]["counts"][-1] == 1
+    assert metrics_dict["queue_depth_history"][-1][1] == 4
+
+
+def test_image_saver_metrics(tmp_path):
+    image_saver = control.core.core.ImageSaver(image_format="tiff")
+    image_saver.set_base_path(str(tmp_path))
+    image_saver.start_new_experiment("metrics", add_timestamp=False)
+
+    image = np.zeros((8, 8), dtype=np.uint16)
+    for frame_id in range(3):
+        image_saver.enqueue(image, frame_id, 0.0)
+    stream_metrics = FrameStreamMetrics("stream")
+    for frame_id in [1, 2, 4]:
+        stream_metrics.frame_received(frame_id)
+    image_saver.save_metrics(stream_metrics=stream_metrics)
+    image_saver.close()
+
+    with open(tmp_path / "metrics" / "recording_metrics.json", "r") as f:
+        metrics = json.load(f)
+    assert metrics["frames_received"] == 3
+    assert metrics["frames_written"] == 3
+    assert metrics["frames_dropped"] == 0
+    assert metrics["bytes_written"] == 3 * image.nbytes
+    assert metrics["stream"]["frames_received"] == 3
+    assert metrics["stream"]["frames_missed"] == 1
+
+
+def test_image_saver_save_metrics_does_not_block_on_full_queue(tmp_path):
+    image_saver = control.core.core.ImageSaver(image_format="tiff")
+    image_saver.set_base_path(str(tmp_path))
+    image_saver.start_new_experiment("metrics", add_timestamp=False)
+    # Hold off the saving thread so the queue fills up.
+    image_saver.queue.mutex.acquire()
+    try:
+        for _ in range(image_saver.queue.maxsize):
+            image_saver.queue.queue.append([np.zeros((8, 8), dtype=np.uint16), 0, 0.0, 0.0])
+            image_saver.queue.unfinished_tasks += 1
+    finally:
+        image_saver.queue.mutex.release()
+
+    assert image_saver.queue.full()
+    image_saver.save_metrics()
+    image_saver.close()
+
+    with open(tmp_path / "metrics" / "recording_metrics.json", "r") as f:
+        metrics = json.load(f)
+    assert "frames_written" in metrics
@@ -184,3 +184,19 @@ def test_timing_manager():
     with tma.get_timer("t2"):
         pass
     assert len(tma.get_timer("t2").get_intervals()) == 1
+
+
+def test_fit_focus_peak():
+    z_mm = np.linspace(0.1, 0.118, 10)
+    true_peak_mm = 0.1093
+    gaussian = 1000 * np.exp(-((z_mm - true_peak_mm) ** 2) / (2 * 0.004**2))
+    assert control.utils.fit_focus_peak(z_mm, gaussian) == pytest.approx(true_peak_mm, abs=1e-6)
+    # Frames can come in any order, and a curve that isn't all positive gets a parabola instead.
+    shuffled = np.random.default_rng(1).permutation(10)
+    assert control.utils.fit_focus_peak(z_mm[shuffled], (gaussian - 500)[shuffled]) == pytest.approx(
+        true_peak_mm, abs=5e-4
+    )
+
+    # A peak at the end of the range stays there.
+    assert control.utils.fit_focus_peak(z_mm, np.arange(10)) == z_mm[-1]
+    assert control.utils.fit_focus_peak(z_mm[:1], [5]) == z_mm[0]
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from control.utils_acquisition import CoordinatesBuffer
+
+
+def test_coordinates_buffer_to_dataframe():
+    columns = ["region", "fov", "x (mm)"]
+    buffer = CoordinatesBuffer(columns)
+    assert len(buffer) == 0
+    assert list(buffer.to_dataframe().columns) == columns
+
+    for fov in range(5):
+        buffer.append({"region": "A1", "fov": fov, "x (mm)": fov * 0.5})
+
+    df = buffer.to_dataframe()
+    assert len(buffer) == 5
+    assert list(df.columns) == columns
+    assert df["fov"].tolist() == list(range(5))
+    assert df["x (mm)"].tolist() == [0.0, 0.5, 1.0, 1.5, 2.0]
+
+    round_tripped = CoordinatesBuffer.from_dataframe(df)
+    pd.testing.assert_frame_equal(round_tripped.to_dataframe(), df)
+
+    with pytest.raises(ValueError):
+        buffer.append({"region": "A1", "fov": 6})
+
+
+def test_coordinates_buffer_flush_csv(tmp_path):
+    csv_path = tmp_path / "coordinates.csv"
+    buffer = CoordinatesBuffer(["fov", "z (um)"])
+
+    for fov in range(3):
+        buffer.append({"fov": fov, "z (um)": 10.0 * fov})
+    assert buffer.get_unflushed_row_count() == 3
+    buffer.flush_csv(str(csv_path))
+    assert buffer.get_unflushed_row_count() == 0
+    assert pd.read_csv(csv_path)["fov"].tolist() == [0, 1, 2]
+
+    for fov in range(3, 5):
+        buffer.append({"fov": fov, "z (um)": 10.0 * fov})
+    buffer.flush_csv(str(csv_path))
+
+    pd.testing.assert_frame_equal(pd.read_csv(csv_path), buffer.to_dataframe())
@@ -1,8 +1,18 @@
+import itertools
+import threading
+import time
 from typing import Optional, Sequence
 
+import cv2
+import numpy as np
+import pytest
+
+import control.utils
 import squid.camera.utils
 import squid.config
 from squid.abc import AbstractCamera, CameraFrame
+from squid.camera.frame_dispatch import FrameOverflowPolicy
+from squid.camera.frame_pool import FrameBufferPool
 from squid.camera.utils import SimulatedCamera
 from squid.config import CameraConfig
 
@@ -105,3 +115,194 @@ def test_read_frame_on_timeout():
     assert frames[frame_to_idx(8)] is None
     assert frames[frame_to_idx(9)] is not None
     assert frames[frame_to_idx(10)] is not None
+
+
+def wait_for(condition, timeout_s=5.0):
+    end_time_s = time.time() + timeout_s
+    while time.time() < end_time_s:
+        if condition():
+            return True
+        time.sleep(0.001)
+    return condition()
+
+
+def _reference_process(raw_frame, rotate_image_angle, flip, crop_width, crop_height):
+    # The cv2 based rotate, flip, then crop _process_raw_frame used to do.
+    image = raw_frame.copy()
+    if rotate_image_angle:
+        image = cv2.rotate(
+            image,
+            {90: cv2.ROTATE_90_CLOCKWISE, -90: cv2.ROTATE_90_COUNTERCLOCKWISE, 180: cv2.ROTATE_180}[rotate_image_angle],
+        )
+    if flip is not None:
+        image = cv2.flip(
+            image,
+            {
+                control.utils.FlipVariant.VERTICAL: 0,
+                control.utils.FlipVariant.HORIZONTAL: 1,
+                control.utils.FlipVariant.BOTH: -1,
+            }[flip],
+        )
+    return control.utils.crop_image(image, crop_width, crop_height)
+
+
+@pytest.mark.parametrize(
+    "rotate_image_angle,flip",
+    list(itertools.product([None, 90, -90, 180], [None] + list(control.utils.FlipVariant))),
+)
+def test_process_raw_frame_matches_rotate_flip_crop(rotate_image_angle, flip):
+    rng = np.random.default_rng(42)
+    raw_frame = rng.integers(0, 65535, size=(31, 44), dtype=np.uint16)
+
+    for crop_width, crop_height in [(None, None), (21, 16), (20, 15)]:
+        config = squid.config.get_camera_config().model_copy(
+            update={
+                "rotate_image_angle": rotate_image_angle,
+                "flip": flip,
+                "crop_width": crop_width,
+                "crop_height": crop_height,
+            }
+        )
+        sim_cam = squid.camera.utils.get_camera(config, simulated=True)
+        sim_cam.set_binning(1, 1)
+
+        expected = _reference_process(raw_frame, rotate_image_angle, flip, *sim_cam.get_crop_size())
+        processed = sim_cam._process_raw_frame(raw_frame)
+        np.testing.assert_array_equal(processed, expected)
+        assert processed.strides[-1] == processed.itemsize
+        assert sim_cam.get_processed_frame_shape(raw_frame.shape) == expected.shape
+
+        if (rotate_image_angle, flip) in [(None, None), (180, control.utils.FlipVariant.BOTH)]:
+            # Plain crops (including a 180 rotation flipped back) are handed out as views, unless the caller asks
+            # for a copy.
+            assert np.shares_memory(processed, raw_frame)
+            assert not np.shares_memory(sim_cam._process_raw_frame(raw_frame, copy=True), raw_frame)
+        else:
+            assert not np.shares_memory(processed, raw_frame)
+
+        out = np.zeros(expected.shape, dtype=expected.dtype)
+        assert sim_cam._process_raw_frame(raw_frame, out=out) is out
+        np.testing.assert_array_equal(out, expected)
+
+        with pytest.raises(ValueError):
+            sim_cam._process_raw_frame(raw_frame, out=np.zeros((1, 1), dtype=expected.dtype))
+
+
+def test_frame_buffer_pool():
+    pool = FrameBufferPool(max_free_buffers=2)
+    a = pool.acquire((4, 5), np.uint16)
+    b = pool.acquire((4, 5), np.uint16)
+    assert a is not b
+    assert pool.get_allocated_count() == 2
+
+    pool.release(a)
+    assert pool.acquire((4, 5), np.uint16) is a
+    # Buffers of other shapes or dtypes are never handed out for a request.
+    pool.release(a)
+    assert pool.acquire((5, 4), np.uint16) is not a
+    assert pool.acquire((4, 5), np.uint8) is not a
+    assert pool.get_reused_count() == 1
+
+    # Only max_free_buffers are kept around, the oldest get dropped first.
+    c = pool.acquire((4, 5), np.uint16)
+    pool.release(b)
+    pool.release(c)
+    assert pool.get_free_count() == 2
+    assert {id(pool.acquire((4, 5), np.uint16)) for _ in range(2)} == {id(b), id(c)}
+
+
+def test_simulated_camera_recycles_released_frames():
+    sim_cam = squid.camera.utils.get_camera(squid.config.get_camera_config(), simulated=True)
+    frames = []
+    sim_cam.add_frame_callback(lambda frame: frames.append(frame))
+
+    sim_cam.send_trigger()
+    sim_cam.send_trigger()
+    first_frame, second_frame = frames
+    assert first_frame.is_pooled()
+    # The camera only holds on to the current frame, so the first one is back in the pool.
+    assert sim_cam._frame_pool.get_free_count() == 1
+
+    # A retained frame is not reused until it is released.
+    second_frame_copy = second_frame.frame.copy()
+    second_frame.retain()
+    sim_cam.send_trigger()
+    sim_cam.send_trigger()
+    assert not np.shares_memory(frames[-1].frame, second_frame.frame)
+    np.testing.assert_array_equal(second_frame.frame, second_frame_copy)
+
+    second_frame.release()
+    allocated_count = sim_cam._frame_pool.get_allocated_count()
+    for _ in range(5):
+        sim_cam.send_trigger()
+    assert sim_cam._frame_pool.get_allocated_count() == allocated_count
+
+    with pytest.raises(ValueError):
+        first_frame.retain()
+
+    # Frames from read_camera_frame are taken out of the pool, since those callers don't know about releasing.
+    read_frame = sim_cam.read_camera_frame()
+    read_frame_copy = read_frame.frame.copy()
+    for _ in range(5):
+        sim_cam.send_trigger()
+    assert not read_frame.is_pooled()
+    np.testing.assert_array_equal(read_frame.frame, read_frame_copy)
+
+
+@pytest.mark.parametrize("overflow_policy", list(FrameOverflowPolicy))
+def test_queued_frame_callback_overflow(overflow_policy):
+    sim_cam = squid.camera.utils.get_camera(squid.config.get_camera_config(), simulated=True)
+    release_callback = threading.Event()
+    received_ids = []
+
+    def slow_callback(frame):
+        release_callback.wait()
+        received_ids.append(frame.frame_id)
+
+    def trigger_frames(count):
+        for _ in range(count):
+            sim_cam.send_trigger()
+
+    callback_id = sim_cam.add_frame_callback(slow_callback, max_queue_size=2, overflow_policy=overflow_policy)
+    # The first frame goes straight to the (stuck) callback, and the next 2 fill the queue.
+    trigger_frames(3)
+    assert wait_for(lambda: sim_cam.get_frame_callback_stats(callback_id).queued_count == 2)
+
+    # Frames past the queue size either get dropped, or have to wait for the callback.
+    trigger_thread = threading.Thread(target=trigger_frames, args=(2,), daemon=True)
+    trigger_thread.start()
+    trigger_thread.join(0.5)
+    assert trigger_thread.is_alive() == (overflow_policy == FrameOverflowPolicy.BLOCK)
+
+    release_callback.set()
+    trigger_thread.join(5)
+    sim_cam.remove_frame_callback(callback_id)
+
+    expected_ids = {
+        FrameOverflowPolicy.BLOCK: [1, 2, 3, 4, 5],
+        FrameOverflowPolicy.DROP_NEWEST: [1, 2, 3],
+        FrameOverflowPolicy.DROP_OLDEST: [1, 4, 5],
+    }[overflow_policy]
+    assert received_ids == expected_ids
+    # Queued (and dropped) frames were released, so all but the camera's current frame are back in the pool.
+    assert sim_cam._frame_pool.get_allocated_count() - sim_cam._frame_pool.get_free_count() == 1
+    assert sim_cam.get_frame_callback_stats(callback_id) is None
+
+
+def test_queued_frame_callback_stats():
+    sim_cam = squid.camera.utils.get_camera(squid.config.get_camera_config(), simulated=True)
+    inline_ids = []
+    queued_ids = []
+    inline_id = sim_cam.add_frame_callback(lambda frame: inline_ids.append(frame.frame_id))
+    queued_id = sim_cam.add_frame_callback(lambda frame: queued_ids.append(frame.frame_id), max_queue_size=4)
+
+    for _ in range(10):
+        sim_cam.send_trigger()
+    assert inline_ids == list(range(1, 11))
+    assert sim_cam.get_frame_callback_stats(inline_id) is None
+
+    assert wait_for(lambda: sim_cam.get_frame_callback_stats(queued_id).delivered_count == 10)
+    assert queued_ids == list(range(1, 11))
+    stats = sim_cam.get_frame_callback_stats(queued_id)
+    assert stats.dropped_count == 0
+    assert 0 <= stats.mean_latency_s <= stats.max_latency_s
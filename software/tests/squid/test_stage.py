@@ -1,7 +1,9 @@
 import pytest
 import tempfile
+import time
 
 import squid.stage.cephla
+import squid.stage.position_history
 import squid.stage.prior
 import squid.stage.utils
 import squid.config
@@ -33,3 +35,49 @@ def test_position_caching():
     p_read = squid.stage.utils.get_cached_position(cache_path=temp_cache_path)
 
     assert p_read == p
+
+
+def test_position_history_interpolates_and_wraps():
+    history = squid.stage.position_history.PositionHistory(capacity=4)
+    assert history.get_pos_at(1.0) is None
+
+    history.add(1.0, 0.0, 10.0, 1.0, None)
+    history.add(2.0, 1.0, 10.0, 2.0, None)
+    assert history.get_pos_at(1.25)[:3] == pytest.approx((0.25, 10.0, 1.25))
+    assert history.get_pos_at(1.25)[3] is None
+
+    # Past either end, we get the end positions.
+    assert history.get_pos_at(0.0)[:3] == pytest.approx((0.0, 10.0, 1.0))
+    assert history.get_pos_at(5.0)[:3] == pytest.approx((1.0, 10.0, 2.0))
+
+    # Overflow the ring, so the oldest entries get dropped.
+    for t in (3.0, 4.0, 5.0):
+        history.add(t, t - 1, 10.0, t, 0.5)
+    assert len(history) == 4
+    assert history.get_latest() == pytest.approx((5.0, 4.0, 10.0, 5.0, 0.5))
+    assert history.get_pos_at(1.0)[:3] == pytest.approx((1.0, 10.0, 2.0))
+    assert history.get_pos_at(4.5)[:3] == pytest.approx((3.5, 10.0, 4.5))
+
+
+def test_cephla_stage_position_listeners_and_history():
+    microcontroller = get_test_micro()
+    stage = squid.stage.cephla.CephlaStage(microcontroller, squid.config.get_stage_config())
+
+    positions = []
+    listener_id = stage.add_position_listener(positions.append)
+
+    before_move = time.time()
+    stage.move_x(1.0)
+    stage.move_y(2.0)
+    after_move = time.time()
+
+    assert positions
+    assert positions[-1].x_mm == pytest.approx(1.0, abs=1e-3)
+    assert positions[-1].y_mm == pytest.approx(2.0, abs=1e-3)
+    assert stage.get_pos_at(after_move + 1).y_mm == pytest.approx(2.0, abs=1e-3)
+    assert stage.get_pos_at(before_move - 1).x_mm == pytest.approx(0.0, abs=1e-3)
+
+    stage.remove_position_listener(listener_id)
+    position_count = len(positions)
+    stage.move_x(1.0)
+    assert len(positions) == position_count
@@ -0,0 +1,43 @@
+import logging
+import os
+
+import squid.logging
+from control.core.raw_recording import RawRecording, convert_raw_recording
+
+log = squid.logging.get_logger("convert raw recording")
+
+
+def main(args):
+    if args.verbose:
+        squid.logging.set_stdout_log_level(logging.DEBUG)
+
+    recording = RawRecording(args.recording)
+    log.info(
+        f"Converting {len(recording)} frames of shape={recording.frame_shape}, dtype={recording.frame_dtype} from "
+        f"'{args.recording}' to '{args.output}'"
+    )
+    output_format = args.format or ("zarr" if args.output.rstrip(os.sep).endswith(".zarr") else "tiff")
+    convert_raw_recording(args.recording, args.output, output_format)
+    log.info("Done.")
+    return 0
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    ap = argparse.ArgumentParser(description="Convert a raw recording (from raw recording mode) to a tiff or zarr.")
+
+    ap.add_argument("recording", type=str, help="The raw recording directory.")
+    ap.add_argument("output", type=str, help="The tiff file or zarr directory to write.")
+    ap.add_argument(
+        "--format",
+        type=str,
+        choices=["tiff", "zarr"],
+        help="The output format.  By default, outputs ending in .zarr are zarr, and everything else is tiff.",
+    )
+    ap.add_argument("--verbose", action="store_true", help="Turn on debug logging")
+
+    args = ap.parse_args()
+
+    sys.exit(main(args))